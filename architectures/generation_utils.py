@@ -11,16 +11,26 @@
 
 import logging
 import warnings
+import itertools
+import threading
 import collections
+import numpy as np
 import keras.ops as K
 
 from keras import tree
 
 from loggers import Timer, timer
-from utils.keras import TensorSpec, ops
+from utils.keras import TensorSpec, execute_eagerly, ops
 
 logger = logging.getLogger(__name__)
 
+_default_decode_chunk_size  = 16
+
+# `{id : CancellationToken}` of the running generations, checked by the compiled decoding loops (see `register_cancellation_token`)
+_cancellation_tokens    = {}
+_cancellation_ids   = itertools.count(1)
+_cancellation_mutex = threading.Lock()
+
 InferenceConfig = collections.namedtuple(
     "InferenceConfig", [
         "use_xla",
@@ -85,8 +95,22 @@ def infer(model,
           return_logits  = False,
           return_attention   = False,
           return_last_attention  = False,
-          return_only_cross_attention    = True
+          return_only_cross_attention    = True,
+          
+          cancellation_token = None,
+          cancellation_id   : TensorSpec(shape = (), dtype = 'int32') = None,
+          decode_chunk_size  = None
          ):
+    """
+        Generate tokens with `method` (greedy / sampling / beam search)
+        
+        Arguments (cancellation) :
+            - cancellation_token    : `CancellationToken`, checked between 2 chunks of decoding steps (eager execution only)
+            - cancellation_id       : the id of a registered token (see `register_cancellation_token`), checked at each step of the compiled decoding loop
+            - decode_chunk_size     : the number of decoding steps per chunk (default to `_default_decode_chunk_size`)
+        
+        When executing eagerly, the decoding loop is executed by chunks (each chunk being a `while_loop`), and the token is checked between 2 chunks. In a compiled graph, a `CancellationToken` cannot be passed (it would trigger a new tracing at each request) : the `cancellation_id` tensor is passed instead, and the token is checked by a host callback at each decoding step. In both cases, the generation stops as soon as the token is cancelled, and the tokens generated so far are returned.
+    """
     if step_fn is None: step_fn = model
     if initial_state:
         assert prefix is None, 'The `prefix` should be None when providing an `initial_state`'
@@ -165,7 +189,11 @@ def infer(model,
         batch_size  = batch_size,
         early_stopping  = early_stopping,
         encoder_output  = encoder_output,
-        enc_padding_mask    = enc_padding_mask
+        enc_padding_mask    = enc_padding_mask,
+        
+        cancellation_token  = cancellation_token,
+        cancellation_id = cancellation_id,
+        decode_chunk_size   = decode_chunk_size
     )
 
 def infer_greedy(self,
@@ -185,6 +213,10 @@ def infer_greedy(self,
                  
                  return_state   = False,
                  
+                 cancellation_token = None,
+                 cancellation_id    = None,
+                 decode_chunk_size  = None,
+                 
                  ** kwargs
                 ):
     @timer
@@ -283,11 +315,14 @@ def infer_greedy(self,
             initial_inputs, outputs, loop_state, first_iter = True
         )
 
-    _, outputs, state = K.while_loop(
-        cond    = cond,
-        body    = body,
-        loop_vars   = (inputs, outputs, state),
-        maximum_iterations  = config.max_steps - 1
+    _, outputs, state = _decoding_loop(
+        cond,
+        body,
+        (inputs, outputs, state),
+        config  = config,
+        cancellation_token  = cancellation_token,
+        cancellation_id = cancellation_id,
+        decode_chunk_size   = decode_chunk_size
     )
 
     return InferenceOutput(
@@ -320,6 +355,10 @@ def infer_beam_search(self,
 
                       return_state   = False,
                      
+                      cancellation_token = None,
+                      cancellation_id    = None,
+                      decode_chunk_size  = None,
+                      
                       ** kwargs
                      ):
     @timer
@@ -456,11 +495,14 @@ def infer_beam_search(self,
             inputs, outputs, loop_state, first_iter = True
         )
 
-    _, outputs, state = K.while_loop(
-        cond    = cond,
-        body    = body,
-        loop_vars   = (inputs, outputs, state),
-        maximum_iterations  = config.max_steps - 1
+    _, outputs, state = _decoding_loop(
+        cond,
+        body,
+        (inputs, outputs, state),
+        config  = config,
+        cancellation_token  = cancellation_token,
+        cancellation_id = cancellation_id,
+        decode_chunk_size   = decode_chunk_size
     )
 
     return tree.map_structure(
@@ -480,6 +522,90 @@ def infer_beam_search(self,
         )
     )
 
+def register_cancellation_token(token):
+    """ Register `token`, and return its id (a scalar tensor) to pass as `cancellation_id` to the compiled `infer` """
+    with _cancellation_mutex:
+        cancellation_id = next(_cancellation_ids) % (2 ** 31 - 1)
+        _cancellation_tokens[cancellation_id] = token
+    return ops.convert_to_tensor(cancellation_id, 'int32')
+
+def unregister_cancellation_token(cancellation_id):
+    with _cancellation_mutex:
+        _cancellation_tokens.pop(int(ops.convert_to_numpy(cancellation_id)), None)
+
+def _is_cancelled(cancellation_id):
+    token = _cancellation_tokens.get(int(cancellation_id), None)
+    return np.array(token is not None and token.cancelled)
+
+def _check_cancellation(cancellation_id):
+    """ Return whether the token registered as `cancellation_id` is cancelled, with a host callback if executed in a compiled graph """
+    if ops.is_tensorflow_graph():
+        return execute_eagerly(_is_cancelled, Tout = 'bool', numpy = True)(cancellation_id, shape = ())
+    elif ops.is_jax_backend():
+        import jax
+        
+        return jax.experimental.io_callback(
+            _is_cancelled, jax.ShapeDtypeStruct((), 'bool'), cancellation_id
+        )
+    # `torch.compile` executes the python check as a graph break
+    return K.convert_to_tensor(_is_cancelled(ops.convert_to_numpy(cancellation_id)))
+
+def _decoding_loop(cond,
+                   body,
+                   loop_vars,
+                   config,
+                   *,
+                   
+                   cancellation_token   = None,
+                   cancellation_id  = None,
+                   decode_chunk_size    = None
+                  ):
+    """
+        Equivalent to `K.while_loop(cond, body, loop_vars, maximum_iterations = config.max_steps - 1)`
+        
+        If the function is executed eagerly and `cancellation_token` (or `cancellation_id`) is provided, the loop is executed by chunks of `decode_chunk_size` steps, and is stopped between 2 chunks if the token is cancelled. This way, an aborted request releases the device (and its cache memory) after at most 1 chunk, instead of running until `max_steps`.
+        In a compiled graph, the token registered as `cancellation_id` is checked at each step (in `cond`) by a host callback.
+    """
+    max_iterations = config.max_steps - 1
+    if cancellation_token is None and cancellation_id is not None:
+        if not ops.executing_eagerly():
+            loop_cond = cond
+            cond = lambda * args: K.logical_and(
+                loop_cond(* args), K.logical_not(_check_cancellation(cancellation_id))
+            )
+        else:
+            cancellation_token = _cancellation_tokens.get(
+                int(ops.convert_to_numpy(cancellation_id)), None
+            )
+    
+    if cancellation_token is None or not ops.executing_eagerly():
+        return K.while_loop(
+            cond    = cond,
+            body    = body,
+            loop_vars   = loop_vars,
+            maximum_iterations  = max_iterations
+        )
+    
+    if not decode_chunk_size: decode_chunk_size = _default_decode_chunk_size
+    max_iterations = int(ops.convert_to_numpy(max_iterations))
+    
+    step = 0
+    while step < max_iterations and not cancellation_token.cancelled:
+        num_steps = min(decode_chunk_size, max_iterations - step)
+        loop_vars = K.while_loop(
+            cond    = cond,
+            body    = body,
+            loop_vars   = loop_vars,
+            maximum_iterations  = num_steps
+        )
+        step += num_steps
+        if not bool(ops.convert_to_numpy(cond(* loop_vars))): break
+    
+    if cancellation_token.cancelled and logger.isEnabledFor(logging.INFO):
+        logger.info('The generation has been cancelled after {} steps'.format(step + 1))
+    
+    return loop_vars
+
 @timer
 def process_logits(scores,
                    lengths,
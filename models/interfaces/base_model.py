@@ -18,7 +18,7 @@ import logging
 from functools import cached_property, partialmethod
 
 from loggers import Timer, timer
-from utils import JSONSaver, Stream, dump_json, load_json, time_to_string, copy_methods
+from utils import AsyncCallback, JSONSaver, Pipeline, Stream, create_iterable, dump_json, make_async, load_json, time_to_string, copy_methods
 from utils.keras import TensorSpec, ops, build_runtime, graph_compile
 from custom_train_objects import CheckpointManager, History
 
@@ -686,8 +686,35 @@ class BaseModel(metaclass = ModelInstances):
                 return_results  = True,
                 return_output   = None,
                 
+                num_workers = 0,
+                batch_size  = 1,
+                
                 ** kwargs
                ):
+        """
+            Performs inference on `inputs` (an iterable of data)
+            
+            Arguments :
+                - inputs    : the data to predict (`list`, generator, `Queue`, `pd.DataFrame`, ...)
+                
+                - predicted / callbacks : the inference callbacks (see `get_inference_callbacks`)
+                
+                - return_results    : whether to return the results
+                - return_output     : whether to return the model output or the saved entry
+                
+                - num_workers   : the number of threads that preprocess the data (see below)
+                - batch_size    : the maximal number of data given to `infer_batch` at once
+                
+                - kwargs    : forwarded to `self.infer` and `self.get_inference_callbacks`
+            Return :
+                - results   : `list` of results (if `return_results`)
+            
+            If `num_workers > 0` or `batch_size > 1`, the inference is performed by a 3-stage `Pipeline` :
+                1. `prepare_for_inference` is called by `num_workers` threads (e.g., to load / parse files)
+                2. `infer` (or `infer_batch` if `batch_size > 1`) is called on the prepared data
+                3. the callbacks (except `FileSaver`) are applied in a separate thread
+            The stages are connected by queues of `prefetch_size` items, such that the model does not wait for the preprocessing of the next data. The results are returned in the order of `inputs`.
+        """
         join_callbacks = predicted is None
         if predicted is None:
             predicted, callbacks = self.get_inference_callbacks(** kwargs)
@@ -695,21 +722,68 @@ class BaseModel(metaclass = ModelInstances):
         if return_output is None:
             return_output = not any(isinstance(callback, JSONSaver) for callback in callbacks)
         
+        use_pipeline = num_workers > 0 or batch_size > 1
+        if use_pipeline:
+            callbacks = make_async(callbacks)
+        
         kwargs.update({
             'predicted' : predicted,
             'callbacks' : callbacks,
             'return_output' : return_output
         })
         
-        results = []
-        for text, output in Stream(self.infer, inputs, ** kwargs).items():
-            if return_results:
-                results.append(output if return_output else predicted[text])
+        if use_pipeline:
+            items = self.get_inference_pipeline(
+                num_workers = num_workers, batch_size = batch_size, ** kwargs
+            )(create_iterable(inputs))
+        else:
+            items = Stream(self.infer, inputs, ** kwargs).items()
         
-        if join_callbacks:
-            for callback in callbacks: callback.join()
+        results = []
+        try:
+            for text, output in items:
+                if return_results:
+                    results.append(output if return_output else predicted[text])
+        finally:
+            for callback in callbacks:
+                if join_callbacks:
+                    callback.join()
+                elif isinstance(callback, AsyncCallback):
+                    callback.executor.join()
         
         return results
+    
+    def prepare_for_inference(self, data, ** kwargs):
+        """
+            Return the data given to `infer` (called by the preprocessing workers of the inference pipeline)
+            
+            Sub-classes can override this method to perform the CPU-bound processing (e.g., loading the files) in parallel of the model inference, as long as `infer` accepts the returned value
+        """
+        return data
+    
+    def infer_batch(self, batch, ** kwargs):
+        """ Return the `list` of `infer` outputs for the `batch` of data (sub-classes can override it to batch the model calls) """
+        return [self.infer(data, ** kwargs) for data in batch]
+    
+    def get_inference_pipeline(self, *, num_workers = 1, batch_size = 1, prefetch_size = 8, ** kwargs):
+        """ Return the `Pipeline` used by `predict`, that outputs tuples `(input, output)` """
+        kwargs = {k : v for k, v in kwargs.items() if k not in ('max_workers', 'dict_as_kwargs')}
+        
+        def prepare(data):
+            return data, self.prepare_for_inference(data, ** kwargs)
+        
+        if batch_size > 1:
+            def infer(batch):
+                outputs = self.infer_batch([prepared for _, prepared in batch], ** kwargs)
+                return [(data, out) for (data, _), out in zip(batch, outputs)]
+        else:
+            def infer(item):
+                return item[0], self.infer(item[1], ** kwargs)
+        
+        return Pipeline([
+            {'fn' : prepare, 'num_workers' : max(num_workers, 1), 'name' : 'prepare'},
+            {'fn' : infer, 'batch_size' : batch_size, 'name' : 'infer'}
+        ], queue_size = max(prefetch_size, 1), name = '{}_predict'.format(self.name))
 
     stream = partialmethod(predict, return_output = False, return_results = False)
     
@@ -9,6 +9,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .message import Message
+from .message import Message, MessageList
 from .conversation import Conversation
+from .conversation_log import ConversationLog
 from .conversation_manager import ConversationManager
\ No newline at end of file
@@ -9,6 +9,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
+from utils.databases import DocumentIndexer
+
+_indexers   = {}
+
 def select_rag(query,
                items,
                *,
@@ -24,6 +30,7 @@ def select_rag(query,
                
                k    = 10,
                threshold = 0.45,
+               incremental  = True,
                
                conv = None,
                tokenizer    = None,
@@ -37,22 +44,41 @@ def select_rag(query,
     
     if not path: path = 'documents.db' if documents else 'messages.db'
     
-    inp = items if not documents else None
-    
-    db = embedding_model.predict(
-        items if documents is None else None,
-        
-        chunk_size  = chunk_size,
-        group_by    = group_by,
-        
-        path    = path,
-        directory   = directory,
-        documents   = documents,
-        ** kwargs
-    )
+    if documents and incremental and hasattr(embedding_model, 'embed'):
+        db = get_document_indexer(
+            os.path.join(directory, path) if directory else path,
+            embedding_model,
+            chunk_size  = chunk_size,
+            group_by    = group_by
+        ).update(documents)
+        # the document set is empty (or has no chunk) : the database is not created
+        if db is None: return [], 0
+    else:
+        db = embedding_model.predict(
+            items if documents is None else None,
+            
+            chunk_size  = chunk_size,
+            group_by    = group_by,
+            
+            path    = path,
+            directory   = directory,
+            documents   = documents,
+            ** kwargs
+        )
     res = embedding_model.retrieve(query, db, k = k)[0]
     filtered = [r for r in res if r['score'] > threshold]
     print('# paragraphs found : {} [{:.3f}, {:.3f}] - filtered : {}'.format(
         len(res), res[-1]['score'], res[0]['score'], len(filtered)
     ))
     return filtered, 0
+
+def get_document_indexer(path, embedding_model, ** kwargs):
+    """ Return the `DocumentIndexer` associated to `path` (created at the 1st call) """
+    if path not in _indexers:
+        _indexers[path] = DocumentIndexer(
+            path,
+            encoder = embedding_model.embed,
+            tokenizer   = getattr(embedding_model, 'tokenizer', None),
+            ** kwargs
+        )
+    return _indexers[path]
@@ -14,7 +14,7 @@ import uuid
 from typing import List, Dict, Any
 from dataclasses import dataclass, field
 
-from .message import Message
+from .message import Message, MessageList
 from utils import load_json, dump_json
 
 CONTENT_KEYS    = ('text', 'image', 'audio', 'video', 'image_url', 'audio_url', 'video_url')
@@ -60,6 +60,10 @@ class Conversation:
     
     __state_fields__    = ('messages', 'instructions', 'documents')
     
+    def __post_init__(self):
+        if not isinstance(self.messages, MessageList):
+            self.messages = MessageList(self.messages)
+    
     @property
     def users(self):
         return set(msg.user for msg in self.messages if msg.user is not None)
@@ -165,6 +169,12 @@ class Conversation:
         raise IndexError('The instruction `{}` is not in the conversation'.format(instruction))
     
     def save(self, filename):
+        """ Save the conversation either in `.json`, either in `.jsonl` (see `ConversationLog`) """
+        if filename.endswith('.jsonl'):
+            from .conversation_log import ConversationLog
+            
+            return ConversationLog(filename).save(self, rewrite = True)
+        
         return dump_json(filename, self, indent = 2)
     
     def set_state(self, state):
@@ -172,9 +182,14 @@ class Conversation:
 
     @classmethod
     def load(cls, filename):
+        if isinstance(filename, str) and filename.endswith('.jsonl'):
+            from .conversation_log import ConversationLog
+            
+            return ConversationLog(filename).load()
+        
         conv = load_json(filename, default = {}) if isinstance(filename, str) else filename
-        for k in ('messages', 'instructions'):
-            conv[k] = [Message(** msg) for msg in conv[k]]
+        conv['messages']     = MessageList(conv['messages'])
+        conv['instructions'] = [Message(** msg) for msg in conv['instructions']]
         
         return cls(** conv)
 
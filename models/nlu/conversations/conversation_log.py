@@ -0,0 +1,276 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import logging
+import threading
+
+from loggers import timer
+from utils import to_json
+from .message import Message, MessageList
+from .conversation import Conversation
+
+logger = logging.getLogger(__name__)
+
+_add_prefix = '{{"op": "add", "key": "{}", "value": '
+
+class ConversationLog:
+    """
+        Append-only persistence of a `Conversation` in a `.jsonl` file
+        
+        Each line is a json-encoded record :
+            - `{"op" : "set", "value" : {...}}` : the conversation attributes (all fields except `__state_fields__`)
+            - `{"op" : "add", "key" : "messages", "value" : {...}}`  : an item appended to a state field
+            - `{"op" : "reset", "key" : "messages"}` : all the items of a state field have been removed
+        
+        `save` only appends the records describing what changed since the last call. Items are expected to be appended : if an already saved item has been removed (e.g., `remove_document` or `set_state`), the field is reset and re-written. The obsolete records are then removed by a (background) compaction, which re-writes the file with only the live records.
+        
+        At loading, the messages are not decoded : they are given as raw json to `MessageList`, which only decodes the messages that are accessed.
+    """
+    def __init__(self, filename, *, min_compaction_records = 64, compaction_ratio = 0.5):
+        """
+            Arguments :
+                - filename  : the `.jsonl` file
+                - min_compaction_records    : minimal number of obsolete records to trigger compaction
+                - compaction_ratio  : minimal ratio of obsolete records to trigger compaction
+        """
+        self.filename   = filename
+        self.min_compaction_records = min_compaction_records
+        self.compaction_ratio   = compaction_ratio
+        
+        self._mutex = threading.Lock()
+        self._compaction    = None
+        
+        self._attrs     = None
+        self._persisted = {}
+        self._num_records   = 0
+        self._num_obsolete  = 0
+    
+    @property
+    def num_records(self):
+        return self._num_records
+    
+    @property
+    def num_obsolete(self):
+        return self._num_obsolete
+    
+    @property
+    def is_compacting(self):
+        return self._compaction is not None and self._compaction.is_alive()
+    
+    def __repr__(self):
+        return '<ConversationLog file={} records={} obsolete={}>'.format(
+            self.filename, self._num_records, self._num_obsolete
+        )
+    
+    @timer
+    def load(self):
+        """ Replay the log and return the `Conversation` """
+        self.wait_compaction()
+        
+        attrs, state = {}, {k : [] for k in Conversation.__state_fields__}
+        msg_prefix   = _add_prefix.format('messages')
+        
+        num_records, num_obsolete = 0, 0
+        with open(self.filename, 'r', encoding = 'utf-8') as file:
+            for line in file:
+                line = line.rstrip('\n')
+                if not line: continue
+                
+                num_records += 1
+                # messages are kept as raw json, and only decoded when accessed
+                if line.startswith(msg_prefix):
+                    state['messages'].append(line[len(msg_prefix) : -1])
+                    continue
+                
+                record = json.loads(line)
+                if record['op'] == 'add':
+                    state[record['key']].append(record['value'])
+                elif record['op'] == 'set':
+                    if attrs: num_obsolete += 1
+                    attrs = record['value']
+                elif record['op'] == 'reset':
+                    num_obsolete += len(state[record['key']]) + 1
+                    state[record['key']] = []
+        
+        conv = Conversation(
+            messages    = MessageList(state['messages']),
+            documents   = state['documents'],
+            instructions    = [Message(** inst) for inst in state['instructions']],
+            ** attrs
+        )
+        
+        self._attrs     = attrs
+        self._persisted = {k : self._get_marker(getattr(conv, k)) for k in state}
+        self._num_records   = num_records
+        self._num_obsolete  = num_obsolete
+        
+        return conv
+    
+    @timer
+    def save(self, conv, *, rewrite = False, compact = True):
+        """
+            Append the changes of `conv` since the last `save` / `load`
+            
+            Arguments :
+                - conv  : the `Conversation` to save
+                - rewrite   : whether to re-write the entire file instead of appending the changes
+                - compact   : whether to start a background compaction (if there are too many obsolete records)
+            Return :
+                - num_records   : the number of appended records
+        """
+        if rewrite or self._attrs is None:
+            self.wait_compaction()
+            return self._rewrite(conv)
+        
+        attrs = self.get_attributes(conv)
+        # the counters are also updated by the compaction (in a separate thread)
+        with self._mutex:
+            records = []
+            if attrs != self._attrs:
+                records.append({'op' : 'set', 'value' : attrs})
+                if self._attrs: self._num_obsolete += 1
+            
+            markers = {}
+            for key in Conversation.__state_fields__:
+                items   = getattr(conv, key)
+                length, last = self._persisted.get(key, (0, None))
+                
+                if len(items) < length or (length and _get_id(items[length - 1]) != last):
+                    records.append({'op' : 'reset', 'key' : key})
+                    self._num_obsolete += length + 1
+                    length = 0
+                
+                records.extend(
+                    {'op' : 'add', 'key' : key, 'value' : items[i]} for i in range(length, len(items))
+                )
+                markers[key] = self._get_marker(items)
+            
+            if records:
+                _append_records(self.filename, records)
+                self._num_records += len(records)
+            
+            self._attrs = attrs
+            self._persisted.update(markers)
+        
+        if compact and self.should_compact():
+            self.compact(blocking = False)
+        
+        return len(records)
+    
+    def should_compact(self):
+        return self._num_obsolete >= max(
+            self.min_compaction_records, self.compaction_ratio * self._num_records
+        )
+    
+    def compact(self, blocking = True):
+        """ Re-write the file with only the live records (by default, in a separate thread) """
+        if self.is_compacting:
+            if blocking: self.wait_compaction()
+            return
+        
+        self._compaction = threading.Thread(
+            target = self._compact, name = 'compaction_{}'.format(self.filename), daemon = True
+        )
+        self._compaction.start()
+        if blocking: self.wait_compaction()
+    
+    def wait_compaction(self):
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+    
+    @timer
+    def _compact(self):
+        with self._mutex:
+            with open(self.filename, 'r', encoding = 'utf-8') as file:
+                lines = file.readlines()
+        
+        attrs, state = None, {k : [] for k in Conversation.__state_fields__}
+        for line in lines:
+            if not line.strip(): continue
+            
+            for key in state:
+                if line.startswith(_add_prefix.format(key)):
+                    state[key].append(line)
+                    break
+            else:
+                record = json.loads(line)
+                if record['op'] == 'set':
+                    attrs = line
+                elif record['op'] == 'reset':
+                    state[record['key']] = []
+        
+        compacted = ([attrs] if attrs else []) + [l for items in state.values() for l in items]
+        
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'w', encoding = 'utf-8') as file:
+            file.write(''.join(compacted))
+        
+        with self._mutex:
+            # the records appended during the compaction are copied at the end of the new file
+            with open(self.filename, 'r', encoding = 'utf-8') as file:
+                new_lines = file.readlines()[len(lines) :]
+            
+            if new_lines:
+                with open(tmp_file, 'a', encoding = 'utf-8') as file:
+                    file.write(''.join(new_lines))
+            
+            os.replace(tmp_file, self.filename)
+            self._num_obsolete  = max(0, self._num_obsolete - (len(lines) - len(compacted)))
+            self._num_records   = len(compacted) + len(new_lines)
+        
+        logger.info('[CONVERSATION] {} compacted ({} -> {} records)'.format(
+            self.filename, len(lines) + len(new_lines), self._num_records
+        ))
+    
+    def _rewrite(self, conv):
+        attrs   = self.get_attributes(conv)
+        records = [{'op' : 'set', 'value' : attrs}]
+        for key in Conversation.__state_fields__:
+            records.extend({'op' : 'add', 'key' : key, 'value' : it} for it in getattr(conv, key))
+        
+        tmp_file = self.filename + '.tmp'
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok = True)
+        with self._mutex:
+            _append_records(tmp_file, records, mode = 'w')
+            os.replace(tmp_file, self.filename)
+            
+            self._attrs     = attrs
+            self._persisted = {
+                k : self._get_marker(getattr(conv, k)) for k in Conversation.__state_fields__
+            }
+            self._num_records   = len(records)
+            self._num_obsolete  = 0
+        
+        return len(records)
+    
+    @staticmethod
+    def get_attributes(conv):
+        return to_json({
+            k : v for k, v in conv.__dict__.items() if k not in Conversation.__state_fields__
+        })
+    
+    @staticmethod
+    def _get_marker(items):
+        """ Return a `(length, last_item_id)` marker used to detect removed / replaced items """
+        return (len(items), _get_id(items[-1]) if len(items) else None)
+
+def _get_id(item):
+    return str(item.id) if isinstance(item, Message) else item
+
+def _append_records(filename, records, mode = 'a'):
+    lines = [
+        json.dumps(to_json(record), ensure_ascii = False) + '\n' for record in records
+    ]
+    with open(filename, mode, encoding = 'utf-8') as file:
+        file.write(''.join(lines))
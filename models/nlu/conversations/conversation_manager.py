@@ -12,9 +12,13 @@
 import os
 import logging
 import warnings
+import threading
 
 from loggers import Timer, timer
+from utils import LRUCache
+from .message import Message
 from .conversation import Conversation
+from .conversation_log import ConversationLog
 from .conv_item_selectors import select_items
 
 logger = logging.getLogger(__name__)
@@ -25,11 +29,40 @@ _in_memory_conv_id = '__in_memory__'
 _default_conv_id    = 'default'
 
 class ConversationManager:
-    def __init__(self, path, tokenizer):
+    def __init__(self,
+                 path,
+                 tokenizer,
+                 *,
+                 
+                 max_conversations  = 1024,
+                 max_bytes  = 256 * 1024 ** 2,
+                 ttl    = 3600
+                ):
+        """
+            Arguments :
+                - path  : the default directory where conversations are saved
+                - tokenizer : the `Tokenizer` used by the items selectors
+                
+                - max_conversations : the maximal number of conversations kept in memory
+                - max_bytes : the maximal (estimated) size of the conversations kept in memory
+                - ttl   : the time (in seconds) after which an unused conversation is evicted
+            
+            Evicted conversations are saved, and are reloaded at the next `get_conversation` call
+            The conversations used by a running request are pinned (see `get_conversation`), and are not evicted until they are released
+        """
         self.path   = path
         self.tokenizer = tokenizer
         
-        self._convs = {}
+        self._mutex = threading.RLock()
+        self._convs = LRUCache(
+            max_conversations,
+            max_bytes   = max_bytes,
+            size_fn     = get_conversation_size,
+            ttl     = ttl,
+            sliding_ttl = True,
+            on_evict    = self._on_evict
+        )
+        self._logs  = {}
     
     @timer
     def get_context(self,
@@ -120,19 +153,37 @@ class ConversationManager:
                          messages   = None,
                          instructions   = None,
                          
+                         pin    = False,
+                         
                          ** kwargs
                         ):
+        """ Return the conversation `conv_id` (from memory, loaded from `directory`, or created). If `pin`, it is not evicted until `release` is called """
         if directory is None: directory = self.path
         
+        with self._mutex:
+            conv = self._get_conversation(
+                conv_id, directory, messages = messages, instructions = instructions, ** kwargs
+            )
+            if pin: self._convs.pin((directory, conv.id))
+            return conv
+    
+    def _get_conversation(self, conv_id, directory, *, messages, instructions, ** kwargs):
+        self._convs.purge()
+        
         if conv_id is None:
             conv_id = _in_memory_conv_id
             if messages is not None: self._convs.pop((directory, conv_id), None)
-        elif (directory, conv_id) not in self._convs:
+        
+        conv = self._convs.get((directory, conv_id), None)
+        if conv is None and conv_id != _in_memory_conv_id:
             path = self.get_conv_file(directory, conv_id)
             if os.path.exists(path):
-                self._convs[(directory, conv_id)] = Conversation.load(path)
+                conv = self.get_log(directory, conv_id).load()
+            elif os.path.exists(self.get_legacy_conv_file(directory, conv_id)):
+                conv = Conversation.load(self.get_legacy_conv_file(directory, conv_id))
+            
+            if conv is not None: self._convs[(directory, conv_id)] = conv
         
-        conv = self._convs.get((directory, conv_id), None)
         if conv is None:
             kwargs = {k : v for k, v in kwargs.items() if k in Conversation.__dataclass_fields__}
             kwargs['id'] = conv_id
@@ -150,9 +201,65 @@ class ConversationManager:
         return conv
 
     def save(self, conv, directory = None):
+        """ Append the new items of `conv` to its `conversation.jsonl` file (see `ConversationLog`) """
+        if directory is None: directory = self.path
+        
         if conv.id != _in_memory_conv_id:
-            conv.save(self.get_conv_file(directory or self.path, conv.id))
+            with self._mutex:
+                log = self.get_log(directory, conv.id)
+            log.save(conv)
+        
+        with self._mutex:
+            self._convs.update_size((directory, conv.id))
+    
+    def release(self, conv, directory = None):
+        """ Release a conversation pinned by `get_conversation` """
+        with self._mutex:
+            self._convs.unpin((directory or self.path, conv.id))
+    
+    def get_cache_stats(self):
+        """ Return the conversations cache statistics (`hits`, `misses`, `evictions`, ...) """
+        return self._convs.get_stats()
+    
+    def _on_evict(self, key, conv):
+        """
+            Save the evicted conversation, which will be reloaded at the next `get_conversation`
+            
+            The evictions are triggered by the cache operations performed under `self._mutex` : the conversation is therefore saved before any `get_conversation` can reload it.
+        """
+        directory, conv_id = key
+        with self._mutex:
+            if conv_id != _in_memory_conv_id:
+                self.get_log(directory, conv_id).save(conv, compact = False)
+            self._logs.pop(key, None)
+    
+    def get_log(self, directory, conv_id):
+        key = (directory, conv_id)
+        if key not in self._logs:
+            self._logs[key] = ConversationLog(self.get_conv_file(directory, conv_id))
+        return self._logs[key]
     
     @staticmethod
     def get_conv_file(directory, conv_id):
+        return os.path.join(directory, conv_id, 'conversation.jsonl')
+    
+    @staticmethod
+    def get_legacy_conv_file(directory, conv_id):
         return os.path.join(directory, conv_id, 'conversation.json')
+
+def get_conversation_size(conv):
+    """ Return an estimation of the memory used by `conv`, i.e., its contents and cached lengths """
+    size = sum(len(doc) for doc in conv.documents)
+    for items in (getattr(conv.messages, '_items', conv.messages), conv.instructions):
+        for msg in items:
+            if not isinstance(msg, Message):
+                # raw message (not decoded yet)
+                size += len(msg) if isinstance(msg, str) else len(str(msg))
+                continue
+            
+            if isinstance(msg.content, str):
+                size += len(msg.content)
+            else:
+                size += sum(len(str(v)) for c in msg.content for v in c.values())
+            if 'length' in msg.metadata: size += 8
+    return size
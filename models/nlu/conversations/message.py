@@ -10,10 +10,12 @@
 # limitations under the License.
 
 import time
+import json
 import uuid
 
 from typing import Dict, Any, Union, List
 from dataclasses import dataclass, field
+from collections.abc import MutableSequence
 
 @dataclass
 class Message:
@@ -86,4 +88,62 @@ class Message:
         data.update(data.pop('metadata'))
         return data
     
-    to_dict = to_json
\ No newline at end of file
+    to_dict = to_json
+
+
+class MessageList(MutableSequence):
+    """
+        `list`-like container of `Message` that lazily instantiates them
+        
+        Items can either be `Message`, `dict` or json-serialized `Message` (`str`), the 2 latters being converted to `Message` the first time they are accessed. This allows to load long conversations without decoding the entire history : iterating over the messages in reverse order (e.g., in `select_last_messages`) only decodes the last ones.
+    """
+    def __init__(self, items = None):
+        self._items = list(items) if items is not None else []
+    
+    @property
+    def num_decoded(self):
+        return sum(isinstance(it, Message) for it in self._items)
+    
+    def _get(self, idx):
+        item = self._items[idx]
+        if not isinstance(item, Message):
+            if isinstance(item, str): item = json.loads(item)
+            item = Message(** item)
+            self._items[idx] = item
+        return item
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(len(self._items))[idx]]
+        return self._get(idx)
+    
+    def __setitem__(self, idx, value):
+        self._items[idx] = value
+    
+    def __delitem__(self, idx):
+        del self._items[idx]
+    
+    def __iter__(self):
+        for i in range(len(self._items)): yield self._get(i)
+    
+    def __reversed__(self):
+        for i in range(len(self._items) - 1, -1, -1): yield self._get(i)
+    
+    def __eq__(self, other):
+        if not isinstance(other, (list, MessageList)): return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    
+    def __repr__(self):
+        return '<MessageList length={} decoded={}>'.format(len(self), self.num_decoded)
+    
+    def insert(self, idx, value):
+        self._items.insert(idx, value)
+    
+    def copy(self):
+        return MessageList(self._items)
+    
+    def get_config(self):
+        return list(self)
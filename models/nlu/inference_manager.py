@@ -9,9 +9,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import time
 import logging
 import inspect
+import numpy as np
 
 from loggers import timer
 from utils import time_to_string
@@ -21,6 +23,8 @@ logger = logging.getLogger(__name__)
 END_OF_STREAM   = None
 END_OF_REQUEST  = inspect._empty
 
+_word_re    = re.compile(r'\s*\S+')
+
 class InferenceManager:
     def __init__(self,
                  conversation,
@@ -32,7 +36,8 @@ class InferenceManager:
                  callback   = None,
                  request_id = None,
                  request_manager    = None,
-                 wait_finalization  = False
+                 wait_finalization  = False,
+                 cancellation_token = None
                 ):
         if wait_finalization and not hasattr(request_manager, 'wait_finalize'):
             raise VaueError('`wait_finalization` requires a valid `request_manager`')
@@ -51,6 +56,7 @@ class InferenceManager:
         self.request_id = request_id
         self.request_manager    = request_manager
         self.wait_finalization  = wait_finalization
+        self.cancellation_token = cancellation_token
         
         self.conversation   = conversation
         self._initial_state = conversation.get_state()
@@ -61,6 +67,8 @@ class InferenceManager:
         self._aborted   = False
         self._all_results   = []
         self._inference_stream  = None
+        self._decoder_state = None
+        self.flight = None
         
         if self.stream_text:
             self._decode    = lambda out: tokenizer.decode(out)[0][0]
@@ -81,18 +89,37 @@ class InferenceManager:
     def initial_state(self):
         return self._initial_state
     
+    @property
+    def cancelled(self):
+        """ Whether the request is aborted or its `cancellation_token` is cancelled (checked by the `keras` decoding loop, see `TextGenerator.generate`) """
+        return self._aborted or (self.cancellation_token is not None and self.cancellation_token.cancelled)
+    
     def __len__(self):
         return len(self._all_results)
     
     def get_inference_config(self):
         return self._inference_config.copy()
     
-    def set_inference_stream(self, stream, /):
+    def set_inference_stream(self, stream, /, flight = None):
+        """
+            Set the inference stream, and forward its items to the callbacks (if streaming) and to `flight` (if provided)
+            
+            The stream is aborted as soon as `cancellation_token` is cancelled, until its result is retrieved (see `result`) or the request is aborted.
+        """
         self.stream = stream
+        self.flight = flight
         
-        if self._streaming: self.start_stream()
+        if self.cancellation_token is not None:
+            self.cancellation_token.add_callback(self._release)
+        
+        try:
+            if self._streaming: self.start_stream()
+        except Exception:
+            self._detach()
+            raise
     
     def abort(self):
+        """ Abort the request (the `cancellation_token` is owned by the caller, and may be shared : it is not cancelled) """
         if self._aborted: return
         
         self.conversation.set_state(self.initial_state)
@@ -101,8 +128,8 @@ class InferenceManager:
             logger.info('Request {} is aborted !'.format(self.request_id))
         
         self._aborted = True
-        if self.stream is not None and not self.stream.is_aborted():
-            self.stream.abort()
+        self._release()
+        self._detach()
         
         if self.request_manager is not None and self.request_id is not None:
             self.request_manager.pop(self.request_id)
@@ -110,11 +137,25 @@ class InferenceManager:
     def is_aborted(self):
         if self._aborted:
             return True
+        elif self.cancellation_token is not None and self.cancellation_token.cancelled:
+            self.abort()
+            return True
         elif hasattr(self.request_manager, 'is_aborted') and self.request_manager.is_aborted(self.request_id):
             self.abort()
             return True
         else:
             return False
+    
+    def _release(self):
+        """ Abort the inference stream, which releases its batch slot and cache memory in the runtime (called from the thread that cancels the token) """
+        stream = self.stream
+        if stream is not None and hasattr(stream, 'abort') and not stream.is_aborted():
+            stream.abort()
+    
+    def _detach(self):
+        """ Remove the `_release` callback from `cancellation_token` (which may outlive this request) """
+        if self.cancellation_token is not None:
+            self.cancellation_token.remove_callback(self._release)
 
     @timer
     def start_stream(self):
@@ -128,19 +169,10 @@ class InferenceManager:
                 self.stream.abort()
                 break
             
-            out = self._decode(tokens)
+            if self.flight is not None: self.flight.publish(tokens)
             
-            if self.request_manager is not None:
-                if self.request_manager(out, request_id = self.request_id) is False:
-                    self.abort()
-                    if logger.isEnabledFor(logging.INFO):
-                        logger.info('[LLM] Inference interrupted after {}'.format(
-                            time_to_string(time.time() - t0)
-                        ))
-                    return
-                
-            if self.callback is not None:
-                self.callback(out)
+            if not self._send(tokens, t0):
+                return
             
             if i == 0 and logger.isEnabledFor(logging.INFO):
                 t1 = time.time()
@@ -155,6 +187,71 @@ class InferenceManager:
                 n, time_to_string(t1 - t0), n / (t1 - t0)
             ))
 
+        self._end_stream()
+    
+    def follow(self, flight):
+        """
+            Forward the tokens published by `flight` (i.e., the same generation performed by another request), and return its result
+            
+            Return `None` if this request is aborted, and raises an exception if the leading request has failed / been aborted
+        """
+        if self._streaming:
+            t0 = time.time()
+            for tokens in flight:
+                if self.is_aborted() or not self._send(tokens, t0):
+                    return None
+        
+        result = flight.result()
+        if self._streaming: self._end_stream()
+        return result
+    
+    def replay(self, text, *, step = 4):
+        """
+            Stream `text` (e.g., a cached answer) to the callbacks as if it was generated, `step` words (or tokens) at a time
+            
+            With `stream_text`, the cumulated text is directly sliced from `text`, without encoding / decoding it. Otherwise, `text` is encoded once, and the cumulated tokens are sent (like the runtime streams).
+            Return `False` if the request is aborted, `True` otherwise
+        """
+        if not self._streaming: return True
+        
+        t0 = time.time()
+        if self.stream_text:
+            ends = [match.end() for match in _word_re.finditer(text)][step - 1 :: step]
+            if not ends or ends[-1] != len(text): ends.append(len(text))
+            outputs = (text[: end] for end in ends)
+        else:
+            tokens  = self.tokenizer.encode(text, add_sos_and_eos = False, return_type = 'list')
+            outputs = ([[tokens[: end]]] for end in range(step, len(tokens) + step, step))
+        
+        for out in outputs:
+            if self.is_aborted() or not self._forward(out, t0):
+                return False
+        
+        self._end_stream()
+        return True
+    
+    def _send(self, tokens, t0):
+        """ Send `tokens` to the `request_manager` and `callback`, and return whether the request is still running """
+        return self._forward(self._decode(tokens), t0)
+    
+    def _forward(self, out, t0):
+        """ Send the (decoded) `out` to the `request_manager` and `callback` """
+        if self.request_manager is not None:
+            if self.request_manager(out, request_id = self.request_id) is False:
+                self.abort()
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info('[LLM] Inference interrupted after {}'.format(
+                        time_to_string(time.time() - t0)
+                    ))
+                return False
+        
+        if self.callback is not None and self.callback(out) is False:
+            self.abort()
+            return False
+        
+        return True
+    
+    def _end_stream(self):
         if self.request_manager is not None:
             if self.request_manager(END_OF_STREAM, request_id = self.request_id) is False:
                 self.abort()
@@ -166,11 +263,67 @@ class InferenceManager:
     def append(self, result, /):
         self._all_results.append(result)
     
+    def save_decoder_state(self, prompt, tokens, output, output_tokens):
+        """
+            Record the prompt and the generated tokens of the current step (e.g., before a tool call)
+            
+            The next step (see `get_prompt_tokens`) then starts with exactly the same tokens, such that the runtime reuses their KV-cache blocks (e.g., `TensorRT-LLM` with `kv_cache_enable_block_reuse`), and only prefills the new messages (e.g., the tool output).
+        """
+        output_tokens = np.asarray(output_tokens, dtype = tokens.dtype)
+        while output_tokens.ndim > 1: output_tokens = output_tokens[0] # 1st beam
+        
+        if self.tokenizer is not None:
+            output_tokens = self._get_output_tokens(output, output_tokens)
+            if output_tokens is None:
+                self._decoder_state = None
+                return
+        
+        self._decoder_state = (prompt + output, np.concatenate([tokens, output_tokens]))
+    
+    def _get_output_tokens(self, output, output_tokens):
+        """
+            Return the tokens of `output_tokens` that exactly encode `output`
+            
+            The final stop / end tokens (e.g., end-of-turn) are usually not part of `output`, while the next prompt adds them back in its text (e.g., with the chat template) : keeping them would duplicate them in the spliced tokens. If `output` does not correspond to the tokens (with or without the end tokens), `None` is returned, and the next step encodes its whole prompt.
+        """
+        end_ids = {self.tokenizer.eos_token_idx, self.tokenizer.sep_token_idx}
+        if getattr(self.tokenizer, 'pad_token', None) is not None:
+            end_ids.add(self.tokenizer.blank_token_idx)
+        end_ids.discard(-1)
+        
+        end = len(output_tokens)
+        while end > 0 and output_tokens[end - 1] in end_ids: end -= 1
+        
+        for candidate in (output_tokens[: end], output_tokens):
+            if self.tokenizer.decode(candidate) == output: return candidate
+        
+        logger.debug('The generated tokens do not match the output : the decoder state is not saved')
+        return None
+    
+    def get_prompt_tokens(self, prompt):
+        """ Return the tokens of `prompt` by extending the tokens of the previous step (`None` if `prompt` does not extend it) """
+        if self._decoder_state is None or self.tokenizer is None: return None
+        
+        text, tokens = self._decoder_state
+        if not prompt.startswith(text): return None
+        
+        new_tokens = self.tokenizer.encode_prompt(
+            prompt[len(text) :], add_sos = False, add_eos = False, return_type = 'np'
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('The prompt extends the previous step ({} cached tokens, {} new tokens)'.format(
+                len(tokens), len(new_tokens)
+            ))
+        return np.concatenate([tokens, np.asarray(new_tokens, dtype = tokens.dtype)])
+    
     def result(self):
-        if hasattr(self.stream, 'result'):
-            return [out.token_ids for out in self.stream.result().outputs]
-        else:
-            return self.stream
+        try:
+            if hasattr(self.stream, 'result'):
+                return [out.token_ids for out in self.stream.result().outputs]
+            else:
+                return self.stream
+        finally:
+            self._detach()
     
     def cumulated_results(self):
         return self._all_results.copy()
@@ -187,7 +340,54 @@ class InferenceManager:
             if hasattr(self.request_manager, 'finalize'):
                 self.request_manager.finalize(self.request_id)
         
+        self._detach()
+        
         if self.request_id is not None:
             logger.info('Request {} is finished !'.format(self.request_id))
 
         return True
+
+class TextDeltaCallback:
+    """
+        Stream callback that converts the decoded text (cumulated at each step) into text deltas, and forwards them to `buffer.put`
+        
+        The end of the decoded text may still change at the next step (e.g., merged characters or incomplete multi-bytes characters), while the deltas cannot be retracted : the text is therefore only sent up to its last whitespace, and the held back tail is flushed at the end of the stream. The concatenated deltas are then equal to the final text.
+        The text generated by successive inferences (e.g., tool calls) is separated by `separator`, similarly to the final output. `__call__` returns `False` if `buffer.put` returns `False`, which aborts the inference.
+    """
+    def __init__(self, buffer, *, separator = '\n\n'):
+        self.buffer = buffer
+        self.separator  = separator
+        
+        self._text  = ''
+        self._sent  = ''
+        self._num_streams   = 0
+        self.num_deltas = 0
+    
+    def __call__(self, text):
+        if text is END_OF_REQUEST:
+            return True
+        elif text is END_OF_STREAM:
+            result = self._send(self._text, len(self._text))
+            if self._sent: self._num_streams += 1
+            self._text, self._sent = '', ''
+            return result
+        
+        self._text = text
+        
+        end = len(text)
+        while end > 0 and not text[end - 1].isspace(): end -= 1
+        return self._send(text, end)
+    
+    def _send(self, text, end):
+        """ Send `text[: end]` (minus the text already sent) to `buffer` """
+        if end <= len(self._sent): return True
+        if not text.startswith(self._sent):
+            logger.warning('The streamed text has been modified after being sent : the deltas may differ from the final text')
+            return True
+        
+        delta = text[len(self._sent) : end]
+        if not self._sent and self._num_streams: delta = self.separator + delta
+        self._sent = text[: end]
+        
+        self.num_deltas += 1
+        return self.buffer.put(delta) is not False
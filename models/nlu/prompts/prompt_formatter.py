@@ -15,8 +15,8 @@ from datetime import datetime
 from functools import cached_property
 
 from loggers import Timer, timer
-from utils import timestamp_to_str
-from utils.text import format_text
+from utils import LRUCache, timestamp_to_str
+from utils.text import format_text, get_format_variables
 
 format_text = timer(format_text)
 
@@ -27,6 +27,9 @@ class PromptFormatter:
         self.audio_token = audio_token
         self.image_token = image_token
         self.video_token = video_token
+        
+        # formatted messages, keyed by `(message_format, message_id, content)`
+        self._formatted_messages    = LRUCache(4096)
     
     @property
     def template(self):
@@ -48,6 +51,12 @@ class PromptFormatter:
         if self.audio_token: supported.append('audio')
         return supported
     
+    def is_cacheable_format(self, format):
+        """ Return whether `format` only depends on the message (and on the constant special tokens) """
+        constants = {'text', 'message', 'audio_token', 'image_token', 'video_token'}
+        constants.update(self.tokenizer.tokens.keys())
+        return get_format_variables(format).issubset(constants)
+    
     def prepare_query(self, text, *, format = None, prefix = None, suffix = None, ** kwargs):
         if format: text = format_text(format, text = text, ** kwargs)
         if prefix: text = format_text(prefix, ** kwargs) + text
@@ -186,10 +195,19 @@ class PromptFormatter:
         
         with Timer('messages formatting'):
             if message_format:
+                cacheable = self.is_cacheable_format(message_format)
                 for i, message in enumerate(messages):
                     if i == 0 and message['role'] == 'system':
                         continue
                     
+                    key = None
+                    if cacheable and message.get('id', None) and isinstance(message['content'], str):
+                        key = (message_format, str(message['id']), message['content'])
+                        formatted = self._formatted_messages.get(key, None)
+                        if formatted is not None:
+                            messages[i] = formatted
+                            continue
+                    
                     message = message.copy()
                     if isinstance(message['content'], str):
                         message['content'] = format_text(
@@ -202,6 +220,7 @@ class PromptFormatter:
                         )})
 
                     messages[i] = message
+                    if key is not None: self._formatted_messages[key] = message
 
             if last_message_format:
                 last_msg  = messages[-1].copy()
@@ -11,17 +11,21 @@
 
 import os
 import re
+import asyncio
 import logging
 import inspect
 import warnings
+import numpy as np
 
 from copy import deepcopy
-from functools import partial
+from functools import partial, wraps
 
 from loggers import Timer, timer
+from utils.keras import ops
 from utils.text import parse_document, search_on_web
 from utils.callbacks import apply_callbacks
-from .inference_manager import InferenceManager
+from utils.threading import AsyncStreamBuffer, CancellationToken, RequestScheduler, SingleFlight, canonical_hash
+from .inference_manager import InferenceManager, TextDeltaCallback
 from .prompts import PromptFormatter, add_prompt_wrapper
 from .base_language_model import BaseLanguageModel
 from .tools import execute_code, extract_code, format_code_result, normalize_tools, remove_simulated_output
@@ -29,6 +33,50 @@ from .conversations import ConversationManager, Conversation, Message
 
 logger = logging.getLogger(__name__)
 
+# the `infer` arguments that do not impact the answer, ignored in the response cache scope
+# the history and paragraphs are taken from the selected context (i.e., what the prompt actually contains)
+_response_cache_ignored_kwargs  = {
+    'paragraphs', 'conv', 'conv_id', 'messages', 'instructions', 'directory', 'save',
+    'stream_text', 'stream_callback', 'request_id', 'request_manager', 'wait_finalization',
+    'cancellation_token', 'decode_chunk_size', 'callbacks', 'streaming', '_inference_manager'
+}
+
+def scheduled(fn):
+    """
+        Execute the synchronous calls to `fn` (i.e., `TextGenerator.infer`) in `self.scheduler` if `self.scheduler_config` is provided
+        
+        This way, the priorities and admission control also apply to the direct calls (e.g., from a workflow), and not only to the `submit` / `ainfer` / `astream` requests. The calls already executed by a scheduler (e.g., `rag` calling `infer`, or a tool calling the model) and the tool-calling recursion are executed directly.
+    """
+    @wraps(fn)
+    def inner(self, * args, tenant = None, priority = 0, deadline = None, ** kwargs):
+        if (
+            self.scheduler_config is None
+            or kwargs.get('_inference_manager', None) is not None
+            or RequestScheduler.is_scheduled()
+        ):
+            return fn(self, * args, ** kwargs)
+        
+        return self.submit(
+            * args, method = partial(fn, self), tenant = tenant, priority = priority, deadline = deadline, ** kwargs
+        ).result()
+    
+    return inner
+
+def releases_conversation(fn):
+    """ Release the conversation pinned by the root call of `fn` (i.e., `TextGenerator.infer`) when it returns or raises, such that it is not evicted while the request uses it """
+    @wraps(fn)
+    def inner(self, * args, ** kwargs):
+        if kwargs.get('_inference_manager', None) is not None:
+            return fn(self, * args, ** kwargs)
+        
+        pinned = []
+        try:
+            return fn(self, * args, _pinned = pinned, ** kwargs)
+        finally:
+            for conv, directory in pinned: self.conv_manager.release(conv, directory)
+    
+    return inner
+
 class TextGenerator(BaseLanguageModel):
     _directories    = {
         ** BaseLanguageModel._directories,
@@ -43,9 +91,21 @@ class TextGenerator(BaseLanguageModel):
     
     output_signature    = BaseLanguageModel.text_signature
     
-    def __init__(self, * args, ** kwargs):
+    def __init__(self,
+                 * args,
+                 max_concurrent_requests    = 32,
+                 scheduler_config   = None,
+                 single_flight  = True,
+                 single_flight_ttl  = 0,
+                 ** kwargs
+                ):
         super().__init__(* args, ** kwargs)
         
+        self.max_concurrent_requests    = max_concurrent_requests
+        self.single_flight  = SingleFlight(ttl = single_flight_ttl) if single_flight else None
+        self.scheduler_config   = scheduler_config
+        self._scheduler = None
+        
         self.conv_manager   = ConversationManager(self.conv_dir, self.tokenizer)
         self.prompt_formatter   = PromptFormatter(
             self.tokenizer,
@@ -73,6 +133,8 @@ class TextGenerator(BaseLanguageModel):
     
     @timer
     @add_prompt_wrapper('default')
+    @scheduled
+    @releases_conversation
     def infer(self,
               text  = None,
               *,
@@ -96,6 +158,7 @@ class TextGenerator(BaseLanguageModel):
               request_manager   = None,
               stream_callback   = None,
               wait_finalization = False,
+              cancellation_token    = None,
 
               save  = None,
               conv_id   = None,
@@ -103,8 +166,12 @@ class TextGenerator(BaseLanguageModel):
               
               callbacks = None,
               predicted = None,
+              cached_answer = None,
+              response_cache    = None,
+              cache_encoder = None,
               
               _inference_manager    = None,
+              _pinned   = None,
               
               ** kwargs
              ):
@@ -136,8 +203,14 @@ class TextGenerator(BaseLanguageModel):
                 - stream_text   : whether to pass string (decoded text) or tokens to `stream_callback`
                 - request_id    : used to identify the request for `request_manager`
                 - request_manager   : `callable` that manages the request, see below for more info
-                - stream_callback   : `callable` called at each inference step
+                - stream_callback   : `callable` called at each inference step (the request is aborted if it returns `False`)
                 - wait_finalization : whether to wait request finalization or not (see below)
+                - cancellation_token    : `CancellationToken` that aborts the request when cancelled (e.g., when the user leaves)
+                - decode_chunk_size : the number of decoding steps between 2 checks of `cancellation_token` (`keras` runtime only, enables the eager chunked decoding)
+                
+                - cached_answer : the answer (e.g., from a `SemanticCache`), streamed as if it was generated instead of running the model
+                - response_cache    : `SemanticCache` returning the answer to a similar query with the same prompt context (see below)
+                - cache_encoder     : the encoder used to embed the queries if `response_cache` has no `encoder`
                 
                 - kwargs    : forwarded to `self.get_input` and `self.model`
             Return :
@@ -156,6 +229,8 @@ class TextGenerator(BaseLanguageModel):
                     finalize the request if not aborted (called at most once per request_id)
                 - `pop(request_id)` :
                     Pop the request from the manager. Called when the request is aborted
+            
+            The `response_cache` is checked once the context is selected : the cached answer is only used if the prompt has the same paragraphs, history (messages and instructions) and configuration (task prompts, `lang`, ... see `get_response_cache_scope`). It is not used for the tool-augmented requests.
         """
         ##############################
         #    State initialization    #
@@ -163,6 +238,7 @@ class TextGenerator(BaseLanguageModel):
         
         query       = None
         _root_call  = False
+        cache_request   = None
         if _inference_manager is None:
             if save is None: save = conv_id is not None or conv is not None
             
@@ -184,8 +260,9 @@ class TextGenerator(BaseLanguageModel):
 
             if conv is None:
                 conv = self.conv_manager.get_conversation(
-                    conv_id = conv_id, directory = directory, ** kwargs
+                    conv_id = conv_id, directory = directory, pin = _pinned is not None, ** kwargs
                 )
+                if _pinned is not None: _pinned.append((conv, directory))
             
             if save:
                 os.makedirs(os.path.join(directory, conv.id), exist_ok = True)
@@ -215,7 +292,8 @@ class TextGenerator(BaseLanguageModel):
                 callback    = stream_callback,
                 request_id  = request_id,
                 request_manager = request_manager,
-                wait_finalization   = wait_finalization
+                wait_finalization   = wait_finalization,
+                cancellation_token  = cancellation_token
             )
             
             kwargs.update(_inference_manager.get_inference_config())
@@ -237,6 +315,30 @@ class TextGenerator(BaseLanguageModel):
             context.setdefault('messages', []).append(
                 conv.add_message(text = query, role = 'user', ** kwargs)
             )
+            
+            if (
+                response_cache is not None
+                and cached_answer is None
+                and isinstance(text, str)
+                and not (tools or allow_code_execution)
+            ):
+                cache_request = {
+                    'query'     : text,
+                    'context'   : context.get('paragraphs', kwargs.get('paragraphs', None)),
+                    'scope'     : get_response_cache_scope(
+                        context,
+                        stop_words  = stop_words,
+                        max_new_tokens  = max_new_tokens,
+                        possible_answers    = possible_answers,
+                        add_answer_start    = add_answer_start,
+                        ** kwargs
+                    ),
+                    'embedding' : response_cache.embed(text, encoder = cache_encoder)
+                }
+                entry = response_cache.lookup(** cache_request)
+                if entry is not None:
+                    logger.info('Cached answer found for {} (score {:.3f})'.format(text, entry['score']))
+                    cached_answer, cache_request = entry['answer'], None
         else:
             tool_names = ['print'] + [tool.name for tool in tools]
         
@@ -247,7 +349,10 @@ class TextGenerator(BaseLanguageModel):
         prompt, multimodal_data = self.prompt_formatter.get_prompt(
             allow_code_execution = allow_code_execution, ** {** kwargs, ** context}
         )
-        tokens = self.tokenizer.encode(prompt, add_eos = False, return_type = 'np')
+        # after a tool call, the prompt extends the previous step : its tokens (and KV-cache blocks) are reused
+        tokens = _inference_manager.get_prompt_tokens(prompt) if not multimodal_data else None
+        if tokens is None:
+            tokens = self.tokenizer.encode_prompt(prompt, add_eos = False, return_type = 'np')
         
         infer_kwargs = kwargs.copy()
         if multimodal_data:
@@ -267,24 +372,25 @@ class TextGenerator(BaseLanguageModel):
         #     Inference    #
         ####################
         
-        out = self.compiled_infer(
-            tokens[None], tokenizer = self.tokenizer, max_new_tokens = max_new_tokens, ** infer_kwargs
-        )
-        if self.runtime == 'trt_llm':
-            _inference_manager.set_inference_stream(out)
-            out = _inference_manager.result()
-        
-        if _inference_manager.is_aborted():
-            return {}
+        if cached_answer is not None:
+            if not _inference_manager.replay(cached_answer):
+                return {}
+            
+            pred = cached_answer
+        else:
+            out = self.generate(tokens, max_new_tokens, _inference_manager, ** infer_kwargs)
 
-        pred = self.decode_output(out)[0]
-        if isinstance(pred, list):
-            if len(pred) > 1:
-                warnings.warn('Multiple outputs have been generated, which is not supported yet. Only the 1st one will be returned')
-            pred = pred[0]
-        
-        if add_answer_start and kwargs.get('answer_start', None):
-            pred = kwargs['answer_start'] + pred
+            if _inference_manager.is_aborted():
+                return {}
+            
+            pred = self.decode_output(out)[0]
+            if isinstance(pred, list):
+                if len(pred) > 1:
+                    warnings.warn('Multiple outputs have been generated, which is not supported yet. Only the 1st one will be returned')
+                pred = pred[0]
+            
+            answer_start = kwargs['answer_start'] if add_answer_start and kwargs.get('answer_start', None) else ''
+            pred = answer_start + pred
 
         code_block = None
         if tools or allow_code_execution:
@@ -293,6 +399,12 @@ class TextGenerator(BaseLanguageModel):
 
             _, code_block = extract_code(pred)
             if code_block: code_block = code_block[0]
+            
+            # the state is saved once the output is final, such that it matches the next prompt
+            if cached_answer is None and self.runtime == 'trt_llm':
+                _inference_manager.save_decoder_state(
+                    prompt, tokens, pred[len(answer_start) :], out[0]
+                )
 
         _inference_manager.append(pred)
         
@@ -357,7 +469,11 @@ class TextGenerator(BaseLanguageModel):
             return result
         elif not _inference_manager.finalize():
             return result
-        elif callbacks:
+        
+        if cache_request is not None and full_output:
+            response_cache.insert(answer = full_output, ** cache_request)
+        
+        if callbacks:
             apply_callbacks(callbacks, {}, result, save = False)
         
         if save:
@@ -365,6 +481,199 @@ class TextGenerator(BaseLanguageModel):
         
         return result
 
+    @add_prompt_wrapper('default')
+    def prepare_for_inference(self, text, ** kwargs):
+        """
+            Tokenize the prompt of `text` without history (i.e., its system prompt, paragraphs and query) in the preprocessing workers of `predict`
+            
+            The tokens of each prompt segment are cached by `Tokenizer.encode_prompt` : the `infer` call of `text` then only tokenizes the segments that depend on the conversation history.
+        """
+        if not isinstance(text, str): return text
+        
+        config = {k : v for k, v in kwargs.items() if k not in ('messages', 'callbacks', 'predicted')}
+        try:
+            prompt, multimodal_data = self.prompt_formatter.get_prompt(
+                self.prompt_formatter.prepare_query(text, ** config), messages = [], ** config
+            )
+            if not multimodal_data:
+                self.tokenizer.encode_prompt(prompt, add_eos = False, return_type = 'list')
+        except Exception as e:
+            logger.debug('The prompt of {} cannot be prepared : {}'.format(text, e))
+        
+        return text
+    
+    def generate(self, tokens, max_new_tokens, inference_manager, ** kwargs):
+        """
+            Generate the output tokens for the given input `tokens`
+            
+            If `self.single_flight` is enabled, identical concurrent generations (same tokens, `max_new_tokens` and generation config) are only computed once : the other requests follow the stream / result of the first one. The sampled generations (see `is_sampling_config`) are never merged, as each request expects its own sample.
+            
+            If the request has a `cancellation_token`, the `keras` generation is stopped as soon as the token is cancelled or the request is aborted (see `InferenceManager.cancelled`) :
+                - by default, the generation keeps its fully compiled path, and the token is registered (see `register_cancellation_token`), and checked at each decoding step by a host callback
+                - with an explicit `decode_chunk_size`, the generation is executed eagerly, and the decoding loop is executed by chunks of compiled steps, with the token checked between 2 chunks
+            The other runtimes abort their stream when the token is cancelled.
+        """
+        flight, is_leader = None, True
+        if self.single_flight is not None and not is_sampling_config(** kwargs):
+            flight, is_leader = self.single_flight.acquire(
+                get_generation_key(tokens, max_new_tokens = max_new_tokens, ** kwargs)
+            )
+        
+        # the chunked decoding requires eager execution, which is slower : it is only used if explicitly requested
+        decode_chunk_size = kwargs.pop('decode_chunk_size', None)
+        if self.runtime == 'keras' and decode_chunk_size and inference_manager.cancellation_token is not None:
+            kwargs.update(
+                run_eagerly = True,
+                decode_chunk_size   = decode_chunk_size,
+                cancellation_token  = inference_manager
+            )
+        
+        if not is_leader:
+            try:
+                return inference_manager.follow(flight)
+            except Exception as e:
+                logger.info('The identical generation has failed ({}), running it again'.format(e))
+                flight = None
+        
+        # otherwise, the token is checked inside the compiled decoding loop
+        cancellation_id = None
+        if self.runtime == 'keras' and 'cancellation_token' not in kwargs and inference_manager.cancellation_token is not None:
+            from architectures.generation_utils import register_cancellation_token
+            
+            cancellation_id = register_cancellation_token(inference_manager)
+            kwargs['cancellation_id'] = cancellation_id
+        
+        try:
+            out = self.compiled_infer(
+                tokens[None], tokenizer = self.tokenizer, max_new_tokens = max_new_tokens, ** kwargs
+            )
+            if self.runtime == 'trt_llm':
+                inference_manager.set_inference_stream(out, flight = flight)
+                out = inference_manager.result()
+        except Exception as e:
+            if flight is not None: self.single_flight.release(flight, exception = e)
+            raise
+        finally:
+            if cancellation_id is not None:
+                from architectures.generation_utils import unregister_cancellation_token
+                
+                unregister_cancellation_token(cancellation_id)
+        
+        if flight is not None:
+            if inference_manager.is_aborted():
+                self.single_flight.release(
+                    flight, exception = RuntimeError('The leading request has been aborted')
+                )
+            else:
+                self.single_flight.release(flight, result = out)
+        
+        return out
+    
+    @property
+    def scheduler(self):
+        """ `RequestScheduler` shared by all the `submit` / `ainfer` / `astream` requests of this model """
+        if self._scheduler is None:
+            self._scheduler = RequestScheduler(
+                max_workers = self.max_concurrent_requests,
+                name    = '{}_scheduler'.format(self.name),
+                ** (self.scheduler_config or {})
+            )
+        return self._scheduler
+    
+    def submit(self,
+               * args,
+               method   = 'infer',
+               
+               tenant   = None,
+               priority = 0,
+               deadline = None,
+               timeout  = None,
+               
+               ** kwargs
+              ):
+        """
+            Schedule the execution of `self.infer` (or `getattr(self, method)`) in `self.scheduler`
+            
+            Arguments :
+                - args / kwargs : forwarded to `self.infer` (or `getattr(self, method)`)
+                - method    : the inference method (e.g., "answer", "rag", ...)
+                
+                - tenant    : the tenant that submits the request (fair queuing between tenants)
+                - priority  : the priority class (e.g., 0 for interactive requests, 1 for batch jobs)
+                - deadline / timeout    : the absolute (`time.time()`) / relative time before which the inference should be completed (the request is dropped if its expected execution time cannot meet it)
+            Return :
+                - future    : `concurrent.futures.Future` of the inference result
+            
+            The cost of a request (used for fair queuing and admission control) is its `max_new_tokens`.
+            If `scheduler_config` is provided, the synchronous `infer` calls are also executed by `self.scheduler` (see `scheduled`), with the same `tenant`, `priority` and `deadline` arguments.
+        """
+        return self.scheduler.submit(
+            getattr(self, method) if isinstance(method, str) else method,
+            * args,
+            tenant  = tenant,
+            priority    = priority,
+            cost    = kwargs.get('max_new_tokens', None) or self.max_output_length or 2048,
+            deadline    = deadline,
+            timeout = timeout,
+            ** kwargs
+        )
+    
+    async def ainfer(self, * args, ** kwargs):
+        """
+            `asyncio` version of `self.submit` (see `self.submit` for the arguments)
+            
+            The inference is executed in a worker thread of `self.scheduler`, while the event loop is free to serve other requests.
+        """
+        return await asyncio.wrap_future(self.submit(* args, ** kwargs))
+    
+    async def astream(self, * args, method = 'infer', max_buffer_size = 256, ** kwargs):
+        """
+            Asynchronous iterator of the generated text deltas
+            
+            Arguments :
+                - args / kwargs : forwarded to `self.submit`
+                - method    : the inference method (e.g., "answer", "rag", ...)
+                - max_buffer_size   : maximal number of pending (non-consumed) deltas
+            Return :
+                - deltas    : an asynchronous generator of `str`
+            
+            The deltas are forwarded by an `AsyncStreamBuffer` : the inference thread only wakes up the event loop when the consumer is waiting, and the deltas generated in the meantime are concatenated. If `max_buffer_size` deltas are pending, the generation waits for the consumer (backpressure).
+            Stopping the iteration (e.g., `break` or task cancellation) cancels the `cancellation_token` of the request, which aborts the inference (see `self.generate`).
+            
+            Example usage :
+            ```python
+            async for delta in model.astream('Hello !', conv_id = 'client_1'):
+                print(delta, end = '', flush = True)
+            ```
+        """
+        buffer  = AsyncStreamBuffer(max_buffer_size, loop = asyncio.get_running_loop())
+        callback    = TextDeltaCallback(buffer)
+        token   = kwargs.pop('cancellation_token', None) or CancellationToken()
+        
+        future = self.submit(
+            * args,
+            method  = getattr(self, method),
+            stream_text = True,
+            stream_callback = callback,
+            cancellation_token  = token,
+            ** kwargs
+        )
+        # the buffer is also closed if the request is dropped by the scheduler
+        future.add_done_callback(lambda f: buffer.close())
+        try:
+            async for delta in buffer:
+                yield delta
+            
+            result = await asyncio.wrap_future(future)
+            # runtimes that do not support streaming only produce the final output
+            if not callback.num_deltas and result.get('predicted', None):
+                yield result['predicted']
+        finally:
+            if not future.done():
+                future.cancel()
+                buffer.cancel()
+                token.cancel('the consumer has stopped the stream')
+    
     answer  = add_prompt_wrapper('answer', fn = infer)
     
     ask_expert  = add_prompt_wrapper('expert',      fn = answer)
@@ -391,8 +700,15 @@ class TextGenerator(BaseLanguageModel):
             retriever   = None,
             retriever_config    = {},
             
+            response_cache  = None,
+            
             ** kwargs
            ):
+        """
+            Answer `question` based on the most relevant paragraphs (retrieved by `retriever`)
+            
+            If `response_cache` (a `SemanticCache`) is provided, the answer to a similar question with the same retrieved paragraphs is returned (and streamed) instead of running the model (see `self.infer`). The queries are embedded with `retriever.embed` if the cache has no `encoder`.
+        """
         assert paragraphs or documents or web_search
         
         if queries is None:             queries = [question]
@@ -422,7 +738,68 @@ class TextGenerator(BaseLanguageModel):
         else:
             infos = retrieved[0]
         
-        return self.answer(question, paragraphs = infos, ** kwargs)
+        return self.answer(
+            question,
+            paragraphs  = infos,
+            response_cache  = response_cache,
+            cache_encoder   = getattr(retriever, 'embed', None),
+            ** kwargs
+        )
+
+def get_response_cache_scope(context, ** kwargs):
+    """
+        Return the `SemanticCache` scope of a request, i.e., the hash of everything (but the query and paragraphs) that the answer depends on
+        
+        Arguments :
+            - context   : the selected context (see `ConversationManager.get_context`), where the last message is the query
+            - kwargs    : the `infer` arguments (e.g., the task prompts, `lang`, `target_lang`, ...)
+        Return :
+            - scope : the hash of the history (instructions and messages) and of the arguments that impact the answer
+        
+        This way, the answer cached for a task (e.g., `answer`) is not returned for another one (e.g., `translate`) with the same text, nor for a follow-up question in another conversation. The callables (e.g., `stop_condition`) are identified by their name, such that the scope is identical across processes.
+    """
+    history = [
+        (msg['role'], _to_scope_value(msg['content']))
+        for msg in list(context.get('instructions', [])) + list(context.get('messages', []))[:-1]
+    ]
+    return canonical_hash({
+        'history'   : history,
+        ** {k : _to_scope_value(v) for k, v in kwargs.items() if k not in _response_cache_ignored_kwargs}
+    })
+
+def _to_scope_value(value):
+    if isinstance(value, (list, tuple)):
+        return [_to_scope_value(v) for v in value]
+    elif isinstance(value, dict):
+        return {k : _to_scope_value(v) for k, v in value.items()}
+    elif callable(value):
+        return '{}.{}'.format(getattr(value, '__module__', None), getattr(value, '__qualname__', repr(value)))
+    return value
+
+def get_generation_key(tokens, ** kwargs):
+    """
+        Return the single-flight key of a generation, ignoring the arguments that do not impact it (e.g., `streaming`)
+        
+        All the other arguments are part of the key : the tensors are hashed by their content, and the other objects by their `repr` (see `canonical_hash`). This way, 2 generations with different (non-scalar) configurations never share the same key.
+    """
+    return canonical_hash(tokens, ** {
+        k : _to_hashable_config(v) for k, v in kwargs.items() if k != 'streaming'
+    })
+
+def is_sampling_config(method = None, temperature = None, top_k = None, top_p = None, sampling_config = None, ** _):
+    """ Return whether the generation is random (i.e., 2 identical requests may produce different outputs) """
+    if method == 'sample' or sampling_config is not None: return True
+    return bool(temperature) or (top_k or 0) > 1 or bool(top_p)
+
+def _to_hashable_config(value):
+    if isinstance(value, (list, tuple)):
+        return [_to_hashable_config(v) for v in value]
+    elif isinstance(value, dict):
+        return {k : _to_hashable_config(v) for k, v in value.items()}
+    elif not isinstance(value, np.ndarray) and ops.is_array(value):
+        # the `repr` of large tensors is truncated
+        return ops.convert_to_numpy(value)
+    return value
 
 def _contains_tool(text, tool_names):
     return any(name + '(' in text for name in tool_names)
@@ -42,4 +42,4 @@ def get_weather(location : str, date : datetime = None):
     else:
         return response.json()['message']
 
-OpenWeatherMapTool = Tool.from_function(get_weather)
\ No newline at end of file
+OpenWeatherMapTool = Tool.from_function(get_weather, cache_ttl = 600)
\ No newline at end of file
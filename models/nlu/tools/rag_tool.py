@@ -43,20 +43,76 @@ def rag(query   : Union[str, list],
         reverse = True,
         retriever   = None
        ):
-    if isinstance(query, str): query = [query]
+    return rag_batch([{
+        'query' : query, 'documents' : documents, 'k' : k, 'reverse' : reverse, 'retriever' : retriever
+    }])[0]
+
+def rag_batch(calls):
+    """
+        Batched version of `rag`, where the calls on the same documents share a single `retriever.predict` and `retriever.retrieve` call
+        
+        Arguments :
+            - calls : `list` of `dict`, the arguments of each `rag` call
+        Return :
+            - results   : `list` of results (one per call)
+    """
+    groups = {}
+    for i, call in enumerate(calls):
+        query = call['query']
+        if isinstance(query, str): query = [query]
+        
+        k   = max(2, int(math.ceil(call.get('k', 5) / len(query))))
+        retriever = call.get('retriever', None)
+        
+        documents = call['documents']
+        if isinstance(documents, str): documents = [documents]
+        
+        key = (
+            tuple(documents),
+            k,
+            call.get('reverse', True),
+            retriever if isinstance(retriever, str) else id(retriever)
+        )
+        groups.setdefault(key, (retriever, []))[1].append((i, query))
     
-    if isinstance(retriever, str):
-        from models import get_pretrained
-        retriever = get_pretrained(retriever)
-
-    db  = retriever.predict(documents = documents, save = False)
-    retrieved = retriever.retrieve(
-        query, db, reverse = reverse, k = max(2,int(math.ceil(k / len(query)))), run_eagerly = True
-    )
+    results = [None] * len(calls)
+    for (documents, k, reverse, _), (retriever, group) in groups.items():
+        if isinstance(retriever, str):
+            from models import get_pretrained
+            retriever = get_pretrained(retriever)
+
+        db  = retriever.predict(documents = list(documents), save = False)
+        retrieved = retriever.retrieve(
+            [q for _, query in group for q in query], db, reverse = reverse, k = k, run_eagerly = True
+        )
+        
+        idx = 0
+        for i, query in group:
+            results[i] = []
+            for res in retrieved[idx : idx + len(query)]:
+                results[i].extend(res)
+            idx += len(query)
     
-    results = []
-    for res in retrieved:
-        results.extend(res)
     return results
 
-RAGTool = Tool.from_function(rag, ignore = ['retriever', 'reverse'])
\ No newline at end of file
+def get_cache_inputs(arguments):
+    """ Identify the documents by their path, size and last modification time, such that an edited document is processed again """
+    documents = arguments.get('documents', None)
+    if documents is None: return arguments
+    if isinstance(documents, str): documents = [documents]
+    
+    return {
+        ** arguments,
+        'documents' : [
+            (f, os.path.getmtime(f), os.path.getsize(f)) if isinstance(f, str) and os.path.isfile(f) else f
+            for f in documents
+        ]
+    }
+
+RAGTool = Tool.from_function(
+    rag,
+    ignore  = ['retriever', 'reverse'],
+    batch_function  = rag_batch,
+    cache_ttl   = 300,
+    cache_inputs    = get_cache_inputs
+)
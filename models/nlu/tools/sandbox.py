@@ -0,0 +1,365 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import queue
+import pickle
+import atexit
+import signal
+import logging
+import builtins
+import multiprocessing
+
+from threading import Thread, Lock
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_pool   = None
+_pool_mutex = Lock()
+
+class SandboxError(RuntimeError):
+    """ Raised when the code cannot be executed in the sandbox (e.g., the worker cannot be started) """
+
+def get_sandbox_pool(num_workers = 2, ** kwargs):
+    """ Return the `SandboxPool` shared by all the `execute_code` calls (created at the 1st call) """
+    global _pool
+    with _pool_mutex:
+        if _pool is None:
+            _pool = SandboxPool(num_workers, ** kwargs)
+            atexit.register(_pool.terminate)
+        return _pool
+
+class SandboxPool:
+    """
+        Pool of pre-warmed worker processes executing the code written by the LLMs
+        
+        Each worker imports the safe modules (see `tool_executor._safe_modules`) once at startup, then executes one code at a time with its own `stdout` / `stderr` capture. This way, concurrent requests do not interleave their outputs, and do not pay the import cost at each call.
+        The tools are executed in the current process (as they may use the models) : the workers only receive the tool names, and forward the tool calls through their pipe.
+        
+        The execution is limited in time (the worker is restarted if it exceeds `time_limit`), in CPU time and in memory (with `resource.setrlimit`, only available on Unix).
+        
+        Example usage :
+        ```python
+        pool = SandboxPool(4, time_limit = 5)
+        result = pool.execute('print(sum(range(10)))')
+        print(result['stdout']) # print(sum(range(10))) # 45
+        ```
+    """
+    def __init__(self,
+                 num_workers    = 2,
+                 *,
+                 
+                 time_limit = 30,
+                 cpu_limit  = 30,
+                 memory_limit   = 2 * 1024 ** 3,
+                 
+                 max_calls  = 256,
+                 wait_timeout   = 10,
+                 start_method   = None
+                ):
+        """
+            Arguments :
+                - num_workers   : the number of worker processes
+                
+                - time_limit    : the default maximal execution time (in seconds) of a call, excluding the time spent in the tools
+                - cpu_limit     : the default maximal CPU time (in seconds) of a call
+                - memory_limit  : the default maximal additional memory (in bytes) of a call
+                
+                - max_calls     : the number of calls after which a worker is restarted (as a code may modify the imported modules)
+                - wait_timeout  : the maximal time (in seconds) to wait for an idle worker, before raising a `SandboxError`
+                - start_method  : the `multiprocessing` start method of the workers (default to `forkserver`, or `spawn` if not available)
+        """
+        # `fork` is not used by default, as forking a multi-threaded process (e.g., with running models) may deadlock
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        
+        self.num_workers    = num_workers
+        self.time_limit = time_limit
+        self.cpu_limit  = cpu_limit
+        self.memory_limit   = memory_limit
+        self.max_calls  = max_calls
+        self.wait_timeout   = wait_timeout
+        
+        self._context   = multiprocessing.get_context(start_method)
+        self._idle  = queue.Queue()
+        self._workers   = []
+        self._mutex = Lock()
+        self._started   = False
+    
+    def __len__(self):
+        return self.num_workers
+    
+    def __repr__(self):
+        return '<SandboxPool workers={} idle={}>'.format(self.num_workers, self._idle.qsize())
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, * args):
+        self.terminate()
+    
+    def start(self):
+        """ Start (and warm up) the workers """
+        with self._mutex:
+            if self._started: return self
+            self._started = True
+            
+            try:
+                for _ in range(self.num_workers):
+                    self._idle.put(self._start_worker())
+            except SandboxError:
+                self._started = False
+                raise
+        return self
+    
+    def terminate(self):
+        with self._mutex:
+            workers, self._workers = self._workers, []
+            self._started = False
+        
+        for worker in workers:
+            worker.terminate()
+        
+        while not self._idle.empty():
+            self._idle.get_nowait()
+    
+    def execute(self,
+                code,
+                tools   = None,
+                *,
+                
+                globals_dict    = None,
+                add_traceback   = False,
+                
+                time_limit  = None,
+                cpu_limit   = None,
+                memory_limit    = None
+               ):
+        """
+            Execute `code` in an idle worker, and return its result (see `tool_executor.run_code`)
+            
+            Arguments :
+                - code  : the (already checked) python code to execute
+                - tools : `dict` of `{name : callable}`, executed in the current process when called by the code
+                - globals_dict  : additional global variables (should be picklable)
+                - add_traceback : whether to add the traceback of the exceptions in `stderr`
+                
+                - time_limit / cpu_limit / memory_limit : the limits of this call (default to the pool limits)
+            Return :
+                - result    : `dict` with `variables`, `stdout` and `stderr` entries
+        """
+        if time_limit is None:      time_limit = self.time_limit
+        if cpu_limit is None:       cpu_limit = self.cpu_limit
+        if memory_limit is None:    memory_limit = self.memory_limit
+        if tools is None: tools = {}
+        
+        try:
+            request = pickle.dumps(('exec', {
+                'code'  : code,
+                'tools' : list(tools.keys()),
+                'globals_dict'  : globals_dict,
+                'add_traceback' : add_traceback,
+                'cpu_limit' : cpu_limit,
+                'memory_limit'  : memory_limit
+            }))
+        except Exception as e:
+            raise SandboxError('the global variables are not picklable ({})'.format(e))
+        
+        if not self._started: self.start()
+        if not self._workers: raise SandboxError('no worker is available')
+        
+        try:
+            worker  = self._idle.get(timeout = self.wait_timeout)
+        except queue.Empty:
+            raise SandboxError('no worker is available after {} seconds'.format(self.wait_timeout))
+        
+        try:
+            worker.conn.send_bytes(request)
+            
+            deadline = time.time() + time_limit if time_limit else None
+            while True:
+                timeout = max(0., deadline - time.time()) if deadline else None
+                if not worker.conn.poll(timeout):
+                    worker.terminate()
+                    return {
+                        'variables' : {},
+                        'stdout'    : '',
+                        'stderr'    : 'TimeoutError : the execution exceeded {} seconds'.format(time_limit)
+                    }
+                
+                message = worker.conn.recv()
+                if message[0] == 'done':
+                    worker.num_calls += 1
+                    return message[1]
+                elif message[0] == 'call':
+                    start = time.time()
+                    worker.conn.send(_call_tool(tools, * message[1:]))
+                    if deadline: deadline += time.time() - start
+                else:
+                    raise SandboxError('unknown message from the worker : {}'.format(message[0]))
+        except (EOFError, OSError) as e:
+            worker.terminate()
+            return {
+                'variables' : {},
+                'stdout'    : '',
+                'stderr'    : 'SandboxError : the worker stopped unexpectedly ({})'.format(e)
+            }
+        except Exception as e:
+            # the worker may still wait for a tool result : it is replaced, as its pipe is out of sync
+            worker.terminate()
+            if isinstance(e, SandboxError): raise
+            raise SandboxError('the communication with the worker failed ({})'.format(e)) from e
+        finally:
+            self._release(worker)
+    
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target = _worker_loop, args = (child_conn, ), name = 'sandbox', daemon = True
+        )
+        try:
+            process.start()
+        except Exception as e:
+            raise SandboxError('the worker cannot be started ({})'.format(e))
+        finally:
+            child_conn.close()
+        
+        worker = _Worker(process, parent_conn)
+        self._workers.append(worker)
+        return worker
+    
+    def _release(self, worker):
+        """ Put `worker` back in the idle queue, or replace it if it is stopped / used too many times """
+        if worker.is_alive() and (not self.max_calls or worker.num_calls < self.max_calls):
+            self._idle.put(worker)
+            return
+        
+        worker.terminate()
+        # the new worker is started in a separate thread, as its warm up takes some time
+        Thread(target = self._restart, args = (worker, ), daemon = True).start()
+    
+    def _restart(self, worker):
+        with self._mutex:
+            if worker in self._workers: self._workers.remove(worker)
+            if not self._started: return
+            
+            try:
+                self._idle.put(self._start_worker())
+            except SandboxError as e:
+                logger.error('Unable to restart a sandbox worker : {}'.format(e))
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process    = process
+        self.conn   = conn
+        self.num_calls  = 0
+    
+    def is_alive(self):
+        return self.process.is_alive()
+    
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+def _call_tool(tools, name, args, kwargs):
+    """ Execute the tool, and return its (picklable) result to send to the worker """
+    try:
+        return ('result', _to_picklable(tools[name](* args, ** kwargs)))
+    except Exception as e:
+        return ('error', (e.__class__.__name__, str(e)))
+
+def _make_tool_proxy(conn, name):
+    def tool_proxy(* args, ** kwargs):
+        conn.send(('call', name, args, kwargs))
+        status, value = conn.recv()
+        if status == 'error':
+            error_class = getattr(builtins, value[0], None)
+            if not isinstance(error_class, type) or not issubclass(error_class, Exception):
+                error_class = RuntimeError
+            raise error_class(value[1])
+        return value
+    
+    tool_proxy.__name__ = name
+    return tool_proxy
+
+def _on_cpu_limit(signum, frame):
+    raise TimeoutError('the CPU time limit is exceeded')
+
+def _set_limits(cpu_limit, memory_limit):
+    """ Limit the CPU time / address space of the worker for the next call, and return a function restoring the limits """
+    if resource is None: return lambda: None
+    
+    limits = {}
+    if cpu_limit:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        limits[resource.RLIMIT_CPU] = int(used.ru_utime + used.ru_stime + cpu_limit) + 1
+    if memory_limit and os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as file:
+            vm_size = int(file.read().split()[0]) * resource.getpagesize()
+        limits[resource.RLIMIT_AS] = vm_size + memory_limit
+    
+    previous = {}
+    for key, limit in limits.items():
+        previous[key] = resource.getrlimit(key)
+        hard = previous[key][1]
+        resource.setrlimit(key, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+    
+    def restore():
+        for key, value in previous.items(): resource.setrlimit(key, value)
+    
+    return restore
+
+def _worker_loop(conn):
+    from .tool_executor import run_code, create_safe_globals
+    
+    # the safe modules are imported once, such that the calls only execute the code
+    safe_globals = create_safe_globals()
+    if hasattr(signal, 'SIGXCPU'): signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    
+    while True:
+        try:
+            command, config = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            break
+        
+        restore = _set_limits(config['cpu_limit'], config['memory_limit'])
+        try:
+            result = run_code(
+                config['code'],
+                {name : _make_tool_proxy(conn, name) for name in config['tools']},
+                globals_dict    = config['globals_dict'],
+                add_traceback   = config['add_traceback'],
+                safe_globals    = safe_globals
+            )
+        except BaseException as e:
+            result = {
+                'variables' : {}, 'stdout' : '', 'stderr' : '{} : {}'.format(e.__class__.__name__, e)
+            }
+        finally:
+            restore()
+        
+        result['variables'] = {k : _to_picklable(v) for k, v in result['variables'].items()}
+        conn.send(('done', result))
+
+def _to_picklable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
@@ -9,16 +9,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import time
 import inspect
 
 from functools import cached_property
 from dataclasses import dataclass, field
 from typing import Dict, Any, List, Callable, Optional, Union
 
+from utils import LRUCache
+from utils.threading import canonical_hash
 from ..prompts import Prompt, get_prompt
 
 _globals_ignore = {'self', 'model'}
 
+_results_cache  = LRUCache(1024)
+
 @dataclass
 class Tool:
     name    : str
@@ -27,6 +33,9 @@ class Tool:
     instructs   : List  = field(default_factory = list, repr = False)
     ignore      : List  = field(default_factory = list, repr = False)
     metadata    : Dict[str, Any] = field(default_factory = dict, repr = False)
+    batch_function  : Optional[Callable] = field(default = None, repr = False)
+    cache_ttl   : Optional[float] = None
+    cache_inputs    : Optional[Callable] = field(default = None, repr = False)
     
     def __post_init__(self):
         if self.function is None:
@@ -46,7 +55,80 @@ class Tool:
     def __call__(self, * args, ** kwargs):
         if 'kwargs' not in self.argnames:
             kwargs = {k : v for k, v in kwargs.items() if k in self.argnames}
-        return self.function(* args, ** kwargs)
+        
+        if not self.cache_ttl: return self.function(* args, ** kwargs)
+        
+        key = self.get_cache_key(args, kwargs)
+        result = self.get_cached_result(key)
+        if result is None:
+            result = self.function(* args, ** kwargs)
+            self.set_cached_result(key, result)
+        return result
+    
+    def get_cache_key(self, args, kwargs):
+        """
+            Return the key of the call in the results cache (the `model` and the extra kwargs are ignored)
+            
+            If provided, `cache_inputs` maps the arguments (`dict`) to the values identifying the call (e.g., the modification time of the documents, such that an edited document is processed again).
+        """
+        kwargs = {k : v for k, v in kwargs.items() if k in self.argnames and k not in _globals_ignore}
+        # the arguments are mapped to their name, such that `f(x)` and `f(x = x)` have the same key
+        try:
+            kwargs, args = {** inspect.signature(self.function).bind_partial(* args, ** kwargs).arguments}, ()
+        except TypeError:
+            pass
+        if self.cache_inputs is not None: kwargs = self.cache_inputs(kwargs)
+        return canonical_hash(self.name, args, kwargs)
+    
+    def get_cached_result(self, key):
+        """ Return a copy of the result cached for `key`, or `None` if it is missing or older than `cache_ttl` """
+        entry = _results_cache.get(key, None)
+        if entry is None or time.time() - entry[0] > self.cache_ttl: return None
+        return copy.deepcopy(entry[1])
+    
+    def set_cached_result(self, key, result):
+        if result is not None: _results_cache.put(key, (time.time(), copy.deepcopy(result)))
+    
+    def batch(self, calls, ** kwargs):
+        """
+            Execute multiple calls of the tool, in a single call to `batch_function` if provided
+            
+            Arguments :
+                - calls : `list` of `(args, kwargs)` tuples
+                - kwargs    : additional kwargs forwarded to each call (e.g., the `model`)
+            Return :
+                - results   : `list` of results (one per call)
+            
+            The `batch_function` receives a `list` of `dict`, the arguments of each call (i.e., `args` are mapped to their parameter name).
+        """
+        if self.batch_function is None:
+            return [self(* args, ** {** kwargs, ** call_kwargs}) for args, call_kwargs in calls]
+        
+        signature = inspect.signature(self.function)
+        
+        results, inputs, keys = [None] * len(calls), {}, {}
+        for i, (args, call_kwargs) in enumerate(calls):
+            call_kwargs = {** kwargs, ** call_kwargs}
+            if 'kwargs' not in self.argnames:
+                call_kwargs = {k : v for k, v in call_kwargs.items() if k in self.argnames}
+            
+            if self.cache_ttl:
+                keys[i] = self.get_cache_key(args, call_kwargs)
+                results[i] = self.get_cached_result(keys[i])
+                if results[i] is not None: continue
+            
+            arguments = signature.bind_partial(* args, ** call_kwargs).arguments
+            for name, param in signature.parameters.items():
+                if param.kind == inspect.Parameter.VAR_KEYWORD and name in arguments:
+                    arguments.update(arguments.pop(name))
+            inputs[i] = arguments
+        
+        if inputs:
+            for i, result in zip(inputs.keys(), self.batch_function(list(inputs.values()))):
+                results[i] = result
+                if self.cache_ttl: self.set_cached_result(keys[i], result)
+        
+        return results
     
     def to_signature(self, lang = 'en'):
         return "def {}{}:\n    {}".format(
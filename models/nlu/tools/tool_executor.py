@@ -14,12 +14,20 @@ import re
 import ast
 import sys
 import inspect
+import logging
 import builtins
 import traceback
 import importlib
+import contextvars
 
+from threading import Lock
 from functools import partial
 from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.threading import canonical_hash
+
+logger = logging.getLogger(__name__)
 
 _orphan_re  = r'\n?[\s\S] → None\n'
 
@@ -42,6 +50,12 @@ _safe_modules   = {
     'statistics', 'decimal', 'typing'
 }
 
+_imported_modules   = None
+_redirect_mutex     = Lock()
+
+_tool_executor  = None
+_tool_executor_mutex    = Lock()
+
 def extract_code(text):
     """
         Extract text and python code parts from `text`
@@ -89,8 +103,35 @@ def execute_code(code,
                  add_traceback  = False,
                  allowed_modules = _safe_modules,
                  
+                 sandbox    = True,
+                 time_limit = None,
+                 cpu_limit  = None,
+                 memory_limit   = None,
+                 
                  ** kwargs
                 ):
+    """
+        Execute `code` (written by a LLM), and return its result
+        
+        Arguments :
+            - code  : the python code to execute
+            - tools : `list` of `Tool` available in the code
+            
+            - globals_dict  : additional global variables
+            - add_traceback : whether to add the traceback of the exceptions in `stderr`
+            - allowed_modules   : the modules that the code can import
+            
+            - sandbox   : whether to execute the code in a `SandboxPool` worker process (or the `SandboxPool` to use)
+            - time_limit    : the maximal execution time (in seconds), excluding the time spent in the tools
+            - cpu_limit     : the maximal CPU time (in seconds)
+            - memory_limit  : the maximal additional memory (in bytes)
+            
+            - kwargs    : forwarded to each tool
+        Return :
+            - result    : `dict` with `variables`, `stdout` and `stderr` entries
+        
+        The limits are only applied in the sandbox, which also isolates the `stdout` / `stderr` of each call. If the sandbox is not available (or if `globals_dict` cannot be sent to the worker), the code is executed in the current process.
+    """
     try:
         parsed_ast = ast.parse(code)
         
@@ -103,22 +144,98 @@ def execute_code(code,
                 'stdout'    : '',
                 'stderr'    : "⚠️ Unsafe code detected ⚠️\n{}".format(security_visitor)
             }
-        
-        code_lines = code.splitlines()
-        orphan_visitor = FunctionCallVisitor(code_lines)
-        orphan_visitor.visit(parsed_ast)
     except SyntaxError as e:
         return {'variables' : {}, 'stdout' : '', 'stderr' : str(e)}
+    
+    tools   = {tool.name : tool for tool in tools} if tools else {}
+    futures = {}
+    if tools:
+        calls = get_independent_tool_calls(parsed_ast, tools)
+        if len(calls) > 1: futures = dispatch_tool_calls(calls, tools, ** kwargs)
+    
+    tools = {
+        name : _prefetched_tool(name, partial(tool, ** kwargs), futures)
+        for name, tool in tools.items()
+    }
+    try:
+        return _execute_code(
+            code,
+            tools,
+            globals_dict    = globals_dict,
+            add_traceback   = add_traceback,
+            sandbox = sandbox,
+            time_limit  = time_limit,
+            cpu_limit   = cpu_limit,
+            memory_limit    = memory_limit
+        )
+    finally:
+        for future in futures.values(): future.cancel()
 
-    locals_dict     = {}
-    safe_globals    = create_safe_globals(globals_dict)
+def _execute_code(code,
+                  tools,
+                  *,
+                  
+                  globals_dict,
+                  add_traceback,
+                  
+                  sandbox,
+                  time_limit,
+                  cpu_limit,
+                  memory_limit
+                 ):
+    if sandbox:
+        from .sandbox import SandboxError, get_sandbox_pool
+        
+        pool = sandbox if not isinstance(sandbox, bool) else get_sandbox_pool()
+        try:
+            return pool.execute(
+                code,
+                tools,
+                globals_dict    = globals_dict,
+                add_traceback   = add_traceback,
+                time_limit  = time_limit,
+                cpu_limit   = cpu_limit,
+                memory_limit    = memory_limit
+            )
+        except SandboxError as e:
+            logger.warning('The code is executed in the current process : {}'.format(e))
+    
+    # `redirect_stdout` is global to the process, so the in-process executions are serialized
+    with _redirect_mutex:
+        return run_code(
+            code, tools, globals_dict = globals_dict, add_traceback = add_traceback
+        )
+
+def run_code(code, tools = None, *, globals_dict = None, add_traceback = False, safe_globals = None):
+    """
+        Execute `code` block by block, and capture its output
+        
+        Arguments :
+            - code  : the (already checked) python code to execute
+            - tools : `dict` of `{name : callable}` available in the code
+            - globals_dict  : additional global variables
+            - add_traceback : whether to add the traceback of the exceptions in `stderr`
+            - safe_globals  : the result of `create_safe_globals()` (computed if not provided)
+        Return :
+            - result    : `dict` with `variables`, `stdout` and `stderr` entries
+    """
+    if tools is None: tools = {}
     
-    if tools: safe_globals.update({tool.name : partial(tool, ** kwargs) for tool in tools})
+    parsed_ast  = ast.parse(code)
+    code_lines  = code.splitlines()
+    orphan_visitor = FunctionCallVisitor(code_lines)
+    orphan_visitor.visit(parsed_ast)
+    
+    locals_dict     = {}
+    safe_globals    = {
+        ** (safe_globals if safe_globals is not None else create_safe_globals()),
+        ** create_safe_globals(globals_dict, import_safe_modules = False, add_builtins = False),
+        ** tools
+    }
     
     stdout_buffer   = io.StringIO()
     stderr_buffer   = io.StringIO()
 
-    tool_names  = [tool.name for tool in tools]
     # Exécution de chaque bloc
     with redirect_stdout(stdout_buffer), redirect_stderr(stderr_buffer):
         for block in parsed_ast.body:
@@ -126,7 +243,7 @@ def execute_code(code,
                 code = '\n'.join([
                     line.rstrip() for line in code_lines[block.lineno - 1 : block.end_lineno]
                 ]).strip()
-                if isinstance(block, ast.FunctionDef) and block.name in tool_names:
+                if isinstance(block, ast.FunctionDef) and block.name in tools:
                     continue
                 elif block in orphan_visitor:
                     compiled_block = """
@@ -163,6 +280,180 @@ def execute_code(code,
         "stderr"    : stderr_buffer.getvalue()
     }
 
+def get_independent_tool_calls(parsed_ast, tool_names):
+    """
+        Return the tool calls of `parsed_ast` whose arguments do not depend on the code execution
+        
+        Arguments :
+            - parsed_ast    : the `ast.Module` of the code
+            - tool_names    : the names of the tools
+        Return :
+            - calls : `list` of `(name, args, kwargs)`
+        
+        The arguments are independent if they are literals, or variables assigned only once (at the top-level of the code) to a literal (possibly indexed). Such calls can therefore be executed before the code, e.g., concurrently.
+        Only the calls that are always executed are returned, i.e. the calls in the top-level statements, outside of conditional expressions, lambdas and comprehensions : the calls in the `if` / `for` / `while` / `try` / `def` blocks are never executed in advance.
+        
+        Example :
+        ```python
+        documents = ['report.pdf']
+        x = rag('query 1', documents)       # independent : ('rag', ('query 1', ['report.pdf']), {})
+        y = rag('query 2', documents, k = 3)    # independent : ('rag', ('query 2', ['report.pdf']), {'k' : 3})
+        z = rag(x[0]['text'], documents)    # depends on `x`
+        ```
+    """
+    num_assignments = {}
+    for node in ast.walk(parsed_ast):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            num_assignments[node.id] = num_assignments.get(node.id, 0) + 1
+    
+    constants = {}
+    for block in parsed_ast.body:
+        if (
+            isinstance(block, ast.Assign)
+            and len(block.targets) == 1
+            and isinstance(block.targets[0], ast.Name)
+            and num_assignments[block.targets[0].id] == 1
+        ):
+            constants[block.targets[0].id] = block.value
+    
+    calls = []
+    for node in _iter_unconditional_nodes(parsed_ast):
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in tool_names
+            and node.func.id not in num_assignments
+        ):
+            continue
+        
+        if any(kw.arg is None for kw in node.keywords): continue
+        
+        try:
+            args    = tuple(_evaluate_literal(arg, constants) for arg in node.args)
+            kwargs  = {
+                kw.arg : _evaluate_literal(kw.value, constants) for kw in node.keywords
+            }
+        except (ValueError, TypeError, KeyError, IndexError):
+            continue
+        
+        calls.append((node.func.id, args, kwargs))
+    
+    return calls
+
+def _iter_unconditional_nodes(parsed_ast):
+    """ Yield the nodes of `parsed_ast` that are always evaluated when the code is executed """
+    for block in parsed_ast.body:
+        # `run_code` executes each top-level block, even if a previous one raised an exception
+        if isinstance(block, (ast.Expr, ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            yield from _iter_evaluated_nodes(block)
+
+def _iter_evaluated_nodes(node):
+    """ Yield `node` and its sub-nodes that are always evaluated when `node` is evaluated """
+    yield node
+    if isinstance(node, (ast.Lambda, ast.GeneratorExp, ast.ListComp, ast.SetComp, ast.DictComp)):
+        return
+    elif isinstance(node, ast.IfExp):
+        children = [node.test]
+    elif isinstance(node, ast.BoolOp):
+        children = node.values[:1]
+    else:
+        children = ast.iter_child_nodes(node)
+    
+    for child in children: yield from _iter_evaluated_nodes(child)
+
+def _evaluate_literal(node, constants):
+    """ Evaluate `node` if it is a literal (where the names in `constants` are replaced by their value), raise a `ValueError` otherwise """
+    if isinstance(node, ast.Name):
+        if node.id not in constants: raise ValueError('{} is not a constant'.format(node.id))
+        return _evaluate_literal(constants[node.id], constants)
+    elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        values = [_evaluate_literal(elt, constants) for elt in node.elts]
+        return values if isinstance(node, ast.List) else (tuple if isinstance(node, ast.Tuple) else set)(values)
+    elif isinstance(node, ast.Subscript):
+        return _evaluate_literal(node.value, constants)[_evaluate_literal(node.slice, constants)]
+    elif isinstance(node, ast.Dict):
+        if any(k is None for k in node.keys): raise ValueError('`**` in dict literals is not supported')
+        return {
+            _evaluate_literal(k, constants) : _evaluate_literal(v, constants)
+            for k, v in zip(node.keys, node.values)
+        }
+    return ast.literal_eval(node)
+
+def get_tool_executor(max_workers = 8):
+    """ Return the executor used to execute the tool calls concurrently """
+    global _tool_executor
+    with _tool_executor_mutex:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers, thread_name_prefix = 'tool')
+        return _tool_executor
+
+def dispatch_tool_calls(calls, tools, ** kwargs):
+    """
+        Execute the independent `calls` concurrently, and return their `Future`
+        
+        Arguments :
+            - calls : `list` of `(name, args, kwargs)` (see `get_independent_tool_calls`)
+            - tools : `dict` of `{name : Tool}`
+            - kwargs    : forwarded to each tool
+        Return :
+            - futures   : `dict` of `{call_key : Future}`, where `call_key = canonical_hash(name, args, kwargs)`
+        
+        The calls to the same tool are coalesced in a single `Tool.batch` call if the tool has a `batch_function` (e.g., a single `retrieve` for multiple `rag` queries), while the other calls are executed in parallel.
+        The tools are executed in a copy of the current context, such that a tool calling the model within a scheduled request (see `RequestScheduler.is_scheduled`) is not scheduled again.
+    """
+    executor = get_tool_executor()
+    
+    groups  = {}
+    for name, args, call_kwargs in calls:
+        key = canonical_hash(name, args, call_kwargs)
+        if any(key == k for k, _, _ in groups.get(name, [])): continue
+        groups.setdefault(name, []).append((key, args, call_kwargs))
+    
+    futures = {}
+    for name, group in groups.items():
+        tool = tools[name]
+        if tool.batch_function is not None and len(group) > 1:
+            batch   = executor.submit(
+                contextvars.copy_context().run, tool.batch, [(args, kw) for _, args, kw in group], ** kwargs
+            )
+            items   = [Future() for _ in group]
+            batch.add_done_callback(partial(_split_batch, items = items))
+            futures.update({key : item for (key, _, _), item in zip(group, items)})
+        else:
+            tool = partial(tool, ** kwargs)
+            futures.update({
+                key : executor.submit(contextvars.copy_context().run, tool, * args, ** kw)
+                for key, args, kw in group
+            })
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('{} independent tool calls are dispatched ({} tools)'.format(len(futures), len(groups)))
+    
+    return futures
+
+def _split_batch(batch, items):
+    if batch.cancelled():
+        for item in items: item.cancel()
+        return
+    
+    try:
+        results = batch.result()
+        for item, result in zip(items, results): item.set_result(result)
+    except Exception as e:
+        for item in items:
+            if not item.done(): item.set_exception(e)
+
+def _prefetched_tool(name, tool, futures):
+    """ Return a wrapper of `tool` that returns the result of the dispatched call (if any) instead of calling `tool` """
+    def wrapper(* args, ** kwargs):
+        future = futures.pop(canonical_hash(name, args, kwargs), None) if futures else None
+        if future is None or future.cancelled():
+            return tool(* args, ** kwargs)
+        return future.result()
+    
+    wrapper.__name__ = name
+    return wrapper
+
 def format_code_result(result):
     if not any(v for v in result.values()): return ''
     
@@ -254,16 +545,21 @@ class SecurityVisitor(ast.NodeVisitor):
         self.generic_visit(node)
 
 
-def create_safe_globals(user_globals = None, import_safe_modules = True):
-    safe_globals    = {
-        '__builtins__'  : {
+def get_safe_modules():
+    """ Return the `_safe_modules` (imported once, at the 1st call) """
+    global _imported_modules
+    if _imported_modules is None:
+        _imported_modules = {name : importlib.import_module(name) for name in _safe_modules}
+    return _imported_modules
+
+def create_safe_globals(user_globals = None, import_safe_modules = True, add_builtins = True):
+    safe_globals    = {}
+    if add_builtins:
+        safe_globals['__builtins__'] = {
             k : getattr(builtins, k) for k in dir(builtins) if k not in _dangerous_builtins
         }
-    }
     if import_safe_modules:
-        safe_globals.update({
-            name : importlib.import_module(name) for name in _safe_modules
-        })
+        safe_globals.update(get_safe_modules())
     
     if user_globals:
         safe_globals.update({
@@ -10,13 +10,21 @@
 # limitations under the License.
 
 from .node import NodeManager, Node
+from .speculation import speculate_branch, resolve_branch
 
 class BranchingNode(Node):
-    def __init__(self, condition, branches, ** kwargs):
+    def __init__(self, condition, branches, *, speculate = False, ** kwargs):
+        """
+            Arguments :
+                - condition : the `Node` (or context key) returning the branch to execute
+                - branches  : `dict` (or `list` of `(key, node)`) of branches, where "default" is executed if the value is not in `branches`
+                - speculate : whether to prefetch the most probable branch (see `SpeculationEngine`) while evaluating `condition`
+        """
         super().__init__(** kwargs)
         
         self.condition  = condition
         self.branches   = branches
+        self.speculate  = speculate
     
     def build(self):
         super().build()
@@ -41,12 +49,15 @@ class BranchingNode(Node):
         return [self.condition] + list(self.branches.values())
     
     def run(self, context, ** kwargs):
+        speculated = speculate_branch(self, context, self.branches) if self.speculate else None
+        
         value = self.condition(context, ** kwargs)
+        
+        key = value if value in self.branches else 'default'
+        if self.speculate: resolve_branch(self, context, self.branches, speculated, key)
 
-        if value in self.branches:
-            return self.branches[value](context, ** kwargs)
-        elif 'default' in self.branches:
-            return self.branches['default'](context, ** kwargs)
+        if key in self.branches:
+            return self.branches[key](context, ** kwargs)
         else:
             return None
     
@@ -66,16 +77,25 @@ class BranchingNode(Node):
         return {
             ** super().get_config(),
             'condition' : self.condition.get_config(),
-            'branches'  : [[k, v.get_config()] for k, v in self.branches.items()]
+            'branches'  : [[k, v.get_config()] for k, v in self.branches.items()],
+            'speculate' : self.speculate
         }
 
 class ConditionNode(Node):
-    def __init__(self, condition, true_node, false_node = None, ** kwargs):
+    def __init__(self, condition, true_node, false_node = None, *, speculate = False, ** kwargs):
+        """
+            Arguments :
+                - condition : the `Node` (or context key) evaluated to select the branch
+                - true_node : the `Node` executed if `condition` is `True`
+                - false_node    : the `Node` executed if `condition` is `False` (optional)
+                - speculate : whether to prefetch the most probable branch (see `SpeculationEngine`) while evaluating `condition`
+        """
         super().__init__(** kwargs)
         
         self.condition  = condition
         self.true_node  = true_node
         self.false_node = false_node
+        self.speculate  = speculate
 
     def build(self):
         super().build()
@@ -96,11 +116,19 @@ class ConditionNode(Node):
     @property
     def nested_nodes(self):
         return [self.condition, self.true_node] + ([] if self.false_node is None else [self.false_node])
+    
+    @property
+    def branches(self):
+        return {True : self.true_node, False : self.false_node}
 
     def run(self, context, ** kwargs):
+        speculated = speculate_branch(self, context, self.branches) if self.speculate else None
+        
         value = self.condition(context, ** kwargs)
+        
+        if self.speculate: resolve_branch(self, context, self.branches, speculated, bool(value))
 
-        if self.is_stopped():
+        if self.is_stopped(context):
             return None
         elif value:
             return self.true_node(context, ** kwargs)
@@ -132,5 +160,6 @@ class ConditionNode(Node):
             ** super().get_config(),
             'condition' : self.condition.get_config(),
             'true_node' : self.true_node.get_config(),
-            'false_node'    : self.false_node.get_config() if self.false_node is not None else None
+            'false_node'    : self.false_node.get_config() if self.false_node is not None else None,
+            'speculate' : self.speculate
         }
@@ -9,9 +9,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
 from .function import FunctionNode
 
 class DocumentNode(FunctionNode):
     def __init__(self, source_key, ** kwargs):
         from utils.text.parsers import parse_document
         super().__init__(parse_document, source_key = source_key, ** kwargs)
+    
+    def get_cache_inputs(self, context):
+        """ Identify the documents by their path and their last modification time, such that a modified document is parsed again """
+        filenames = context[self.source_key]
+        if not isinstance(filenames, (list, tuple)): filenames = [filenames]
+        
+        return {
+            self.source_key : [
+                (f, os.path.getmtime(f)) if isinstance(f, str) and os.path.isfile(f) else f
+                for f in filenames
+            ]
+        }
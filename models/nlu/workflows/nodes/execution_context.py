@@ -0,0 +1,206 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from threading import Lock
+from multiprocessing import cpu_count
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_executor   = None
+_executor_mutex = Lock()
+
+def get_executor(max_workers = None):
+    """ Return the executor shared by all the workflow executions (created at the 1st call with `max_workers` threads) """
+    global _executor
+    with _executor_mutex:
+        if _executor is None:
+            if max_workers is None: max_workers = max(4, cpu_count())
+            _executor = ThreadPoolExecutor(max_workers, thread_name_prefix = 'workflow')
+        return _executor
+
+class Task:
+    """
+        Asynchronous execution of `fn(* args, ** kwargs)` in the shared executor
+        
+        If the task is not started when `get` is called, it is executed in the calling thread : this way, a task waiting for its sub-tasks never blocks a worker of the (bounded) executor, which avoids dead-locks when all the workers are busy.
+    """
+    def __init__(self, executor, fn, args = (), kwargs = {}, callback = None):
+        self.fn = fn
+        self.args   = args
+        self.kwargs = kwargs
+        self.callback   = callback
+        
+        self._future    = executor.submit(self._run)
+    
+    def _run(self):
+        result = self.fn(* self.args, ** self.kwargs)
+        if self.callback is not None: self.callback(result)
+        return result
+    
+    def get(self, timeout = None):
+        if self._future.cancel(): return self._run()
+        return self._future.result(timeout)
+    
+    def run_if_pending(self):
+        """ Execute the task in the calling thread if it is not started, and return whether it has been executed """
+        if not self._future.cancel(): return False
+        self._run()
+        return True
+    
+    def cancel(self):
+        """ Cancel the task if it is not started (without waiting for it otherwise), and return whether it is cancelled """
+        return self._future.cancel()
+    
+    def done(self):
+        return self._future.done()
+
+class ExecutionContext:
+    """
+        Carries the state of a single execution of a workflow
+        
+        The `Node`s are immutable and shared between executions (e.g., multiple users running the same `Graph` concurrently), while all the state of a run is stored in its `ExecutionContext` (available in `context['__execution__']`) :
+            - the abort flag of the run
+            - the prefetched nodes (i.e., their `Speculation`)
+            - the stopping condition (e.g., of a parallel branch, see `child`)
+            - the `stats` reported by the nodes (e.g., the critical path of a `DAGExecution`)
+        
+        All the executions share a bounded executor (see `get_executor`), such that many runs of a workflow can be executed concurrently.
+        
+        Example usage :
+        ```python
+        executions = [graph.submit(query = query) for query in queries]
+        results    = [execution.result() for execution in executions]
+        ```
+    """
+    def __init__(self, graph = None, *, parent = None, stopper = None, executor = None):
+        """
+            Arguments :
+                - graph : the root `Node` of the execution
+                - parent    : the parent `ExecutionContext` (for sub-executions, see `child`)
+                - stopper   : a callable returning `True` if the execution should be stopped
+                - executor  : the executor used to run the asynchronous tasks (default to `get_executor()`)
+        """
+        if executor is None:
+            executor = parent.executor if parent is not None else get_executor()
+        
+        self.graph  = graph if graph is not None or parent is None else parent.graph
+        self.parent = parent
+        self.stopper    = stopper
+        self.executor   = executor
+        
+        self._mutex = Lock()
+        self._started   = False
+        self._aborted   = False
+        self._prefetched    = {}
+        self.speculation    = None
+        self._task  = None
+        self.stats  = {}
+    
+    @property
+    def root(self):
+        return self if self.parent is None else self.parent.root
+    
+    def __repr__(self):
+        return '<ExecutionContext graph={} aborted={} prefetched={}>'.format(
+            getattr(self.graph, 'name', None), self.is_aborted(), list(self._prefetched)
+        )
+    
+    def child(self, stopper = None):
+        """ Return a sub-execution (e.g., for a parallel branch) stopped when `stopper()` returns `True` or when `self` is stopped """
+        return ExecutionContext(parent = self, stopper = stopper)
+    
+    def enter(self):
+        """ Return `True` the 1st time it is called on a root execution (i.e., by the root node of the workflow) """
+        if self.parent is not None: return False
+        with self._mutex:
+            if self._started: return False
+            self._started = True
+            return True
+    
+    def finalize(self, context):
+        """ Remove the execution from `context` at the end of the root node, and cancel the unused prefetched nodes """
+        if context.get('__execution__', None) is self: context.pop('__execution__')
+        
+        with self._mutex:
+            speculations, self._prefetched = list(self._prefetched.values()), {}
+        for speculation in speculations: speculation.cancel()
+    
+    def run_async(self, fn, /, * args, callback = None, ** kwargs):
+        """ Execute `fn(* args, ** kwargs)` in the shared executor, and return its `Task` """
+        return Task(self.executor, fn, args, kwargs, callback = callback)
+    
+    def submit(self, node, context, /, ** kwargs):
+        """ Execute `node.start(context, ** kwargs)` in the shared executor (see `result`) """
+        self._task = self.run_async(node.start, context, ** kwargs)
+        return self
+    
+    def result(self, timeout = None):
+        """ Return the result of the node executed by `submit` """
+        if self._task is None: raise RuntimeError('The execution is not submitted')
+        return self._task.get(timeout)[1]
+    
+    def abort(self):
+        """ Stop the whole execution (including the parent executions) """
+        self.root._aborted = True
+    
+    def is_aborted(self):
+        return self.root._aborted
+    
+    def is_cancelled(self, node = None):
+        """ Return whether the execution is a cancelled `Speculation` (or a sub-execution of it) """
+        execution = self
+        while execution is not None:
+            if execution.speculation is not None and execution.speculation.cancelled: return True
+            execution = execution.parent
+        return False
+    
+    def is_stopped(self, node = None):
+        """ Return whether `node` should stop (i.e., the execution is aborted, the node is cancelled or a `stopper` returns `True`) """
+        if self.is_aborted() or self.is_cancelled(): return True
+        
+        execution = self
+        while execution is not None:
+            if execution.stopper is not None and execution.stopper(): return True
+            execution = execution.parent
+        return False
+    
+    def is_prefetched(self, node):
+        return node.name in self.root._prefetched
+    
+    def prefetch(self, node, context, /, ** kwargs):
+        """ Start the `Speculation` of `node` (i.e., its asynchronous execution on a copy of `context`) """
+        from .speculation import Speculation
+        
+        root = self.root
+        with root._mutex:
+            if node.name in root._prefetched: return root._prefetched[node.name]
+            speculation = root._prefetched[node.name] = Speculation(node, context, self, ** kwargs)
+        return speculation
+    
+    def pop_prefetch(self, node):
+        """ Remove and return the `Speculation` of `node` (`None` if it is not prefetched) """
+        root = self.root
+        with root._mutex:
+            return root._prefetched.pop(node.name, None)
+    
+    def cancel(self, node):
+        """
+            Cancel the prefetching of `node`, and return whether it was prefetched
+            
+            The speculative run is stopped at its next `is_stopped` check (e.g., at the next generated token of a `LLMNode`), but this method does not wait for it : the node can directly be prefetched / started again, as the speculative run has its own copy of the context.
+        """
+        speculation = self.pop_prefetch(node)
+        if speculation is None: return False
+        speculation.cancel()
+        return True
@@ -9,13 +9,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+import queue
+import logging
+
 from .node import NodeManager, NodeWrapper
 
+logger = logging.getLogger(__name__)
+
 class SequentialExecution(NodeWrapper):
     def run(self, context, ** kwargs):
         res = None
         for node in self.nodes:
-            if self.is_stopped(): return res
+            if self.is_stopped(context): return res
             res = node(context, ** kwargs)
         return res
 
@@ -45,6 +51,163 @@ class SequentialExecution(NodeWrapper):
 
 Graph = SequentialExecution
 
+class DAGExecution(NodeWrapper):
+    """
+        Executes the nodes as soon as their inputs are available, based on the dependencies derived from their `input_keys` / `output_keys`
+        
+        A node depends on the previous nodes that :
+            - write a key that it reads (i.e., its inputs)
+            - read or write a key that it writes (i.e., the order of the writes is preserved)
+        A node that may read the whole context (i.e., `input_keys is None`) depends on all the previous nodes, and all the next nodes depend on it.
+        
+        The independent nodes are executed concurrently on the same `context` (they write different keys, so no copy is required), and the result of the last node is returned, like `SequentialExecution`.
+        The critical path (i.e., the longest chain of dependent nodes) and its latency are stored in `context['__execution__'].stats[self.name]`.
+        
+        Example usage :
+        ```python
+        graph = DAGExecution(
+            WebNode('web_query', output_key = 'web_results'),
+            LLMNode(model, method = 'rag', source_key = 'question', mapping = {'web_results' : 'paragraphs'}, output_key = 'answer'),
+            LLMNode(model, method = 'translate', source_key = 'title', output_key = 'translated_title'),
+        )
+        # the web search and the translation are executed concurrently
+        ```
+    """
+    def build(self):
+        super().build()
+        
+        self._dependencies  = self.get_dependencies()
+    
+    @property
+    def dependencies(self):
+        """ `list` of `set`, the indexes of the nodes on which each node depends """
+        self._ensure_built()
+        return self._dependencies
+    
+    def get_dependencies(self):
+        dependencies = []
+        for i, node in enumerate(self.nodes):
+            inputs, outputs = node.input_keys, set(node.output_keys)
+            
+            deps = set()
+            for j, prev in enumerate(self.nodes[:i]):
+                prev_inputs = prev.input_keys
+                if inputs is None or prev_inputs is None:
+                    deps.add(j)
+                    continue
+                
+                prev_outputs = set(prev.output_keys)
+                if prev_outputs.intersection(inputs) or outputs.intersection(prev_inputs) or outputs & prev_outputs:
+                    deps.add(j)
+            
+            # transitive dependencies are removed
+            for j in sorted(deps, reverse = True):
+                deps.difference_update(dependencies[j])
+            dependencies.append(deps)
+        
+        return dependencies
+    
+    def run(self, context, ** kwargs):
+        if not self.nodes: return None
+        
+        execution   = self.get_execution(context)
+        dependencies    = self.dependencies
+        remaining   = [set(deps) for deps in dependencies]
+        dependents  = [[j for j, deps in enumerate(dependencies) if i in deps] for i in range(len(self.nodes))]
+        
+        def run_node(idx):
+            start = time.time()
+            try:
+                finished.put((idx, self.nodes[idx](context, ** kwargs), None, start, time.time()))
+            except Exception as e:
+                finished.put((idx, None, e, start, time.time()))
+        
+        t0  = time.time()
+        finished    = queue.Queue()
+        tasks   = {}
+        results, timings, error = [None] * len(self.nodes), {}, None
+        
+        ready = [i for i, deps in enumerate(remaining) if not deps]
+        while ready or tasks:
+            if error is None and not self.is_stopped(context):
+                for idx in ready: tasks[idx] = execution.run_async(run_node, idx)
+            ready = []
+            if not tasks: break
+            
+            # while waiting, the pending nodes are executed in this thread (to not block a worker)
+            while finished.empty() and any(task.run_if_pending() for task in list(tasks.values())):
+                pass
+            
+            idx, result, exception, start, end = finished.get()
+            tasks.pop(idx)
+            results[idx], timings[idx] = result, (start - t0, end - t0)
+            if exception is not None:
+                if error is None: error = exception
+                continue
+            
+            for j in dependents[idx]:
+                remaining[j].discard(idx)
+                if not remaining[j]: ready.append(j)
+        
+        if timings:
+            execution.root.stats[self.name] = self.get_critical_path(timings, time.time() - t0)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('[{}] Critical path : {}'.format(self.name, execution.root.stats[self.name]))
+        
+        if error is not None: raise error
+        return results[-1]
+    
+    def get_critical_path(self, timings, total_time):
+        """
+            Return the critical path of an execution
+            
+            Arguments :
+                - timings   : `dict` `{node_index : (start, end)}` (relative to the start of the execution)
+                - total_time    : the total execution time
+            Return :
+                - report    : `dict` with the `critical_path` (node names), its `critical_path_time` (sum of the durations of its nodes), the `total_time`, and the `sequential_time` (i.e., sum of all the durations)
+        """
+        path_time, previous = {}, {}
+        for idx in sorted(timings):
+            duration = timings[idx][1] - timings[idx][0]
+            deps = [j for j in self.dependencies[idx] if j in path_time]
+            prev = max(deps, key = path_time.__getitem__) if deps else None
+            path_time[idx], previous[idx] = duration + (path_time[prev] if prev is not None else 0.), prev
+        
+        idx, path = max(path_time, key = path_time.__getitem__), []
+        critical_time = path_time[idx]
+        while idx is not None:
+            path.append(self.nodes[idx].name)
+            idx = previous[idx]
+        
+        return {
+            'critical_path' : path[::-1],
+            'critical_path_time'    : critical_time,
+            'total_time'    : total_time,
+            'sequential_time'   : sum(end - start for start, end in timings.values())
+        }
+    
+    def plot_node(self, graph, node_id, *, shape = 'box', label = None):
+        if not self.built: self.build()
+        
+        next_id = node_id
+        g_name  = 'cluster_{}'.format(self.name)
+        with graph.subgraph(name = g_name) as sub_graph:
+            sub_graph.attr(label = self.name)
+            
+            ids = []
+            for node, deps in zip(self.nodes, self.dependencies):
+                start_node, end_node, next_id, config = node.plot_node(sub_graph, next_id)
+                for dep in sorted(deps):
+                    for n in (ids[dep][1] if isinstance(ids[dep][1], list) else [ids[dep][1]]):
+                        graph.edge(n, start_node, ** config)
+                ids.append((start_node, end_node))
+        
+        has_dependents = set().union(* self.dependencies)
+        first_nodes = [ids[i][0] for i, deps in enumerate(self.dependencies) if not deps]
+        last_nodes  = [ids[i][1] for i in range(len(ids)) if i not in has_dependents]
+        return first_nodes[0], last_nodes if len(last_nodes) > 1 else last_nodes[0], next_id, {'lhead' : g_name}
+
 class ParallelExecution(NodeWrapper):
     def run(self, context, ** kwargs):
         if len(self.nodes) == 1:
@@ -31,6 +31,10 @@ class CLINode(Node):
         super().__init__(** kwargs)
         self.prompt = prompt
     
+    @property
+    def input_keys(self):
+        return []
+    
     def run(self, context):
         return input(self.prompt)
 
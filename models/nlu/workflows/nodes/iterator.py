@@ -9,6 +9,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
+
 from .node import NodeManager, Node
 
 class IteratorNode(Node):
@@ -46,6 +48,15 @@ class IteratorNode(Node):
     @property
     def nested_nodes(self):
         return [self.iterable, self.body]
+    
+    @property
+    def input_keys(self):
+        keys = super().input_keys
+        return keys if keys is None else [k for k in keys if k != self.item_key]
+    
+    @property
+    def output_keys(self):
+        return super().output_keys + [self.item_key]
         
     def plot_node(self, graph, node_id, *, shape = 'box', label = None):
         if not self.built: self.build()
@@ -84,7 +95,7 @@ class SequentialIteratorNode(IteratorNode):
     def run(self, context, ** kwargs):
         res = None
         for item in self.iterable(context, ** kwargs):
-            if self.is_stopped(): return res
+            if self.is_stopped(context): return res
             
             context[self.item_key] = item
             res = self.body(context, ** kwargs)
@@ -95,24 +106,24 @@ class ParallelIteratorNode(IteratorNode):
     def run(self, context, ** kwargs):
         iterable = self.iterable(context, ** kwargs)
         
-        if self.is_stopped() or len(iterable) == 0:
+        if self.is_stopped(context) or len(iterable) == 0:
             return []
         elif len(iterable) == 1:
             context[self.item_key] = iterable[0]
             return [self.body(context, ** kwargs)]
         
         # This ensures that `body.build()` is only called once
-        if not self.body.built: self.body.build()
+        self.body._ensure_built()
         
-        # The "request_manager" argument is used to control `LLMNode` inferences
-        # As the `LLMNode` (body) is called multiple times, it is necessary to
-        # pass a unique `request_manager` that will stop all parallel inferences
-        # Indeed, simply calling `self.body.abort` cannot guarantee that **all**
-        # inferences will be stopped.
+        # Each branch has its own `ExecutionContext`, stopped when this node is stopped
+        # such that all the parallel inferences (e.g., `LLMNode`) are stopped
+        execution = self.get_execution(context)
         outputs = [
-            NodeManager.run_async(
-                self.body, {** context, self.item_key : item}, _stopper = self.is_stopped
-            )
+            execution.run_async(self.body, {
+                ** context,
+                self.item_key   : item,
+                '__execution__' : execution.child(partial(self.is_stopped, context))
+            })
             for item in iterable
         ]
         return [out.get() for out in outputs]
@@ -31,10 +31,10 @@ class LLMNode(Node):
         self.source_key = source_key
         self.keep_history   = keep_history
     
-    def build(self):
-        super().build()
-        
-        self.request_manager = RequestManager(self)
+    @property
+    def input_keys(self):
+        if not self.source_key: return None
+        return [self.source_key] + list(self.mapping or {})
     
     def __str__(self):
         des = super().__str__()
@@ -48,7 +48,7 @@ class LLMNode(Node):
         if isinstance(self.model, str):
             from models import get_pretrained
             
-            self.model = get_pretrained(model)
+            self.model = get_pretrained(self.model)
 
         if self.source_key:
             if isinstance(context[self.source_key], dict):
@@ -61,7 +61,9 @@ class LLMNode(Node):
                         if ctx_key in context
                     })
         else:
-            args, kwargs = (), {** self.kwargs, ** context}
+            args, kwargs = (), {
+                ** self.kwargs, ** {k : v for k, v in context.items() if not k.startswith('__')}
+            }
         
         if self.keep_history:
             kwargs['conv_id'] = self.name
@@ -71,7 +73,7 @@ class LLMNode(Node):
         if 'request_manager' in kwargs:
             raise NotImplementedError('The `request_manager` is currently not supported')
         
-        kwargs['request_manager'] = self.request_manager
+        kwargs['request_manager'] = RequestManager(self, context)
         
         return getattr(self.model, self.method)(* args, ** kwargs)['predicted']
     
@@ -90,11 +92,13 @@ class TranslationNode(LLMNode):
         super().__init__(model, method = method, add_answer_start = False, ** kwargs)
 
 class RequestManager:
-    def __init__(self, node):
+    """ Stops the inference of a `LLMNode` when the node is stopped in the execution of `context` """
+    def __init__(self, node, context):
         self.node = node
+        self.context    = context
     
     def is_aborted(self, request_id = None):
-        return self.node.is_stopped()
+        return self.node.is_stopped(self.context)
     
     def __call__(self, item, request_id = None):
         return not self.is_aborted()
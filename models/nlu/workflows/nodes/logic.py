@@ -11,23 +11,22 @@
 
 import queue
 
-from .node import NodeManager
 from .iterator import ParallelIteratorNode
 
 class AnyNode(ParallelIteratorNode):
     def run(self, context):
         iterable = self.iterable(context)
         
-        if self.is_stopped() or len(iterable) == 0:
+        if self.is_stopped(context) or len(iterable) == 0:
             return False
         elif len(iterable) == 1:
             context[self.item_key] = iterable[0]
             return bool(self.body(context))
         
-        if not self.body.built: self.body.build()
+        self.body._ensure_built()
         
         def should_stop():
-            return state['valid'] or self.is_stopped()
+            return state['valid'] or self.is_stopped(context)
         
         def run_and_add_to_buffer(context, /, *, index, ** kwargs):
             output = None
@@ -39,11 +38,11 @@ class AnyNode(ParallelIteratorNode):
         
         state   = {'valid' : False}
         buffer  = queue.Queue()
+        execution   = self.get_execution(context)
         outputs = [
-            NodeManager.run_async(
+            execution.run_async(
                 run_and_add_to_buffer,
-                {** context, self.item_key : item},
-                _stopper = should_stop,
+                {** context, self.item_key : item, '__execution__' : execution.child(should_stop)},
                 index = i
             )
             for i, item in enumerate(iterable)
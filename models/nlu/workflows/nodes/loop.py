@@ -46,7 +46,7 @@ class LoopNode(Node):
     
     def run(self, context):
         res, iteration = None, 0
-        while self.cond(context) and iteration < self.max_iter and not self.is_stopped():
+        while self.cond(context) and iteration < self.max_iter and not self.is_stopped(context):
             res = self.body(context)
             iteration += 1
             
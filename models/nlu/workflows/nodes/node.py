@@ -11,14 +11,17 @@
 
 import logging
 
+from threading import RLock
 from abc import ABCMeta, abstractmethod
-from multiprocessing import cpu_count
-from multiprocessing.pool import ThreadPool
+
+from .node_cache import get_node_cache
+from .execution_context import ExecutionContext
 
 logger = logging.getLogger(__name__)
 
+_build_mutex    = RLock()
+
 class NodeManager(ABCMeta):
-    _pools  = {}
     _instances  = {}
     
     def __call__(cls, * args, name = None, ** kwargs):
@@ -62,20 +65,9 @@ class NodeManager(ABCMeta):
             raise ValueError('Unsupported node type : {}'.format(type(node)))
 
     @staticmethod
-    def run_async(node, context, /, *, max_workers = None, callback = None, ** kwargs):
-        root = context['__graph__']
-        if root not in NodeManager._pools:
-            if max_workers is None: max_workers = cpu_count()
-            NodeManager._pools[root] = ThreadPool(max_workers).__enter__()
-        
-        return NodeManager._pools[root].apply_async(node, (context, ), kwargs, callback = callback)
-    
-    @staticmethod
-    def finalize(root, context):
-        root = context.pop('__graph__')
-        
-        if root in NodeManager._pools:
-            NodeManager._pools.pop(root).__exit__(None, None, None)
+    def run_async(node, context, /, *, callback = None, ** kwargs):
+        """ Execute `node(context, ** kwargs)` in the executor of the execution of `context`, and return its `Task` """
+        return context['__execution__'].run_async(node, context, callback = callback, ** kwargs)
 
         
 class Node(metaclass = NodeManager):
@@ -88,10 +80,13 @@ class Node(metaclass = NodeManager):
         
         The `Node` class is an abstraction : the `run(context)` method has to be defined in sub-classes
         
-        The `run` method may also implement an interruption mechanism, in case of `is_stopped()` returns `True`. This can happen in two different scenarios :
+        The nodes are shared between all the executions of a workflow (e.g., concurrent requests), and should therefore not store any state of a run. This state (abort, prefetching, ...) is stored in the `ExecutionContext` of the run, available in `context['__execution__']`.
+        
+        The `run` method may also implement an interruption mechanism, in case of `is_stopped(context)` returns `True`. This can happen in two different scenarios :
         1) The `abort` method is called, aborting the execution of the graph itself
         2) The `cancel` method is called (after a `prefetch` call), cancelling the prefetching of the node
-        The `nested_nodes` property may be defined to also abort/cancel sub-nodes execution.
+        
+        In the 2nd case, the prefetching `run` has its own copy of the context and its own sub-execution (see `Speculation`) : the cancellation does not wait for it, and the node can directly be started again.
         
         
         The `prefetch` mechanism enables to pre-compute the node result in a separate thread, to directly return the result once the `start` method is called. 
@@ -117,7 +112,14 @@ class Node(metaclass = NodeManager):
         On the other hand, if the `WebNode` if called (i.e., the query requires a web search), the final answer will be cancelled (`cancel`), and re-computed with the web results.
         
         **WARNING** This behavior can save significant amount of time to generate the final answer when no web search is required, but leads to useless computation if search is required. It is therefore critical to only prefetch paths where speed is required.
+        
+        
+        The `cache` mechanism memoizes the node results (see `NodeCache`) : if the node is executed with the same config and the same values for the context keys it reads (`input_keys`), the cached result is directly returned. The entries expire after `cache_ttl` seconds (default to `default_cache_ttl` of the node type).
+        
+        **WARNING** The cache should only be enabled on deterministic nodes (e.g., a `LLMNode` without sampling nor history).
     """
+    default_cache_ttl   = None
+    
     def __init__(self,
                  *,
                  
@@ -127,6 +129,9 @@ class Node(metaclass = NodeManager):
                  start_prefetch = None,
                  stop_prefetch  = None,
                  
+                 cache  = False,
+                 cache_ttl  = None,
+                 
                  ** kwargs
                 ):
         self.name   = name
@@ -136,12 +141,10 @@ class Node(metaclass = NodeManager):
         self.start_prefetch = start_prefetch if start_prefetch is not None else []
         self.stop_prefetch  = stop_prefetch if stop_prefetch is not None else []
         
-        self.built = False
+        self.cache  = cache
+        self.cache_ttl  = cache_ttl if cache_ttl is not None else self.default_cache_ttl
         
-        self._stopper   = lambda: False
-        self._aborted   = False
-        self._cancelled = False
-        self._prefetch_result   = None
+        self.built = False
     
     def build(self):
         """ Builds the node, e.g., by normalizing sub-nodes with `NodeManager.get` """
@@ -159,6 +162,41 @@ class Node(metaclass = NodeManager):
     def nested_nodes(self):
         return []
     
+    @property
+    def input_keys(self):
+        """ `list` of context keys read by the node, or `None` if it may read the whole context (e.g., an atomic node without `source_key`) """
+        self._ensure_built()
+        
+        keys = []
+        source_key = getattr(self, 'source_key', None)
+        if source_key:
+            keys.append(source_key)
+        elif not self.nested_nodes:
+            return None
+        
+        for node in self.nested_nodes:
+            node_keys = node.input_keys
+            if node_keys is None: return None
+            keys.extend(k for k in node_keys if k not in keys)
+        return keys
+    
+    @property
+    def output_keys(self):
+        """ `list` of context keys written by the node (and its nested nodes) """
+        self._ensure_built()
+        
+        keys = [self.output_key] if self.output_key else []
+        for node in self.nested_nodes:
+            keys.extend(k for k in node.output_keys if k not in keys)
+        return keys
+    
+    def get_cache_inputs(self, context):
+        """ Return the values identifying the inputs of the node in `context` (used to compute the `NodeCache` key) """
+        keys = self.input_keys
+        if keys is None:
+            return {k : v for k, v in context.items() if not k.startswith('__')}
+        return {k : context[k] for k in keys if k in context}
+    
     def __hash__(self):
         return hash(self.name)
     
@@ -177,6 +215,11 @@ class Node(metaclass = NodeManager):
         
         return des
     
+    @staticmethod
+    def get_execution(context):
+        """ Return the `ExecutionContext` of the run of `context` (`None` if the workflow is not running) """
+        return context.get('__execution__', None) if context else None
+    
     def __call__(self, context = None, /, ** kwargs):
         """
             Start the node and returns its result only (i.e., without context)
@@ -188,57 +231,53 @@ class Node(metaclass = NodeManager):
     def run(self, context, /, ** kwargs):
         """ Execute the node logic, and returns its result """
 
-    def abort(self):
-        """ Stop the node execution """
-        self._abort = True
+    def abort(self, context):
+        """ Stop the execution of the workflow running with `context` """
+        execution = self.get_execution(context)
+        if execution is None: return
         
-        if self.built:
-            for node in self.nested_nodes: node.abort()
-
-        self.on_stop()
+        execution.abort()
+        self.on_stop(context)
 
-    def cancel(self):
+    def cancel(self, context):
         """
             Stop the node prefetching
             In practice, this function :
-            1) Set `cancelled` to `True`
-            2) Call `self.stop()`
-            3) Wait until the async result is available (i.e., the `run` is finished)
-            4) Set `cancelled` to `False` and `prefetch_result` to `None`
-            This enables the node to be re-fetched after being interrupted
+            1) Mark the `Speculation` of the node as cancelled (i.e., `is_stopped` returns `True` in the prefetching `run`)
+            2) Remove the prefetched result, without waiting for the prefetching `run` to finish
+            3) Call `self.on_stop(context)`
+            This enables the node to be re-fetched directly after being interrupted
             
-            It is therefore important to define a stopping behavior in the `run` method to enable as fast as possible interruption.
+            It is however important to define a stopping behavior in the `run` method to release the resources (e.g., the LLM inference) as fast as possible.
         """
-        self._cancelled = True
-        
-        if self.built:
-            for node in self.nested_nodes: node.cancel()
-        
-        self.on_stop()
+        execution = self.get_execution(context)
+        if execution is None or not execution.cancel(self): return
         
-        self._prefetch_result.get()
-        self._prefetch_result   = None
-        self._cancelled = False
+        self.on_stop(context)
 
     def clone(self):
         """ Return a new instance of the node with same config but different name """
         return self.__class__(** {** self.get_config(), 'name' : None})
 
-    def is_aborted(self):
-        """ Return whether or not the node is aborted (i.e., `abort()` has been called) """
-        return self._aborted
+    def is_aborted(self, context):
+        """ Return whether or not the execution is aborted (i.e., `abort(context)` has been called) """
+        execution = self.get_execution(context)
+        return execution is not None and execution.is_aborted()
 
-    def is_cancelled(self):
-        """ Return whether or not the node is cancelled (i.e., `cancel()` has been called) """
-        return self._cancelled
+    def is_cancelled(self, context):
+        """ Return whether or not the node is cancelled (i.e., `cancel(context)` has been called) """
+        execution = self.get_execution(context)
+        return execution is not None and execution.is_cancelled(self)
     
-    def is_prefetched(self):
-        """ Return whether or not the node is prefetched (i.e., `prefetch()` has been called) """
-        return self._prefetch_result is not None
+    def is_prefetched(self, context):
+        """ Return whether or not the node is prefetched (i.e., `prefetch(context)` has been called) """
+        execution = self.get_execution(context)
+        return execution is not None and execution.is_prefetched(self)
     
-    def is_stopped(self):
-        """ Return whether or not the node should stop (either `abort` or `cancel` has been called) """
-        return self.is_aborted() or self.is_cancelled() or self._stopper()
+    def is_stopped(self, context):
+        """ Return whether or not the node should stop (either `abort` or `cancel` has been called, or the branch is stopped) """
+        execution = self.get_execution(context)
+        return execution is not None and execution.is_stopped(self)
     
     def on_start(self, context):
         """ Callback method called before running the node """
@@ -246,16 +285,16 @@ class Node(metaclass = NodeManager):
             logger.debug('Start node {}'.format(self.name))
     
         if self.start_prefetch:
-            for node in self.start_prefetch: node.prefetch()
+            for node in self.start_prefetch: node.prefetch(context)
         
         if self.stop_prefetch:
-            for node in self.stop_prefetch: node.abort()
+            for node in self.stop_prefetch: node.cancel(context)
 
-    def on_stop(self):
+    def on_stop(self, context):
         """ Callback method called when the node is interrupted (either `abort` either `cancel`) """
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug('Node {} is {}'.format(
-                self.name, 'aborted' if self.is_aborted() else 'cancelled'
+                self.name, 'aborted' if self.is_aborted(context) else 'cancelled'
             ))
 
     def on_finished(self, context, result):
@@ -268,69 +307,103 @@ class Node(metaclass = NodeManager):
 
     def prefetch(self, context, /, ** kwargs):
         """
-            Prepare the node result by calling `self.run_async` without effectively starting the node (i.e., `on_start` is not called).
+            Prepare the node result by asynchronously calling `self.run` without effectively starting the node (i.e., `on_start` is not called).
             
-            **IMPORTANT** : This method is only defined for "atomic" nodes (i.e., nodes that do not have nested nodes). In the case of non-atomic nodes, calling `self.run` will result in calling the `start` method of sub-nodes, which is unexpected for the `prefetch` mechanism.
-            
-            Please overwrite the method to call the "prefetch" method only from the expected sub-nodes.
+            The node is executed on a copy of `context` (see `Speculation`), such that its (nested) nodes do not modify the actual context before the node is started. The modified entries are merged in `context` once the node is started.
         """
-        if self.is_prefetched() or self.is_aborted(): return
-        if not self.built: self.build()
-        
-        if self.is_cancelled():
-            raise RuntimeError("The node is prefetched while cancelled, which should not happen")
-        elif self.nested_nodes:
-            raise NotImplementedError("The `prefetch` method should only be called on atomic nodes, but {} has nested nodes. Please overwrite the method to prefetch the expected sub nodes.".format(self))
+        if self.is_prefetched(context) or self.is_stopped(context): return
+        self._ensure_built()
         
-        self._prefetch_result   = NodeManager.run_async(self.run, context, ** kwargs)
+        self.get_execution(context).prefetch(self, context, ** kwargs)
     
-    def start(self, context = None, /, _stopper = None, ** kwargs):
+    def start(self, context = None, /, ** kwargs):
         """
             Initialize and execute the node. Then returns the updated context and the node result
             
             Arguments :
                 - context   : a `dict` containing the graph variables / state
-                - _stopper  : a `callable` that returns `True` if the node should be stopped
                 - kwargs    : additional kwargs forwarded to `run`, or used as context if it is the root of the workflow
             Return :
                 - context   : the (possibly in-place updated) context
                 - result    : the node execution result (i.e., the output of `self.run`)
             
             Note : if no context is provided, `kwargs` is used as context
+            Note 2 : if `context` has no `ExecutionContext`, a new one is created, i.e. each call to `start` on the root node is an independent execution
         """
         if context is None: context, kwargs = kwargs, {}
-
-        if _stopper is not None:
-            if _stopper(): return
-            self._stopper       = _stopper
-            if self.nested_nodes: kwargs['_stopper'] = _stopper
         
-        if not self.built: self.build()
+        self._ensure_built()
         
-        _is_root = '__graph__' not in context
-        if _is_root: context['__graph__'] = self
+        execution = self.get_execution(context)
+        if execution is None:
+            execution = context['__execution__'] = ExecutionContext(self)
+        _is_root = execution.enter()
         
-        if context.get('__abort__', False) or self.is_aborted():
+        if context.get('__abort__', False) or execution.is_stopped():
             logger.warning('The workflow is stopped, skipping {}'.format(self))
-            if _is_root: NodeManager.finalize(self, context)
+            if _is_root: execution.finalize(context)
             return context, None
         
         self.on_start(context)
         
         result = None
         try:
-            if self.is_prefetched():
-                result = self._prefetch_result.get()
-                self._prefetch_result = None
+            speculation = execution.pop_prefetch(self)
+            if speculation is not None:
+                result = speculation.result(context)
             else:
-                result = self.run(context, ** kwargs)
+                result = self.run_cached(context, ** kwargs)
         finally:
             self.on_finished(context, result)
 
-            if _is_root: NodeManager.finalize(self, context)
+            if _is_root: execution.finalize(context)
         
         return context, result
     
+    def run_cached(self, context, /, ** kwargs):
+        """ Return the cached result of `self.run` if the cache is enabled (see `NodeCache`), otherwise call `self.run` """
+        if not self.cache: return self.run(context, ** kwargs)
+        
+        cache   = get_node_cache()
+        key     = cache.get_key(self, context, ** kwargs)
+        entry   = cache.get(key, ttl = self.cache_ttl)
+        if entry is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Node {} is loaded from cache'.format(self.name))
+            context.update(entry['outputs'])
+            return entry['result']
+        
+        result = self.run(context, ** kwargs)
+        # the result of an interrupted node may be incomplete
+        if not self.is_stopped(context):
+            cache.put(key, result, {
+                k : context[k] for k in self.output_keys if k != self.output_key and k in context
+            })
+        return result
+    
+    def submit(self, context = None, /, ** kwargs):
+        """
+            Execute the node asynchronously (in the executor shared by all the executions), and return its `ExecutionContext`
+            
+            Example usage :
+            ```python
+            execution = graph.submit(query = 'Hello World !')
+            # execution.abort() stops the run
+            print(execution.result())
+            ```
+        """
+        if context is None: context, kwargs = kwargs, {}
+        
+        self._ensure_built()
+        
+        execution = context['__execution__'] = ExecutionContext(self)
+        return execution.submit(self, context, ** kwargs)
+    
+    def _ensure_built(self):
+        """ Build the node (only once, even if multiple executions start concurrently) """
+        with _build_mutex:
+            if not self.built: self.build()
+    
     def get_config(self):
         if not self.built: self.build()
         
@@ -340,6 +413,8 @@ class Node(metaclass = NodeManager):
             'output_key' : self.output_key,
             'start_prefetch'    : [node.name for node in self.start_prefetch],
             'stop_prefetch'     : [node.name for node in self.stop_prefetch],
+            'cache'     : self.cache,
+            'cache_ttl' : self.cache_ttl,
             ** self.kwargs
         }
 
@@ -0,0 +1,133 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import logging
+import collections
+
+from threading import Lock
+
+from utils import DiskCache, LRUCache
+from utils.cache_utils import is_expired
+from utils.threading import canonical_hash
+
+logger = logging.getLogger(__name__)
+
+_cache_dir  = os.path.expanduser('~/.cache/yui_mhcp/workflows')
+
+_node_cache = None
+
+def get_node_cache():
+    """ Return the `NodeCache` shared by all the workflows """
+    global _node_cache
+    if _node_cache is None: _node_cache = NodeCache()
+    return _node_cache
+
+def set_node_cache(cache):
+    global _node_cache
+    _node_cache = cache
+
+class NodeCache:
+    """
+        Content-addressed cache of the node results, with an in-memory LRU tier backed by an on-disk tier
+        
+        An entry is identified by the hash of the node config and of the values of the context keys read by the node (see `Node.input_keys`), such that any change in the node or in its inputs invalidates the entry. Each entry stores the node result and the context entries written by its nested nodes, and expires after the `ttl` of the node (see `Node.cache_ttl`).
+        
+        The memory tier is bounded in number of entries, and the disk tier (one `.pkl` file per entry, see `DiskCache`) in total size : the oldest files are removed once `max_disk_size` is exceeded.
+        
+        Example usage :
+        ```python
+        set_node_cache(NodeCache(max_size = 1024, directory = None)) # memory only
+        
+        node = WebNode('search_query', cache = True, cache_ttl = 3600)
+        ```
+    """
+    def __init__(self, max_size = 1024, *, directory = _cache_dir, max_disk_size = 1024 ** 3):
+        """
+            Arguments :
+                - max_size  : the maximal number of entries in memory
+                - directory : the directory of the on-disk tier (`None` to disable it)
+                - max_disk_size : the maximal size (in bytes) of the on-disk tier
+        """
+        self.max_size   = max_size
+        self.directory  = directory
+        
+        self._mutex = Lock()
+        self._memory    = LRUCache(max_size)
+        self._disk  = DiskCache(directory, max_size = max_disk_size) if directory else None
+        self._stats = collections.Counter()
+    
+    def __len__(self):
+        return len(self._memory)
+    
+    def __repr__(self):
+        return '<NodeCache size={} directory={}>'.format(len(self), self.directory)
+    
+    @property
+    def max_disk_size(self):
+        return self._disk.max_size if self._disk is not None else None
+    
+    @max_disk_size.setter
+    def max_disk_size(self, value):
+        if self._disk is not None: self._disk.max_size = value
+    
+    def get_key(self, node, context, ** kwargs):
+        """ Return the key of the execution of `node` on `context` (i.e., the hash of its config and inputs) """
+        return canonical_hash(node.get_config(), node.get_cache_inputs(context), kwargs)
+    
+    def get(self, key, *, ttl = None):
+        """ Return the entry (`dict` with `result` and `outputs`) stored for `key`, or `None` if it is missing / expired """
+        entry = self._memory.get(key, None)
+        tier  = 'memory'
+        if entry is None and self._disk is not None:
+            entry = self._disk.load(key)
+            tier  = 'disk'
+            if entry is not None: self._memory.put(key, entry)
+        
+        if entry is not None and ttl is not None and is_expired(entry, ttl):
+            self.pop(key)
+            entry = None
+        
+        with self._mutex:
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['{}_hits'.format(tier)] += 1
+        return entry
+    
+    def put(self, key, result, outputs = None):
+        entry = {'time' : time.time(), 'result' : result, 'outputs' : outputs or {}}
+        self._memory.put(key, entry)
+        if self._disk is not None: self._disk.save(key, entry, timestamp = entry['time'])
+        return entry
+    
+    def pop(self, key):
+        self._memory.pop(key)
+        if self._disk is not None: self._disk.remove(key)
+    
+    def clear(self, disk = False):
+        self._memory.clear()
+        if disk and self._disk is not None: self._disk.clear()
+    
+    def get_stats(self):
+        with self._mutex:
+            hits  = self._stats['memory_hits'] + self._stats['disk_hits']
+            total = hits + self._stats['misses']
+            return {
+                'size'  : len(self._memory),
+                'disk_size' : self._disk.nbytes if self._disk is not None else 0,
+                'memory_hits'   : self._stats['memory_hits'],
+                'disk_hits' : self._stats['disk_hits'],
+                'misses'    : self._stats['misses'],
+                'evictions' : self._disk.evictions if self._disk is not None else 0,
+                'hit_rate'  : hits / total if total else 0.
+            }
@@ -0,0 +1,235 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import time
+import logging
+import collections
+import numpy as np
+
+from threading import Lock
+
+from utils.threading import canonical_hash
+
+logger = logging.getLogger(__name__)
+
+_mutable_types  = (list, dict, set, collections.deque, np.ndarray)
+
+_engine = None
+
+def get_speculation_engine():
+    """ Return the `SpeculationEngine` shared by all the workflows """
+    global _engine
+    if _engine is None: _engine = SpeculationEngine()
+    return _engine
+
+def set_speculation_engine(engine):
+    global _engine
+    _engine = engine
+
+class Speculation:
+    """
+        Speculative execution of `node.run` on a copy of `context`, in a sub-execution of `execution`
+        
+        The speculative run only modifies its own copy of the context, where the mutable values (`list`, `dict`, ...) are deep-copied, such that in-place modifications (e.g., `context['messages'].append(...)`) do not leak in the actual context. If the result is used (`result`), the entries it has written or modified are merged in the actual context (the entries written in the actual context in the meantime are kept). Otherwise, `cancel` stops the run (i.e., `node.is_stopped` returns `True` in the speculative run, which aborts the `LLMNode` inferences), without waiting for it.
+    """
+    def __init__(self, node, context, execution, *, engine = None, ** kwargs):
+        self.node   = node
+        self.engine = engine if engine is not None else get_speculation_engine()
+        
+        self.start_time = time.time()
+        self.end_time   = None
+        
+        self._mutex = Lock()
+        self._cancelled = False
+        self._consumed  = False
+        
+        self._execution = execution.child()
+        self._execution.speculation = self
+        self.context    = {
+            ** {k : _copy_value(v) for k, v in context.items()}, '__execution__' : self._execution
+        }
+        # the initial values (and the hash of the mutable ones), such that only the entries written or modified by the speculative run are merged
+        self._snapshot  = {
+            k : (v, canonical_hash(v) if isinstance(v, _mutable_types) else None)
+            for k, v in self.context.items()
+        }
+        
+        self.engine.on_start(self)
+        self._task  = execution.run_async(self._run, ** kwargs)
+    
+    @property
+    def cancelled(self):
+        return self._cancelled
+    
+    @property
+    def duration(self):
+        return (self.end_time or time.time()) - self.start_time
+    
+    def __repr__(self):
+        return '<Speculation node={} cancelled={} finished={}>'.format(
+            self.node.name, self._cancelled, self.end_time is not None
+        )
+    
+    def _run(self, ** kwargs):
+        try:
+            return self.node.run_cached(self.context, ** kwargs)
+        finally:
+            with self._mutex:
+                self.end_time = time.time()
+                wasted = self._cancelled
+            if wasted: self.engine.on_wasted(self, self.duration)
+    
+    def cancel(self):
+        """ Stop the speculative run (without waiting for it), and record the wasted computation """
+        with self._mutex:
+            if self._cancelled or self._consumed: return
+            self._cancelled = True
+            finished = self.end_time is not None
+        
+        if self._task.cancel():
+            self.engine.on_wasted(self, 0.)
+        elif finished:
+            self.engine.on_wasted(self, self.duration)
+    
+    def result(self, context):
+        """ Return the result of the speculative run, and merge its context in `context` """
+        requested   = time.time()
+        with self._mutex:
+            if self._cancelled: raise RuntimeError('The speculation of {} is cancelled'.format(self.node))
+            self._consumed = True
+        
+        result = self._task.get()
+        # the latency saved is the part of the execution performed before it was requested
+        self.engine.on_used(self, max(0., min(requested, self.end_time) - self.start_time))
+        
+        for k, v in self.context.items():
+            if k != '__execution__' and self._is_modified(k, v):
+                context[k] = v
+        return result
+    
+    def _is_modified(self, key, value):
+        if key not in self._snapshot: return True
+        initial, initial_hash = self._snapshot[key]
+        if initial is not value: return True
+        return initial_hash is not None and canonical_hash(value) != initial_hash
+
+def _copy_value(value):
+    """ Return a deep copy of `value` if it is a mutable container, and `value` otherwise (e.g., models or conversations are shared) """
+    if not isinstance(value, _mutable_types): return value
+    try:
+        return copy.deepcopy(value)
+    except Exception as e:
+        logger.debug('The value cannot be copied ({}) : it is shared with the speculative run'.format(e))
+        return value
+
+class SpeculationEngine:
+    """
+        Records the branches taken by the conditional nodes, and selects the branch to prefetch
+        
+        A branch is speculatively executed (i.e., prefetched while the condition is evaluated) if it has been taken at least `min_probability` of the time, over at least `min_samples` executions. The engine also reports the computation wasted by the cancelled speculations versus the latency saved by the used ones.
+    """
+    def __init__(self, *, min_probability = 0.6, min_samples = 5):
+        self.min_probability    = min_probability
+        self.min_samples    = min_samples
+        
+        self._mutex = Lock()
+        self._counts    = collections.defaultdict(collections.Counter)
+        self._stats = collections.Counter()
+    
+    def __repr__(self):
+        return '<SpeculationEngine nodes={} stats={}>'.format(len(self._counts), self.get_stats())
+    
+    def record(self, node, branch):
+        """ Record that `branch` has been taken by `node` """
+        with self._mutex:
+            self._counts[node.name][branch] += 1
+    
+    def get_probabilities(self, node):
+        with self._mutex:
+            counts = self._counts.get(node.name, {})
+            total  = sum(counts.values())
+            return {k : v / total for k, v in counts.items()}
+    
+    def select(self, node, branches, *, min_probability = None):
+        """ Return the most probable branch (in `branches`) of `node`, or `None` if it is not probable enough """
+        if min_probability is None: min_probability = self.min_probability
+        
+        with self._mutex:
+            counts = self._counts.get(node.name, None)
+            if not counts or sum(counts.values()) < self.min_samples: return None
+            
+            total  = sum(counts.values())
+            branch = max(branches, key = lambda b: counts.get(b, 0))
+            if counts.get(branch, 0) / total < min_probability: return None
+        return branch
+    
+    def on_start(self, speculation):
+        with self._mutex:
+            self._stats['speculations'] += 1
+    
+    def on_wasted(self, speculation, duration):
+        with self._mutex:
+            self._stats['cancelled']    += 1
+            self._stats['wasted_time']  += duration
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[SPECULATION] {} is cancelled after {:.3f} sec'.format(speculation.node, duration))
+    
+    def on_used(self, speculation, saved):
+        with self._mutex:
+            self._stats['used'] += 1
+            self._stats['saved_time']   += saved
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[SPECULATION] {} is used ({:.3f} sec saved)'.format(speculation.node, saved))
+    
+    def get_stats(self):
+        with self._mutex:
+            finished = self._stats['used'] + self._stats['cancelled']
+            return {
+                'speculations'  : self._stats['speculations'],
+                'used'  : self._stats['used'],
+                'cancelled' : self._stats['cancelled'],
+                'hit_rate'  : self._stats['used'] / finished if finished else 0.,
+                'wasted_time'   : self._stats['wasted_time'],
+                'saved_time'    : self._stats['saved_time']
+            }
+    
+    def reset(self):
+        with self._mutex:
+            self._counts.clear()
+            self._stats.clear()
+
+def speculate_branch(node, context, branches, *, min_probability = None):
+    """
+        Prefetch the most probable branch of `node` (a `ConditionNode` / `BranchingNode`), and return its key (`None` if no branch is prefetched)
+        
+        A branch is not prefetched if it reads a key written by the condition (as it is not available yet).
+    """
+    engine  = get_speculation_engine()
+    key = engine.select(node, [k for k, b in branches.items() if b is not None], min_probability = min_probability)
+    if key is None: return None
+    
+    branch  = branches[key]
+    condition_outputs = set(node.condition.output_keys)
+    if condition_outputs:
+        inputs = branch.input_keys
+        if inputs is None or condition_outputs.intersection(inputs): return None
+    
+    branch.prefetch(context)
+    return key
+
+def resolve_branch(node, context, branches, speculated, taken):
+    """ Record the branch `taken` by `node`, and cancel the `speculated` branch if it is not the taken one """
+    get_speculation_engine().record(node, taken)
+    if speculated is not None and speculated != taken:
+        branches[speculated].cancel(context)
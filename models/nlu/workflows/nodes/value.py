@@ -16,6 +16,10 @@ class ValueNode(Node):
         super().__init__(output_key = output_key, ** kwargs)
         self.value = value
     
+    @property
+    def input_keys(self):
+        return []
+    
     def __str__(self):
         return super().__str__() + "- Value : {}\n".format(self.value)
     
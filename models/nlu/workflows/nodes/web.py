@@ -12,6 +12,8 @@
 from .node import Node
 
 class WebNode(Node):
+    default_cache_ttl   = 24 * 3600
+    
     def __init__(self, source_key, ** kwargs):
         super().__init__(** kwargs)
         self.source_key = source_key
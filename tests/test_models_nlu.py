@@ -0,0 +1,367 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import keras
+import shutil
+import numpy as np
+import keras.ops as K
+from utils.keras import ops
+
+from types import SimpleNamespace
+
+from . import CustomTestCase, temp_dir
+from utils.text import default_english_tokenizer
+from utils.databases import SemanticCache
+from utils.threading import CancellationToken, RequestScheduler, SingleFlight
+from architectures import generation_utils
+from architectures.generation_utils import _decoding_loop
+from models.nlu.conversations import ConversationManager
+from models.nlu.prompts import PromptFormatter
+from models.nlu.inference_manager import END_OF_STREAM, InferenceManager, TextDeltaCallback
+from models.nlu.text_generator import TextGenerator, get_generation_key, is_sampling_config
+
+class _FakeGenerator:
+    """ Minimal `TextGenerator` recording the `infer` / `compiled_infer` calls """
+    def __init__(self):
+        self.lang   = 'en'
+        self.runtime    = 'keras'
+        self.tokenizer  = None
+        self.single_flight  = None
+        self.calls  = []
+    
+    def infer(self, text = None, ** kwargs):
+        self.calls.append((text, kwargs.get('cached_answer', None)))
+        return {'predicted' : kwargs.get('cached_answer', None) or 'Paris'}
+    
+    def compiled_infer(self, tokens, ** kwargs):
+        self.calls.append(kwargs)
+        return tokens
+    
+    answer  = TextGenerator.answer
+    generate    = TextGenerator.generate
+
+class _CancelledAfter:
+    """ Token cancelled after `num_checks` checks (i.e., after `num_checks - 1` decoding chunks) """
+    def __init__(self, num_checks):
+        self.num_checks = num_checks
+    
+    @property
+    def cancelled(self):
+        self.num_checks -= 1
+        return self.num_checks < 0
+
+class TestDecodingLoop(CustomTestCase):
+    def setUp(self):
+        if keras.backend.backend() != 'jax':
+            self.skipTest('The eager decoding loop is tested with the `jax` backend')
+        self.config = SimpleNamespace(max_steps = 51)
+    
+    def run_loop(self, max_length = 100, ** kwargs):
+        return [int(v) for v in _decoding_loop(
+            lambda i, x: i < max_length,
+            lambda i, x: (i + 1, x + 2),
+            (K.convert_to_tensor(0), K.convert_to_tensor(0)),
+            self.config,
+            ** kwargs
+        )]
+    
+    def test_loop(self):
+        self.assertEqual([50, 100], self.run_loop())
+        self.assertEqual([20, 40], self.run_loop(20))
+    
+    def test_chunked_loop(self):
+        token = CancellationToken()
+        self.assertEqual([50, 100], self.run_loop(cancellation_token = token, decode_chunk_size = 8))
+        # the loop stops within a chunk if `cond` is False
+        self.assertEqual([20, 40], self.run_loop(20, cancellation_token = token, decode_chunk_size = 8))
+    
+    def test_cancellation(self):
+        self.assertEqual(
+            [16, 32], self.run_loop(cancellation_token = _CancelledAfter(2), decode_chunk_size = 8)
+        )
+        
+        token = CancellationToken()
+        token.cancel()
+        self.assertEqual([0, 0], self.run_loop(cancellation_token = token, decode_chunk_size = 8))
+
+class TestCompiledCancellation(CustomTestCase):
+    def test_cancellation_id(self):
+        config  = SimpleNamespace(max_steps = 51)
+        token   = CancellationToken()
+        cancellation_id = generation_utils.register_cancellation_token(token)
+        
+        def body(i, x):
+            if int(i) == 9: token.cancel()
+            return i + 1, x + 2
+        
+        try:
+            # the token is checked at each step (by a host callback) in the compiled loop
+            with ops.XLAExecution():
+                self.assertFalse(ops.executing_eagerly())
+                out = _decoding_loop(
+                    lambda i, x: i < 100,
+                    body,
+                    (K.convert_to_tensor(0), K.convert_to_tensor(0)),
+                    config,
+                    cancellation_id = cancellation_id
+                )
+        finally:
+            generation_utils.unregister_cancellation_token(cancellation_id)
+        
+        self.assertEqual([10, 20], [int(v) for v in out])
+        self.assertEqual({}, generation_utils._cancellation_tokens)
+
+class TestGenerate(CustomTestCase):
+    def test_eager_decoding(self):
+        model   = _FakeGenerator()
+        token   = CancellationToken()
+        manager = SimpleNamespace(cancellation_token = token)
+        
+        # a cancellation token alone (e.g., in `astream`) keeps the compiled generation, and is checked by id
+        model.generate(np.arange(5), 16, manager)
+        self.assertFalse('run_eagerly' in model.calls[-1])
+        self.assertFalse('cancellation_token' in model.calls[-1])
+        self.assertTrue('cancellation_id' in model.calls[-1])
+        # the token is unregistered once the generation is finished
+        self.assertEqual({}, generation_utils._cancellation_tokens)
+        
+        model.generate(np.arange(5), 16, manager, decode_chunk_size = 4)
+        self.assertEqual(True, model.calls[-1]['run_eagerly'])
+        self.assertEqual(4, model.calls[-1]['decode_chunk_size'])
+        self.assertTrue(model.calls[-1]['cancellation_token'] is manager)
+        
+        model.generate(np.arange(5), 16, SimpleNamespace(cancellation_token = None), decode_chunk_size = 4)
+        self.assertFalse('decode_chunk_size' in model.calls[-1])
+    
+    def test_generation_key(self):
+        tokens = np.arange(5)
+        self.assertEqual(
+            get_generation_key(tokens, temperature = None, streaming = True),
+            get_generation_key(tokens, temperature = None, streaming = False)
+        )
+        # the non-scalar arguments are part of the key
+        for first, second in (
+            ({'stop_words' : ['a']}, {'stop_words' : ['b']}),
+            ({'options' : {'x' : 1}}, {'options' : {'x' : 2}}),
+            ({'image' : K.zeros((64, 64))}, {'image' : K.ones((64, 64))})
+        ):
+            self.assertNotEqual(get_generation_key(tokens, ** first), get_generation_key(tokens, ** second))
+        # the tensors are hashed by their content
+        self.assertEqual(
+            get_generation_key(tokens, image = K.zeros((64, 64), dtype = 'float32')),
+            get_generation_key(tokens, image = np.zeros((64, 64), dtype = 'float32'))
+        )
+    
+    def test_sampling(self):
+        self.assertFalse(is_sampling_config())
+        self.assertFalse(is_sampling_config(method = 'greedy', temperature = 0., top_k = 1))
+        for config in ({'method' : 'sample'}, {'temperature' : 0.7}, {'top_k' : 50}, {'top_p' : 0.9}):
+            self.assertTrue(is_sampling_config(** config), str(config))
+        
+        model   = _FakeGenerator()
+        model.single_flight = SingleFlight()
+        manager = SimpleNamespace(cancellation_token = None, is_aborted = lambda: False)
+        
+        model.generate(np.arange(5), 16, manager, temperature = 0.7)
+        self.assertEqual(0, model.single_flight.get_stats()['leaders'])
+        model.generate(np.arange(5), 16, manager)
+        self.assertEqual(1, model.single_flight.get_stats()['leaders'])
+
+class TestDecoderState(CustomTestCase):
+    def setUp(self):
+        self.tokenizer  = default_english_tokenizer(
+            vocab_size  = 150, pad_token = '_', sos_token = '<s>', eos_token = '</s>', use_sos_and_eos = True
+        )
+        self.manager    = InferenceManager(
+            SimpleNamespace(get_state = lambda: None), tokenizer = self.tokenizer
+        )
+        self.prompt = '<s>user : what is the weather in paris</s><s>assistant : '
+        self.tokens = self.tokenizer.encode_prompt(self.prompt, add_eos = False, return_type = 'np')
+    
+    def encode(self, text):
+        return self.tokenizer.encode_prompt(text, add_sos = False, add_eos = False, return_type = 'np')
+    
+    def test_splice(self):
+        output  = 'weather of paris'
+        # the generation ends with the end-of-turn token, which is not part of the output text
+        output_tokens = np.concatenate([self.encode(output), [self.tokenizer.eos_token_idx]])
+        self.manager.save_decoder_state(self.prompt, self.tokens, output, output_tokens[None])
+        
+        new_prompt = self.prompt + output + '</s><s>tool : sunny</s><s>assistant : '
+        self.assertEqual(
+            self.tokenizer.encode_prompt(new_prompt, add_eos = False, return_type = 'np'),
+            self.manager.get_prompt_tokens(new_prompt)
+        )
+        self.assertEqual(None, self.manager.get_prompt_tokens('<s>user : hello</s>'))
+    
+    def test_splice_end_token_in_output(self):
+        output  = 'weather of paris</s>'
+        self.manager.save_decoder_state(self.prompt, self.tokens, output, self.encode(output))
+        
+        new_prompt = self.prompt + output + '<s>tool : sunny</s><s>assistant : '
+        self.assertEqual(
+            self.tokenizer.encode_prompt(new_prompt, add_eos = False, return_type = 'np'),
+            self.manager.get_prompt_tokens(new_prompt)
+        )
+    
+    def test_mismatch(self):
+        # the output has been modified after the generation : the whole prompt has to be encoded
+        self.manager.save_decoder_state(self.prompt, self.tokens, 'weather of rome', self.encode('weather of paris'))
+        self.assertEqual(None, self.manager.get_prompt_tokens(self.prompt + 'weather of rome</s>'))
+
+class _ChatGenerator:
+    """ Minimal `TextGenerator` executing the real `infer` (prompt, history, ...), where the generation always returns `answer` """
+    def __init__(self, directory, answer = 'paris', scheduler_config = None):
+        self.name   = 'chat_generator'
+        self.lang   = 'en'
+        self.runtime    = 'keras'
+        self.max_input_length   = None
+        self.max_output_length  = None
+        self.max_concurrent_requests    = 1
+        self.scheduler_config   = scheduler_config
+        self._scheduler = None
+        self.tokenizer  = default_english_tokenizer(
+            vocab_size  = 150, pad_token = '_', sos_token = '<s>', eos_token = '</s>', use_sos_and_eos = True
+        )
+        self.tokenizer.template = '{% for message in messages %}<s>{{ message["role"] }} : {{ message["content"] }}</s>{% endfor %}<s>assistant : '
+        self.conv_manager   = ConversationManager(directory, self.tokenizer)
+        self.prompt_formatter   = PromptFormatter(self.tokenizer)
+        self.answer_tokens  = self.tokenizer.encode(answer, add_sos_and_eos = False, return_type = 'list')
+        self.num_generations    = 0
+    
+    def generate(self, tokens, max_new_tokens, inference_manager, ** kwargs):
+        self.num_generations += 1
+        self.is_scheduled = RequestScheduler.is_scheduled()
+        return [[self.answer_tokens]]
+    
+    def decode_output(self, output):
+        return [self.tokenizer.decode(output[0][0])]
+    
+    infer   = TextGenerator.infer
+    answer  = TextGenerator.answer
+    translate   = TextGenerator.translate
+    prepare_for_inference   = TextGenerator.prepare_for_inference
+    submit  = TextGenerator.submit
+    scheduler   = TextGenerator.scheduler
+
+class TestTextDeltaCallback(CustomTestCase):
+    def test_unstable_tail(self):
+        deltas  = []
+        callback    = TextDeltaCallback(SimpleNamespace(put = deltas.append))
+        # the end of the decoded text changes between 2 steps
+        for text in ('Hello', 'Hello wor', 'Hello wor\ufffd', 'Hello world ab', 'Hello world abd !'):
+            callback(text)
+        callback(END_OF_STREAM)
+        self.assertEqual('Hello world abd !', ''.join(deltas))
+        self.assertEqual(['Hello ', 'world ', 'abd ', '!'], deltas)
+        
+        # the text of the next inference is separated from the previous one
+        callback('Done')
+        callback(END_OF_STREAM)
+        self.assertEqual('Hello world abd !\n\nDone', ''.join(deltas))
+
+class TestResponseCache(CustomTestCase):
+    def setUp(self):
+        self.path   = os.path.join(temp_dir, 'response-cache-{}.db'.format(self._testMethodName))
+        self.cache  = SemanticCache(self.path, threshold = 0.9)
+        self.model  = _ChatGenerator(os.path.join(temp_dir, 'conversations'))
+        self.paragraphs = [{'chunk_id' : 'chunk-1', 'text' : 'Paris is the capital of France'}]
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors = True)
+    
+    @staticmethod
+    def _encoder(texts):
+        vectors = np.zeros((len(texts), 16), dtype = 'float32')
+        for i, text in enumerate(texts):
+            for word in sorted(set(text.split())):
+                vectors[i, sum(map(ord, word)) % 16] += 1
+        return vectors
+    
+    def answer(self, question, method = 'answer', ** kwargs):
+        kwargs.setdefault('paragraphs', self.paragraphs)
+        return getattr(self.model, method)(
+            question, response_cache = self.cache, cache_encoder = self._encoder, ** kwargs
+        )
+    
+    def test_answer(self):
+        for question in ('What is the capital of France ?', 'what is the capital of france'):
+            result = self.answer(question, conv_id = 'conv-{}'.format(len(question)), save = False)
+            self.assertEqual('paris', result['predicted'])
+        
+        # the 2nd (new) conversation has the same (empty) history : the cached answer is used
+        self.assertEqual(1, self.model.num_generations)
+        
+        # different paragraphs : the model is executed
+        self.answer('What is the capital of France ?', messages = [], paragraphs = None)
+        self.assertEqual(2, self.model.num_generations)
+    
+    def test_scope_and_history(self):
+        question    = 'What is the capital of France ?'
+        self.answer(question, messages = [])
+        
+        # another task / language : the cached answer is not used
+        self.answer(question, method = 'translate', messages = [])
+        self.answer(question, messages = [], lang = 'fr')
+        self.assertEqual(3, self.model.num_generations)
+        
+        # the default conversation now contains the previous answer : the prompt (and the answer) differs
+        self.answer(question)
+        self.assertEqual(4, self.model.num_generations)
+        # the arguments that do not impact the answer are ignored
+        self.answer(question, messages = [], stream_text = True, stream_callback = lambda _: True)
+        self.assertEqual(4, self.model.num_generations)
+    
+    def test_replay(self):
+        self.model.answer_tokens = self.model.tokenizer.encode(
+            'paris is the capital of france, and its largest city', add_sos_and_eos = False, return_type = 'list'
+        )
+        self.answer('Where is Paris ?', messages = [])
+        
+        texts   = []
+        result  = self.answer(
+            'Where is Paris ?', messages = [], stream_text = True, stream_callback = texts.append
+        )
+        
+        self.assertEqual(1, self.model.num_generations)
+        self.assertEqual(
+            ['paris is the capital', 'paris is the capital of france, and its', result['predicted']],
+            [text for text in texts if isinstance(text, str)]
+        )
+
+class TestPrepareForInference(CustomTestCase):
+    def test_prompt_tokens_cache(self):
+        model = _ChatGenerator(os.path.join(temp_dir, 'conversations'))
+        paragraphs  = [{'text' : 'Paris is the capital of France'}]
+        
+        self.assertEqual('Where is Paris ?', model.prepare_for_inference('Where is Paris ?', paragraphs = paragraphs))
+        
+        # all the segments of the prompt have been tokenized by `prepare_for_inference`
+        misses  = model.tokenizer._segments_cache.get_stats()['misses']
+        model.infer('Where is Paris ?', messages = [], paragraphs = paragraphs)
+        self.assertEqual(misses, model.tokenizer._segments_cache.get_stats()['misses'])
+
+class TestScheduledInfer(CustomTestCase):
+    def test_scheduled_infer(self):
+        model = _ChatGenerator(os.path.join(temp_dir, 'conversations'))
+        model.infer('Where is Paris ?', messages = [])
+        self.assertFalse(model.is_scheduled)
+        # the conversation is released at the end of the request
+        self.assertEqual(0, len(model.conv_manager._convs._pinned))
+        
+        # with a `scheduler_config`, the synchronous calls are executed by the scheduler
+        model = _ChatGenerator(os.path.join(temp_dir, 'conversations'), scheduler_config = {})
+        result = model.answer('Where is Paris ?', messages = [], priority = 1)
+        self.assertEqual('paris', result['predicted'])
+        self.assertTrue(model.is_scheduled)
+        self.assertEqual(1, model.scheduler.get_stats()['completed'])
+        model.scheduler.stop()
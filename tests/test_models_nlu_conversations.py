@@ -0,0 +1,214 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import tempfile
+
+from . import CustomTestCase
+from utils import to_json
+from models.nlu.conversations import Conversation, ConversationLog, ConversationManager, MessageList
+from models.nlu.conversations.conversation_log import _add_prefix
+
+class TestConversationLog(CustomTestCase):
+    def setUp(self):
+        self.directory  = tempfile.TemporaryDirectory()
+        self.filename   = os.path.join(self.directory.name, 'conversation.jsonl')
+        
+        self.conv   = Conversation(id = 'conv', name = 'test')
+        self.conv.add_instruction('Be concise')
+        self.conv.add_message('Hello !', role = 'user', documents = 'report.pdf')
+        self.conv.add_message(
+            'Bonjour "à tous" !\n{"op": "reset"}', role = 'assistant', prompt = '<s>Hello !</s>'
+        )
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def read_records(self):
+        with open(self.filename, 'r', encoding = 'utf-8') as file:
+            return [json.loads(line) for line in file]
+    
+    def assertConvEqual(self, target, value):
+        self.assertEqual(ConversationLog.get_attributes(target), ConversationLog.get_attributes(value))
+        for key in Conversation.__state_fields__:
+            self.assertEqual(to_json(list(getattr(target, key))), to_json(list(getattr(value, key))))
+    
+    def test_round_trip(self):
+        log = ConversationLog(self.filename)
+        self.assertEqual(5, log.save(self.conv))
+        
+        conv = ConversationLog(self.filename).load()
+        self.assertConvEqual(self.conv, conv)
+        self.assertEqual(
+            self.conv.messages[1].metadata, conv.messages[1].metadata
+        )
+        # the `.jsonl` extension is supported by `Conversation.save` / `Conversation.load`
+        filename = os.path.join(self.directory.name, 'copy.jsonl')
+        self.conv.save(filename)
+        self.assertConvEqual(self.conv, Conversation.load(filename))
+    
+    def test_lazy_messages(self):
+        ConversationLog(self.filename).save(self.conv)
+        
+        # the messages are written with the prefix used by the loading fast path
+        with open(self.filename, 'r', encoding = 'utf-8') as file:
+            lines = [l for l in file if l.startswith(_add_prefix.format('messages'))]
+        self.assertEqual(2, len(lines))
+        
+        conv = ConversationLog(self.filename).load()
+        self.assertTrue(isinstance(conv.messages, MessageList))
+        self.assertTrue(conv.messages.num_decoded <= 1)
+        self.assertEqual('Bonjour "à tous" !\n{"op": "reset"}', conv.messages[-1].content)
+        self.assertEqual('Hello !', conv.messages[0].content)
+        self.assertEqual(2, conv.messages.num_decoded)
+    
+    def test_other_layout(self):
+        # a log written with another `json.dumps` layout is loaded without the fast path
+        ConversationLog(self.filename).save(self.conv)
+        lines   = [json.dumps(r, separators = (',', ':'), ensure_ascii = True) for r in self.read_records()]
+        with open(self.filename, 'w', encoding = 'utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        
+        self.assertConvEqual(self.conv, ConversationLog(self.filename).load())
+    
+    def test_append(self):
+        log = ConversationLog(self.filename)
+        log.save(self.conv)
+        self.assertEqual(0, log.save(self.conv))
+        
+        self.conv.add_message('How are you ?', role = 'user')
+        self.conv.name = 'renamed'
+        self.assertEqual(2, log.save(self.conv))
+        self.assertEqual(['set', 'add'], [r['op'] for r in self.read_records()[-2 :]])
+        self.assertEqual(1, log.num_obsolete)
+        
+        # a reloaded log appends to the existing file
+        log  = ConversationLog(self.filename)
+        conv = log.load()
+        conv.add_message('Fine, thanks !', role = 'assistant')
+        self.assertEqual(1, log.save(conv))
+        
+        self.conv.messages.append(conv.messages[-1])
+        self.assertConvEqual(self.conv, ConversationLog(self.filename).load())
+    
+    def test_reset(self):
+        log = ConversationLog(self.filename)
+        log.save(self.conv)
+        
+        state = self.conv.get_state()
+        self.conv.add_message('Message to remove', role = 'user')
+        log.save(self.conv)
+        
+        self.conv.set_state(state)
+        self.conv.remove_document('report.pdf')
+        self.conv.add_message('New message', role = 'user')
+        log.save(self.conv)
+        
+        self.assertEqual(
+            [('reset', 'messages'), ('reset', 'documents')],
+            [(r['op'], r['key']) for r in self.read_records() if r['op'] == 'reset']
+        )
+        self.assertConvEqual(self.conv, ConversationLog(self.filename).load())
+    
+    def test_compaction(self):
+        log = ConversationLog(self.filename, min_compaction_records = 4)
+        log.save(self.conv)
+        for i in range(3):
+            state = self.conv.get_state()
+            self.conv.add_message('Message {}'.format(i), role = 'user')
+            log.save(self.conv, compact = False)
+            self.conv.set_state(state)
+        
+        self.conv.add_message('Final message', role = 'user')
+        log.save(self.conv)
+        log.wait_compaction()
+        
+        self.assertEqual(0, log.num_obsolete)
+        self.assertEqual(6, log.num_records)
+        self.assertEqual(6, len(self.read_records()))
+        self.assertFalse(any(r['op'] == 'reset' for r in self.read_records()))
+        
+        conv = ConversationLog(self.filename).load()
+        self.assertConvEqual(self.conv, conv)
+        
+        # the compacted log is still appendable
+        conv.add_message('After compaction', role = 'user')
+        log.save(conv)
+        self.assertConvEqual(conv, ConversationLog(self.filename).load())
+
+    def test_save_during_compaction(self):
+        log = ConversationLog(self.filename, min_compaction_records = 2, compaction_ratio = 0.)
+        log.save(self.conv)
+        for i in range(20):
+            state = self.conv.get_state()
+            self.conv.add_message('Message {}'.format(i), role = 'user')
+            # the compaction runs in the background while the next messages are saved
+            log.save(self.conv)
+            self.conv.set_state(state)
+            self.conv.add_message('Kept {}'.format(i), role = 'user')
+            log.save(self.conv)
+        log.wait_compaction()
+        
+        self.assertEqual(len(self.read_records()), log.num_records)
+        self.assertConvEqual(self.conv, ConversationLog(self.filename).load())
+
+class TestConversationManager(CustomTestCase):
+    def test_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = ConversationManager(directory, None)
+            conv    = manager.get_conversation('conv', name = 'test')
+            conv.add_message('Hello !', role = 'user')
+            manager.save(conv)
+            conv.add_message('Hi !', role = 'assistant')
+            manager.save(conv)
+            
+            conv = ConversationManager(directory, None).get_conversation('conv')
+            self.assertEqual('test', conv.name)
+            self.assertEqual(['Hello !', 'Hi !'], [msg.content for msg in conv.messages])
+    
+    def test_pinned_conversation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = ConversationManager(directory, None, max_conversations = 1)
+            conv    = manager.get_conversation('conv', pin = True)
+            conv.add_message('Hello !', role = 'user')
+            
+            # the pinned conversation is kept in memory, and is still the one returned
+            manager.get_conversation('other')
+            self.assertTrue(manager.get_conversation('conv') is conv)
+            self.assertEqual(0, manager.get_cache_stats()['evictions'])
+            
+            # once released, the cache is bounded again, and the conversation is saved when evicted
+            manager.release(conv)
+            self.assertEqual(1, manager.get_cache_stats()['evictions'])
+            manager.get_conversation('other')
+            self.assertEqual(2, manager.get_cache_stats()['evictions'])
+            self.assertEqual(
+                ['Hello !'], [msg.content for msg in manager.get_conversation('conv').messages]
+            )
+
+class TestRAGSelector(CustomTestCase):
+    def test_empty_documents(self):
+        from models.nlu.conversations.conv_item_selectors.rag_selector import select_rag
+        
+        class EmbeddingModel:
+            def embed(self, texts):
+                raise AssertionError('No chunk should be embedded')
+            
+            def retrieve(self, query, db, ** _):
+                raise AssertionError('The retrieval requires a database')
+        
+        with tempfile.TemporaryDirectory() as directory:
+            documents = os.path.join(directory, 'documents')
+            os.makedirs(documents)
+            self.assertEqual(([], 0), select_rag(
+                'query', [], embedding_model = EmbeddingModel(), directory = directory, documents = documents
+            ))
@@ -0,0 +1,297 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import ast
+import time
+import tempfile
+import threading
+
+from . import CustomTestCase
+from models.nlu.tools import Tool, execute_code
+from models.nlu.tools.rag_tool import get_cache_inputs, rag_batch
+from models.nlu.tools.sandbox import SandboxError, SandboxPool
+from models.nlu.tools.tool_executor import dispatch_tool_calls, get_independent_tool_calls
+
+class _Recorder:
+    def __init__(self, delay = 0.):
+        self.delay  = delay
+        self.calls  = []
+        self.batches    = []
+        self._mutex = threading.Lock()
+    
+    def weather(self, city):
+        """ Return the weather in `city` """
+        time.sleep(self.delay)
+        with self._mutex: self.calls.append(('weather', city))
+        return 'sunny in {}'.format(city)
+    
+    def send_email(self, to, content):
+        """ Send an email """
+        with self._mutex: self.calls.append(('send_email', to))
+        return True
+    
+    def weather_batch(self, calls):
+        with self._mutex: self.batches.append(len(calls))
+        return ['sunny in {}'.format(call['city']) for call in calls]
+    
+    def get_tools(self, batch = False):
+        return [
+            Tool.from_function(
+                self.weather, name = 'weather', batch_function = self.weather_batch if batch else None
+            ),
+            Tool.from_function(self.send_email, name = 'send_email')
+        ]
+
+class TestToolCallsAnalysis(CustomTestCase):
+    def get_calls(self, code):
+        return get_independent_tool_calls(ast.parse(code), {'weather', 'send_email'})
+    
+    def test_independent_calls(self):
+        code = '\n'.join([
+            "cities = ['Paris', 'London']",
+            "a = weather('Paris')",
+            "b = weather(cities[1])",
+            "c = weather(a)",
+            "print(weather(city = 'Rome'))"
+        ])
+        self.assertEqual([
+            ('weather', ('Paris', ), {}),
+            ('weather', ('London', ), {}),
+            ('weather', (), {'city' : 'Rome'})
+        ], self.get_calls(code))
+    
+    def test_conditional_calls(self):
+        code = '\n'.join([
+            "w = weather('Paris')",
+            "if w == 'London':",
+            "    send_email('boss@corp', 'delete everything')",
+            "else:",
+            "    weather('Rome')",
+            "for city in []:",
+            "    send_email('a@b', 'loop')",
+            "while False:",
+            "    send_email('a@b', 'while')",
+            "def notify():",
+            "    send_email('a@b', 'function')",
+            "f = lambda: send_email('a@b', 'lambda')",
+            "x = send_email('a@b', 'ifexp') if w else None",
+            "y = w and send_email('a@b', 'boolop')",
+            "z = [send_email('a@b', 'comprehension') for _ in range(0)]"
+        ])
+        self.assertEqual([('weather', ('Paris', ), {})], self.get_calls(code))
+    
+    def test_conditional_execution(self):
+        recorder = _Recorder()
+        code = '\n'.join([
+            "w = weather('Paris')",
+            "v = weather('Berlin')",
+            "if w == 'London':",
+            "    send_email('boss@corp', 'delete everything')"
+        ])
+        result = execute_code(code, recorder.get_tools(), sandbox = False)
+        
+        self.assertEqual('', result['stderr'])
+        self.assertEqual('sunny in Paris', result['variables']['w'])
+        self.assertEqual(
+            [('weather', 'Berlin'), ('weather', 'Paris')], sorted(recorder.calls)
+        )
+
+class TestToolCallsDispatch(CustomTestCase):
+    def test_parallel_dispatch(self):
+        recorder = _Recorder(delay = 0.2)
+        code = '\n'.join([
+            "a = weather('Paris')",
+            "b = weather('London')",
+            "c = weather('Rome')"
+        ])
+        
+        start  = time.time()
+        result = execute_code(code, recorder.get_tools(), sandbox = False)
+        
+        self.assertTrue(time.time() - start < 0.5, 'The calls are not executed concurrently')
+        self.assertEqual('sunny in Rome', result['variables']['c'])
+        self.assertEqual(3, len(recorder.calls))
+    
+    def test_batching(self):
+        recorder = _Recorder()
+        tools    = {tool.name : tool for tool in recorder.get_tools(batch = True)}
+        futures  = dispatch_tool_calls([
+            ('weather', ('Paris', ), {}),
+            ('weather', (), {'city' : 'London'}),
+            ('weather', ('Paris', ), {}),
+            ('send_email', ('a@b', 'hello'), {})
+        ], tools)
+        
+        self.assertEqual(3, len(futures))
+        self.assertEqual(
+            ['True', 'sunny in London', 'sunny in Paris'], sorted(str(f.result()) for f in futures.values())
+        )
+        self.assertEqual([2], recorder.batches)
+        self.assertEqual([('send_email', 'a@b')], recorder.calls)
+
+class TestToolCache(CustomTestCase):
+    def test_ttl(self):
+        recorder = _Recorder()
+        tool     = Tool.from_function(recorder.weather, name = 'cached_weather', cache_ttl = 0.1)
+        
+        self.assertEqual('sunny in Paris', tool('Paris'))
+        self.assertEqual('sunny in Paris', tool(city = 'Paris'))
+        self.assertEqual('sunny in Rome', tool('Rome'))
+        self.assertEqual([('weather', 'Paris'), ('weather', 'Rome')], recorder.calls)
+        
+        time.sleep(0.15)
+        self.assertEqual('sunny in Paris', tool('Paris'))
+        self.assertEqual(3, len(recorder.calls))
+    
+    def test_copies(self):
+        def forecast(city):
+            """ Return the forecast in `city` """
+            return {'city' : city, 'forecast' : []}
+        
+        tool = Tool.from_function(forecast, name = 'cached_forecast', cache_ttl = 10)
+        
+        tool('Paris')['forecast'].append('rain')
+        self.assertEqual({'city' : 'Paris', 'forecast' : []}, tool('Paris'))
+    
+    def test_batch(self):
+        recorder = _Recorder()
+        tool     = Tool.from_function(
+            recorder.weather, name = 'cached_batch_weather', batch_function = recorder.weather_batch, cache_ttl = 10
+        )
+        
+        self.assertEqual(['sunny in Paris'], tool.batch([(('Paris', ), {})]))
+        self.assertEqual(
+            ['sunny in Paris', 'sunny in London'], tool.batch([(('Paris', ), {}), ((), {'city' : 'London'})])
+        )
+        # only `London` is computed by the 2nd batch
+        self.assertEqual([1, 1], recorder.batches)
+        self.assertEqual('sunny in London', tool('London'))
+        self.assertEqual([], recorder.calls)
+
+    def test_modified_document(self):
+        def read(documents):
+            """ Return the content of `documents` """
+            with open(documents, 'r') as f: return f.read()
+        
+        tool = Tool.from_function(read, name = 'cached_read', cache_ttl = 10, cache_inputs = get_cache_inputs)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'report.txt')
+            with open(filename, 'w') as f: f.write('v1')
+            self.assertEqual('v1', tool(filename))
+            
+            with open(filename, 'w') as f: f.write('v2 !')
+            self.assertEqual('v2 !', tool(filename))
+
+class TestRAGBatch(CustomTestCase):
+    def test_string_documents(self):
+        class Retriever:
+            def __init__(self):
+                self.documents  = []
+            
+            def predict(self, documents, ** _):
+                self.documents.append(documents)
+                return documents
+            
+            def retrieve(self, queries, db, k, ** _):
+                return [[{'text' : '{} in {}'.format(q, db[0])}] for q in queries]
+        
+        retriever = Retriever()
+        results   = rag_batch([
+            {'query' : 'q1', 'documents' : 'report.pdf', 'retriever' : retriever},
+            {'query' : 'q2', 'documents' : ['report.pdf'], 'retriever' : retriever}
+        ])
+        
+        self.assertEqual([['report.pdf']], retriever.documents)
+        self.assertEqual([[{'text' : 'q1 in report.pdf'}], [{'text' : 'q2 in report.pdf'}]], results)
+
+class TestSandbox(CustomTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = SandboxPool(2, time_limit = 5, memory_limit = 256 * 1024 ** 2, wait_timeout = 0.2).start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.terminate()
+    
+    def test_execute(self):
+        result = self.pool.execute('x = sum(range(10))\nprint(x)')
+        
+        self.assertEqual('', result['stderr'])
+        self.assertEqual(45, result['variables']['x'])
+        self.assertEqual('print(x) # 45', result['stdout'])
+    
+    def test_time_limit(self):
+        start  = time.time()
+        result = self.pool.execute('while True: pass', time_limit = 0.5)
+        
+        self.assertTrue(time.time() - start < 2.5)
+        self.assertTrue(result['stderr'].startswith('TimeoutError'), result['stderr'])
+        # the killed worker is replaced
+        self.assertEqual('', self.pool.execute('x = 1', time_limit = 5)['stderr'])
+    
+    def test_memory_limit(self):
+        result = self.pool.execute('x = bytearray(1024 ** 3)')
+        self.assertTrue(result['stderr'].startswith('MemoryError'), result['stderr'])
+        self.assertEqual('', self.pool.execute('x = bytearray(1024)')['stderr'])
+    
+    def test_tools(self):
+        recorder = _Recorder()
+        result   = self.pool.execute(
+            'w = weather("Paris")\nsend_email(w, "hello")',
+            {'weather' : recorder.weather, 'send_email' : recorder.send_email}
+        )
+        
+        self.assertEqual('', result['stderr'])
+        self.assertEqual('sunny in Paris', result['variables']['w'])
+        # the tools are executed in the current process
+        self.assertEqual([('weather', 'Paris'), ('send_email', 'sunny in Paris')], recorder.calls)
+    
+    def test_unpicklable_tool_result(self):
+        result = self.pool.execute('lock = make_lock()', {'make_lock' : threading.Lock})
+        
+        self.assertEqual('', result['stderr'])
+        self.assertTrue(isinstance(result['variables']['lock'], str))
+        # the pipe protocol is still in sync for the next calls
+        for _ in range(len(self.pool)):
+            result = self.pool.execute('y = 1 + 1\nprint(y)')
+            self.assertEqual(('', 2), (result['stderr'], result['variables']['y']))
+    
+    def test_concurrent_outputs(self):
+        code = 'import time\nfor _ in range(5):\n    print({})\n    time.sleep(0.02)'
+        
+        results = {}
+        def run(i):
+            results[i] = self.pool.execute(code.format(i))
+        
+        threads = [threading.Thread(target = run, args = (i, )) for i in range(2)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        
+        self.assertEqual({0 : '0\n0\n0\n0\n0', 1 : '1\n1\n1\n1\n1'}, {
+            i : res['stdout'] for i, res in results.items()
+        })
+    
+    def test_no_idle_worker(self):
+        pool = SandboxPool(1, wait_timeout = 0.2).start()
+        try:
+            thread = threading.Thread(target = pool.execute, args = ('import time\ntime.sleep(1)', ))
+            thread.start()
+            while not pool._idle.empty(): time.sleep(0.01)
+            
+            with self.assertRaises(SandboxError):
+                pool.execute('x = 1')
+            # `execute_code` falls back to the in-process execution
+            result = execute_code('x = 2', sandbox = pool)
+            self.assertEqual(2, result['variables']['x'])
+            thread.join()
+        finally:
+            pool.terminate()
@@ -0,0 +1,272 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import tempfile
+import threading
+
+from . import CustomTestCase
+from models.nlu.workflows.nodes import DAGExecution, FunctionNode, Graph
+from models.nlu.workflows.nodes.execution_context import ExecutionContext
+from models.nlu.workflows.nodes.node_cache import NodeCache, get_node_cache, set_node_cache
+from models.nlu.workflows.nodes.speculation import SpeculationEngine, get_speculation_engine, set_speculation_engine
+
+_calls  = []
+_started    = threading.Event()
+_release    = threading.Event()
+
+def _square(x):
+    _calls.append(x)
+    return x ** 2
+
+def _write_b(context):
+    time.sleep(0.05)
+    context['b'] = context['a'] * 10
+    return 'done'
+
+def _append_message(context):
+    context['messages'].append('speculated')
+    return 'done'
+
+def _wait_until_stopped(context):
+    node = FunctionNode.get('wait_until_stopped')
+    _started.set()
+    while not node.is_stopped(context): time.sleep(0.01)
+    return 'stopped'
+
+def _wait_for_release(context):
+    node = FunctionNode.get('wait_for_release')
+    while not node.is_stopped(context) and not _release.is_set(): time.sleep(0.01)
+    return context['x']
+
+def _sleep(x, delay = 0.1):
+    time.sleep(delay)
+    return x
+
+class TestExecutionContext(CustomTestCase):
+    def test_child(self):
+        stop  = threading.Event()
+        root  = ExecutionContext()
+        child = root.child(stopper = stop.is_set)
+        
+        self.assertTrue(root.enter())
+        self.assertFalse(root.enter())
+        self.assertFalse(child.enter())
+        self.assertIs(root, child.root)
+        
+        self.assertFalse(child.is_stopped())
+        stop.set()
+        self.assertTrue(child.is_stopped())
+        self.assertFalse(root.is_stopped())
+        
+        child.abort()
+        self.assertTrue(root.is_aborted())
+        self.assertTrue(root.is_stopped())
+    
+    def test_tasks(self):
+        execution = ExecutionContext()
+        results   = []
+        task = execution.run_async(_square, 3, callback = results.append)
+        self.assertEqual(9, task.get())
+        self.assertEqual([9], results)
+        
+        with self.assertRaises(RuntimeError):
+            execution.result()
+
+    def test_concurrent_submit(self):
+        engine = get_speculation_engine()
+        set_speculation_engine(SpeculationEngine())
+        try:
+            graph = Graph(
+                FunctionNode(_wait_for_release, name = 'wait_for_release', start_prefetch = 'concurrent_square'),
+                FunctionNode(_square, source_key = 'x', name = 'concurrent_square'),
+                name = 'concurrent_graph'
+            )
+            first, second = graph.submit(x = 2), graph.submit(x = 3)
+            # both executions have prefetched their own `concurrent_square`
+            while not (first.is_prefetched(graph.nodes[1]) and second.is_prefetched(graph.nodes[1])):
+                time.sleep(0.01)
+            
+            first.abort()
+            self.assertEqual(2, first.result(timeout = 5))
+            self.assertFalse(second.is_aborted())
+            self.assertTrue(second.is_prefetched(graph.nodes[1]))
+            
+            _release.set()
+            self.assertEqual(9, second.result(timeout = 5))
+            self.assertEqual(
+                {'used' : 1, 'cancelled' : 1},
+                {k : v for k, v in get_speculation_engine().get_stats().items() if k in ('used', 'cancelled')}
+            )
+        finally:
+            _release.set()
+            set_speculation_engine(engine)
+
+class TestSpeculation(CustomTestCase):
+    def setUp(self):
+        self.engine = get_speculation_engine()
+        set_speculation_engine(SpeculationEngine())
+    
+    def tearDown(self):
+        set_speculation_engine(self.engine)
+    
+    def test_merge(self):
+        node    = FunctionNode(_write_b, name = 'write_b')
+        context = {'a' : 1, 'c' : 'x', '__execution__' : ExecutionContext()}
+        
+        node.prefetch(context)
+        self.assertTrue(node.is_prefetched(context))
+        # written by another node while the speculation is running
+        context['a'] = 2
+        context['c'] = 'y'
+        
+        context, result = node.start(context)
+        self.assertEqual('done', result)
+        self.assertEqual({'a' : 2, 'b' : 10, 'c' : 'y'}, context)
+        self.assertEqual(1, get_speculation_engine().get_stats()['used'])
+    
+    def test_cancel(self):
+        node    = FunctionNode(_wait_until_stopped, name = 'wait_until_stopped')
+        context = {'__execution__' : ExecutionContext()}
+        
+        node.prefetch(context)
+        speculation = context['__execution__'].root._prefetched[node.name]
+        self.assertTrue(_started.wait(timeout = 5))
+        node.cancel(context)
+        
+        self.assertFalse(node.is_prefetched(context))
+        self.assertFalse(node.is_stopped(context))
+        # the speculative run is stopped (without stopping the execution)
+        self.assertEqual('stopped', speculation._task._future.result(timeout = 5))
+        with self.assertRaises(RuntimeError):
+            speculation.result(context)
+        self.assertEqual(1, get_speculation_engine().get_stats()['cancelled'])
+
+    def test_in_place_mutation(self):
+        node    = FunctionNode(_append_message, name = 'append_message')
+        context = {'messages' : ['hello'], '__execution__' : ExecutionContext()}
+        
+        node.prefetch(context)
+        speculation = context['__execution__'].root._prefetched[node.name]
+        self.assertEqual('done', speculation._task._future.result(timeout = 5))
+        node.cancel(context)
+        # the cancelled speculation does not modify the actual context
+        self.assertEqual(['hello'], context['messages'])
+        
+        node.prefetch(context)
+        context, result = node.start(context)
+        self.assertEqual('done', result)
+        self.assertEqual(['hello', 'speculated'], context['messages'])
+
+class TestNodeCache(CustomTestCase):
+    def setUp(self):
+        self.cache  = get_node_cache()
+        self.directory  = tempfile.TemporaryDirectory()
+        set_node_cache(NodeCache(directory = self.directory.name))
+        _calls.clear()
+    
+    def tearDown(self):
+        set_node_cache(self.cache)
+        self.directory.cleanup()
+    
+    def test_tiers(self):
+        node = FunctionNode(_square, source_key = 'x', cache = True, name = 'cached_square')
+        
+        self.assertEqual(4, node(x = 2))
+        self.assertEqual(4, node(x = 2))
+        self.assertEqual(9, node(x = 3))
+        self.assertEqual([2, 3], _calls)
+        
+        # a new instance (e.g., a new process) only has the on-disk tier
+        set_node_cache(NodeCache(directory = self.directory.name))
+        self.assertEqual(4, node(x = 2))
+        self.assertEqual([2, 3], _calls)
+        self.assertEqual(1, get_node_cache().get_stats()['disk_hits'])
+    
+    def test_ttl(self):
+        node = FunctionNode(_square, source_key = 'x', cache = True, cache_ttl = 0.05, name = 'ttl_square')
+        
+        node(x = 2)
+        node(x = 2)
+        time.sleep(0.1)
+        node(x = 2)
+        self.assertEqual([2, 2], _calls)
+
+    def test_disk_eviction(self):
+        cache = NodeCache(directory = self.directory.name, max_disk_size = 2000)
+        for i in range(10): cache.put('key{}'.format(i), 'x' * 500)
+        
+        self.assertTrue(cache.get_stats()['disk_size'] <= 2000)
+        self.assertTrue(cache.get_stats()['evictions'] > 0)
+        
+        cache = NodeCache(directory = self.directory.name)
+        self.assertEqual(None, cache.get('key0'))
+        self.assertEqual('x' * 500, cache.get('key9')['result'])
+    
+    def test_concurrent_save(self):
+        cache = get_node_cache()
+        def put(i):
+            for _ in range(20): cache.put('key', [i] * 100)
+        
+        with self.assertNoLogs('models.nlu.workflows.nodes.node_cache', level = 'WARNING'):
+            threads = [threading.Thread(target = put, args = (i, )) for i in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        
+        # no temporary file is left
+        self.assertEqual(['key.pkl'], os.listdir(self.directory.name))
+        self.assertEqual(100, len(NodeCache(directory = self.directory.name).get('key')['result']))
+
+class TestDAGExecution(CustomTestCase):
+    def test_dependencies(self):
+        graph = DAGExecution(
+            FunctionNode(_sleep, source_key = 'x', output_key = 'a', name = 'deps_a'),
+            FunctionNode(_sleep, source_key = 'x', output_key = 'b', name = 'deps_b'),
+            FunctionNode(_sleep, source_key = 'a', output_key = 'c', name = 'deps_c'),
+            # writes a key read by `deps_c` : executed after it
+            FunctionNode(_sleep, source_key = 'b', output_key = 'a', name = 'deps_d'),
+            # may read the whole context : depends on all the previous nodes
+            FunctionNode(lambda context: context['c'] + context['a'], name = 'deps_e'),
+            name = 'dag_dependencies'
+        )
+        self.assertEqual([set(), set(), {0}, {1, 2}, {3}], graph.dependencies)
+    
+    def test_parallelism(self):
+        graph = DAGExecution(
+            * [
+                FunctionNode(_sleep, source_key = 'x', output_key = 'out_{}'.format(i), name = 'parallel_{}'.format(i))
+                for i in range(4)
+            ],
+            FunctionNode(_sleep, source_key = 'out_0', output_key = 'final', name = 'parallel_final'),
+            name = 'dag_parallelism'
+        )
+        
+        start = time.time()
+        context, result = graph.start(x = 1)
+        self.assertTrue(time.time() - start < 0.35, 'The independent nodes are not executed concurrently')
+        self.assertEqual(1, result)
+        self.assertEqual({'x' : 1, 'out_0' : 1, 'out_1' : 1, 'out_2' : 1, 'out_3' : 1, 'final' : 1}, context)
+    
+    def test_critical_path(self):
+        graph = DAGExecution(
+            FunctionNode(_sleep, source_key = 'x', output_key = 'a', name = 'dag_a'),
+            FunctionNode(_sleep, source_key = 'x', output_key = 'b', name = 'dag_b', delay = 0.),
+            FunctionNode(_sleep, source_key = 'a', output_key = 'c', name = 'dag_c'),
+            name = 'dag_critical_path'
+        )
+        execution = graph.submit(x = 1)
+        self.assertEqual(1, execution.result())
+        
+        stats = execution.stats[graph.name]
+        self.assertEqual(['dag_a', 'dag_c'], stats['critical_path'])
+        self.assertTrue(stats['critical_path_time'] <= stats['total_time'])
+        self.assertTrue(stats['total_time'] < stats['sequential_time'] + 0.05)
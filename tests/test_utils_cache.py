@@ -0,0 +1,196 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import tempfile
+import threading
+import numpy as np
+
+from . import CustomTestCase
+from utils.cache_utils import DiskCache, LRUCache
+from utils.threading import SingleFlight, canonical_hash
+
+class TestLRUCache(CustomTestCase):
+    def test_max_size(self):
+        evicted = []
+        cache   = LRUCache(2, on_evict = lambda k, v: evicted.append(k))
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        
+        self.assertEqual(['b'], evicted)
+        self.assertEqual(['a', 'c'], cache.keys())
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(
+            {'hits' : 1, 'misses' : 1, 'evictions' : 1},
+            {k : v for k, v in cache.get_stats().items() if k in ('hits', 'misses', 'evictions')}
+        )
+    
+    def test_max_bytes(self):
+        cache = LRUCache(max_bytes = 10, size_fn = len)
+        cache['a'] = 'x' * 4
+        cache['b'] = 'x' * 4
+        self.assertEqual(8, cache.nbytes)
+        
+        cache['c'] = 'x' * 4
+        self.assertEqual(['b', 'c'], cache.keys())
+        self.assertEqual(8, cache.nbytes)
+        
+        # the most recent item is always kept
+        cache['d'] = 'x' * 20
+        self.assertEqual(['d'], cache.keys())
+    
+    def test_update_size(self):
+        cache = LRUCache(max_bytes = 10, size_fn = len)
+        cache['a'] = [1, 2]
+        cache['b'] = value = [1, 2]
+        
+        value.extend(range(8))
+        cache.update_size('b')
+        self.assertEqual(['b'], cache.keys())
+        self.assertEqual(10, cache.nbytes)
+    
+    def test_ttl(self):
+        evicted = []
+        cache   = LRUCache(ttl = 0.05, on_evict = lambda k, v: evicted.append(k))
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertTrue('a' in cache)
+        
+        time.sleep(0.1)
+        self.assertFalse('a' in cache)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(1, len(cache))
+        
+        cache.purge()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(['a', 'b'], evicted)
+        self.assertEqual(2, cache.get_stats()['expirations'])
+    
+    def test_pin(self):
+        evicted = []
+        cache   = LRUCache(2, ttl = 0.05, on_evict = lambda k, v: evicted.append(k))
+        cache['a'] = 1
+        cache.pin('a')
+        cache['b'] = 2
+        cache['c'] = 3
+        # `a` is the least recently used item, but it is pinned
+        self.assertEqual(['b'], evicted)
+        
+        time.sleep(0.1)
+        self.assertEqual(1, cache.get('a'))
+        
+        cache.unpin('a')
+        cache.purge()
+        self.assertEqual(['b', 'c', 'a'], evicted)
+
+class TestDiskCache(CustomTestCase):
+    def setUp(self):
+        self.directory  = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def test_save_and_load(self):
+        cache = DiskCache(
+            self.directory.name,
+            extension   = '.json',
+            dumps   = lambda entry: json.dumps(entry).encode('utf-8'),
+            loads   = lambda data: json.loads(data.decode('utf-8'))
+        )
+        self.assertTrue(cache.save(os.path.join('ns', 'a'), {'value' : 1}))
+        self.assertEqual({'value' : 1}, cache.load(os.path.join('ns', 'a')))
+        self.assertEqual(None, cache.load('b'))
+        
+        # a new instance scans the existing files
+        self.assertEqual(cache.nbytes, DiskCache(self.directory.name, extension = '.json').nbytes)
+        
+        cache.remove(os.path.join('ns', 'a'))
+        self.assertEqual(0, cache.nbytes)
+        self.assertEqual([], os.listdir(os.path.join(self.directory.name, 'ns')))
+    
+    def test_eviction(self):
+        cache = DiskCache(self.directory.name, max_size = 2000)
+        for i in range(10): cache.save('key{}'.format(i), 'x' * 500, timestamp = i)
+        
+        self.assertTrue(cache.nbytes <= 2000)
+        self.assertTrue(cache.evictions > 0)
+        self.assertEqual(None, cache.load('key0'))
+        self.assertEqual('x' * 500, cache.load('key9'))
+    
+    def test_concurrent_save(self):
+        cache = DiskCache(self.directory.name)
+        def save(i):
+            for _ in range(20): cache.save('key', [i] * 100)
+        
+        with self.assertNoLogs('utils.cache_utils', level = 'WARNING'):
+            threads = [threading.Thread(target = save, args = (i, )) for i in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        
+        # no temporary file is left
+        self.assertEqual(['key.pkl'], os.listdir(self.directory.name))
+        self.assertEqual(100, len(cache.load('key')))
+
+class TestSingleFlight(CustomTestCase):
+    def test_canonical_hash(self):
+        self.assertEqual(
+            canonical_hash('a', x = {'b' : 1, 'c' : np.arange(3)}),
+            canonical_hash('a', x = {'c' : np.arange(3), 'b' : 1})
+        )
+        self.assertNotEqual(canonical_hash(np.arange(3)), canonical_hash(np.arange(4)))
+        self.assertNotEqual(canonical_hash(np.arange(3)), canonical_hash(np.arange(3.)))
+    
+    def test_deduplication(self):
+        calls, event = [], threading.Event()
+        def compute(x):
+            calls.append(x)
+            event.wait()
+            return x * 2
+        
+        single_flight = SingleFlight()
+        results = []
+        threads = [
+            threading.Thread(target = lambda: results.append(single_flight.do('key', compute, 2)))
+            for _ in range(5)
+        ]
+        for t in threads: t.start()
+        while single_flight.get_stats()['followers'] < 4: time.sleep(0.001)
+        event.set()
+        for t in threads: t.join()
+        
+        self.assertEqual([2], calls)
+        self.assertEqual([4] * 5, results)
+        self.assertEqual(0, single_flight.get_stats()['in_flight'])
+        
+        # without cache, the computation is performed again
+        single_flight.do('key', compute, 2)
+        self.assertEqual([2, 2], calls)
+    
+    def test_cache_and_errors(self):
+        calls = []
+        def compute(x):
+            calls.append(x)
+            if x < 0: raise ValueError()
+            return x
+        
+        single_flight = SingleFlight(ttl = 10)
+        self.assertEqual(1, single_flight.do('a', compute, 1))
+        self.assertEqual(1, single_flight.do('a', compute, 1))
+        self.assertEqual([1], calls)
+        
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                single_flight.do('b', compute, -1)
+        self.assertEqual([1, -1, -1], calls)
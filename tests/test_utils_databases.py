@@ -0,0 +1,165 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import shutil
+import numpy as np
+
+from . import CustomTestCase, temp_dir
+from utils.databases import DocumentIndexer, SemanticCache
+
+class TestDocumentIndexer(CustomTestCase):
+    def setUp(self):
+        self.directory  = os.path.join(temp_dir, 'indexer-{}'.format(self._testMethodName))
+        self.documents  = os.path.join(self.directory, 'documents')
+        os.makedirs(self.documents, exist_ok = True)
+        
+        self._embedded  = []
+        for i in range(3): self._write(i, 'Document {}\n\nParagraph of document {}'.format(i, i))
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors = True)
+    
+    def _write(self, i, text):
+        with open(os.path.join(self.documents, 'doc{}.txt'.format(i)), 'w') as file:
+            file.write(text)
+    
+    def _encoder(self, texts):
+        self._embedded.extend(texts)
+        return np.random.uniform(size = (len(texts), 8)).astype('float32')
+    
+    def _get_indexer(self, ** kwargs):
+        return DocumentIndexer(
+            os.path.join(self.directory, 'documents.db'),
+            encoder = self._encoder,
+            ** kwargs
+        )
+    
+    def test_incremental_update(self):
+        indexer = self._get_indexer()
+        
+        db = indexer.update(self.documents, cache = False)
+        self.assertEqual(3, len(indexer))
+        self.assertEqual(6, len(db))
+        self.assertEqual(6, len(db.vectors))
+        self.assertEqual(6, len(self._embedded))
+        
+        self._embedded = []
+        indexer.update(self.documents, cache = False)
+        self.assertEqual([], self._embedded)
+        
+        self._write(3, 'New document')
+        db = indexer.update(self.documents, cache = False)
+        self.assertEqual(['New document'], self._embedded)
+        self.assertEqual(7, len(db))
+        
+        self._embedded = []
+        self._write(0, 'Document 0\n\nUpdated paragraph')
+        db = indexer.update(self.documents, cache = False)
+        self.assertEqual(['Updated paragraph'], self._embedded)
+        self.assertEqual(7, len(db))
+        self.assertEqual(7, len(db.vectors))
+        self.assertFalse(any('Paragraph of document 0' in t for t in db.get_column('text')))
+        
+        os.remove(os.path.join(self.documents, 'doc1.txt'))
+        db = indexer.update(self.documents, cache = False)
+        self.assertEqual(3, len(indexer))
+        self.assertEqual(5, len(db))
+        self.assertEqual(5, len(db.vectors))
+    
+    def test_batching(self):
+        batches = []
+        def encoder(texts):
+            batches.append(len(texts))
+            return self._encoder(texts)
+        
+        indexer = self._get_indexer(batch_size = 4)
+        indexer.encoder = encoder
+        indexer.update(self.documents, cache = False)
+        self.assertEqual([4, 2], batches)
+    
+    def test_manifest_persistence(self):
+        self._get_indexer().update(self.documents, cache = False)
+        self._embedded = []
+        
+        indexer = DocumentIndexer(
+            os.path.join(self.directory, 'documents.db'), encoder = self._encoder
+        )
+        self.assertEqual(3, len(indexer))
+        self.assertEqual(6, len(indexer.database))
+        indexer.update(self.documents, cache = False)
+        self.assertEqual([], self._embedded)
+
+class TestSemanticCache(CustomTestCase):
+    def setUp(self):
+        self.path   = os.path.join(temp_dir, 'cache-{}.db'.format(self._testMethodName))
+        self.context    = [{'chunk_id' : 'chunk-1', 'text' : 'Hello'}, {'text' : 'World'}]
+        self._embedded  = []
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors = True)
+    
+    def _encoder(self, texts):
+        """ Bag-of-words embedding : the queries with the same words have the same embedding """
+        self._embedded.extend(texts)
+        vectors = np.zeros((len(texts), 16), dtype = 'float32')
+        for i, text in enumerate(texts):
+            for word in sorted(set(text.split())):
+                vectors[i, sum(map(ord, word)) % 16] += 1
+        return vectors
+    
+    def _get_cache(self, ** kwargs):
+        return SemanticCache(self.path, encoder = self._encoder, ** kwargs)
+    
+    def test_lookup(self):
+        cache = self._get_cache()
+        self.assertEqual(None, cache.lookup('What is the capital of France ?', self.context))
+        
+        cache.insert('What is the capital of France ?', 'Paris', self.context)
+        self.assertEqual(['what is the capital of france'], self._embedded)
+        
+        self._embedded = []
+        entry = cache.lookup('what is the  capital of France', self.context)
+        self.assertEqual('Paris', entry['answer'])
+        self.assertEqual([], self._embedded)
+        
+        entry = cache.lookup('The capital of France is what ?', self.context[::-1])
+        self.assertEqual('Paris', entry['answer'])
+        self.assertEqual(1, len(self._embedded))
+        
+        self.assertEqual(None, cache.lookup('What is the capital of France ?', self.context[:1]))
+        self.assertEqual(None, cache.lookup('What is the capital of Belgium ?', self.context))
+        
+        stats = cache.get_stats()
+        self.assertEqual((2, 1, 3), (stats['hits'], stats['exact_hits'], stats['misses']))
+        self.assertEqual(0.4, stats['hit_rate'])
+    
+    def test_ttl_and_eviction(self):
+        cache = self._get_cache(ttl = 0.05, max_size = 2)
+        for i in range(3): cache.insert('Query {}'.format(i), 'Answer {}'.format(i), self.context)
+        
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.lookup('Query 0', self.context))
+        self.assertEqual('Answer 2', cache.lookup('Query 2', self.context)['answer'])
+        
+        time.sleep(0.1)
+        self.assertEqual(None, cache.lookup('Query 2', self.context))
+        self.assertEqual(1, len(cache))
+    
+    def test_invalidate(self):
+        cache = self._get_cache()
+        cache.insert('Query 1', 'Answer 1', self.context)
+        cache.insert('Query 2', 'Answer 2', [{'chunk_id' : 'chunk-2'}])
+        
+        self.assertEqual(1, cache.invalidate('chunk-1'))
+        self.assertEqual(None, cache.lookup('Query 1', self.context))
+        self.assertEqual('Answer 2', cache.lookup('Query 2', [{'chunk_id' : 'chunk-2'}])['answer'])
@@ -12,6 +12,8 @@
 import os
 import time
 import queue
+import asyncio
+import threading
 import inspect
 import logging
 import unittest
@@ -24,11 +26,23 @@ from absl.testing import parameterized
 
 from . import CustomTestCase
 from utils import STOP, KEEP_ALIVE, IS_RUNNING, CONTROL, DataWithResult, Stream, create_iterable
+from utils.threading import AsyncStreamBuffer, CancellationToken, LocalPrefixCache, Pipeline, PrefixRouter, ProcessPool, RequestScheduler, SharedMemoryQueue, SharedArray, WorkerCrashedError
 
 def _generator():
     for i in range(1, 5):
         yield i
 
+def _square_or_crash(x):
+    if x < 0: os._exit(3)
+    time.sleep(0.01)
+    return x ** 2
+
+def _crashing_worker(stream, callback, ** kwargs):
+    Stream(_square_or_crash, stream = stream, callback = callback).run()
+
+def _close_queue(queue):
+    queue.close()
+
 class TestStream(CustomTestCase, parameterized.TestCase):
     def _reset_counters(self):
         self._counter = 0
@@ -284,3 +298,399 @@ class TestStream(CustomTestCase, parameterized.TestCase):
 
         self._check_counters(start = 1, stop = 1, callback = 4, counter = 4)
         self.assertEqual([1, 2, 3, 4], res)
+
+    def test_batched_callbacks(self):
+        batches, items = [], []
+        def batch_callback(results):
+            batches.append(results)
+        batch_callback.batched = True
+        
+        res = list(Stream(
+            lambda x: x * 2, range(10), callback = [items.append, batch_callback], callback_batch_size = 4
+        ))
+        self.assertEqual([2 * i for i in range(10)], res)
+        self.assertEqual(res, items)
+        self.assertEqual([[0, 2, 4, 6], [8, 10, 12, 14], [16, 18]], batches)
+    
+    def test_batched_callbacks_delay(self):
+        batches = []
+        def batch_callback(results):
+            batches.append(results)
+        batch_callback.batched = True
+        
+        stream = Stream(
+            lambda x: x,
+            callback    = batch_callback,
+            callback_batch_size = 100,
+            callback_batch_delay    = 0.05,
+            max_workers = 1
+        )
+        stream.start()
+        for i in range(3): stream(i)
+        time.sleep(0.25)
+        self.assertEqual([[0, 1, 2]], batches)
+        stream.join()
+    
+    def test_batched_callbacks_delay_only(self):
+        batches = []
+        def batch_callback(results):
+            batches.append(results)
+        batch_callback.batched = True
+        
+        # without size limit, the batches are only bounded by the delay
+        stream = Stream(lambda x: x, callback = batch_callback, callback_batch_delay = 0.05, max_workers = 1)
+        stream.start()
+        for i in range(3): stream(i)
+        time.sleep(0.25)
+        for i in range(3, 5): stream(i)
+        time.sleep(0.25)
+        self.assertEqual([[0, 1, 2], [3, 4]], batches)
+        
+        # all the windows are flushed by the same thread
+        flushers = [t for t in threading.enumerate() if t.name == '{}_flusher'.format(stream.name)]
+        self.assertEqual(1, len(flushers))
+        stream.join()
+        flushers[0].join(timeout = 1)
+        self.assertFalse(flushers[0].is_alive())
+    
+    def test_slow_batched_callback(self):
+        batches, produced = [], []
+        def batch_callback(results):
+            time.sleep(0.2)
+            batches.append(results)
+        batch_callback.batched = True
+        
+        stream = Stream(
+            lambda x: x,
+            callback    = [lambda res: produced.append(time.time()), batch_callback],
+            callback_batch_size = 2,
+            callback_batch_delay    = 10.,
+            max_workers = 1
+        )
+        stream.start()
+        t0 = time.time()
+        for i in range(6): stream(i)
+        while len(produced) < 6 and time.time() - t0 < 5: time.sleep(0.01)
+        # the producer is not blocked by the batched callback (called by the flusher)
+        self.assertTrue(produced[-1] - t0 < 0.2)
+        stream.join()
+        
+        self.assertEqual(list(range(6)), [res for batch in batches for res in batch])
+    
+    def test_callbacks_registration(self):
+        called = []
+        stream = Stream(lambda x: x, range(3))
+        stream.add_callback(called.append)
+        self.assertEqual([0, 1, 2], list(stream))
+        self.assertEqual([0, 1, 2], called)
+        
+        stream.remove_callback(called.append)
+        self.assertEqual((), stream._callbacks['item'])
+
+class TestAsyncStreamBuffer(CustomTestCase):
+    def test_coalescing(self):
+        async def consume():
+            buffer = AsyncStreamBuffer(loop = asyncio.get_running_loop())
+            for i in range(5): buffer.put(str(i))
+            buffer.close()
+            return [it async for it in buffer]
+        
+        self.assertEqual(['01234'], asyncio.run(consume()))
+    
+    def test_backpressure(self):
+        async def consume():
+            buffer  = AsyncStreamBuffer(2, loop = asyncio.get_running_loop())
+            
+            def produce():
+                for i in range(10):
+                    if not buffer.put([i]): break
+                buffer.close()
+            
+            thread = threading.Thread(target = produce)
+            thread.start()
+            
+            items = []
+            async for it in buffer:
+                self.assertTrue(len(it) <= 2)
+                items.extend(it)
+                await asyncio.sleep(0.01)
+            thread.join()
+            return items
+        
+        self.assertEqual(list(range(10)), asyncio.run(consume()))
+    
+    def test_cancel(self):
+        async def consume():
+            buffer  = AsyncStreamBuffer(1, loop = asyncio.get_running_loop())
+            results = []
+            
+            def produce():
+                results.extend(buffer.put(i) for i in range(3))
+            
+            thread = threading.Thread(target = produce)
+            thread.start()
+            
+            await buffer.get()
+            buffer.cancel()
+            await asyncio.to_thread(thread.join)
+            return results
+        
+        self.assertIn(False, asyncio.run(consume()))
+
+class TestCancellationToken(CustomTestCase):
+    def test_cancel(self):
+        token   = CancellationToken()
+        calls   = []
+        token.add_callback(lambda: calls.append(1))
+        self.assertFalse(token.cancelled)
+        
+        threading.Timer(0.05, token.cancel).start()
+        self.assertTrue(token.wait(1.))
+        self.assertTrue(token.cancelled)
+        self.assertFalse(token.cancel())
+        self.assertEqual([1], calls)
+        
+        token.add_callback(lambda: calls.append(2))
+        self.assertEqual([1, 2], calls)
+    
+    def test_remove_callback(self):
+        token   = CancellationToken()
+        calls   = []
+        callback = calls.append
+        token.add_callback(callback)
+        token.remove_callback(callback)
+        token.cancel()
+        self.assertEqual([], calls)
+
+class TestSharedMemoryQueue(CustomTestCase):
+    def setUp(self):
+        self.queue = SharedMemoryQueue(
+            multiprocessing.Queue(), num_slots = 2, slot_size = 1024, min_size = 128
+        )
+    
+    def tearDown(self):
+        self.queue.close()
+    
+    def test_encoding(self):
+        small, large = np.arange(4), np.arange(64, dtype = 'float32').reshape(8, 8)
+        
+        encoded = self.queue.encode(DataWithResult(args = (large, ), kwargs = {'x' : [small]}))
+        self.assertTrue(isinstance(encoded.args[0], SharedArray))
+        self.assertTrue(isinstance(encoded.kwargs['x'][0], np.ndarray))
+        self.assertEqual(1, self.queue.ring.num_used)
+        
+        decoded = self.queue.decode(encoded)
+        self.assertEqual(large, decoded.args[0])
+        self.assertEqual(small, decoded.kwargs['x'][0])
+        
+        del decoded, encoded
+        self.assertEqual(0, self.queue.ring.num_used)
+    
+    def test_fallback(self):
+        arrays  = [np.ones((16, 16), dtype = 'float32') for _ in range(3)]
+        encoded = [self.queue.encode(arr) for arr in arrays]
+        self.assertEqual([True, True, False], [isinstance(enc, SharedArray) for enc in encoded])
+        self.assertTrue(isinstance(self.queue.encode(np.ones((64, 64))), np.ndarray))
+        
+        self.queue.put(arrays[0])
+        self.assertEqual(arrays[0], self.queue.get())
+    
+    @unittest.skipIf(not os.path.isdir('/dev/shm'), 'The shared memory is not in `/dev/shm`')
+    def test_forked_close(self):
+        self.queue.ring.shm
+        # the forked child inherits the ring of its parent : closing it must not unlink the memory
+        process = multiprocessing.get_context('fork').Process(target = _close_queue, args = (self.queue, ))
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertTrue(os.path.exists(os.path.join('/dev/shm', self.queue.ring.name.lstrip('/'))))
+
+class TestPrefixCache(CustomTestCase):
+    def setUp(self):
+        self.system = list(range(100, 164))
+        self.cache  = LocalPrefixCache(block_size = 16, max_blocks = 8)
+    
+    def test_lookup(self):
+        self.assertEqual(0, self.cache.lookup(self.system + [1, 2]).length)
+        
+        self.cache.insert(self.system + [1, 2, 3], worker = 'w0')
+        match = self.cache.lookup(self.system + [4, 5])
+        self.assertEqual((64, 'w0'), (match.length, match.worker))
+        self.assertEqual(32, self.cache.lookup(self.system[:40]).length)
+        self.assertEqual(0, self.cache.lookup([0] + self.system).length)
+        self.assertEqual(0, self.cache.lookup(self.system, workers = ['w1']).length)
+    
+    def test_eviction(self):
+        self.cache.insert(self.system, worker = 0)
+        self.cache.insert(list(range(1000, 1080)), worker = 0)
+        self.assertEqual(8, self.cache.get_stats()['blocks'])
+        self.assertEqual(0, self.cache.lookup(self.system).length)
+    
+    def test_routing(self):
+        router = PrefixRouter(self.cache, max_imbalance = 2)
+        
+        first = router(self.system + [1], [0, 0, 0])
+        # the prompt is only recorded once the worker has processed it
+        router.on_result(self.system + [1], first, 'done')
+        self.assertEqual(first, router(self.system + [2], [0, 1, 0]))
+        self.assertEqual(first, router(self.system + [3], [2, 0, 0] if first == 0 else [0, 2, 0]))
+        
+        load = [0, 0, 0]
+        load[first] = 5
+        self.assertNotEqual(first, router(self.system + [4], load))
+    
+    def test_failed_request(self):
+        router = PrefixRouter(self.cache)
+        router.on_result(self.system, 0, WorkerCrashedError('worker-0', -9))
+        self.assertEqual(0, self.cache.lookup(self.system).length)
+
+class TestRequestScheduler(CustomTestCase):
+    def setUp(self):
+        self.order  = []
+        self.event  = threading.Event()
+        self.scheduler  = RequestScheduler(1, weights = {'a' : 2})
+        # blocks the worker until all the requests are submitted
+        self.scheduler.submit(self.event.wait)
+        while not self.scheduler.num_running: time.sleep(0.001)
+    
+    def tearDown(self):
+        self.event.set()
+        self.scheduler.stop()
+    
+    def _submit(self, name, ** kwargs):
+        return self.scheduler.submit(self.order.append, name, ** kwargs)
+    
+    def test_ordering(self):
+        futures = [
+            self._submit('batch', priority = 1),
+            * [self._submit('a{}'.format(i), tenant = 'a') for i in range(4)],
+            * [self._submit('b{}'.format(i), tenant = 'b') for i in range(2)]
+        ]
+        self.assertEqual(7, self.scheduler.get_stats()['queued'])
+        
+        self.event.set()
+        for f in futures: f.result()
+        self.assertEqual(['a0', 'b0', 'a1', 'a2', 'b1', 'a3', 'batch'], self.order)
+    
+    def test_deadline_and_admission(self):
+        self.scheduler.max_pending_cost = 10
+        late = self._submit('late', timeout = 0.01)
+        with self.assertRaises(RuntimeError):
+            self._submit('large', cost = 10)
+        
+        time.sleep(0.05)
+        self.event.set()
+        with self.assertRaises(TimeoutError):
+            late.result()
+        
+        stats = self.scheduler.get_stats()
+        self.assertEqual((1, 1), (stats['dropped'], stats['rejected']))
+
+    def test_finish_tags(self):
+        self.event.set()
+        for i in range(100): self._submit(i, tenant = i).result()
+        # the tags of the tenants without pending request are removed
+        self.assertTrue(len(self.scheduler._finish_tags) <= 1, str(self.scheduler._finish_tags))
+    
+    def test_is_scheduled(self):
+        self.event.set()
+        self.assertFalse(RequestScheduler.is_scheduled())
+        self.assertTrue(self.scheduler.submit(RequestScheduler.is_scheduled).result())
+
+class TestPipeline(CustomTestCase):
+    def test_order(self):
+        def preprocess(x):
+            time.sleep(np.random.uniform(0, 0.01))
+            return x
+        
+        processed = []
+        def postprocess(x):
+            processed.append(x)
+            return x + 1
+        
+        pipeline = Pipeline([
+            {'fn' : preprocess, 'num_workers' : 4},
+            {'fn' : lambda batch: [x * 2 for x in batch], 'batch_size' : 8},
+            postprocess
+        ], queue_size = 4)
+        
+        self.assertEqual([2 * i + 1 for i in range(100)], list(pipeline(range(100))))
+        self.assertEqual([2 * i for i in range(100)], processed)
+    
+    def test_batching(self):
+        sizes = []
+        def model(batch):
+            sizes.append(len(batch))
+            time.sleep(0.05)
+            return batch
+        
+        pipeline = Pipeline([{'fn' : model, 'batch_size' : 4}], queue_size = 16)
+        self.assertEqual(list(range(10)), list(pipeline(range(10))))
+        self.assertTrue(max(sizes) > 1 and max(sizes) <= 4, str(sizes))
+    
+    def test_error(self):
+        def fn(x):
+            if x == 5: raise ValueError('Invalid item')
+            return x
+        
+        outputs = []
+        with self.assertRaises(ValueError):
+            for out in Pipeline([{'fn' : fn, 'num_workers' : 3}, fn])(range(100)):
+                outputs.append(out)
+        self.assertEqual(list(range(5)), outputs)
+    
+    def test_early_stop(self):
+        num_threads = threading.active_count()
+        
+        generator = Pipeline([{'fn' : lambda x: x, 'num_workers' : 2}], queue_size = 2)(range(1000))
+        self.assertEqual(0, next(generator))
+        generator.close()
+        self.assertEqual(num_threads, threading.active_count())
+
+class TestProcessPool(CustomTestCase):
+    def setUp(self):
+        self.pool = ProcessPool(_crashing_worker, 2, name = 'test_pool', restart = 3).start()
+    
+    def tearDown(self):
+        self.pool.terminate()
+    
+    def test_map(self):
+        self.assertEqual([i ** 2 for i in range(10)], self.pool.map(list(range(10))))
+        self.assertEqual([0, 0], self.pool.outstanding)
+    
+    def test_crash(self):
+        results = [self.pool(i) for i in (1, -1, 2, 3)]
+        
+        with self.assertRaises(WorkerCrashedError):
+            results[1].get(timeout = 10)
+        self.assertEqual([1, 4, 9], [res.get(timeout = 10) for i, res in enumerate(results) if i != 1])
+        self.assertEqual([0, 0], self.pool.outstanding)
+        
+        with self.assertRaises(WorkerCrashedError):
+            self.pool.map_async([4, -1, 5]).get(timeout = 10)
+        self.assertEqual([36, 49], self.pool.map([6, 7]))
+    
+    def test_crash_with_queued_requests(self):
+        # the requests queued behind the crashing one (possibly still in the feeder buffer) are processed by the restarted worker
+        results = [self.pool.workers[0](i) for i in (-1, * range(50))]
+        
+        with self.assertRaises(WorkerCrashedError):
+            results[0].get(timeout = 10)
+        self.assertEqual([i ** 2 for i in range(50)], [res.get(timeout = 10) for res in results[1:]])
+        # the finished requests are forgotten when a new request is sent
+        self.assertEqual(4, self.pool.workers[0](2).get(timeout = 10))
+        self.assertEqual(1, len(self.pool.workers[0]._sent))
+    
+    def test_router_cache(self):
+        router  = PrefixRouter(LocalPrefixCache(block_size = 1), get_tokens = lambda x: [abs(x)])
+        pool    = ProcessPool(_crashing_worker, 2, name = 'test_router_pool', router = router).start()
+        try:
+            self.assertEqual([1, 4], pool.map([1, 2]))
+            self.assertEqual(2, router.cache.get_stats()['workers'])
+            
+            with self.assertRaises(WorkerCrashedError):
+                pool(-1).get(timeout = 10)
+            self.assertEqual(1, router.cache.get_stats()['workers'])
+            self.assertEqual([1, 4], pool.map([1, 2]))
+        finally:
+            pool.terminate()
@@ -10,17 +10,38 @@
 # limitations under the License.
 
 import os
+import time
+import asyncio
 import logging
+import tempfile
 import unittest
+import threading
 import numpy as np
 
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 from absl.testing import parameterized
 try:
     from transformers import AutoTokenizer
 except:
     AutoTokenizer   = None
 
+try:
+    import jinja2
+except:
+    jinja2  = None
+
+try:
+    import bs4
+except:
+    bs4 = None
+
 from utils.text import *
+from utils.text import web
+from utils.text.web.fetcher import AsyncFetcher
+from utils.text.web.search_cache import SearchCache, get_search_cache, set_search_cache
+from utils.text.web.search_engine import process_urls
+from utils.text.parsers.html_parser import HTMLParser, HTMLStreamParser
 from . import CustomTestCase, data_dir, reproductibility_dir, is_tensorflow_available
 
 _default_texts  = [
@@ -206,6 +227,346 @@ class TestTextSplitter(CustomTestCase, parameterized.TestCase):
     def test_merging_words(self, text, max_length, target):
         merged, _, indices = merge_texts(text, max_length, tokenizer = lambda text: text.split())
 
+class TestDocumentParsing(CustomTestCase):
+    def test_iter_document(self):
+        for ext in ('txt', 'md'):
+            filename = os.path.join(data_dir, 'files', 'test.{}'.format(ext))
+            
+            paragraphs = parse_document(filename, cache = False)
+            self.assertTrue(len(paragraphs) > 0)
+            self.assertEqual(paragraphs, list(iter_document(filename, cache = False)))
+    
+    def test_iter_chunks(self):
+        paragraphs = [
+            {'text' : 'Hello World !', 'section' : 'a'},
+            {'text' : 'This is a test.', 'section' : 'a'},
+            {'text' : 'This is another section.', 'section' : 'b'}
+        ]
+        
+        self.assertEqual(
+            chunks_from_paragraphs(paragraphs, 10), list(iter_chunks(iter(paragraphs), 10))
+        )
+        self.assertEqual(
+            chunks_from_paragraphs(paragraphs, group_by = 'section'),
+            list(iter_chunks(iter(paragraphs), group_by = 'section'))
+        )
+
+class TestHTMLStreamParser(CustomTestCase, parameterized.TestCase):
+    html = '''<html><head><title>Title</title><style>p { color : red; }</style></head><body>
+<header><p>Menu</p></header>
+<h1>Introduction</h1><p>First paragraph : é à ç</p><p>Second paragraph</p><ul><li>Item 1</li><li>Item 2</li></ul>
+<h2>Section</h2><table><tr><td>x</td><td>y</td></tr><tr><td>1</td><td>2</td></tr><tr><td>3</td><td>4</td></tr></table>
+<p>Last paragraph</p><footer><p>Footer</p></footer></body></html>'''
+    
+    @unittest.skipIf(bs4 is None, 'The `bs4` library is unavailable !')
+    @parameterized.parameters(1, 16, 100, 10000)
+    def test_stream_parsing(self, chunk_size):
+        target  = HTMLParser(html = self.html).get_paragraphs()
+        
+        data    = self.html.encode('utf-8')
+        parser  = HTMLStreamParser(encoding = 'utf-8')
+        
+        paragraphs = []
+        for i in range(0, len(data), chunk_size):
+            paragraphs.extend(parser.feed(data[i : i + chunk_size]))
+        
+        if chunk_size < len(data): self.assertTrue(len(paragraphs) > 0)
+        paragraphs.extend(parser.close())
+        self.assertEqual(target, paragraphs)
+    
+    @unittest.skipIf(bs4 is None, 'The `bs4` library is unavailable !')
+    def test_unknown_encoding(self):
+        parser  = HTMLStreamParser(encoding = 'utf8mb4')
+        paragraphs = parser.feed(self.html.encode('utf-8')) + parser.close()
+        self.assertEqual(HTMLParser(html = self.html).get_paragraphs(), paragraphs)
+
+class _WebHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    pages   = {
+        '/page'     : ('text/html; charset=utf-8', '<html><body><p>Hello World !</p></body></html>'),
+        '/charset'  : ('text/html; charset=utf8mb4', '<html><body><p>Unknown charset</p></body></html>'),
+        '/binary'   : ('application/octet-stream', 'x' * 100000),
+        '/large'    : ('text/plain', 'x' * 100000)
+    }
+    
+    def do_GET(self):
+        if self.path == '/redirect' or self.path.startswith('/slow/'):
+            # each redirection of `/slow/<n>` takes 0.2 sec
+            if self.path.startswith('/slow/'): time.sleep(0.2)
+            n = int(self.path.split('/')[-1]) if self.path.startswith('/slow/') else 0
+            self.send_response(302)
+            self.send_header('Location', '/slow/{}'.format(n - 1) if n > 1 else '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        if self.path not in self.pages:
+            content = b'<html><body><p>Page not found</p></body></html>'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        
+        content_type, content = self.pages[self.path]
+        if self.headers.get('If-None-Match', None) == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        
+        content = content.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def log_message(self, * args):
+        pass
+
+class TestWebFetcher(CustomTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server  = ThreadingHTTPServer(('127.0.0.1', 0), _WebHandler)
+        cls.url     = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+        threading.Thread(target = cls.server.serve_forever, daemon = True).start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+    
+    def setUp(self):
+        self.fetcher = AsyncFetcher(max_per_host = 2, timeout = 5)
+    
+    def tearDown(self):
+        self.fetcher.close()
+    
+    def test_fetch(self):
+        result = self.fetcher.fetch_sync(self.url + '/page')
+        self.assertEqual(200, result['status'])
+        self.assertEqual('"v1"', result['etag'])
+        self.assertEqual(_WebHandler.pages['/page'][1], result['content'])
+        
+        result = self.fetcher.fetch_sync(self.url + '/redirect')
+        self.assertEqual(self.url + '/page', result['url'])
+        self.assertEqual(_WebHandler.pages['/page'][1], result['content'])
+    
+    def test_timeout(self):
+        # each redirection is faster than the timeout, but not the whole request
+        with self.assertRaises(asyncio.TimeoutError):
+            self.fetcher.fetch_sync(self.url + '/slow/3', timeout = 0.5)
+        
+        result = self.fetcher.fetch_sync(self.url + '/slow/1', timeout = 0.5)
+        self.assertEqual(_WebHandler.pages['/page'][1], result['content'])
+    
+    def test_prune_idle(self):
+        fetcher = AsyncFetcher(keep_alive_timeout = 0.1)
+        try:
+            fetcher.fetch_sync(self.url + '/page')
+            self.assertEqual(1, len(fetcher._idle))
+            self.assertEqual({}, fetcher._host_semaphores)
+            
+            time.sleep(0.3)
+            self.assertEqual({}, fetcher._idle)
+        finally:
+            fetcher.close()
+    
+    def test_keep_alive(self):
+        for _ in range(5): self.fetcher.fetch_sync(self.url + '/page')
+        
+        stats = self.fetcher.get_stats()
+        self.assertEqual(1, stats['connections'])
+        self.assertEqual(4, stats['reused'])
+    
+    def test_concurrency(self):
+        urls    = [self.url + '/page'] * 10
+        results = list(self.fetcher.iter_fetch(urls, concurrency = 4))
+        
+        self.assertEqual(list(range(10)), sorted(idx for idx, _, _ in results))
+        self.assertTrue(all(res['status'] == 200 for _, _, res in results))
+        self.assertTrue(self.fetcher.get_stats()['connections'] <= 2)
+    
+    def test_cutoff(self):
+        result = self.fetcher.fetch_sync(self.url + '/binary', allowed_contents = ['text/html'])
+        self.assertEqual(None, result['content'])
+        
+        result = self.fetcher.fetch_sync(self.url + '/large', max_size = 1000)
+        self.assertTrue(result['truncated'])
+        self.assertEqual(1000, len(result['content']))
+        
+        result = self.fetcher.fetch_sync(self.url + '/page', allowed_contents = ['text/html'])
+        self.assertEqual(_WebHandler.pages['/page'][1], result['content'])
+    
+    def test_chunks(self):
+        chunks, results = [], []
+        for idx, url, chunk, result in self.fetcher.iter_chunks([self.url + '/large'], max_size = 200000):
+            if chunk is not None:
+                chunks.append(chunk)
+            else:
+                results.append(result)
+        
+        self.assertEqual(1, len(results))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(results[0]['content'], b''.join(chunks).decode())
+    
+    def test_error_status(self):
+        result = self.fetcher.fetch_sync(self.url + '/missing')
+        self.assertEqual(404, result['status'])
+        self.assertEqual(None, result['content'])
+        
+        # the error page is never streamed, and is considered as a failed request
+        chunks, results = [], {}
+        for idx, url, chunk, result in self.fetcher.iter_chunks([self.url + '/missing', self.url + '/page']):
+            if chunk is not None:
+                chunks.append(idx)
+            else:
+                results[idx] = result
+        
+        self.assertNotIn(0, chunks)
+        self.assertEqual(None, results[0])
+        self.assertEqual(200, results[1]['status'])
+    
+    def test_failed_pages(self):
+        previous = get_search_cache()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SearchCache(directory = directory)
+            set_search_cache(cache)
+            try:
+                urls = [self.url + '/missing', self.url + '/page']
+                self.assertEqual([urls[1]], list(process_urls(urls, save = True)))
+            finally:
+                set_search_cache(previous)
+            
+            self.assertTrue(cache.is_failed(urls[0]))
+            self.assertEqual(None, cache.get('pages', urls[0]))
+            self.assertFalse(cache.is_failed(urls[1]))
+            self.assertEqual(1, len(cache.get('pages', urls[1])['parsed']))
+    
+    def test_unknown_charset(self):
+        result = self.fetcher.fetch_sync(self.url + '/charset')
+        self.assertEqual('utf-8', result['encoding'])
+        self.assertEqual(_WebHandler.pages['/charset'][1], result['content'])
+        
+        urls = [self.url + '/charset', self.url + '/page']
+        self.assertEqual(urls, sorted(process_urls(urls)))
+    
+    def test_conditional_request(self):
+        result = self.fetcher.fetch_sync(self.url + '/page', etag = '"v1"')
+        self.assertEqual(304, result['status'])
+        self.assertTrue(result['not_modified'])
+        self.assertEqual(None, result['content'])
+
+class TestSearchCache(CustomTestCase):
+    def setUp(self):
+        self.directory  = tempfile.TemporaryDirectory()
+        self.cache  = SearchCache(2, directory = self.directory.name)
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def test_tiers(self):
+        self.cache.put('queries', 'query', ['url1', 'url2'])
+        self.assertEqual(['url1', 'url2'], self.cache.get('queries', 'query'))
+        self.assertEqual(None, self.cache.get('queries', 'other'))
+        
+        # a new instance (e.g., a new process) only has the on-disk tier
+        cache = SearchCache(2, directory = self.directory.name)
+        self.assertEqual(['url1', 'url2'], cache.get('queries', 'query'))
+        self.assertEqual(['url1', 'url2'], cache.get('queries', 'query'))
+        self.assertEqual(
+            {'memory_hits' : 1, 'disk_hits' : 1, 'misses' : 0},
+            {k : v for k, v in cache.get_stats().items() if k in ('memory_hits', 'disk_hits', 'misses')}
+        )
+    
+    def test_ttl(self):
+        self.cache.put('queries', 'query', ['url'], ttl = 0.1)
+        self.cache.put('pages', 'url', {'parsed' : [], 'etag' : 'v1'}, ttl = 0.1)
+        time.sleep(0.15)
+        
+        self.assertEqual(None, self.cache.get('queries', 'query'))
+        self.assertEqual(None, self.cache.get('pages', 'url'))
+        # the expired pages are kept for revalidation
+        entry = self.cache.get_entry('pages', 'url')
+        self.assertTrue(self.cache.is_expired(entry))
+        self.assertEqual('v1', entry['value']['etag'])
+    
+    def test_failures(self):
+        self.assertFalse(self.cache.is_failed('url'))
+        self.cache.set_failed('url', ttl = 0.1)
+        self.assertTrue(self.cache.is_failed('url'))
+        time.sleep(0.15)
+        self.assertFalse(self.cache.is_failed('url'))
+        # the known failures are counted as negative hits, and the failures lookups are not counted as misses
+        self.assertEqual(
+            {'memory_hits' : 0, 'negative_hits' : 1, 'misses' : 0},
+            {k : v for k, v in self.cache.get_stats().items() if k in ('memory_hits', 'negative_hits', 'misses')}
+        )
+    
+    def test_disk_eviction(self):
+        self.cache.max_disk_size = 1000
+        for i in range(10):
+            self.cache.put('pages', 'url{}'.format(i), {'parsed' : ['x' * 100]})
+        
+        self.assertTrue(self.cache.get_stats()['disk_size'] <= 1000)
+        self.assertTrue(self.cache.get_stats()['evictions'] > 0)
+        
+        cache = SearchCache(2, directory = self.directory.name)
+        self.assertEqual(None, cache.get('pages', 'url0'))
+        self.assertEqual({'parsed' : ['x' * 100]}, cache.get('pages', 'url9'))
+    
+    def test_concurrent_save(self):
+        def put(i):
+            for _ in range(20): self.cache.put('pages', 'url', {'parsed' : [str(i)] * 100})
+        
+        with self.assertNoLogs('utils.text.web.search_cache', level = 'WARNING'):
+            threads = [threading.Thread(target = put, args = (i, )) for i in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        
+        # no temporary file is left
+        self.assertEqual(1, len(os.listdir(os.path.join(self.directory.name, 'pages'))))
+        self.assertEqual(100, len(SearchCache(2, directory = self.directory.name).get('pages', 'url')['parsed']))
+
+class _FakeEngine:
+    calls   = []
+    
+    def __init__(self, ** _):
+        pass
+    
+    def search(self, query, *, n, ** kwargs):
+        self.calls.append((query, kwargs))
+        return {'query' : query, 'results' : {'url' : ['paragraph']}}
+
+class TestWebSearch(CustomTestCase):
+    def setUp(self):
+        _FakeEngine.calls.clear()
+        web._engines['fake'] = _FakeEngine
+    
+    def tearDown(self):
+        web._engines.pop('fake')
+    
+    def test_copies(self):
+        first   = search_on_web('copies', engine = 'fake')
+        first['results']['url'].append('modified')
+        second  = search_on_web('copies', engine = 'fake')
+        
+        self.assertEqual(1, len(_FakeEngine.calls))
+        self.assertEqual({'url' : ['paragraph']}, second['results'])
+        second['results']['url'].clear()
+        self.assertEqual({'url' : ['paragraph']}, search_on_web('copies', engine = 'fake')['results'])
+    
+    def test_non_scalar_kwargs(self):
+        search_on_web('kwargs', engine = 'fake', site = ['a.com'])
+        search_on_web('kwargs', engine = 'fake', site = ['b.com'])
+        search_on_web('kwargs', engine = 'fake', site = ['a.com'])
+        
+        self.assertEqual([['a.com'], ['b.com']], [kwargs['site'] for _, kwargs in _FakeEngine.calls])
+
 class TestTokensProcessing(CustomTestCase):
     def test_text_filtering(self):
         texts   = np.tile(np.arange(10)[np.newaxis], [10, 1]).astype(np.int32)
@@ -316,6 +677,46 @@ class TestTokenizer(CustomTestCase, parameterized.TestCase):
             self.tokenizer.encode(text, cleaned = True)
         )
         
+    def test_encode_prompt(self):
+        prompt = '<s>' + '</s><s>'.join(_default_texts) + '</s>'
+        self.assertEqual(
+            self.tokenizer.encode(prompt, add_sos_and_eos = False, return_type = 'list'),
+            self.tokenizer.encode_prompt(prompt, return_type = 'list')
+        )
+        # the segments are now cached
+        self.assertEqual(
+            self.tokenizer.encode(prompt, add_sos_and_eos = False, return_type = 'list'),
+            self.tokenizer.encode_prompt(prompt, return_type = 'list')
+        )
+    
+    @parameterized.parameters(* _default_texts)
+    def test_encode_prompt_defaults(self, text):
+        self.assertEqual(
+            self.tokenizer.encode(text, return_type = 'list'),
+            self.tokenizer.encode_prompt(text, return_type = 'list')
+        )
+        self.assertEqual(
+            self.tokenizer.encode(text, add_eos = False, return_type = 'list'),
+            self.tokenizer.encode_prompt(text, add_eos = False, return_type = 'list')
+        )
+    
+    @unittest.skipIf(jinja2 is None, 'The `jinja2` library is unavailable !')
+    def test_encode_chat_truncation(self):
+        self.tokenizer.template = '{% for message in messages %}<s>{{ message["content"] }}</s>{% endfor %}'
+        messages = [{'role' : 'user', 'content' : 'message ' + c} for c in 'abcdefghij']
+        length   = len(self.tokenizer.encode_prompt('<s>message a</s>'))
+        
+        text, encoded = self.tokenizer.encode_chat(
+            messages = messages, max_length = 4 * length + 1, add_generation_prompt = False, return_text = True
+        )
+        self.assertEqual(4 * length, len(encoded))
+        self.assertEqual(
+            '<s>message a</s><s>message h</s><s>message i</s><s>message j</s>', text
+        )
+        
+        with self.assertRaises(ValueError):
+            self.tokenizer.encode_chat(messages = messages, max_length = 10)
+    
     @parameterized.parameters(* _default_texts)
     def _test_format(self, text):
         self.assertEqual(
@@ -13,6 +13,7 @@ import warnings
 
 from loggers import set_level
 
+from .cache_utils import DiskCache, LRUCache
 from .comparison_utils import is_diff, is_equal
 from .distances import *
 from .embeddings import *
@@ -0,0 +1,394 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import pickle
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+class LRUCache:
+    """
+        Thread-safe mapping bounded in number of items, in bytes and in time
+        
+        When one of the bounds is exceeded, the least recently used items are evicted. Expired items (i.e., older than `ttl`) are evicted when accessed, or when calling `purge`.
+        The pinned items (see `pin`) are never evicted nor expired, until they are unpinned.
+        The `hits`, `misses`, `evictions` and `expirations` counters are available with `get_stats`.
+        
+        Example usage :
+        ```python
+        cache = LRUCache(max_size = 2, on_evict = lambda key, value: print('Evict', key))
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')  # 1 (`a` becomes the most recently used item)
+        cache['c'] = 3  # prints "Evict b"
+        ```
+    """
+    def __init__(self,
+                 max_size   = None,
+                 *,
+                 
+                 max_bytes  = None,
+                 size_fn    = None,
+                 
+                 ttl    = None,
+                 sliding_ttl    = False,
+                 
+                 on_evict   = None
+                ):
+        """
+            Arguments :
+                - max_size  : the maximal number of items
+                - max_bytes : the maximal cumulated size of the items (computed by `size_fn`)
+                - size_fn   : a callable returning the size (in bytes) of a given value
+                
+                - ttl   : the time-to-live (in seconds) of an item
+                - sliding_ttl   : whether the `ttl` is reset when the item is accessed
+                
+                - on_evict  : callable `on_evict(key, value)` called when an item is evicted or expires
+                              It is not called for items explicitly removed with `pop` or `clear`
+        """
+        if max_bytes and size_fn is None:
+            raise ValueError('`size_fn` is required when `max_bytes` is provided')
+        
+        self.max_size   = max_size
+        self.max_bytes  = max_bytes
+        self.size_fn    = size_fn
+        self.ttl    = ttl
+        self.sliding_ttl    = sliding_ttl
+        self.on_evict   = on_evict
+        
+        self._mutex = threading.RLock()
+        self._items = collections.OrderedDict()
+        self._sizes = {}
+        self._times = {}
+        self._pinned    = collections.Counter()
+        self._nbytes    = 0
+        
+        self.hits   = 0
+        self.misses = 0
+        self.evictions  = 0
+        self.expirations    = 0
+    
+    @property
+    def nbytes(self):
+        return self._nbytes
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __contains__(self, key):
+        with self._mutex:
+            return key in self._items and not self._is_expired(key)
+    
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing: raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        self.put(key, value)
+    
+    def __delitem__(self, key):
+        if self.pop(key, _missing) is _missing: raise KeyError(key)
+    
+    def __repr__(self):
+        return '<{} size={} nbytes={} hits={} misses={} evictions={}>'.format(
+            self.__class__.__name__, len(self), self._nbytes, self.hits, self.misses, self.evictions
+        )
+    
+    def keys(self):
+        with self._mutex:
+            return list(self._items.keys())
+    
+    def values(self):
+        with self._mutex:
+            return list(self._items.values())
+    
+    def items(self):
+        with self._mutex:
+            return list(self._items.items())
+    
+    def get(self, key, default = None):
+        """ Return the value associated to `key` (or `default`), and mark it as recently used """
+        evicted = []
+        with self._mutex:
+            if key in self._items and self._is_expired(key):
+                evicted.append((key, self._remove(key)))
+                self.expirations += 1
+            
+            if key not in self._items:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+                if self.sliding_ttl: self._times[key] = time.time()
+                value = self._items[key]
+        
+        self._notify(evicted)
+        return value
+    
+    def put(self, key, value):
+        """ Add (or update) `key`, and evict the least recently used items if needed """
+        size = self.size_fn(value) if self.size_fn is not None else 0
+        with self._mutex:
+            if key in self._items: self._nbytes -= self._sizes[key]
+            
+            self._items[key] = value
+            self._items.move_to_end(key)
+            self._sizes[key] = size
+            self._times[key] = time.time()
+            self._nbytes    += size
+            
+            evicted = self._evict()
+        
+        self._notify(evicted)
+        return value
+    
+    def update_size(self, key):
+        """ Re-compute the size of `key` (e.g., if the value has been modified inplace) """
+        with self._mutex:
+            if key not in self._items or self.size_fn is None: return
+            
+            size = self.size_fn(self._items[key])
+            self._nbytes += size - self._sizes[key]
+            self._sizes[key] = size
+            
+            evicted = self._evict()
+        
+        self._notify(evicted)
+    
+    def pin(self, key):
+        """ Prevent `key` from being evicted (e.g., while it is used), until the same number of `unpin` calls """
+        with self._mutex:
+            self._pinned[key] += 1
+    
+    def unpin(self, key):
+        """ Release a `pin` of `key`, and evict the least recently used items if the bounds are exceeded """
+        with self._mutex:
+            if self._pinned[key] <= 1:
+                self._pinned.pop(key, None)
+            else:
+                self._pinned[key] -= 1
+            
+            if self.sliding_ttl and key in self._items: self._times[key] = time.time()
+            evicted = self._evict()
+        
+        self._notify(evicted)
+    
+    def pop(self, key, default = None):
+        with self._mutex:
+            return self._remove(key) if key in self._items else default
+    
+    def purge(self):
+        """ Evict all the expired items """
+        if not self.ttl: return []
+        
+        with self._mutex:
+            expired = [k for k in self._items if self._is_expired(k)]
+            evicted = [(k, self._remove(k)) for k in expired]
+            self.expirations += len(evicted)
+        
+        self._notify(evicted)
+        return evicted
+    
+    def clear(self):
+        with self._mutex:
+            self._items.clear()
+            self._sizes.clear()
+            self._times.clear()
+            self._pinned.clear()
+            self._nbytes = 0
+    
+    def get_stats(self):
+        with self._mutex:
+            total = self.hits + self.misses
+            return {
+                'size'  : len(self._items),
+                'nbytes'    : self._nbytes,
+                'hits'  : self.hits,
+                'misses'    : self.misses,
+                'hit_rate'  : self.hits / total if total else 0.,
+                'evictions' : self.evictions,
+                'expirations'   : self.expirations
+            }
+    
+    def _is_expired(self, key):
+        return self.ttl is not None and key not in self._pinned and time.time() - self._times[key] > self.ttl
+    
+    def _remove(self, key):
+        self._nbytes -= self._sizes.pop(key)
+        self._times.pop(key)
+        return self._items.pop(key)
+    
+    def _evict(self):
+        """ Remove the least recently used items until the cache fits in the bounds (the most recent item and the pinned items are always kept) """
+        evicted, candidates = [], None
+        while len(self._items) > 1 and (
+            (self.max_size and len(self._items) > self.max_size)
+            or (self.max_bytes and self._nbytes > self.max_bytes)
+        ):
+            if candidates is None:
+                candidates = iter([k for k in list(self._items)[:-1] if k not in self._pinned])
+            
+            key = next(candidates, None)
+            if key is None: break
+            evicted.append((key, self._remove(key)))
+        
+        self.evictions += len(evicted)
+        return evicted
+    
+    def _notify(self, evicted):
+        """ Call `on_evict` outside of the lock, as it may be slow (e.g., saving the value) """
+        if self.on_evict is None: return
+        
+        for key, value in evicted:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                logger.error('Error while evicting {} : {}'.format(key, e))
+
+class DiskCache:
+    """
+        Directory of serialized entries (one file per entry), bounded in total size : the oldest files are removed once `max_size` bytes are exceeded
+        
+        The entries are identified by their `name` (a relative path without extension), and are written atomically : a concurrent `load` (from any thread or process) never reads a partial file. The directory is only scanned once (at the first access), then the files index is maintained in memory.
+        
+        Example usage :
+        ```python
+        cache = DiskCache('~/.cache/my_cache', max_size = 1024 ** 2)
+        cache.save('key', {'time' : time.time(), 'value' : 1})
+        cache.load('key')   # {'time' : ..., 'value' : 1}
+        ```
+    """
+    def __init__(self,
+                 directory,
+                 *,
+                 
+                 max_size   = None,
+                 
+                 extension  = '.pkl',
+                 dumps  = pickle.dumps,
+                 loads  = pickle.loads
+                ):
+        """
+            Arguments :
+                - directory : the directory where the entries are saved
+                - max_size  : the maximal cumulated size (in bytes) of the files
+                
+                - extension : the extension of the files
+                - dumps / loads : the functions converting an entry to `bytes` and back
+        """
+        self.directory  = directory
+        self.max_size   = max_size
+        self.extension  = extension
+        self.dumps  = dumps
+        self.loads  = loads
+        
+        self._mutex = threading.Lock()
+        self._index = None
+        self._nbytes    = 0
+        
+        self.evictions  = 0
+    
+    @property
+    def nbytes(self):
+        with self._mutex:
+            self._get_index()
+            return self._nbytes
+    
+    def __repr__(self):
+        return '<DiskCache directory={} nbytes={}>'.format(self.directory, self._nbytes)
+    
+    def get_filename(self, name):
+        return os.path.join(self.directory, name + self.extension)
+    
+    def load(self, name):
+        """ Return the entry saved as `name`, or `None` if it is missing or cannot be loaded """
+        filename = self.get_filename(name)
+        if not os.path.exists(filename): return None
+        
+        try:
+            with open(filename, 'rb') as file:
+                return self.loads(file.read())
+        except Exception as e:
+            logger.warning('Unable to load the cached entry {} : {}'.format(filename, e))
+            return None
+    
+    def save(self, name, entry, *, timestamp = None):
+        """ Save `entry` as `name`, then remove the oldest files if `max_size` is exceeded. Return whether the entry has been saved """
+        filename = self.get_filename(name)
+        try:
+            data = self.dumps(entry)
+            
+            os.makedirs(os.path.dirname(filename), exist_ok = True)
+            # the name of the temporary file is unique per thread, as the same entry may be saved concurrently
+            tmp_file = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+            with open(tmp_file, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_file, filename)
+        except Exception as e:
+            logger.warning('Unable to save the cached entry in {} : {}'.format(filename, e))
+            return False
+        
+        with self._mutex:
+            index = self._get_index()
+            _, previous = index.pop(filename, (None, 0))
+            index[filename] = (timestamp if timestamp is not None else time.time(), len(data))
+            self._nbytes += len(data) - previous
+            
+            if self.max_size and self._nbytes > self.max_size: self._evict()
+        return True
+    
+    def remove(self, name):
+        with self._mutex:
+            self._remove_file(self.get_filename(name))
+    
+    def clear(self):
+        with self._mutex:
+            for filename in list(self._get_index()): self._remove_file(filename)
+    
+    def _get_index(self):
+        """ Return the `{filename : (time, size)}` of the saved entries """
+        if self._index is None:
+            self._index, self._nbytes = {}, 0
+            if os.path.exists(self.directory):
+                for root, _, files in os.walk(self.directory):
+                    for name in files:
+                        if not name.endswith(self.extension): continue
+                        filename = os.path.join(root, name)
+                        stat = os.stat(filename)
+                        self._index[filename] = (stat.st_mtime, stat.st_size)
+                        self._nbytes += stat.st_size
+        return self._index
+    
+    def _remove_file(self, filename):
+        _, size = self._get_index().pop(filename, (None, 0))
+        self._nbytes -= size
+        if os.path.exists(filename): os.remove(filename)
+    
+    def _evict(self):
+        """ Remove the oldest files until the directory fits in `max_size` """
+        for filename, _ in sorted(self._index.items(), key = lambda it: it[1][0]):
+            if self._nbytes <= self.max_size: break
+            self._remove_file(filename)
+            self.evictions += 1
+
+def is_expired(entry, ttl = None):
+    """ Return whether `entry` (a `dict` with its creation `time`) is older than `ttl` (default to `entry['ttl']`, if any) """
+    if ttl is None: ttl = entry.get('ttl', None)
+    return ttl is not None and time.time() - entry['time'] > ttl
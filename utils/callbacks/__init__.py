@@ -14,6 +14,7 @@ import logging
 import importlib
 
 from .callback import Callback
+from .async_callback import AsyncCallback, make_async
 from .file_saver import FileSaver, JSONSaver
 
 logger = logging.getLogger(__name__)
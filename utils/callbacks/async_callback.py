@@ -0,0 +1,75 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import queue
+import logging
+
+from .callback import Callback
+from .file_saver import FileSaver
+from ..threading import Stream
+
+logger = logging.getLogger(__name__)
+
+class AsyncCallback(Callback):
+    """
+        Wrapper that applies `callback` in a background thread, such that the caller (e.g., the model inference) is not blocked by it
+        
+        The callbacks sharing the same `executor` are applied sequentially, in the order of the calls.
+    """
+    def __init__(self, callback, executor = None, name = None, ** kwargs):
+        super().__init__(name = name or 'async {}'.format(callback.name), ** kwargs)
+        
+        self.callback   = callback
+        self.executor   = executor
+    
+    def __repr__(self):
+        return '<AsyncCallback callback={}>'.format(self.callback)
+    
+    def build(self):
+        super().build()
+        if self.executor is None: self.executor = get_callbacks_executor()
+    
+    def __call__(self, infos, output, ** kwargs):
+        if not self.built: self.build()
+        
+        self.executor(self.callback, infos, output, ** kwargs)
+    
+    def join(self):
+        if self.built: self.executor.join()
+        self.callback.join()
+
+def get_callbacks_executor():
+    """ Return a `Stream` that sequentially applies the callbacks in a separate thread """
+    return Stream(_apply_callback, queue.Queue(), max_workers = 1, name = 'callbacks')
+
+def make_async(callbacks):
+    """
+        Wrap `callbacks` in `AsyncCallback` sharing the same executor
+        
+        The `FileSaver` are not wrapped, as they already save the data in a separate thread, and as their result (e.g., the `JSONSaver` entry) may be required by the caller.
+    """
+    executor = None
+    wrapped  = []
+    for callback in callbacks:
+        if isinstance(callback, (FileSaver, AsyncCallback)):
+            wrapped.append(callback)
+            continue
+        
+        if executor is None: executor = get_callbacks_executor()
+        wrapped.append(AsyncCallback(callback, executor))
+    return wrapped
+
+def _apply_callback(callback, infos, output, ** kwargs):
+    try:
+        callback(infos, output, ** kwargs)
+    except Exception as e:
+        logger.error('- An exception occured while calling {} : {}'.format(callback, e))
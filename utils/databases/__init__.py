@@ -13,6 +13,8 @@ import os
 import importlib
 
 from .database import Database
+from .document_indexer import DocumentIndexer
+from .semantic_cache import SemanticCache
 
 _databases = {}
 
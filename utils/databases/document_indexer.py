@@ -0,0 +1,246 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+from loggers import timer
+from ..file_utils import dump_json, load_json, hash_file, expand_path
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+class DocumentIndexer:
+    """
+        Incrementally indexes a set of documents into a `VectorDatabase`
+        
+        The indexer keeps a manifest (`{path}/manifest.json`) mapping each indexed file to its hash and to the ids of its chunks. When `update` is called, only the files whose hash changed are re-parsed, and only the chunks that are not already in the database are embedded. Chunks (or files) that are not part of the new document set anymore are removed from the database.
+        
+        Example usage :
+        ```python
+        indexer = DocumentIndexer('documents.db', encoder = model.embed, chunk_size = 256)
+        db = indexer.update(['doc1.pdf', 'doc2.md'])       # embeds all chunks
+        db = indexer.update(['doc1.pdf', 'doc2.md', 'doc3.txt'])  # only embeds `doc3.txt`
+        ```
+    """
+    def __init__(self,
+                 path,
+                 encoder    = None,
+                 *,
+                 
+                 text_key   = 'text',
+                 chunk_key  = 'chunk_id',
+                 batch_size = 256,
+                 
+                 chunk_size = None,
+                 group_by   = None,
+                 tokenizer  = None,
+                 
+                 ** kwargs
+                ):
+        """
+            Arguments :
+                - path  : the directory of the `VectorDatabase` (and of the manifest)
+                - encoder   : a callable taking a `list` of texts and returning their embeddings
+                
+                - text_key  : the chunk entry to embed
+                - chunk_key : the primary key used in the database (the chunk hash)
+                - batch_size    : the maximal number of chunks given to `encoder` at once
+                
+                - chunk_size / group_by / tokenizer : forwarded to `iter_chunks`
+                
+                - kwargs    : forwarded to `VectorDatabase` (e.g., `index`)
+        """
+        self.path   = path
+        self.encoder    = encoder
+        
+        self.text_key   = text_key
+        self.chunk_key  = chunk_key
+        self.batch_size = batch_size
+        
+        self.chunk_size = chunk_size
+        self.group_by   = group_by
+        self.tokenizer  = tokenizer
+        
+        self.kwargs = kwargs
+        
+        self._manifest  = load_json(self.manifest_file, default = {})
+        self._database  = None
+        if Database.load_config(path):
+            self._database = self._init_database()
+    
+    @property
+    def manifest_file(self):
+        return os.path.join(self.path, 'manifest.json')
+    
+    @property
+    def database(self):
+        return self._database
+    
+    @property
+    def files(self):
+        return list(self._manifest.keys())
+    
+    def __len__(self):
+        return len(self._manifest)
+    
+    def __contains__(self, filename):
+        return filename in self._manifest
+    
+    def __repr__(self):
+        return '<{} path={} files={} chunks={}>'.format(
+            self.__class__.__name__, self.path, len(self), len(self._database or ())
+        )
+    
+    def _init_database(self, embedding_dim = None):
+        from . import init_database
+        
+        kwargs = self.kwargs.copy()
+        if embedding_dim: kwargs['embedding_dim'] = embedding_dim
+        return init_database(
+            'VectorDatabase', path = self.path, primary_key = self.chunk_key, ** kwargs
+        )
+    
+    def get_chunk_id(self, chunk):
+        """ Return the hash identifying `chunk` (i.e., its filename and content) """
+        data = {k : v for k, v in chunk.items() if k != self.chunk_key and not hasattr(v, 'shape')}
+        return hashlib.sha256(
+            json.dumps(data, sort_keys = True, default = str).encode('utf-8')
+        ).hexdigest()
+    
+    def get_chunks(self, filename, ** kwargs):
+        """ Parse `filename` and return its chunks (with their `chunk_key` entry) """
+        return list(self.iter_chunks(filename, ** kwargs))
+    
+    def iter_chunks(self, filename, ** kwargs):
+        """ Lazily parse and chunk `filename` (see `iter_document` and `iter_chunks`) """
+        from ..text import iter_document, iter_chunks
+        
+        chunks = iter_chunks(
+            iter_document(filename, ** kwargs),
+            self.chunk_size,
+            group_by    = self.group_by,
+            tokenizer   = self.tokenizer,
+        )
+        for chunk in chunks:
+            if not chunk.get(self.text_key, None): continue
+            chunk[self.chunk_key] = self.get_chunk_id(chunk)
+            yield chunk
+    
+    @timer
+    def diff(self, documents, *, remove_missing = True):
+        """
+            Compare `documents` with the manifest
+            
+            Arguments :
+                - documents : the (list of) file(s) / directory(ies) to index
+                - remove_missing    : whether indexed files not in `documents` are removed
+            Return :
+                - changed   : `dict` `{filename : hash}` of new or modified files
+                - removed   : `list` of indexed files not in `documents` anymore
+        """
+        files = expand_path(documents)
+        
+        changed = {}
+        for file in files:
+            file_hash = hash_file(file)
+            if self._manifest.get(file, {}).get('hash', None) != file_hash:
+                changed[file] = file_hash
+        
+        removed = []
+        if remove_missing:
+            files   = set(files)
+            removed = [f for f in self._manifest if f not in files]
+        
+        return changed, removed
+    
+    @timer
+    def update(self, documents, *, remove_missing = True, save = True, ** kwargs):
+        """
+            Update the database such that it reflects `documents`
+            
+            Arguments :
+                - documents : the (list of) file(s) / directory(ies) to index
+                - remove_missing    : whether indexed files not in `documents` are removed
+                - save  : whether to save the database and the manifest
+                - kwargs    : forwarded to `parse_document`
+            Return :
+                - database  : the updated `VectorDatabase` (`None` if no chunk has ever been embedded, e.g., empty document set)
+        """
+        changed, removed = self.diff(documents, remove_missing = remove_missing)
+        
+        if not changed and not removed:
+            return self._database
+        
+        to_remove = []
+        for file in removed:
+            to_remove.extend(self._manifest.pop(file)['chunks'])
+        
+        # chunks are embedded by batch while the next ones are parsed
+        to_embed, new_ids = [], set()
+        for file, file_hash in changed.items():
+            ids = []
+            for chunk in self.iter_chunks(file, ** kwargs):
+                _id = chunk[self.chunk_key]
+                ids.append(_id)
+                if _id in new_ids: continue
+                if self._database is None or _id not in self._database:
+                    to_embed.append(chunk)
+                    new_ids.add(_id)
+                    if len(to_embed) >= self.batch_size:
+                        self.add_chunks(to_embed)
+                        to_embed = []
+            
+            previous    = self._manifest.get(file, {}).get('chunks', [])
+            to_remove.extend(set(previous).difference(ids))
+            
+            self._manifest[file] = {'hash' : file_hash, 'chunks' : list(dict.fromkeys(ids))}
+        
+        if to_remove and self._database is not None:
+            # a chunk may be shared by multiple files (e.g., a copied file)
+            used = set()
+            for infos in self._manifest.values(): used.update(infos['chunks'])
+            to_remove = [
+                _id for _id in set(to_remove) if _id not in used and _id in self._database
+            ]
+            if to_remove: self._database.multi_pop(to_remove)
+        
+        if to_embed:
+            self.add_chunks(to_embed)
+        
+        logger.info('[INDEXER] {} file(s) updated, {} removed ({} chunks embedded, {} removed)'.format(
+            len(changed), len(removed), len(new_ids), len(to_remove)
+        ))
+        
+        if save: self.save()
+        
+        return self._database
+    
+    def add_chunks(self, chunks):
+        """ Embed `chunks` (by batch of `batch_size`) and add them to the database """
+        if self.encoder is None:
+            raise RuntimeError('An `encoder` is required to embed new chunks')
+        
+        for start in range(0, len(chunks), self.batch_size):
+            batch   = chunks[start : start + self.batch_size]
+            vectors = np.asarray(self.encoder([c[self.text_key] for c in batch]))
+            
+            if self._database is None:
+                self._database = self._init_database(embedding_dim = vectors.shape[-1])
+            self._database.multi_insert(batch, vectors = vectors)
+    
+    def save(self):
+        if self._database is not None: self._database.save()
+        os.makedirs(self.path, exist_ok = True)
+        dump_json(self.manifest_file, self._manifest, indent = 2)
@@ -79,6 +79,7 @@ class OrderedDatabaseWrapper(DatabaseWrapper):
         self._entry_to_idx.update({
             entry : len(self._entry_to_idx) + i for i, entry in enumerate(entries)
         })
+        return entries
 
     def multi_pop(self, iterable, /):
         items   = super().multi_pop(iterable)
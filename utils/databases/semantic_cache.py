@@ -0,0 +1,275 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+import json
+import hashlib
+import logging
+import collections
+import numpy as np
+
+from threading import RLock
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """
+        Cache of the answers to (paraphrased) queries, stored in a `VectorDatabase`
+        
+        A cached answer is returned for a new query if :
+            1. the cosine similarity between the embeddings of both (normalized) queries is at least `threshold`
+            2. both queries have the same context fingerprint (i.e., the same retrieved chunks and the same `scope`)
+            3. the answer is not older than `ttl` seconds
+        
+        As the fingerprint is computed from the ids of the retrieved chunks (e.g., their content hash in `DocumentIndexer`), a modified document produces a different fingerprint, and the previous answers are not returned anymore. `invalidate` additionally removes the answers that used the given chunks.
+        
+        Example usage :
+        ```python
+        cache = SemanticCache('cache.db', encoder = retriever.embed, threshold = 0.95, ttl = 3600)
+        
+        entry = cache.lookup(question, paragraphs)
+        if entry is None:
+            answer = model.answer(question, paragraphs = paragraphs)['predicted']
+            cache.insert(question, answer, paragraphs)
+        print(cache.get_stats())    # {'size' : 1, 'hits' : 0, 'misses' : 1, 'hit_rate' : 0., ...}
+        ```
+    """
+    def __init__(self,
+                 path,
+                 encoder    = None,
+                 *,
+                 
+                 threshold  = 0.95,
+                 ttl    = None,
+                 max_size   = 10000,
+                 k  = 5,
+                 
+                 id_key = 'chunk_id',
+                 text_key   = 'text',
+                 
+                 ** kwargs
+                ):
+        """
+            Arguments :
+                - path  : the directory of the `VectorDatabase`
+                - encoder   : a callable taking a `list` of texts and returning their embeddings
+                
+                - threshold : the minimal similarity between 2 queries to return the cached answer
+                - ttl   : the time-to-live (in seconds) of the cached answers (`None` for no limit)
+                - max_size  : the maximal number of cached answers (the oldest ones are removed first)
+                - k : the number of similar queries compared (only the ones with the same fingerprint are valid)
+                
+                - id_key    : the context entry used as chunk identifier
+                - text_key  : the context entry hashed if `id_key` is missing (e.g., web search results)
+                
+                - kwargs    : forwarded to `VectorDatabase` (e.g., `index`)
+        """
+        self.path   = path
+        self.encoder    = encoder
+        
+        self.threshold  = threshold
+        self.ttl    = ttl
+        self.max_size   = max_size
+        self.k  = k
+        
+        self.id_key = id_key
+        self.text_key   = text_key
+        
+        self.kwargs = kwargs
+        
+        self._mutex = RLock()
+        self._stats = collections.Counter()
+        self._database  = None
+        if Database.load_config(path):
+            self._database = self._init_database()
+    
+    @property
+    def database(self):
+        return self._database
+    
+    def __len__(self):
+        return len(self._database) if self._database is not None else 0
+    
+    def __repr__(self):
+        return '<SemanticCache path={} size={} threshold={} hit_rate={:.2f}>'.format(
+            self.path, len(self), self.threshold, self.get_stats()['hit_rate']
+        )
+    
+    def _init_database(self, embedding_dim = None):
+        from . import init_database
+        
+        kwargs = self.kwargs.copy()
+        if embedding_dim: kwargs['embedding_dim'] = embedding_dim
+        return init_database('VectorDatabase', path = self.path, primary_key = 'key', ** kwargs)
+    
+    def normalize_query(self, query):
+        """ Return the normalized `query` (lowercased, without extra spaces and final punctuation) """
+        return re.sub(r'\s+', ' ', query).strip().rstrip('?!.').strip().lower()
+    
+    def get_context_ids(self, context):
+        """ Return the sorted ids of the `context` chunks (`dict` or `str`) """
+        if not context: return []
+        
+        ids = set()
+        for chunk in context:
+            if isinstance(chunk, dict) and chunk.get(self.id_key, None) is not None:
+                ids.add(str(chunk[self.id_key]))
+            else:
+                text = chunk.get(self.text_key, '') if isinstance(chunk, dict) else str(chunk)
+                ids.add(hashlib.sha256(text.encode('utf-8')).hexdigest())
+        return sorted(ids)
+    
+    def get_fingerprint(self, context, scope = None):
+        """ Return the hash identifying the set of `context` chunks (and the `scope` string, e.g., the prompt configuration) """
+        data = self.get_context_ids(context)
+        if scope is not None: data = [data, scope]
+        return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+    
+    def get_key(self, query, fingerprint):
+        return hashlib.sha256(
+            json.dumps([self.normalize_query(query), fingerprint]).encode('utf-8')
+        ).hexdigest()
+    
+    def embed(self, query, *, encoder = None):
+        """ Return the embedding of the normalized `query` (1-D `np.ndarray`), `encoder` is only used if `self.encoder` is not set """
+        if self.encoder is not None: encoder = self.encoder
+        if encoder is None:
+            raise RuntimeError('An `encoder` is required to embed the queries')
+        
+        return np.asarray(encoder([self.normalize_query(query)]))[0]
+    
+    def lookup(self, query, context = None, *, scope = None, embedding = None, encoder = None):
+        """
+            Return the cached entry (`dict` with the `answer`, `query` and `score` entries) for `query`, or `None`
+            
+            Arguments :
+                - query : the query (`str`)
+                - context   : the chunks used to answer the query
+                - scope     : `str` identifying everything else the answer depends on (e.g., the prompt configuration)
+                - embedding : the embedding of `query` (computed with `self.embed` if not provided)
+                - encoder   : the encoder used if `self.encoder` is not set
+            Return :
+                - entry : the cached entry (or `None` if there is no valid entry)
+        """
+        fingerprint = self.get_fingerprint(context, scope)
+        key = self.get_key(query, fingerprint)
+        
+        with self._mutex:
+            entry = self._get_valid(key)
+            if entry is not None:
+                self._stats['hits'] += 1
+                self._stats['exact_hits'] += 1
+                return {** entry, 'score' : 1.}
+            
+            if not len(self):
+                self._stats['misses'] += 1
+                return None
+        
+        if embedding is None: embedding = self.embed(query, encoder = encoder)
+        
+        with self._mutex:
+            if len(self):
+                results = self._database.search(
+                    np.asarray(embedding)[None], k = min(self.k, len(self))
+                )[0]
+                for res in results:
+                    if res['score'] < self.threshold: continue
+                    if res['fingerprint'] != fingerprint: continue
+                    
+                    entry = self._get_valid(res['key'])
+                    if entry is not None:
+                        self._stats['hits'] += 1
+                        return {** entry, 'score' : float(res['score'])}
+            
+            self._stats['misses'] += 1
+            return None
+    
+    def insert(self, query, answer, context = None, *, scope = None, embedding = None, encoder = None):
+        """ Add the `answer` to `query` (with the given `context` and `scope`) in the cache """
+        if embedding is None: embedding = self.embed(query, encoder = encoder)
+        embedding = np.asarray(embedding)
+        
+        fingerprint = self.get_fingerprint(context, scope)
+        entry = {
+            'key'   : self.get_key(query, fingerprint),
+            'query' : query,
+            'answer'    : answer,
+            'fingerprint'   : fingerprint,
+            'context_ids'   : self.get_context_ids(context),
+            'timestamp' : time.time(),
+            'embedding' : embedding
+        }
+        
+        with self._mutex:
+            if self._database is None:
+                self._database = self._init_database(embedding_dim = embedding.shape[-1])
+            elif entry['key'] in self._database:
+                self._database.pop(entry['key'])
+            
+            if self.max_size and len(self._database) >= self.max_size:
+                # entries are ordered by insertion time
+                oldest = [it['key'] for it in self._database[: len(self._database) - self.max_size + 1]]
+                self._database.multi_pop(oldest)
+                self._stats['evicted'] += len(oldest)
+            
+            self._database.insert(entry)
+            self._stats['inserted'] += 1
+    
+    def invalidate(self, ids):
+        """ Remove the cached answers whose context contains any of the given chunk `ids`, and return their number """
+        if isinstance(ids, str): ids = [ids]
+        ids = {str(_id) for _id in ids}
+        
+        with self._mutex:
+            if not len(self): return 0
+            
+            to_remove = [
+                entry['key'] for entry in self._database if ids.intersection(entry['context_ids'])
+            ]
+            if to_remove: self._database.multi_pop(to_remove)
+            self._stats['invalidated'] += len(to_remove)
+        
+        return len(to_remove)
+    
+    def clear(self):
+        with self._mutex:
+            if len(self):
+                self._stats['invalidated'] += len(self)
+                self._database.multi_pop([entry['key'] for entry in self._database])
+    
+    def save(self):
+        with self._mutex:
+            if self._database is not None: self._database.save()
+    
+    def get_stats(self):
+        with self._mutex:
+            total = self._stats['hits'] + self._stats['misses']
+            return {
+                'size'  : len(self),
+                'hit_rate'  : self._stats['hits'] / total if total else 0.,
+                ** {k : self._stats[k] for k in (
+                    'hits', 'exact_hits', 'misses', 'inserted', 'expired', 'evicted', 'invalidated'
+                )}
+            }
+    
+    def _get_valid(self, key):
+        """ Return the entry `key` if it exists and is not expired (expired entries are removed), must be called with the lock held """
+        if self._database is None or key not in self._database: return None
+        
+        entry = self._database[key]
+        if self.ttl is not None and time.time() - entry['timestamp'] > self.ttl:
+            self._database.pop(key)
+            self._stats['expired'] += 1
+            return None
+        return entry
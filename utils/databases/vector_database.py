@@ -10,6 +10,7 @@
 # limitations under the License.
 
 import os
+import numpy as np
 
 from loggers import timer
 from ..keras import ops
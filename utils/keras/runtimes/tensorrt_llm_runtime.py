@@ -38,7 +38,15 @@ _default_enc_dec_config = {
 }
 
 class TensorRTLLMRuntime(Runtime):
-    def __init__(self, path, *, multimodal_engine = None, ** kwargs):
+    def __init__(self, path, *, multimodal_engine = None, prefix_cache = None, worker_id = None, ** kwargs):
+        """
+            Arguments :
+                - path  : the engine directory
+                - multimodal_engine : the vision engine (loaded from `{path}/vision` by default)
+                - prefix_cache  : `PrefixCache` (see `utils.threading`) that records the prompt prefixes in the KV cache of this worker, to monitor the length of the reused prefixes
+                - worker_id     : the identifier of this worker in `prefix_cache`
+                - kwargs    : forwarded to `load_engine`
+        """
         super().__init__(path, ** kwargs)
 
         _subdirs = os.listdir(self.path)
@@ -46,6 +54,9 @@ class TensorRTLLMRuntime(Runtime):
         self.is_multimodal  = 'vision' in _subdirs
         self.infer_signature    = set(inspect.signature(self.engine.generate).parameters.keys())
         
+        self.prefix_cache   = prefix_cache
+        self.worker_id  = worker_id
+        
         self.multimodal_engine  = multimodal_engine
         if self.is_multimodal and multimodal_engine is None:
             self.multimodal_engine = TensorRTRuntime(os.path.join(self.path, 'vision', 'model.engine'))
@@ -86,6 +97,9 @@ class TensorRTLLMRuntime(Runtime):
         kwargs.update(self.prepare_inputs(
             inputs, tokens = tokens, encoder_output_lengths = encoder_output_lengths, ** kwargs
         ))
+        
+        if self.prefix_cache is not None and not self.is_enc_dec:
+            self.update_prefix_cache(kwargs['batch_input_ids'])
 
         if 'kwargs' not in self.infer_signature:
             kwargs = {k : v for k, v in kwargs.items() if k in self.infer_signature}
@@ -174,6 +188,25 @@ class TensorRTLLMRuntime(Runtime):
         
         return kwargs
 
+    def update_prefix_cache(self, batch_input_ids):
+        """
+            Record the prompts in `self.prefix_cache`, and return the length of their cached prefixes
+            
+            The engine reuses the KV-cache blocks of the cached prefixes by itself (`kv_cache_enable_block_reuse = True`), as long as they are not evicted from its KV cache : the returned lengths are advisory (i.e., only used for monitoring).
+            `self.prefix_cache` is local to the process of this runtime : the routing between the workers of a `ProcessPool` is performed by a `PrefixRouter` in the dispatching process, fed with the results of the workers
+        """
+        workers = [self.worker_id]
+        lengths = []
+        for ids in batch_input_ids:
+            if hasattr(ids, 'cpu'): ids = ids.cpu().numpy()
+            lengths.append(self.prefix_cache.lookup(ids, workers = workers).length)
+            self.prefix_cache.insert(ids, self.worker_id)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[TRT-LLM] Cached prefix lengths : {}'.format(lengths))
+        
+        return lengths
+    
     def encode_multimodal_data(self, ** kwargs):
         multimodal_inputs = [
             kwargs[k] for k in self.multimodal_engine.argnames
@@ -141,6 +141,41 @@ def chunks_from_paragraphs(paragraphs,
     
     return splitted
 
+def iter_chunks(paragraphs, max_length = None, *, group_by = None, ** kwargs):
+    """
+        Generator version of `chunks_from_paragraphs`, which consumes `paragraphs` as a stream
+        
+        Arguments :
+            - paragraphs    : an iterable of paragraphs (e.g., the output of `iter_document`)
+            - max_length    : maximum length for a given chunk
+            - group_by      : the (list of) paragraph's entries used to group them
+            - kwargs    : forwarded to `chunks_from_paragraphs`
+        Return :
+            - chunks    : a generator of splitted/merged paragraphs
+        
+        Without `group_by`, each paragraph is chunked as soon as it is received. Otherwise, consecutive paragraphs with the same `group_by` value(s) are buffered, and chunked when a paragraph from another group is received.
+        Note that, contrary to `chunks_from_paragraphs`, non-consecutive paragraphs of a same group are therefore not merged together.
+    """
+    if not group_by:
+        for para in paragraphs:
+            yield from chunks_from_paragraphs([para], max_length, ** kwargs)
+        return
+    
+    keys = [group_by] if isinstance(group_by, str) else group_by
+    
+    group, group_key = [], None
+    for para in paragraphs:
+        key = tuple(_to_hashable(para.get(k, ())) for k in keys)
+        if group and key != group_key:
+            yield from chunks_from_paragraphs(group, max_length, group_by = group_by, ** kwargs)
+            group = []
+        
+        group_key = key
+        group.append(para)
+    
+    if group:
+        yield from chunks_from_paragraphs(group, max_length, group_by = group_by, ** kwargs)
+
 def group_paragraphs(paragraphs, key):
     """
         Group `paragraphs` into groups that have the same value for `key`(s)
@@ -168,7 +203,8 @@ def merge_paragraphs(paragraphs):
         Return :
             - merged    : a `dict` with a `content` entry that is the list of individual paragraphs
     """
-    if len(paragraphs) <= 1: return paragraphs
+    if len(paragraphs) == 1: return paragraphs[0]
+    elif not paragraphs: return {}
     
     common  = set(paragraphs[0].keys())
     content = paragraphs
@@ -126,6 +126,51 @@ def parse_document(filename,
                 - `list` : an enumeration
                     - items : `list` of items (`str`)
     """
+    return list(iter_document(
+        filename,
+        
+        recursive   = recursive,
+        
+        image_folder    = image_folder,
+        extract_images  = extract_images,
+        
+        strip   = strip,
+        return_raw  = return_raw,
+        
+        cache   = cache,
+        reload  = reload,
+        cache_dir   = cache_dir,
+        
+        _cache  = _cache,
+        
+        ** kwargs
+    ))
+
+def iter_document(filename,
+                  *,
+                  
+                  recursive    = True,
+                  
+                  image_folder = None,
+                  extract_images   = None,
+                  
+                  strip    = True,
+                  return_raw   = False,
+                  
+                  cache    = True,
+                  reload   = False,
+                  cache_dir    = _cache_dir,
+                  
+                  _cache   = None,
+                  
+                  ** kwargs
+                 ):
+    """
+        Generator version of `parse_document` (see its documentation for the arguments)
+        
+        Paragraphs are yielded as soon as they are extracted by the parser (e.g., page by page for `pdf` documents), which allows to process (e.g., chunk and embed) the beginning of the document while the rest is being parsed.
+        A document is only added to the cache once it has been entirely parsed, and the cache is not used when a subset of `pages` is requested.
+    """
     if isinstance(filename, str):
         if '*' in filename:
             filename = glob.glob(filename)
@@ -143,32 +188,36 @@ def parse_document(filename,
 
         _initial_cache_length = len(_cache) if cache else 0
         
-        paragraphs = []
-        for file in filename:
-            paragraphs.extend(parse_document(
-                file,
-                
-                recursive   = recursive,
-                image_folder    = image_folder,
-                extract_images  = extract_images,
-                
-                strip   = strip,
-                return_raw  = return_raw,
-                
-                cache   = False,
-                reload  = reload,
-                _cache  = _cache,
-                
-                ** kwargs
-            ))
-        
-        if (cache) and (reload or len(_cache) != _initial_cache_length):
-            _cache.save()
+        try:
+            for file in filename:
+                yield from iter_document(
+                    file,
+                    
+                    recursive   = recursive,
+                    image_folder    = image_folder,
+                    extract_images  = extract_images,
+                    
+                    strip   = strip,
+                    return_raw  = return_raw,
 
-        return paragraphs
+                    cache   = False,
+                    reload  = reload,
+                    _cache  = _cache,
+                    
+                    ** kwargs
+                )
+        finally:
+            if (cache) and (reload or len(_cache) != _initial_cache_length):
+                _cache.save()
+        
+        return
+    
+    if kwargs.get('pages', None) is not None:
+        _cache = None
     
     if _cache is not None and not reload and filename in _cache:
-        return normalize_paragraphs(_cache[filename]['paragraphs'], filename, strip = strip)
+        yield from normalize_paragraphs(_cache[filename]['paragraphs'], filename, strip = strip)
+        return
     
     basename, _, ext = filename.rpartition('.')
     if ext not in _parsers:
@@ -183,12 +232,17 @@ def parse_document(filename,
     elif image_folder and '{}' in image_folder:
         image_folder = image_folder.format(os.path.basename(basename))
     
+    paragraphs = [] if _cache is not None else None
     try:
         parser = _parsers[ext](filename)
         if return_raw:
-            paragraphs = parser.get_text(** kwargs)
+            iterator = parser.get_text(** kwargs)
         else:
-            paragraphs = parser.get_paragraphs(image_folder = image_folder, ** kwargs)
+            iterator = parser.iter_paragraphs(image_folder = image_folder, ** kwargs)
+        
+        for para in iterator:
+            if paragraphs is not None: paragraphs.append(para)
+            yield from normalize_paragraphs([para], filename, strip = strip)
     
     except Exception as e:
         logger.warning('An exception occured while loading {} : {}'.format(filename, e))
@@ -198,8 +252,6 @@ def parse_document(filename,
         _cache[filename] = {'filename' : filename, 'paragraphs' : paragraphs}
         if cache: _cache.save()
 
-    return normalize_paragraphs(paragraphs, filename, strip = strip)
-
 def normalize_paragraphs(paragraphs, filename, *, strip = True, ** kwargs):
     for para in paragraphs:
         if 'type' not in para:
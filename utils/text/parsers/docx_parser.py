@@ -16,7 +16,24 @@ class DocxParser(Parser):
     
     def get_paragraphs(self, ** kwargs):
         """ Extract a list of paragraphs """
+        return list(self.iter_paragraphs(** kwargs))
+    
+    def iter_paragraphs(self, *, pages = None, ** kwargs):
+        """
+            Lazily iterate over the paragraphs
+            
+            The `page` entry is only added if `pages` is provided, as the page index is inferred from the rendered page breaks stored in the document (if any)
+        """
         from docx import Document
         
-        return [{'text' : p.text} for p in Document(self.filename).paragraphs]
+        if isinstance(pages, int): pages = [pages]
+        
+        page = 0
+        for para in Document(self.filename).paragraphs:
+            if pages is None:
+                yield {'text' : para.text}
+                continue
+            
+            if page in pages: yield {'text' : para.text, 'page' : page}
+            if getattr(para, 'contains_page_break', False): page += 1
 
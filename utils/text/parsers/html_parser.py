@@ -10,6 +10,7 @@
 # limitations under the License.
 
 import re
+import codecs
 import logging
 
 from loggers import Timer, timer
@@ -23,6 +24,11 @@ _link_re    = r'<a [^>]*?href\=([^>\s]+)[^>]*?>(.*?)</a>'
 _title_re   = r'\<title\>(.*?)\<\/title\>'
 _whitespace_re = re.compile(r'\s+')
 
+_block_end_re   = re.compile(r'</(?:p|ul|ol|h[1-6]|table|pre)\s*>', flags = re.IGNORECASE)
+_container_re   = re.compile(
+    r'<(/?)(head|script|style|table|ul|ol|header|footer|nav|aside|form)\b', flags = re.IGNORECASE
+)
+
 class HTMLParser(Parser):
     __extension__ = 'html'
 
@@ -45,9 +51,109 @@ class HTMLParser(Parser):
         self.html = html
 
     def get_paragraphs(self, html = None, ** kwargs):
+        return list(self.iter_paragraphs(** kwargs))
+    
+    def iter_paragraphs(self, ** kwargs):
         title, html = prepare_html(self.html, ** kwargs)
 
-        return extract_paragraphs(html, title = title or 'html', ** kwargs)
+        yield from iter_paragraphs(html, title = title or 'html', ** kwargs)
+
+class HTMLStreamParser:
+    """
+        Incremental version of `HTMLParser` : the html is given by chunks (e.g., while it is downloaded), and the paragraphs are returned as soon as their tag is complete
+        
+        The buffered html is split after the last complete block (`</p>`, `</ul>`, `</h1>`, ...) that is not inside a container tag (e.g., `<table>`, `<script>` or `<header>`), then the complete part is processed like a whole page (see `prepare_html` and `iter_paragraphs`). The sections (i.e., the `<h*>` titles) are kept across chunks.
+        The only difference with `HTMLParser` is that `skip_footer` removes the last footer of each processed part (instead of the last footer of the page).
+        
+        Example usage :
+        ```python
+        parser = HTMLStreamParser(encoding = 'utf-8', origin = url)
+        for chunk in response_chunks:
+            for para in parser.feed(chunk):
+                print(para['text'])
+        paragraphs = parser.close()
+        ```
+    """
+    def __init__(self, *, encoding = 'utf-8', ** kwargs):
+        """
+            Arguments :
+                - encoding  : the encoding of the `bytes` chunks
+                - kwargs    : forwarded to `prepare_html` and `iter_paragraphs`
+        """
+        self.kwargs = kwargs
+        
+        self._decoder   = codecs.getincrementaldecoder(get_codec(encoding))(errors = 'replace')
+        self._buffer    = ''
+        self._title     = None
+        self._state     = {'section' : []}
+        self._skip_header   = kwargs.get('skip_header', True)
+        # the part of `self._buffer` already scanned by `_find_split`, and the container depths at its end
+        self._scan_pos  = 0
+        self._depths    = {}
+    
+    def feed(self, chunk):
+        """ Add `chunk` (`bytes` or `str`) to the html, and return the `list` of paragraphs completed by it """
+        if isinstance(chunk, bytes): chunk = self._decoder.decode(chunk)
+        self._buffer += chunk
+        
+        split, self._scan_pos = _find_split(self._buffer, self._scan_pos, self._depths)
+        if not split: return []
+        
+        html, self._buffer = self._buffer[:split], self._buffer[split:]
+        self._scan_pos -= split
+        return self._parse(html)
+    
+    def close(self):
+        """ Return the remaining paragraphs (i.e., the end of the html) """
+        html, self._buffer = self._buffer + self._decoder.decode(b'', final = True), ''
+        self._scan_pos, self._depths = 0, {}
+        return self._parse(html) if html.strip() else []
+    
+    def _parse(self, html):
+        title, html = prepare_html(html, ** {** self.kwargs, 'skip_header' : self._skip_header})
+        if self._title is None: self._title = title
+        # the 1st header is only removed once
+        if self._skip_header and '<header' in html.lower(): self._skip_header = False
+        
+        return list(iter_paragraphs(
+            html, title = self._title or 'html', _state = self._state, ** self.kwargs
+        ))
+
+def _find_split(html, start = 0, depths = None):
+    """
+        Return the end of the last complete block of `html[start :]` that is outside of any container tag (0 if there is none), and the position where the next scan should start
+        
+        `depths` (updated inplace) are the depths of the container tags at `start`. The tags starting at the last `<` may be incomplete : they are scanned at the next call (with more html), such that each part of `html` is only scanned once.
+    """
+    if depths is None: depths = {}
+    
+    end = html.rfind('<', start)
+    if end == -1: return 0, start
+    
+    events = sorted(
+        [(m.start(), 0, m) for m in _block_end_re.finditer(html, start, end)]
+        + [(m.start(), 1, m) for m in _container_re.finditer(html, start, end)],
+        key = lambda event: event[:2]
+    )
+    
+    split = 0
+    for _, is_container, match in events:
+        if is_container:
+            tag = match.group(2).lower()
+            depths[tag] = max(0, depths.get(tag, 0) + (-1 if match.group(1) else 1))
+        elif not any(depths.values()):
+            split = match.end()
+    
+    return split, end
+
+def get_codec(encoding, default = 'utf-8'):
+    """ Return `encoding` if it is a known codec, `default` otherwise (e.g., for an invalid `charset` sent by a server) """
+    if not encoding: return default
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        logger.warning('Unknown encoding {}, {} is used instead'.format(encoding, default))
+        return default
 
 def extract_title(html):
     match = re.search(_title_re, html, flags = re.DOTALL)
@@ -116,7 +222,15 @@ def get_link(link_id):
     return None
 
 @timer
-def extract_paragraphs(html, *, title = 'html', skip_table = False, ** _):
+def extract_paragraphs(html, ** kwargs):
+    return list(iter_paragraphs(html, ** kwargs))
+
+def iter_paragraphs(html, *, title = 'html', skip_table = False, _state = None, ** _):
+    """
+        Generator version of `extract_paragraphs` : yields each paragraph once its tag is processed
+        
+        `_state` is used by `HTMLStreamParser` to keep the current section between the chunks of a page
+    """
     from bs4 import BeautifulSoup
     
     tags = ['p', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5']
@@ -128,35 +242,37 @@ def extract_paragraphs(html, *, title = 'html', skip_table = False, ** _):
     with Timer('find tags'):
         tags = soup.find_all(tags)
     
-    titles = []
-    parsed = []
-    with Timer('tags processing'):
-        for tag in tags:
-            if tag.decomposed:
-                continue
-            elif tag.name == 'table':
+    infos  = {'title' : title} if title else {}
+    titles = _state['section'] if _state is not None else []
+    for tag in tags:
+        if tag.decomposed:
+            continue
+        
+        # the timer only measures the processing of the tag (not the consumer, between 2 `yield`)
+        para = None
+        with Timer('tags processing'):
+            if tag.name == 'table':
                 rows = _parse_table(tag)
                 if rows and rows[0]:
-                    parsed.append({'type' : 'table', 'section' : titles, 'rows' : rows})
+                    para = {'type' : 'table', 'section' : titles, 'rows' : rows}
             elif tag.name in ('ul', 'ol'):
                 items = _parse_list(tag)
                 if items:
-                    parsed.append({'type' : 'list', 'section' : titles, 'items' : items})
+                    para = {'type' : 'list', 'section' : titles, 'items' : items}
             elif tag.name[0] == 'h' and tag.name[1].isdigit():
                 titles = _parse_title(tag, titles)
+                if _state is not None: _state['section'] = titles
             elif tag.name == 'code':
                 text = _extract_text(tag)
-                if text: parsed.append({'type' : 'code', 'section' : titles, 'text' : text})
+                if text: para = {'type' : 'code', 'section' : titles, 'text' : text}
             else:
                 text = _extract_text(tag)
-                if text: parsed.append({'type' : 'text', 'section' : titles, 'text' : text})
-
+                if text: para = {'type' : 'text', 'section' : titles, 'text' : text}
+            
             tag.decompose()
-    
-    if title:
-        for para in parsed: para['title'] = title
-    
-    return parsed
+        
+        if para is not None:
+            yield {** para, ** infos}
 
 def _remove_tags(html, tags, mode = 'all'):
     pattern = r'<({})\b[^>]*>.*?</\1>'.format('|'.join(tags))
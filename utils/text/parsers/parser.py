@@ -9,7 +9,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import multiprocessing
+
 from abc import ABC, abstractmethod
+from multiprocessing.pool import ThreadPool
 
 class Parser(ABC):
     def __init__(self, filename):
@@ -28,6 +32,15 @@ class Parser(ABC):
                 - content_type  : the type of content
         """
     
+    def iter_paragraphs(self, ** kwargs):
+        """
+            Iterate over the paragraphs of `self.filename`
+            
+            Paginated parsers (e.g., `pdf`) override this method to lazily parse the document page by page, which bounds the memory usage to a few pages. They also support the `pages` (page range) and `max_workers` (number of parallel workers) arguments.
+            By default, it simply iterates over `self.get_paragraphs`.
+        """
+        yield from self.get_paragraphs(** kwargs)
+    
     def get_text(self, sep = '\n\n', ** kwargs):
         """
             Return raw text from the entire document.
@@ -35,4 +48,35 @@ class Parser(ABC):
         """
         text = sep.join([para['text'] for para in self.get_paragraphs(** kwargs) if 'text' in para])
         return [{'text' : text}]
-    
\ No newline at end of file
+
+def imap_ordered(fn, items, *, max_workers = 0, prefetch_size = None, use_processes = False):
+    """
+        Lazily apply `fn` on each item of `items`, and yield the results in order
+        
+        Arguments :
+            - fn    : the function to apply (should be picklable if `use_processes = True`)
+            - items : an iterable of items (each item is given as single positional argument)
+            - max_workers   : the number of parallel workers (0 means sequential execution)
+            - prefetch_size : the maximal number of pending items (default to `2 * max_workers`)
+            - use_processes : whether to use a process pool instead of a thread pool
+        
+        Contrary to `Pool.imap`, at most `prefetch_size` items are submitted at once, which bounds the memory usage when the consumer is slower than the workers.
+    """
+    if not max_workers:
+        for item in items: yield fn(item)
+        return
+    
+    if not prefetch_size: prefetch_size = 2 * max_workers
+    
+    pool    = multiprocessing.Pool(max_workers) if use_processes else ThreadPool(max_workers)
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(pool.apply_async(fn, (item, )))
+            if len(pending) >= prefetch_size:
+                yield pending.popleft().get()
+        
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
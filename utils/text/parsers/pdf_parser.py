@@ -13,8 +13,11 @@ import os
 import logging
 import numpy as np
 
+from functools import partial
+from contextlib import closing
+
 from loggers import Timer, timer
-from .parser import Parser
+from .parser import Parser, imap_ordered
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +38,8 @@ class Pypdfium2Parser(Parser):
         with Timer('pdf processing'):
             pdf = pypdfium2.PdfDocument(self.filename)
 
-        if pages is None:               pages = range(len(pdf))
-        elif isinstance(pages, int):    pages = [pages]
-
         paragraphs = []
-        for page_index in pages:
+        for page_index in _get_pages(pages, len(pdf)):
             with Timer('page processing'):
                 page = pdf.get_page(page_index)
                 
@@ -49,24 +49,17 @@ class Pypdfium2Parser(Parser):
         
         return paragraphs
 
-    def get_paragraphs(self,
-                       *,
-                       
-                       pages    = None,
-                       raw_content  = None,
-                       image_folder = None,
-                       header_threshold = 0.1,
-                       ** kwargs
-                      ):
+    def get_paragraphs(self, ** kwargs):
         """
             Extract texts and images from `filename` with `pdfium2` library
 
             Arguments :
                 - filename  : the `.pdf` document filename
-                - pagenos   : list of page numbers to parse
+                - pages     : page number(s) to parse (`int`, `list`, `range` or `slice`)
                 - image_folder  : where to store the images (with format `image_{i}.jpg`)
+                - max_workers   : number of processes used to parse pages in parallel
             Return :
-                - document  : `dict` of pages `{page_index : list_of_paragraphs}`
+                - paragraphs    : `list` of paragraphs (see `iter_paragraphs`)
 
                 A `paragraph` is a `dict` containing the following keys :
                     Text paragraphs :
@@ -76,98 +69,131 @@ class Pypdfium2Parser(Parser):
                     - height    : the image height
                     - width     : the image width
         """
+        return list(self.iter_paragraphs(** kwargs))
+    
+    def iter_paragraphs(self,
+                        *,
+                        
+                        pages   = None,
+                        raw_content = None,
+                        
+                        max_workers = 0,
+                        prefetch_size   = None,
+                        
+                        ** kwargs
+                       ):
+        """
+            Lazily extract the paragraphs of `filename`, page by page
+            
+            Only the pages being processed are loaded in memory, meaning that paragraphs can be consumed (e.g., chunked and embedded) while the next pages are parsed.
+            If `max_workers > 0`, pages are parsed in a pool of processes (`pdfium` is not thread-safe), and at most `prefetch_size` pages are pending at the same time.
+            Note that `raw_content` is always parsed sequentially.
+        """
+        if max_workers and raw_content is None:
+            import pypdfium2
+            
+            with closing(pypdfium2.PdfDocument(self.filename)) as pdf:
+                pages = _get_pages(pages, len(pdf))
+            
+            for paragraphs in imap_ordered(
+                partial(_parse_file_page, self.filename, ** kwargs),
+                pages,
+                max_workers = max_workers,
+                prefetch_size   = prefetch_size,
+                use_processes   = True
+            ):
+                yield from paragraphs
+            return
+        
         import pypdfium2
-        import pypdfium2.raw as pypdfium_c
-
+        
         with Timer('pdf processing'):
             pdf = pypdfium2.PdfDocument(self.filename if raw_content is None else raw_content)
+        
+        with closing(pdf):
+            for page_index in _get_pages(pages, len(pdf)):
+                yield from parse_page(pdf, page_index, ** kwargs)
 
-        if pages is None:               pages = range(len(pdf))
-        elif isinstance(pages, int):    pages = [pages]
-
-        filters = (pypdfium_c.FPDF_PAGEOBJ_TEXT, ) if not image_folder else ()
+@timer
+def parse_page(pdf, page_index, *, image_folder = None, header_threshold = 0.1, ** kwargs):
+    """ Extract the paragraphs of the page `page_index` from the `pypdfium2.PdfDocument` """
+    import pypdfium2.raw as pypdfium_c
+    
+    filters = (pypdfium_c.FPDF_PAGEOBJ_TEXT, ) if not image_folder else ()
+    
+    with Timer('page processing'):
+        page    = pdf.get_page(page_index)
+        text    = page.get_textpage()
+        page_h  = page.get_height()
+        page_w  = page.get_width()
 
-        _pages = {}
-        for page_index in pages:
-            with Timer('page processing'):
-                page    = pdf.get_page(page_index)
-                text    = page.get_textpage()
-                page_h  = page.get_height()
-                page_w  = page.get_width()
-                
-                img_num = 0
-                page_infos = {'paragraphs' : [], 'height' : page_h, 'width' : page_w}
-                for obj in page.get_objects(filters):
-                    with Timer('object extraction'):
-                        box = obj.get_bounds()
-                        relative_box = [
-                            box[0] / page_w,            # left
-                            (page_h - box[3]) / page_h, # top
-                            box[2] / page_w,            # right
-                            (page_h - box[1]) / page_h  # bottom
-                        ]
-                        
-                        if obj.type == pypdfium_c.FPDF_PAGEOBJ_TEXT:
-                            txt = text.get_text_bounded(* box).strip()
-                            if (not txt) or (len(txt) == 1 and ord(txt) <= 10):
-                                continue
-                            
-                            page_infos['paragraphs'].append({
-                                'text' : txt,
-                                'box'  : relative_box,
-                                'font_size' : obj.get_font_size()
-                            })
-                        elif obj.type == pypdfium_c.FPDF_PAGEOBJ_IMAGE and image_folder:
-                            if img_num == 0 and not os.path.exists(image_folder):
-                                os.makedirs(image_folder)
+        img_num = 0
+        blocks  = []
+        for obj in page.get_objects(filters):
+            with Timer('object extraction'):
+                box = obj.get_bounds()
+                relative_box = [
+                    box[0] / page_w,            # left
+                    (page_h - box[3]) / page_h, # top
+                    box[2] / page_w,            # right
+                    (page_h - box[1]) / page_h  # bottom
+                ]
 
-                            image_path = os.path.join(
-                                image_folder, 'image_{}_{}.png'.format(page_index, img_num)
-                            )
-                            obj.extract(image_path[:-4])
-                            
-                            page_infos['paragraphs'].append({
-                                'type'  : 'image',
-                                'image' : image_path,
-                                'height': box[3] - box[1],
-                                'width' : box[2] - box[0],
-                                'box'   : relative_box
-                            })
-                            img_num += 1
-                
-                _pages[page_index] = page_infos
+                if obj.type == pypdfium_c.FPDF_PAGEOBJ_TEXT:
+                    txt = text.get_text_bounded(* box).strip()
+                    if (not txt) or (len(txt) == 1 and ord(txt) <= 10):
+                        continue
+                    
+                    blocks.append({
+                        'text' : txt,
+                        'box'  : relative_box,
+                        'font_size' : obj.get_font_size()
+                    })
+                elif obj.type == pypdfium_c.FPDF_PAGEOBJ_IMAGE and image_folder:
+                    if img_num == 0 and not os.path.exists(image_folder):
+                        os.makedirs(image_folder, exist_ok = True)
+                    
+                    image_path = os.path.join(
+                        image_folder, 'image_{}_{}.png'.format(page_index, img_num)
+                    )
+                    obj.extract(image_path[:-4])
+                    
+                    blocks.append({
+                        'type'  : 'image',
+                        'image' : image_path,
+                        'height': box[3] - box[1],
+                        'width' : box[2] - box[0],
+                        'box'   : relative_box
+                    })
+                    img_num += 1
         
-        paragraphs = []
-        for index, page in _pages.items():
-            content = combine_blocks(page['paragraphs'], ** kwargs)
-            
-            font_size = sorted(p['font_size'] for p in content if 'font_size' in p)
-            font_size = font_size[len(font_size) // 2]
-            for i, para in enumerate(content):
-                if i and 'font_size' in para and not para.get('is_footnote', False):
-                    if (
-                        (font_size - para['font_size'] > 1.5)
-                        and (i == len(content) - 1 or para['box'][1] > content[i + 1]['box'][1])
-                    ):
-                        para['is_footnote'] = True
-                
-                if 'text' in para and para['box'][1] <= header_threshold and '\n' not in para['text']:
-                    para['is_header'] = True
-                
-                para.update({
-                    'page' : index, 'page_h' : page['height'], 'page_w' : page['width']
-                })
-            
-            if content[-1].get('text', '').isdigit():
-                content[-1]['is_page_number'] = True
-            
-            content = sorted(
-                content, key = lambda p: _get_paragraph_order_weight(p)
-            )
-            
-            paragraphs.extend(content)
+        text.close()
+        page.close()
+    
+    content = combine_blocks(blocks, ** kwargs)
+    if not content: return []
+    
+    font_size = sorted(p['font_size'] for p in content if 'font_size' in p)
+    font_size = font_size[len(font_size) // 2] if font_size else 0
+    for i, para in enumerate(content):
+        if i and 'font_size' in para and not para.get('is_footnote', False):
+            if (
+                (font_size - para['font_size'] > 1.5)
+                and (i == len(content) - 1 or para['box'][1] > content[i + 1]['box'][1])
+            ):
+                para['is_footnote'] = True
         
-        return paragraphs
+        if 'text' in para and para['box'][1] <= header_threshold and '\n' not in para['text']:
+            para['is_header'] = True
+        
+        para.update({
+            'page' : page_index, 'page_h' : page_h, 'page_w' : page_w
+        })
+    
+    if content[-1].get('text', '').isdigit():
+        content[-1]['is_page_number'] = True
+    
+    return sorted(content, key = lambda p: _get_paragraph_order_weight(p))
 
 @timer
 def combine_blocks(blocks, ** kwargs):
@@ -352,6 +378,20 @@ def compute_union(boxes):
     ], axis = 0)
 
 
+def _get_pages(pages, num_pages):
+    """ Return the `list` of page indexes from `pages` (`None`, `int`, `list`, `range` or `slice`) """
+    if pages is None:               return range(num_pages)
+    elif isinstance(pages, int):    return [pages]
+    elif isinstance(pages, slice):  return range(num_pages)[pages]
+    return pages
+
+def _parse_file_page(filename, page_index, ** kwargs):
+    """ Function executed by the workers : the document is closed once the page is parsed """
+    import pypdfium2
+    
+    with closing(pypdfium2.PdfDocument(filename)) as pdf:
+        return parse_page(pdf, page_index, ** kwargs)
+
 def _overlap_y(box1, box2):
     return min(box1[3], box2[3]) - max(box1[1], box2[1]) > 0
 
@@ -311,6 +311,19 @@ def format_text(format, ** kwargs):
     else:
         return format
 
+@cache
+def get_format_variables(format):
+    """ Return the `frozenset` of variables used by `format` (see `format_text`) """
+    if '{' not in format:
+        return frozenset()
+    elif '{%' in format or '{{' in format:
+        from jinja2 import meta
+        
+        template = compile_jinja_template(format)
+        return frozenset(meta.find_undeclared_variables(template.environment.parse(format)))
+    else:
+        return frozenset(re.findall(r'\{([^\s\'\"\}\[\.!:]+)', format))
+
 @cache
 def compile_jinja_template(template):
     import jinja2
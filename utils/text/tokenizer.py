@@ -21,6 +21,7 @@ import regex as re
 from functools import cached_property, cache
 
 from loggers import Timer, timer
+from ..cache_utils import LRUCache
 from .. import load_json, dump_json, pad_batch, get_enum_item, is_dataframe, convert_to_str, timestamp_to_str
 from ..keras import TensorSpec, ops, execute_eagerly
 from .ctc_decoder import ctc_decode
@@ -151,6 +152,7 @@ class Tokenizer:
             '({})'.format('|'.join([re.escape(tok) for tok in self._special_tokens]))
         )
         self._bpe_cache     = {}
+        self._segments_cache    = LRUCache(4096)
         self._symbol_to_id  = {}
         self._id_to_symbol  = {}
         self.__build_indexes(vocab_size, add_special_tokens_at_end)
@@ -468,6 +470,48 @@ class Tokenizer:
 
     __call__    = encode
     
+    @timer
+    def encode_prompt(self, prompt, *, add_sos = None, add_eos = None, return_type = 'np'):
+        """
+            Encode a (long) `prompt`, typically the output of a chat template
+            
+            As the text is split on special tokens before being tokenized (see `tokenize`), the prompt is encoded segment by segment, and the tokens of each segment are cached. In a chat template, each message is delimited by special tokens : the messages of the previous turns are therefore not tokenized again.
+            The result is identical to `self.encode(prompt, add_sos = add_sos, add_eos = add_eos)` (`add_sos` and `add_eos` also default to `self.use_sos_and_eos`)
+        """
+        if add_sos is None: add_sos = self.use_sos_and_eos
+        if add_eos is None: add_eos = self.use_sos_and_eos
+        
+        text = self.clean_text(prompt, self._cleaned_tokens)
+        
+        tokens = []
+        for part in re.split(self._tokens_split_re, text):
+            if not part: continue
+            elif part in self._special_tokens:
+                tokens.append(self._symbol_to_id.get(part, self.ukn_token_idx))
+                continue
+            
+            ids = self._segments_cache.get(part, None)
+            if ids is None:
+                ids = [
+                    self._symbol_to_id.get(tok, self.ukn_token_idx)
+                    for word in self._split_text(part) for tok in self._tokenize(word)
+                ]
+                self._segments_cache[part] = ids
+            tokens.extend(ids)
+        
+        tokens = [token for token in tokens if token != -1]
+        
+        if (add_sos and self.sos_token) and (len(tokens) == 0 or tokens[0] != self.sos_token_idx):
+            tokens.insert(0, self.sos_token_idx)
+        if (add_eos and self.eos_token) and (len(tokens) == 0 or tokens[-1] != self.eos_token_idx):
+            tokens.append(self.eos_token_idx)
+        
+        if return_type == 'list': return tokens
+        elif return_type == 'np': return np.array(tokens, dtype = np.int32)
+        elif return_type == 'tf': return ops.convert_to_tf_tensor(tokens, dtype = 'int32')
+        elif return_type == 'tensor':   return ops.convert_to_tensor(tokens, dtype = 'int32')
+        else:   raise ValueError("Unknown `return_type` : {}".format(return_type))
+    
     @timer
     @execute_eagerly(signature = TensorSpec(shape = (None, ), dtype = 'int32'), numpy = True)
     def encode_chat(self,
@@ -574,7 +618,7 @@ class Tokenizer:
                     'content'   : format_text(system_prompt, messages = messages, ** kwargs)
                 }] + messages
 
-        for _ in range(max(1, len(messages) - 1)):
+        def _encode(messages):
             with Timer('apply template'):
                 text = format_text(
                     self.template,
@@ -584,17 +628,31 @@ class Tokenizer:
                 )
                 if add_generation_prompt and answer_start: text += answer_start
             
-            if not encode: return text
-
-            encoded = self.encode(text, add_sos = False, add_eos = add_eos, return_type = return_type)
-            if not max_length or len(encoded) <= max_length:
-                return encoded if not return_text else (text, encoded)
+            if not encode: return text, None
+            return text, self.encode_prompt(text, add_sos = False, add_eos = add_eos, return_type = return_type)
+        
+        text, encoded = _encode(messages)
+        if not encode: return text
+        
+        if max_length and len(encoded) > max_length:
+            # binary search on the number of removed messages (the first and last ones are kept)
+            best, shortest = None, len(encoded)
+            low, high = 1, len(messages) - 2
+            while low <= high:
+                mid = (low + high) // 2
+                candidate = _encode(messages[:1] + messages[1 + mid :])
+                if len(candidate[1]) <= max_length:
+                    best, high = candidate, mid - 1
+                else:
+                    shortest, low = min(shortest, len(candidate[1])), mid + 1
             
-            messages.pop(1)
+            if best is None:
+                raise ValueError('The message length ({}) exceeded the maximum length ({})'.format(
+                    shortest, max_length
+                ))
+            text, encoded = best
         
-        raise ValueError('The message length ({}) exceeded the maximum length ({})'.format(
-            len(encoded), max_length
-        ))
+        return encoded if not return_text else (text, encoded)
 
     def decode(self, tokens, *, skip_padding = True, remove_tokens = False, ** _):
         """ Decode the given list of token ids into their corresponding token (str) """
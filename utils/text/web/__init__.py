@@ -12,11 +12,16 @@
 import os
 import importlib
 
+from copy import deepcopy
+
+from ...threading import SingleFlight, canonical_hash
 from .search_engine import *
 
 _engines = {}
 _default_engine = 'google'
 
+_search_flights = SingleFlight(ttl = 60)
+
 for module in os.listdir(__package__.replace('.', os.path.sep)):
     if module.startswith(('.', '_')) or '_old' in module: continue
     module = importlib.import_module(__package__ + '.' + module.replace('.py', ''))
@@ -37,7 +42,7 @@ def set_default_engine(engine):
     global _default_engine
     _default_engine = engine
 
-def search_on_web(query, *, n = 5, engine = None, ** kwargs):
+def search_on_web(query, *, n = 5, engine = None, stream = False, ** kwargs):
     """
         Returns the result of `query` search on the given `engine`
         
@@ -45,6 +50,7 @@ def search_on_web(query, *, n = 5, engine = None, ** kwargs):
             - query : the query to search
             - n     : the expected number of url to process (it may be less if the engine returns less url)
             - engine    : the search engine to use
+            - stream    : whether to return a generator of paragraphs, yielded while the pages are downloaded (see `SearchEngine.iter_search`)
         Return :
             - parsed    : `dict` containing the result of the engine's `search` method
                 - urls      : list of urls returned
@@ -53,6 +59,8 @@ def search_on_web(query, *, n = 5, engine = None, ** kwargs):
                 - query     : the query
                 - engine    : the search engine class
                 - config    : the url parsing configuration
+        
+        Identical concurrent searches (same `query`, `n`, `engine` and keyword arguments) are only performed once, and their result is kept for 1 minute. Each caller receives its own copy of the result, such that it can be modified safely.
     """
     if engine is None: engine = get_default_engine()
     
@@ -60,5 +68,14 @@ def search_on_web(query, *, n = 5, engine = None, ** kwargs):
         raise ValueError('Unsupported search engine\n  Accepted : {}\n  Got : {}'.format(
             tuple(_engines.keys()), engine
         ))
+    
+    if stream:
+        return _engines[engine](** kwargs).iter_search(query, n = n, ** kwargs)
+    
+    # identical concurrent (or recent) searches are only performed once
+    key = canonical_hash(query, n = n, engine = engine, ** kwargs)
+    return deepcopy(_search_flights.do(key, _search, query, n = n, engine = engine, ** kwargs))
+
+def _search(query, *, n, engine, ** kwargs):
     return _engines[engine](** kwargs).search(query, n = n, ** kwargs)
 
@@ -0,0 +1,540 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ssl
+import time
+import queue
+import asyncio
+import logging
+import collections
+
+from threading import Thread, Lock
+from urllib.parse import urlsplit, urljoin
+
+from ..parsers.html_parser import get_codec
+
+logger = logging.getLogger(__name__)
+
+_user_agent = 'Mozilla/5.0 (compatible; yui-mhcp)'
+_chunk_size = 64 * 1024
+
+_fetcher    = None
+_fetcher_mutex  = Lock()
+
+def get_fetcher(** kwargs):
+    """ Return the `AsyncFetcher` shared by all the web searches of the process (created at the 1st call) """
+    global _fetcher
+    with _fetcher_mutex:
+        if _fetcher is None or _fetcher.closed:
+            _fetcher = AsyncFetcher(** kwargs)
+        return _fetcher
+
+class FetchError(RuntimeError):
+    """ Raised when the response of a server cannot be read (e.g., malformed HTTP response) """
+
+class AsyncFetcher:
+    """
+        `asyncio` HTTP/1.1 client with a keep-alive connection pool per host
+        
+        The fetcher limits the number of concurrent requests (globally and per host), and reuses the idle connections of a host for the subsequent requests. The body is read as a stream, such that :
+            - the download is stopped as soon as the `Content-Type` is not allowed (without reading the body)
+            - the content is truncated once it exceeds `max_size` bytes
+        The `timeout` is a single deadline for the whole request (including the redirections), started once the request has its connection slot. The connections idle for more than `keep_alive_timeout` are closed, and the hosts without request in progress are forgotten, such that a long-running crawler does not accumulate state for every host it has visited.
+        
+        It also supports conditional requests (`etag` / `last_modified`) : the result has `not_modified = True` (and no content) if the server answers `304 Not Modified`. The body of the error responses (i.e., not 2xx / 304) is not read, and these responses are considered as failed requests by `iter_fetch` / `iter_chunks`.
+        
+        The connections are bound to the event loop of the fetcher (executed in a background thread), so the synchronous methods (`fetch_sync`, `iter_fetch`) can be called from any thread, while the coroutines (`fetch`) should be executed in `self.loop`.
+        
+        Example usage :
+        ```python
+        fetcher = get_fetcher()
+        result  = fetcher.fetch_sync('https://example.com', allowed_contents = ['text/html'])
+        print(result['status'], result['content_type'], len(result['content']))
+        
+        for idx, url, result in fetcher.iter_fetch(urls, concurrency = 4):
+            ...
+        ```
+    """
+    def __init__(self,
+                 *,
+                 
+                 max_connections    = 64,
+                 max_per_host   = 6,
+                 
+                 timeout    = 10.,
+                 max_size   = 10 * 1024 ** 2,
+                 max_redirects  = 5,
+                 keep_alive_timeout = 30.,
+                 
+                 user_agent = _user_agent
+                ):
+        """
+            Arguments :
+                - max_connections   : the maximal number of concurrent requests
+                - max_per_host      : the maximal number of concurrent requests (and of idle connections) per host
+                
+                - timeout   : the default timeout (in seconds) of a request (including its redirections)
+                - max_size  : the default maximal number of bytes read from a response body
+                - max_redirects : the maximal number of redirections followed
+                - keep_alive_timeout    : the time (in seconds) after which an idle connection is closed
+                
+                - user_agent    : the `User-Agent` header of the requests
+        """
+        self.max_connections    = max_connections
+        self.max_per_host   = max_per_host
+        self.timeout    = timeout
+        self.max_size   = max_size
+        self.max_redirects  = max_redirects
+        self.keep_alive_timeout = keep_alive_timeout
+        self.user_agent = user_agent
+        
+        # the idle connections and the semaphores of the hosts are removed once unused (see `_prune_idle` and `_request`)
+        self._idle  = {}
+        self._host_semaphores   = {}
+        self._host_requests = collections.Counter()
+        self._prune_handle  = None
+        self._semaphore = None
+        self._ssl_context   = None
+        self._stats = collections.Counter()
+        self.closed = False
+        
+        self.loop   = asyncio.new_event_loop()
+        self._thread    = Thread(target = self.loop.run_forever, name = 'web_fetcher', daemon = True)
+        self._thread.start()
+    
+    def __repr__(self):
+        return '<AsyncFetcher hosts={} idle={} stats={}>'.format(
+            len(self._host_semaphores), sum(len(conns) for conns in self._idle.values()), dict(self._stats)
+        )
+    
+    def get_stats(self):
+        return dict(self._stats)
+    
+    def close(self):
+        """ Close the idle connections and stop the event loop """
+        if self.closed: return
+        self.closed = True
+        
+        asyncio.run_coroutine_threadsafe(self._close_idle(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+    
+    def fetch_sync(self, url, ** kwargs):
+        """ Synchronous version of `fetch` (executed in the fetcher event loop) """
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, ** kwargs), self.loop).result()
+    
+    def iter_fetch(self, urls, *, concurrency = None, request_kwargs = None, ** kwargs):
+        """
+            Fetch `urls` concurrently, and return a `FetchIterator` of `(idx, url, result)` (in the order of completion)
+            
+            Arguments :
+                - urls  : the urls to fetch
+                - concurrency   : the maximal number of requests in progress (a new url is fetched when a request is completed)
+                - request_kwargs    : `list` of additional kwargs for each url (e.g., `etag`)
+                - kwargs    : forwarded to `fetch`
+            Return :
+                - iterator  : `FetchIterator` yielding `(idx, url, result)`, where `result` is `None` if the request has failed (including the error responses)
+        """
+        buffer  = queue.Queue()
+        def callback(idx, result):
+            buffer.put((idx, urls[idx], result))
+        
+        return self._iter_fetch(urls, buffer, callback, concurrency, request_kwargs, kwargs)
+    
+    def iter_chunks(self, urls, *, concurrency = None, request_kwargs = None, ** kwargs):
+        """
+            Equivalent to `iter_fetch`, but also yields the body chunks while they are downloaded
+            
+            Return :
+                - iterator  : `FetchIterator` yielding `(idx, url, chunk, result)`, where `chunk` is a `bytes` body chunk (`result` then only contains the headers), or `None` when the request is completed (`result` is then the result of `fetch`)
+        """
+        buffer  = queue.Queue()
+        def callback(idx, result):
+            buffer.put((idx, urls[idx], None, result))
+        
+        def get_on_chunk(idx):
+            return lambda chunk, result: buffer.put((idx, urls[idx], chunk, result))
+        
+        request_kwargs = [
+            {** kw, 'on_chunk' : get_on_chunk(idx)}
+            for idx, kw in enumerate(request_kwargs or [{}] * len(urls))
+        ]
+        return self._iter_fetch(
+            urls, buffer, callback, concurrency, request_kwargs, kwargs, is_final = lambda item: item[2] is None
+        )
+    
+    def _iter_fetch(self, urls, buffer, callback, concurrency, request_kwargs, kwargs, is_final = None):
+        if not concurrency: concurrency = len(urls)
+        if request_kwargs is None: request_kwargs = [{}] * len(urls)
+        
+        async def fetch_one(idx):
+            try:
+                result = await self.fetch(urls[idx], ** {** kwargs, ** request_kwargs[idx]})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning('An error occured with url {} : {}'.format(urls[idx], e))
+                result = None
+            
+            if result is not None and not _is_success(result['status']):
+                logger.warning('The request to {} has failed (status {})'.format(urls[idx], result['status']))
+                result = None
+            callback(idx, result)
+        
+        async def schedule():
+            pending, next_idx = set(), 0
+            try:
+                while next_idx < len(urls) or pending:
+                    while next_idx < len(urls) and len(pending) < concurrency:
+                        pending.add(asyncio.ensure_future(fetch_one(next_idx)))
+                        next_idx += 1
+                    _, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+            finally:
+                for task in pending: task.cancel()
+        
+        return FetchIterator(
+            asyncio.run_coroutine_threadsafe(schedule(), self.loop), buffer, len(urls), is_final = is_final
+        )
+    
+    async def fetch(self,
+                    url,
+                    *,
+                    
+                    timeout = None,
+                    max_size    = None,
+                    allowed_contents    = None,
+                    
+                    etag    = None,
+                    last_modified   = None,
+                    headers = None,
+                    
+                    on_chunk    = None,
+                    ** _
+                   ):
+        """
+            Fetch `url` and return the response
+            
+            Arguments :
+                - url   : the url to fetch
+                
+                - timeout   : the maximal time (in seconds) of the request, including the redirections
+                - max_size  : the maximal number of bytes read from the body (the content is truncated)
+                - allowed_contents  : `list` of allowed content types (e.g., `['text/html']`)
+                
+                - etag / last_modified  : the validators of a cached version (conditional request)
+                - headers   : additional request headers
+                
+                - on_chunk  : callable called with `(chunk, result)` for each body chunk (`bytes`) while it is downloaded, where `result` contains the response headers (but not the `content` yet)
+            Return :
+                - result    : `dict` with keys
+                    - url   : the final url (after redirections)
+                    - status    : the HTTP status code
+                    - content   : the (possibly truncated) body (`str` for `text/*` contents, `bytes` otherwise), `None` if not read (e.g., error responses)
+                    - content_type  : the `Content-Type` header
+                    - encoding  : the charset of the `Content-Type` (default to `utf-8`)
+                    - etag / last_modified  : the validators of the response
+                    - not_modified  : whether the server answered `304 Not Modified`
+                    - truncated : whether the content has been truncated to `max_size`
+        """
+        if timeout is None:     timeout = self.timeout
+        if max_size is None:    max_size = self.max_size
+        
+        headers = {** (headers or {})}
+        if etag:            headers['If-None-Match'] = etag
+        if last_modified:   headers['If-Modified-Since'] = last_modified
+        
+        self._stats['requests'] += 1
+        
+        t0 = time.time()
+        deadline    = _Deadline(timeout)
+        for _ in range(self.max_redirects + 1):
+            result = await self._request(
+                url,
+                headers,
+                deadline    = deadline,
+                max_size    = max_size,
+                allowed_contents    = allowed_contents,
+                on_chunk    = on_chunk
+            )
+            if result['status'] in (301, 302, 303, 307, 308) and result.get('location'):
+                url = urljoin(url, result['location'])
+                continue
+            break
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[FETCH] {} ({}) fetched in {:.3f} sec'.format(url, result['status'], time.time() - t0))
+        
+        return result
+    
+    async def _request(self, url, headers, *, deadline, ** kwargs):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported url scheme : {}'.format(url))
+        
+        key  = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query: path += '?' + parts.query
+        
+        host = parts.hostname if not parts.port else '{}:{}'.format(parts.hostname, parts.port)
+        request = 'GET {} HTTP/1.1\r\nHost: {}\r\n'.format(path, host)
+        for k, v in {
+            'User-Agent' : self.user_agent, 'Accept-Encoding' : 'identity', 'Connection' : 'keep-alive', ** headers
+        }.items():
+            request += '{}: {}\r\n'.format(k, v)
+        request = (request + '\r\n').encode('latin-1')
+        
+        if self._semaphore is None: self._semaphore = asyncio.Semaphore(self.max_connections)
+        if key not in self._host_semaphores:
+            self._host_semaphores[key] = asyncio.Semaphore(self.max_per_host)
+        
+        self._host_requests[key] += 1
+        try:
+            async with self._semaphore, self._host_semaphores[key]:
+                remaining = deadline.remaining()
+                if remaining <= 0: raise asyncio.TimeoutError()
+                return await asyncio.wait_for(self._send(key, url, request, ** kwargs), remaining)
+        finally:
+            self._host_requests[key] -= 1
+            if self._host_requests[key] == 0:
+                del self._host_requests[key]
+                self._host_semaphores.pop(key, None)
+    
+    async def _send(self, key, url, request, *, max_size, allowed_contents, on_chunk):
+        # a pooled connection may have been closed by the server : the request is retried once on a new connection
+        for attempt in range(2):
+            reader, writer, reused = await self._acquire(key)
+            reusable, received = False, False
+            try:
+                writer.write(request)
+                await writer.drain()
+                
+                status_line = await reader.readline()
+                if not status_line:
+                    if reused and attempt == 0: continue
+                    raise FetchError('The server closed the connection')
+                
+                received = True
+                result, reusable = await self._read_response(
+                    status_line,
+                    reader,
+                    url = url,
+                    max_size    = max_size,
+                    allowed_contents    = allowed_contents,
+                    on_chunk    = on_chunk
+                )
+                return result
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if reused and attempt == 0 and not received: continue
+                raise
+            finally:
+                self._release(key, reader, writer, reusable)
+    
+    async def _read_response(self, status_line, reader, *, url, max_size, allowed_contents, on_chunk):
+        try:
+            version, status = status_line.decode('latin-1').split(None, 2)[:2]
+            status = int(status)
+        except ValueError:
+            raise FetchError('Malformed status line : {}'.format(status_line))
+        
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''): break
+            k, _, v = line.decode('latin-1').partition(':')
+            k, v = k.strip().lower(), v.strip()
+            headers[k] = '{}, {}'.format(headers[k], v) if k in headers else v
+        
+        content_type = headers.get('content-type', '')
+        result = {
+            'url'   : url,
+            'status'    : status,
+            'content'   : None,
+            'content_type'  : content_type,
+            'encoding'  : _get_charset(content_type),
+            'etag'  : headers.get('etag', None),
+            'last_modified' : headers.get('last-modified', None),
+            'location'  : headers.get('location', None),
+            'not_modified'  : status == 304,
+            'truncated' : False
+        }
+        
+        reusable = version == 'HTTP/1.1' and 'close' not in headers.get('connection', '').lower()
+        if status == 304 or status == 204 or 100 <= status < 200:
+            self._stats['not_modified'] += int(status == 304)
+            return result, reusable
+        
+        length = headers.get('content-length', None)
+        length = int(length) if length and length.isdigit() else None
+        
+        is_redirect = 300 <= status < 400 and result['location']
+        if is_redirect or not _is_success(status):
+            # the body is skipped : the connection is only reused if the body is empty
+            if not is_redirect: self._stats['errors'] += 1
+            return result, reusable and length == 0
+        elif allowed_contents and not _is_allowed(content_type, allowed_contents):
+            self._stats['cutoff'] += 1
+            return result, reusable and length == 0
+        
+        chunks, size, complete = [], 0, True
+        def add_chunk(chunk):
+            chunks.append(chunk)
+            if on_chunk is not None: on_chunk(chunk, result)
+        
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                chunk_size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if chunk_size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''): pass
+                    break
+                if size + chunk_size > max_size:
+                    add_chunk(await reader.readexactly(max_size - size))
+                    size, complete = max_size, False
+                    break
+                add_chunk(await reader.readexactly(chunk_size))
+                await reader.readexactly(2)
+                size += chunk_size
+        else:
+            if length is None:
+                # the body is delimited by the end of the connection
+                reusable = False
+            
+            to_read = min(length, max_size) if length is not None else max_size
+            while size < to_read:
+                chunk = await reader.read(min(_chunk_size, to_read - size))
+                if not chunk: break
+                add_chunk(chunk)
+                size += len(chunk)
+            
+            if length is not None and size < to_read:
+                raise asyncio.IncompleteReadError(b'', to_read - size)
+            complete = size == length if length is not None else size < max_size
+        
+        if not complete:
+            self._stats['truncated'] += 1
+            result['truncated'] = True
+            reusable = False
+        
+        content = b''.join(chunks)
+        if content_type.startswith('text'):
+            content = content.decode(result['encoding'], errors = 'replace')
+        result['content'] = content
+        
+        return result, reusable
+    
+    async def _acquire(self, key):
+        """ Return an idle connection to `key` (if any), otherwise open a new one """
+        idle = self._idle.get(key, [])
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if not idle: self._idle.pop(key, None)
+            if time.time() - last_used < self.keep_alive_timeout and not reader.at_eof() and not writer.is_closing():
+                self._stats['reused'] += 1
+                return reader, writer, True
+            writer.close()
+        
+        scheme, hostname, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None: self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        
+        reader, writer = await asyncio.open_connection(hostname, port, ssl = ssl_context)
+        self._stats['connections'] += 1
+        return reader, writer, False
+    
+    def _release(self, key, reader, writer, reusable):
+        if reusable and not self.closed and len(self._idle.get(key, [])) < self.max_per_host:
+            self._idle.setdefault(key, []).append((reader, writer, time.time()))
+            if self._prune_handle is None:
+                self._prune_handle = self.loop.call_later(self.keep_alive_timeout, self._prune_idle)
+        else:
+            writer.close()
+    
+    def _prune_idle(self):
+        """ Close the expired idle connections, and remove the hosts without idle connection """
+        self._prune_handle = None
+        
+        now = time.time()
+        for key, conns in list(self._idle.items()):
+            for conn in [c for c in conns if now - c[2] >= self.keep_alive_timeout]:
+                conn[1].close()
+                conns.remove(conn)
+            if not conns: del self._idle[key]
+        
+        if self._idle and not self.closed:
+            self._prune_handle = self.loop.call_later(self.keep_alive_timeout, self._prune_idle)
+    
+    async def _close_idle(self):
+        if self._prune_handle is not None:
+            self._prune_handle.cancel()
+            self._prune_handle = None
+        
+        for conns in self._idle.values():
+            for _, writer, _ in conns: writer.close()
+        self._idle.clear()
+
+class _Deadline:
+    """ Deadline shared by the requests of a `fetch` call (i.e., its redirections), started at the 1st call to `remaining` """
+    def __init__(self, timeout):
+        self.timeout    = timeout
+        self.end    = None
+    
+    def remaining(self):
+        if self.end is None: self.end = time.monotonic() + self.timeout
+        return self.end - time.monotonic()
+
+class FetchIterator:
+    """
+        Iterator over the results of `AsyncFetcher.iter_fetch`
+        
+        `get(timeout)` waits for the next result at most `timeout` seconds (raising `queue.Empty`), and `close` cancels the remaining requests.
+    """
+    def __init__(self, future, buffer, length, is_final = None):
+        self._future    = future
+        self._buffer    = buffer
+        self._remaining = length
+        self._is_final  = is_final
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        if self._remaining <= 0: raise StopIteration()
+        return self.get()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, * args):
+        self.close()
+    
+    def get(self, timeout = None):
+        if self._remaining <= 0: raise StopIteration()
+        item = self._buffer.get(timeout = timeout)
+        if self._is_final is None or self._is_final(item): self._remaining -= 1
+        return item
+    
+    def close(self):
+        self._remaining = 0
+        if not self._future.done(): self._future.cancel()
+
+def _is_success(status):
+    return 200 <= status < 300 or status == 304
+
+def _is_allowed(content_type, allowed_contents):
+    return content_type in allowed_contents or content_type.split(';')[0].strip() in allowed_contents
+
+def _get_charset(content_type):
+    for param in content_type.split(';')[1:]:
+        k, _, v = param.partition('=')
+        if k.strip().lower() == 'charset' and v.strip():
+            return get_codec(v.strip().strip('"'))
+    return 'utf-8'
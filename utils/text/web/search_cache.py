@@ -0,0 +1,206 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import logging
+import collections
+
+from threading import Lock
+
+from ...cache_utils import DiskCache, LRUCache, is_expired
+from ...threading import canonical_hash
+
+logger = logging.getLogger(__name__)
+
+_cache_dir  = os.path.expanduser('~/.cache/yui_mhcp/web')
+
+_default_ttl    = {
+    'queries'   : 24 * 3600,
+    'pages'     : 7 * 24 * 3600,
+    'failures'  : 3600
+}
+
+_search_cache   = None
+_search_cache_mutex = Lock()
+
+def get_search_cache():
+    """ Return the `SearchCache` shared by all the web searches of the process (created at the 1st call) """
+    global _search_cache
+    with _search_cache_mutex:
+        if _search_cache is None: _search_cache = SearchCache()
+        return _search_cache
+
+def set_search_cache(cache):
+    global _search_cache
+    with _search_cache_mutex:
+        _search_cache = cache
+
+class SearchCache:
+    """
+        Two-level cache of the web searches, with an in-memory LRU tier backed by an on-disk tier
+        
+        The entries are grouped in namespaces :
+            - queries   : the urls returned by a search engine for a formatted query
+            - pages     : the parsed pages (with their `etag` / `last_modified` validators)
+            - failures  : the urls that cannot be fetched / parsed (negative cache)
+        Each entry has its own time-to-live (default to the `ttl` of its namespace). The expired pages are kept (until evicted), such that they can be revalidated with a conditional request (see `get_entry`).
+        
+        The memory tier is bounded in number of entries, and the disk tier (one `.json` file per entry, see `DiskCache`) in total size : the oldest files are removed once `max_disk_size` is exceeded.
+        The positive `is_failed` lookups are counted as `negative_hits`, while the `queries` and `pages` lookups are counted as hits / misses.
+        
+        Example usage :
+        ```python
+        cache = get_search_cache()
+        cache.put('queries', 'google:hello world', ['https://example.com'])
+        cache.get('queries', 'google:hello world') # ['https://example.com']
+        ```
+    """
+    def __init__(self,
+                 max_size   = 1024,
+                 *,
+                 
+                 directory  = _cache_dir,
+                 max_disk_size  = 512 * 1024 ** 2,
+                 
+                 ttl    = None
+                ):
+        """
+            Arguments :
+                - max_size  : the maximal number of entries in memory
+                - directory : the directory of the on-disk tier (`None` to disable it)
+                - max_disk_size : the maximal size (in bytes) of the on-disk tier
+                
+                - ttl   : `dict` of `{namespace : ttl}` (in seconds) overriding the default time-to-live
+        """
+        self.max_size   = max_size
+        self.directory  = directory
+        self.ttl    = {** _default_ttl, ** (ttl or {})}
+        
+        self._mutex = Lock()
+        self._memory    = LRUCache(max_size)
+        self._disk  = DiskCache(
+            directory,
+            max_size    = max_disk_size,
+            extension   = '.json',
+            dumps   = _dumps,
+            loads   = _loads
+        ) if directory else None
+        self._stats = collections.Counter()
+    
+    def __len__(self):
+        return len(self._memory)
+    
+    def __repr__(self):
+        return '<SearchCache size={} directory={}>'.format(len(self), self.directory)
+    
+    @property
+    def max_disk_size(self):
+        return self._disk.max_size if self._disk is not None else None
+    
+    @max_disk_size.setter
+    def max_disk_size(self, value):
+        if self._disk is not None: self._disk.max_size = value
+    
+    def get(self, namespace, key):
+        """ Return the value stored for `key` in `namespace`, or `None` if it is missing / expired """
+        entry = self.get_entry(namespace, key)
+        if entry is None or not self.is_expired(entry): return entry['value'] if entry else None
+        
+        if namespace != 'pages': self.pop(namespace, key)
+        return None
+    
+    def get_entry(self, namespace, key):
+        """ Return the entry (`dict` with `value`, `time` and `ttl`) stored for `key`, even if it is expired """
+        entry, tier = self._lookup(namespace, key)
+        with self._mutex:
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['{}_hits'.format(tier)] += 1
+        return entry
+    
+    def put(self, namespace, key, value, *, ttl = None):
+        entry = {
+            'key'   : key,
+            'time'  : time.time(),
+            'ttl'   : ttl if ttl is not None else self.ttl.get(namespace, None),
+            'value' : value
+        }
+        self._memory.put((namespace, key), entry)
+        if self._disk is not None:
+            self._disk.save(self._get_name(namespace, key), entry, timestamp = entry['time'])
+        return entry
+    
+    def pop(self, namespace, key):
+        self._memory.pop((namespace, key))
+        if self._disk is not None: self._disk.remove(self._get_name(namespace, key))
+    
+    def is_failed(self, url):
+        """ Return whether `url` has recently failed (see `set_failed`), and count it as a `negative_hit` if so """
+        entry, _ = self._lookup('failures', url)
+        if entry is not None and self.is_expired(entry):
+            self.pop('failures', url)
+            entry = None
+        
+        if entry is None: return False
+        with self._mutex:
+            self._stats['negative_hits'] += 1
+        return True
+    
+    def set_failed(self, url, reason = None, *, ttl = None):
+        self.put('failures', url, reason or 'failed', ttl = ttl)
+    
+    @staticmethod
+    def is_expired(entry):
+        return is_expired(entry)
+    
+    def clear(self, disk = False):
+        self._memory.clear()
+        if disk and self._disk is not None: self._disk.clear()
+    
+    def get_stats(self):
+        with self._mutex:
+            hits  = self._stats['memory_hits'] + self._stats['disk_hits']
+            total = hits + self._stats['misses']
+            return {
+                'size'  : len(self._memory),
+                'disk_size' : self._disk.nbytes if self._disk is not None else 0,
+                'memory_hits'   : self._stats['memory_hits'],
+                'disk_hits' : self._stats['disk_hits'],
+                'negative_hits' : self._stats['negative_hits'],
+                'misses'    : self._stats['misses'],
+                'evictions' : self._disk.evictions if self._disk is not None else 0,
+                'hit_rate'  : hits / total if total else 0.
+            }
+    
+    def _lookup(self, namespace, key):
+        """ Return the entry stored for `key` in `namespace` (even if it is expired) and its tier, without updating the statistics """
+        cache_key   = (namespace, key)
+        entry   = self._memory.get(cache_key, None)
+        if entry is not None or self._disk is None: return entry, 'memory'
+        
+        entry = self._disk.load(self._get_name(namespace, key))
+        # the file name is a hash : the key is checked to avoid collisions
+        if entry is not None and entry.get('key', None) != key: entry = None
+        if entry is not None: self._memory.put(cache_key, entry)
+        return entry, 'disk'
+    
+    @staticmethod
+    def _get_name(namespace, key):
+        return os.path.join(namespace, canonical_hash(key))
+
+def _dumps(entry):
+    return json.dumps(entry, ensure_ascii = False).encode('utf-8')
+
+def _loads(data):
+    return json.loads(data.decode('utf-8'))
@@ -12,21 +12,19 @@
 import os
 import time
 import queue
-import urllib
 import logging
 import collections
 
 from abc import ABC, abstractmethod
-from threading import Thread
 
 from loggers import Timer, timer
 from ..parsers import parse_html
+from ..parsers.html_parser import HTMLStreamParser
+from .search_cache import _cache_dir, get_search_cache
 from ...generic_utils import time_to_string
 
 logger = logging.getLogger(__name__)
 
-_cache_dir  = os.path.expanduser('~/.cache/yui_mhcp/web')
-
 class SearchEngine(ABC):
     cache_dir   = None
     
@@ -95,25 +93,13 @@ class SearchEngine(ABC):
                 if logger.isEnabledFor(logging.DEBUG):
                     logger.debug('Formatted query : `{}`'.format(formatted_query))
                 
-                _cache = {}
-                if save:
-                    from ...databases import init_database
-                    
-                    _cache = init_database(
-                        'JSONDatabase',
-                        path = self.get_cache_path('queries.json'),
-                        primary_key = 'query'
-                    )
-                
-                if reload or formatted_query not in _cache:
-                    _cache[formatted_query] = {
-                        'query' : formatted_query,
-                        'urls'  : self.fetch_urls(formatted_query, n = n, ** kwargs)
-                    }
-                    if save: _cache.save()
+                cache   = get_search_cache() if save else None
+                key     = '{}:{}'.format(self.__class__.__name__, formatted_query)
                 
-                urls = _cache[formatted_query]['urls']
-                if save: _cache.save()
+                urls = cache.get('queries', key) if cache is not None and not reload else None
+                if urls is None:
+                    urls = list(self.fetch_urls(formatted_query, n = n, ** kwargs))
+                    if cache is not None: cache.put('queries', key, urls)
             
             if logger.isEnabledFor(logging.DEBUG):
                 logger.debug('# urls found : {}'.format(len(urls)))
@@ -132,10 +118,19 @@ class SearchEngine(ABC):
             'results'   : results
         }
             
+    def iter_search(self, query = None, *, n = 5, urls = None, reload = False, reparse = False, ** kwargs):
+        """
+            Generator version of `search` : yields the paragraphs (with their `url`) as soon as they are parsed
+            
+            The urls are fetched like in `search`, then processed with `iter_process_urls`, such that the 1st paragraphs are available before the end of the slowest downloads.
+        """
+        urls = self.search(query, n = n, urls = urls, parse = False, reload = reload, ** kwargs)
+        yield from iter_process_urls(urls, reparse = reparse or reload, ** kwargs)
+    
     @classmethod
     def get_cache_path(cls, file):
         return os.path.join(
-            _cache_root, cls.cache_dir or cls.__name__.lower().replace('engine', ''), file
+            _cache_dir, cls.cache_dir or cls.__name__.lower().replace('engine', ''), file
         )
 
 class WebSearchEngine(SearchEngine):
@@ -146,28 +141,16 @@ class WebSearchEngine(SearchEngine):
         return query
     
 @timer
-def process_urls(urls,
-                 *,
-
-                 n  = None,
-                 timeout    = None,
-                 best_only  = False,
-
-                 track_href = False,
-                 
-                 save   = False,
-                 reparse    = False,
-
-                 ** kwargs
-                ):
+def process_urls(urls, ** kwargs):
     """
-        Fetch and process a list of urls in a multi-threaded I/O way
+        Fetch and process a list of urls concurrently (with the shared `AsyncFetcher`, see `fetcher.py`)
         
         Arguments :
             - urls : the urls to process
 
-            - save  : whether to save parsed urls
+            - save  : whether to save parsed urls (in the shared `SearchCache`), and to skip the urls that have recently failed
             - reparse   : whether to re-fetch and parse urls or not
+            - revalidate    : whether to check that the saved urls are not modified (conditional request with their `ETag` / `Last-Modified`) instead of directly using them
 
             - n     : maximal number of links to fetch
             - timeout   : maximum request time
@@ -178,100 +161,207 @@ def process_urls(urls,
             - parsed    : a mapping `{url : parsed_content}`
     """
     if isinstance(urls, str): urls = [urls]
-    if n is None: n = len(urls)
-    kwargs['timeout'] = timeout
     
-    _cache = {}
-    if save:
-        from ...databases import init_database
+    results, completed = collections.defaultdict(list), set()
+    for idx, url, paragraphs, done in _iter_parsed(urls, ** kwargs):
+        results[idx].extend(paragraphs)
+        if done: completed.add(idx)
+    
+    # the partially downloaded urls (i.e., not completed before the end of the search) are skipped
+    return collections.OrderedDict(
+        (urls[idx], results[idx]) for idx in sorted(completed)
+    )
 
-        _cache = init_database(
-            'JSONDir', path = os.path.join(_cache_root, 'parsed'), primary_key = 'url'
-        )
+def iter_process_urls(urls, ** kwargs):
+    """
+        Generator version of `process_urls` : yields the paragraphs while the pages are downloaded
+        
+        The html pages are parsed incrementally (see `HTMLStreamParser`), such that the 1st paragraphs of a page are yielded before the end of its download. This way, the downstream processing (e.g., embedding or ranking) can start before the completion of the slowest pages.
+        
+        Arguments : see `process_urls`
+        Return :
+            - paragraphs    : generator of paragraphs (`dict`), with an additional `url` entry
+    """
+    if isinstance(urls, str): urls = [urls]
     
-    buffer  = queue.Queue()
+    for _, _, paragraphs, _ in _iter_parsed(urls, ** kwargs):
+        yield from paragraphs
 
-    results, workers = {}, []
+def _iter_parsed(urls,
+                 *,
+                 
+                 n  = None,
+                 timeout    = None,
+                 best_only  = False,
+                 
+                 track_href = False,
+                 
+                 save   = False,
+                 reparse    = False,
+                 revalidate = False,
+                 
+                 ** kwargs
+                ):
+    """ Yield `(idx, url, paragraphs, done)`, where `paragraphs` are the new paragraphs of `url`, and `done` is `True` once `url` is completely processed """
+    if n is None: n = len(urls)
+    kwargs['timeout'] = timeout
+    
+    cache   = get_search_cache() if save else None
+    
+    num_done, to_fetch, request_kwargs, cached = 0, [], [], {}
     for i, url in enumerate(urls):
-        if save and not reparse and url in _cache:
-            results[i] = _cache[url]
-        else:
-            workers.append(Thread(
-                target = fetch_content, args = (url, buffer, i), kwargs = kwargs, daemon = True
-            ))
+        if cache is not None and not reparse:
+            if cache.is_failed(url):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('{} is skipped as it has recently failed'.format(url))
+                continue
+            
+            entry = cache.get_entry('pages', url)
+            if entry is not None and not revalidate and not cache.is_expired(entry):
+                num_done += 1
+                yield i, url, entry['value']['parsed'], True
+                continue
+            
+            # the expired (or revalidated) pages are fetched with a conditional request
+            if entry is not None: cached[url] = entry['value']
+        
+        to_fetch.append(i)
+        request_kwargs.append({
+            'etag'  : cached[url]['etag'], 'last_modified' : cached[url]['last_modified']
+        } if url in cached else {})
 
-    additional = 0 if best_only else n // 2
-    worker_idx = min(len(workers), n - len(results) + additional)
-    for i in range(worker_idx): workers[i].start()
+    additional  = 0 if best_only else n // 2
+    concurrency = max(1, min(len(to_fetch), n - num_done + additional))
 
     if logger.isEnabledFor(logging.DEBUG):
-        logger.debug('{} / {} workers started'.format(worker_idx, len(workers)))
-
+        logger.debug('{} urls to fetch ({} concurrent requests)'.format(len(to_fetch), concurrency))
 
+    if not to_fetch or num_done >= n:
+        return
+    
+    from .fetcher import get_fetcher
+    
+    responses = get_fetcher().iter_chunks(
+        [urls[i] for i in to_fetch],
+        concurrency = concurrency,
+        request_kwargs  = request_kwargs,
+        ** kwargs
+    )
+    
+    parsers, parsed, failed = {}, collections.defaultdict(list), set()
     start_time = time.time()
-    for _ in range(len(workers)):
-        try:
-            with Timer('waiting request'):
-                idx, url, response = buffer.get(
-                    timeout = max(0.01, timeout - ellapsed_time) if timeout and parsed else None
-                )
-        except queue.Empty:
-            logger.info('Timeout exceeded, stopping the search...')
-            break
-
-        parsed = {}
-        if response:
-            with Timer('content parsing'):
-                try:
-                    parsed = parse_response(
-                        response, origin = url if track_href else None, ** kwargs
+    try:
+        while True:
+            try:
+                with Timer('waiting request'):
+                    # once a result is available, the remaining requests are bounded by `timeout`
+                    fetch_idx, url, chunk, response = responses.get(
+                        timeout = max(0.01, timeout - (time.time() - start_time)) if timeout and num_done else None
                     )
-                except NotImplementedError:
-                    pass
-
-        if parsed:
-            for para in parsed: para['url'] = url
-
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug('{} paragraphs parsed from {}'.format(len(parsed), url))
-
-            results[idx] = {'url' : url, 'parsed' : parsed}
-
-            if save: _cache[url] = {'url' : url, 'parsed' : parsed}
-
-            if len(results) == n: break
-        elif worker_idx < len(workers):
-            workers[worker_idx].start()
-            worker_idx += 1
-
+            except StopIteration:
+                break
+            except queue.Empty:
+                logger.info('Timeout exceeded, stopping the search...')
+                break
+            
+            idx = to_fetch[fetch_idx]
+            if idx in failed:
+                # the remaining chunks of a page that cannot be parsed are skipped
+                if chunk is None and cache is not None: cache.set_failed(url, 'parsing error')
+                continue
+            
+            if chunk is not None:
+                try:
+                    # the html pages are parsed while they are downloaded
+                    if idx not in parsers and response['content_type'].startswith('text/html'):
+                        parsers[idx] = HTMLStreamParser(
+                            encoding = response['encoding'], origin = url if track_href else None, ** kwargs
+                        )
+                    
+                    paragraphs = []
+                    if idx in parsers:
+                        with Timer('content parsing'):
+                            paragraphs = _set_url(parsers[idx].feed(chunk), url)
+                except Exception as e:
+                    logger.warning('An error occured while parsing {} : {}'.format(url, e))
+                    parsers.pop(idx, None)
+                    failed.add(idx)
+                    continue
+                
+                if paragraphs:
+                    parsed[idx].extend(paragraphs)
+                    yield idx, url, paragraphs, False
+                continue
+            
+            if response is not None and response.get('not_modified', False):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('{} is not modified'.format(url))
+                
+                cache.put('pages', url, cached[url])
+                
+                num_done += 1
+                yield idx, url, cached[url]['parsed'], True
+                if num_done == n: break
+                continue
+            
+            paragraphs = []
+            try:
+                if response is not None and idx in parsers:
+                    with Timer('content parsing'):
+                        paragraphs = _set_url(parsers.pop(idx).close(), url)
+                elif response and response.get('content', None):
+                    with Timer('content parsing'):
+                        paragraphs = _set_url(parse_response(
+                            response, origin = url if track_href else None, ** kwargs
+                        ), url)
+            except NotImplementedError:
+                pass
+            except Exception as e:
+                logger.warning('An error occured while parsing {} : {}'.format(url, e))
+                if cache is not None: cache.set_failed(url, 'parsing error')
+                continue
+            
+            if response is None or not (parsed[idx] or paragraphs):
+                if cache is not None:
+                    cache.set_failed(url, 'no paragraph' if response is not None else 'request error')
+                continue
+            
+            parsed[idx].extend(paragraphs)
             if logger.isEnabledFor(logging.DEBUG):
-                logger.debug('Start new worker ({} / {})'.format(worker_idx, len(workers)))
-
-    if save: _cache.save()
-
-    return collections.OrderedDict(
-        (res[1]['url'], res[1]['parsed']) for res in sorted(results.items())
-    )
+                logger.debug('{} paragraphs parsed from {}'.format(len(parsed[idx]), url))
+
+            if cache is not None:
+                cache.put('pages', url, {
+                    'parsed'    : parsed[idx],
+                    'etag'  : response.get('etag', None),
+                    'last_modified' : response.get('last_modified', None)
+                })
+            
+            num_done += 1
+            yield idx, url, paragraphs, True
+            if num_done == n: break
+    finally:
+        # the pending requests are cancelled
+        responses.close()
 
+def _set_url(paragraphs, url):
+    for para in paragraphs: para['url'] = url
+    return paragraphs
 
-def fetch_content(url, buffer = None, idx = None, allowed_contents = None, timeout = None, ** _):
-    config = {'timeout' : timeout} if timeout else {}
+def fetch_content(url, buffer = None, idx = None, allowed_contents = None, timeout = None, ** kwargs):
+    """ Fetch `url` with the shared `AsyncFetcher` (see `fetcher.py`), and return the response (`None` if it fails) """
+    from .fetcher import get_fetcher
     
     result = None
     t0 = time.time()
     try:
-        with urllib.request.urlopen(url, ** config) as response:
-            content_type = response.getheader('Content-type')
-            if not allowed_contents or content_type in allowed_contents:
-                content = response.read()
-                if content_type.startswith('text'): content = content.decode()
-                
-                result = {
-                    'content'   : content,
-                    'content_type'  : content_type,
-                    'last_modified' : response.getheader('last-modified', default = None)
-                }
-        
+        result = get_fetcher().fetch_sync(
+            url, allowed_contents = allowed_contents, timeout = timeout, ** kwargs
+        )
+        if not result.get('content', None) and not result.get('not_modified', False):
+            if not 200 <= result['status'] < 300:
+                logger.warning('The request to {} has failed (status {})'.format(url, result['status']))
+            result = None
     except Exception as e:
         logger.warning('An error occured with url {} : {}'.format(url, e))
     finally:
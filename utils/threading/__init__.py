@@ -10,7 +10,15 @@
 # limitations under the License.
 
 from .async_result import AsyncResult
+from .async_stream_buffer import AsyncStreamBuffer
+from .cancellation import CancellationToken
+from .pipeline import Pipeline
+from .prefix_cache import PrefixCache, PrefixMatch, LocalPrefixCache, PrefixRouter
 from .priority_queue import PriorityQueue, MultiprocessingPriorityQueue, PriorityItem
-from .process import Process, run_in_thread
+from .process import Process, WorkerCrashedError, run_in_thread
+from .process_pool import ProcessPool
+from .request_scheduler import RequestScheduler
+from .shared_memory import SharedArray, SharedMemoryQueue, SharedMemoryRing
+from .single_flight import Flight, SingleFlight, canonical_hash
 from .stream import STOP, KEEP_ALIVE, IS_RUNNING, CONTROL, DataWithResult, FakeLock, Stream
 from .stream_request_manager import *
\ No newline at end of file
@@ -24,6 +24,7 @@ class AsyncResult:
         self._event     = threading.Event()
         self._abuffer   = asyncio.Queue() if loop is not None else None
         self._result    = None
+        self._exception = None
     
     @property
     def ready(self):
@@ -39,13 +40,20 @@ class AsyncResult:
         if self._callback is not None:
             self._callback(result)
     
+    def set_exception(self, exception):
+        """ Resolve the result with `exception`, raised by `get` / `aget` (the callback receives the exception) """
+        self._exception = exception
+        self(exception)
+    
     def wait(self, timeout = None):
         self._event.wait(timeout)
     
     def get(self, timeout = None):
         self.wait(timeout)
+        if self._exception is not None: raise self._exception
         return self._result
 
     async def aget(self, timeout = None):
         await self._abuffer.get()
+        if self._exception is not None: raise self._exception
         return self._result
@@ -0,0 +1,163 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import operator
+import threading
+
+logger = logging.getLogger(__name__)
+
+class AsyncStreamBuffer:
+    """
+        Bounded buffer to forward items from a producer thread to an `asyncio` consumer
+        
+        Contrary to `asyncio.run_coroutine_threadsafe(queue.put(item), loop)`, the producer does not schedule a task in the event loop for each item : the items are merged (with `merge_fn`) in a pending item, and the loop is only woken up when the consumer is waiting for a new item. This way, a slow consumer receives the coalesced items at once, instead of one item at a time.
+        
+        When `max_size` items are pending, `put` blocks until the consumer gets them (backpressure).
+        
+        Example usage :
+        ```python
+        buffer = AsyncStreamBuffer(loop = asyncio.get_running_loop())
+        
+        # in the producer thread
+        for token in generate():
+            if not buffer.put(token): break  # the consumer has stopped consuming
+        buffer.close()
+        
+        # in the event loop
+        async for text in buffer:
+            print(text, end = '', flush = True)
+        ```
+    """
+    def __init__(self, max_size = 256, *, loop = None, merge_fn = operator.add):
+        """
+            Arguments :
+                - max_size  : maximal number of pending (non-consumed) items
+                - loop      : the event loop of the consumer (default to the running loop)
+                - merge_fn  : callable `merge_fn(pending, item)` that merges 2 consecutive items
+        """
+        self.max_size   = max_size
+        self.loop       = loop if loop is not None else asyncio.get_running_loop()
+        self.merge_fn   = merge_fn
+        
+        self._cond  = threading.Condition()
+        self._item  = None
+        self._num_pending   = 0
+        self._waiter    = None
+        
+        self._closed    = False
+        self._cancelled = False
+        self._exception = None
+        
+        self.num_puts   = 0
+        self.num_gets   = 0
+    
+    @property
+    def closed(self):
+        return self._closed
+    
+    @property
+    def cancelled(self):
+        return self._cancelled
+    
+    def __repr__(self):
+        return '<AsyncStreamBuffer pending={} puts={} gets={} closed={}>'.format(
+            self._num_pending, self.num_puts, self.num_gets, self._closed
+        )
+    
+    def put(self, item, timeout = None):
+        """
+            Add `item` to the buffer (called from the producer thread)
+            
+            Return `False` if the consumer has cancelled the stream, `True` otherwise
+        """
+        with self._cond:
+            if self._num_pending >= self.max_size and not self._cancelled:
+                self._cond.wait_for(
+                    lambda: self._num_pending < self.max_size or self._cancelled, timeout
+                )
+            
+            if self._cancelled: return False
+            if self._closed: raise RuntimeError('The buffer is closed')
+            
+            self._item = item if self._num_pending == 0 else self.merge_fn(self._item, item)
+            self._num_pending += 1
+            self.num_puts     += 1
+            self._wakeup()
+        
+        return True
+    
+    def close(self, exception = None):
+        """ Mark the end of stream (called from the producer thread) """
+        with self._cond:
+            if self._closed: return
+            
+            self._closed    = True
+            self._exception = exception
+            self._wakeup()
+    
+    def cancel(self):
+        """ Stop the stream from the consumer side : the producer is unblocked and `put` returns `False` """
+        with self._cond:
+            self._cancelled = True
+            self._closed    = True
+            self._cond.notify_all()
+    
+    def get_nowait(self):
+        """ Return the coalesced pending items, and raise `asyncio.QueueEmpty` if there is no item """
+        with self._cond:
+            if not self._num_pending: raise asyncio.QueueEmpty()
+            return self._pop()
+    
+    async def get(self):
+        """ Wait until an item is available, and return it (raise `StopAsyncIteration` at the end of stream) """
+        while True:
+            with self._cond:
+                if self._num_pending:
+                    return self._pop()
+                elif self._closed:
+                    if self._exception is not None: raise self._exception
+                    raise StopAsyncIteration()
+                
+                self._waiter = self.loop.create_future()
+                waiter = self._waiter
+            
+            try:
+                await waiter
+            finally:
+                self._waiter = None
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+    
+    def _pop(self):
+        item, self._item = self._item, None
+        self._num_pending = 0
+        self.num_gets    += 1
+        self._cond.notify_all()
+        return item
+    
+    def _wakeup(self):
+        """ Wake up the consumer (at most once per `get`), must be called with the lock held """
+        if self._waiter is not None and not self._waiter.done():
+            waiter, self._waiter = self._waiter, None
+            self.loop.call_soon_threadsafe(_set_done, waiter)
+
+def _set_done(future):
+    if not future.done(): future.set_result(None)
@@ -0,0 +1,89 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from threading import Lock, Event
+
+from ..generic_utils import get_fn_name
+
+logger = logging.getLogger(__name__)
+
+class CancellationToken:
+    """
+        Thread-safe flag used to cooperatively cancel a running computation
+        
+        The computation periodically checks `cancelled` (e.g., between 2 chunks of decoding steps), while the callbacks (`add_callback`) are called as soon as `cancel` is called, in order to release the resources held by the computation (e.g., abort the request in the inference engine).
+        
+        Example usage :
+        ```python
+        token = CancellationToken()
+        threading.Timer(1., token.cancel).start()
+        
+        model.infer('Hello World !', cancellation_token = token) # stops after ~1 second
+        ```
+    """
+    def __init__(self):
+        self._mutex = Lock()
+        self._event = Event()
+        self._reason    = None
+        self._callbacks = []
+    
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+    
+    @property
+    def reason(self):
+        return self._reason
+    
+    def __repr__(self):
+        return '<CancellationToken cancelled={}{}>'.format(
+            self.cancelled, '' if not self._reason else ' reason={}'.format(self._reason)
+        )
+    
+    def is_cancelled(self):
+        return self._event.is_set()
+    
+    def cancel(self, reason = None):
+        """ Cancel the computation and call the callbacks (only the 1st call has an effect) """
+        with self._mutex:
+            if self._event.is_set(): return False
+            
+            self._reason    = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error('An exception occured in the cancellation callback {} : {}'.format(
+                    get_fn_name(callback), e
+                ))
+        return True
+    
+    def add_callback(self, callback):
+        """ Call `callback()` when the token is cancelled (immediately if it is already cancelled) """
+        with self._mutex:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        
+        callback()
+    
+    def remove_callback(self, callback):
+        with self._mutex:
+            self._callbacks = [c for c in self._callbacks if c != callback]
+    
+    def wait(self, timeout = None):
+        """ Wait until the token is cancelled, and return whether it is cancelled """
+        return self._event.wait(timeout)
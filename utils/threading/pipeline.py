@@ -0,0 +1,210 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import queue
+import logging
+
+from threading import Thread, Lock, Event
+
+from ..generic_utils import get_fn_name
+
+logger = logging.getLogger(__name__)
+
+_STOP   = object()
+_POLL_DELAY = 0.1
+
+class _Error:
+    def __init__(self, exception):
+        self.exception = exception
+
+class Pipeline:
+    """
+        Chain of processing stages, executed in parallel and connected by bounded queues
+        
+        Each stage is executed by `num_workers` threads. If `batch_size > 1`, the stage function receives a `list` of (up to `batch_size`) items, and should return the `list` of their outputs : the batches are dynamically built with the items available in the stage queue (i.e., a batch is not delayed to wait for more items).
+        The outputs are yielded in the order of the inputs, and the stages with a single worker also process the items in this order. If a stage raises an exception, it is re-raised when iterating over the corresponding output, and the pipeline is stopped.
+        
+        Example usage :
+        ```python
+        pipeline = Pipeline([
+            {'fn' : load_image, 'num_workers' : 4},             # CPU preprocessing
+            {'fn' : model.predict_batch, 'batch_size' : 16},    # batched inference
+            save_result                                         # postprocessing
+        ], queue_size = 32)
+        
+        for output in pipeline(filenames):
+            print(output)
+        ```
+    """
+    def __init__(self, stages, *, queue_size = 8, name = 'pipeline'):
+        """
+            Arguments :
+                - stages    : `list` of callables, or `dict` with keys `fn`, `num_workers` (default 1) and `batch_size` (default 1)
+                - queue_size    : the maximal number of items waiting in each stage queue (i.e., the prefetch depth)
+                - name  : the name of the pipeline (used to name the threads)
+        """
+        self.stages = [
+            {'num_workers' : 1, 'batch_size' : 1, ** (stage if isinstance(stage, dict) else {'fn' : stage})}
+            for stage in stages
+        ]
+        for stage in self.stages: stage.setdefault('name', get_fn_name(stage['fn']))
+        
+        self.queue_size = queue_size
+        self.name   = name
+    
+    def __repr__(self):
+        return '<Pipeline name={} stages={}>'.format(
+            self.name, [stage['name'] for stage in self.stages]
+        )
+    
+    def __call__(self, iterable):
+        """ Iterate over the outputs of the pipeline for the items of `iterable` (in the same order) """
+        stopped = Event()
+        queues  = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        
+        threads = [Thread(
+            target = self._feed, args = (iterable, queues[0], stopped), name = '{}_feeder'.format(self.name), daemon = True
+        )]
+        for i, stage in enumerate(self.stages):
+            counter = [stage['num_workers'], Lock()]
+            threads.extend([Thread(
+                target  = self._run_stage,
+                args    = (stage, queues[i], queues[i + 1], counter, stopped),
+                name    = '{}_{}_{}'.format(self.name, stage['name'], j),
+                daemon  = True
+            ) for j in range(stage['num_workers'])])
+        
+        for thread in threads: thread.start()
+        
+        try:
+            next_idx, buffer = 0, {}
+            while True:
+                item = queues[-1].get()
+                if item is _STOP: break
+                
+                idx, value = item
+                buffer[idx] = value
+                while next_idx in buffer:
+                    value = buffer.pop(next_idx)
+                    next_idx += 1
+                    if isinstance(value, _Error): raise value.exception
+                    yield value
+        finally:
+            stopped.set()
+            # unblock the threads waiting to put items in full queues
+            for q in queues:
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            for thread in threads: thread.join()
+    
+    map = __call__
+    
+    def _feed(self, iterable, output, stopped):
+        idx = 0
+        try:
+            for item in iterable:
+                if not _put(output, (idx, item), stopped): return
+                idx += 1
+        except Exception as e:
+            _put(output, (idx, _Error(e)), stopped)
+        _put(output, _STOP, stopped)
+    
+    def _run_stage(self, stage, inputs, output, counter, stopped):
+        fn, batch_size = stage['fn'], stage['batch_size']
+        # a single worker processes the items in the order of the inputs (e.g., to apply the callbacks in order)
+        ordered = stage['num_workers'] == 1
+        
+        pending, next_idx, finished = {}, 0, False
+        while not stopped.is_set():
+            items = []
+            if not finished:
+                items = _get_items(inputs, batch_size)
+                if items and items[-1] is _STOP:
+                    finished, items = True, items[:-1]
+            
+            if ordered:
+                pending.update(items)
+                items = []
+                while next_idx in pending and len(items) < batch_size:
+                    items.append((next_idx, pending.pop(next_idx)))
+                    next_idx += 1
+            
+            if items:
+                for result in self._apply(fn, items, batch_size):
+                    if not _put(output, result, stopped): return
+            
+            if finished and not pending: break
+        else:
+            return
+        
+        # the other workers of this stage also have to receive the sentinel
+        _put(inputs, _STOP, stopped)
+        with counter[1]:
+            counter[0] -= 1
+            last = counter[0] == 0
+        if last: _put(output, _STOP, stopped)
+    
+    def _apply(self, fn, batch, batch_size):
+        """ Return the list of `(index, output)` for the `(index, input)` of `batch` """
+        valid   = [(idx, value) for idx, value in batch if not isinstance(value, _Error)]
+        results = [(idx, value) for idx, value in batch if isinstance(value, _Error)]
+        if not valid: return results
+        
+        t0 = time.time()
+        try:
+            if batch_size > 1:
+                outputs = fn([value for _, value in valid])
+                if len(outputs) != len(valid):
+                    raise RuntimeError('The stage returned {} outputs for {} inputs'.format(
+                        len(outputs), len(valid)
+                    ))
+            else:
+                outputs = [fn(valid[0][1])]
+        except Exception as e:
+            logger.error('[{}] An exception occured in stage {} : {}'.format(
+                self.name, get_fn_name(fn), e
+            ))
+            outputs = [_Error(e)] * len(valid)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[{}] {} item(s) processed by {} in {:.3f} sec'.format(
+                self.name, len(valid), get_fn_name(fn), time.time() - t0
+            ))
+        
+        return results + [(idx, out) for (idx, _), out in zip(valid, outputs)]
+
+def _get_items(q, max_items):
+    """ Return up to `max_items` available items of `q` (waiting for the 1st one), where `_STOP` can only be the last one """
+    try:
+        items = [q.get(timeout = _POLL_DELAY)]
+    except queue.Empty:
+        return []
+    
+    while len(items) < max_items and items[-1] is not _STOP:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+def _put(q, item, stopped):
+    """ Put `item` in `q` (waiting if it is full), and return `False` if the pipeline is stopped """
+    while not stopped.is_set():
+        try:
+            q.put(item, timeout = _POLL_DELAY)
+            return True
+        except queue.Full:
+            pass
+    return False
@@ -0,0 +1,215 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import collections
+import numpy as np
+
+from typing import Any, List
+from threading import Lock
+from dataclasses import dataclass, field
+from abc import ABCMeta, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PrefixMatch:
+    """ Result of a `PrefixCache.lookup` : the length (in tokens) of the longest cached prefix, and the worker that holds it """
+    length  : int   = 0
+    worker  : Any   = None
+    block_ids   : List[str] = field(default_factory = list, repr = False)
+
+class PrefixCache(metaclass = ABCMeta):
+    """
+        Runtime-agnostic interface of a prefix-cache service
+        
+        The prompts are split in blocks of `block_size` tokens, identified by the hash of all the tokens up to the end of the block (i.e., a block id identifies the whole prefix, like the KV-cache blocks of `TensorRT-LLM` / `vLLM`). The service records which worker holds which prefix blocks in its KV cache, such that :
+            - a runtime can know how many tokens of a prompt are already cached (`lookup`)
+            - a router can send the requests sharing a prefix (e.g., the same system prompt) to the same worker (`route`)
+    """
+    def __init__(self, block_size = 64):
+        self.block_size = block_size
+    
+    def get_block_ids(self, tokens):
+        """ Return the ids of the complete blocks of `tokens` (1-D `list` / `np.ndarray`) """
+        tokens = np.asarray(tokens, dtype = 'int32').reshape(-1)
+        
+        block_ids, hasher = [], hashlib.sha256()
+        for start in range(0, len(tokens) - self.block_size + 1, self.block_size):
+            hasher.update(tokens[start : start + self.block_size].tobytes())
+            block_ids.append(hasher.copy().hexdigest()[:32])
+        return block_ids
+    
+    @abstractmethod
+    def lookup(self, tokens, *, workers = None):
+        """ Return the `PrefixMatch` of the longest cached prefix of `tokens` (held by one of `workers` if provided) """
+    
+    @abstractmethod
+    def insert(self, tokens, worker = None):
+        """ Record that the prefix blocks of `tokens` are cached by `worker` """
+    
+    @abstractmethod
+    def remove_worker(self, worker):
+        """ Remove all the blocks held by `worker` (e.g., when it is restarted) """
+    
+    def route(self, tokens, workers, *, load = None, max_imbalance = 4):
+        """
+            Return the worker (in `workers`) that should process `tokens`
+            
+            Arguments :
+                - tokens    : the prompt tokens
+                - workers   : the candidate workers
+                - load      : `list` of loads (e.g., number of outstanding requests) of `workers`
+                - max_imbalance : the maximal load difference with the least loaded worker to select the worker holding the prefix
+            Return :
+                - worker    : the worker holding the longest prefix (if not overloaded), otherwise the least loaded one
+        """
+        workers = list(workers)
+        if load is None: load = [0] * len(workers)
+        
+        least_loaded = min(range(len(workers)), key = load.__getitem__)
+        
+        match = self.lookup(tokens, workers = workers)
+        if match.length and match.worker in workers:
+            idx = workers.index(match.worker)
+            if load[idx] - load[least_loaded] <= max_imbalance:
+                return match.worker
+        
+        return workers[least_loaded]
+
+class LocalPrefixCache(PrefixCache):
+    """
+        In-process (CPU) implementation of `PrefixCache`, with a LRU eviction of the blocks
+        
+        Example usage :
+        ```python
+        cache   = LocalPrefixCache(block_size = 32)
+        worker  = cache.route(tokens, workers = [0, 1, 2, 3], load = pool.outstanding)
+        cache.insert(tokens, worker)
+        print(cache.lookup(tokens)) # PrefixMatch(length = 256, worker = 2)
+        ```
+    """
+    def __init__(self, block_size = 64, *, max_blocks = 100000):
+        """
+            Arguments :
+                - block_size    : the number of tokens per block
+                - max_blocks    : the maximal number of blocks per worker (should approximately match the number of KV-cache blocks of the worker)
+        """
+        super().__init__(block_size)
+        self.max_blocks = max_blocks
+        
+        self._mutex = Lock()
+        self._blocks    = collections.defaultdict(collections.OrderedDict)
+        self._stats = collections.Counter()
+    
+    def __len__(self):
+        return sum(len(blocks) for blocks in self._blocks.values())
+    
+    def __repr__(self):
+        return '<LocalPrefixCache block_size={} workers={} blocks={}>'.format(
+            self.block_size, len(self._blocks), len(self)
+        )
+    
+    def lookup(self, tokens, *, workers = None):
+        block_ids = self.get_block_ids(tokens)
+        
+        best = PrefixMatch(block_ids = block_ids)
+        with self._mutex:
+            for worker, blocks in self._blocks.items():
+                if workers is not None and worker not in workers: continue
+                
+                num = 0
+                while num < len(block_ids) and block_ids[num] in blocks:
+                    num += 1
+                if num * self.block_size > best.length:
+                    best.length, best.worker = num * self.block_size, worker
+            
+            if best.length:
+                for block_id in block_ids[: best.length // self.block_size]:
+                    self._blocks[best.worker].move_to_end(block_id)
+            
+            self._stats['lookups'] += 1
+            self._stats['hit_tokens']   += best.length
+            self._stats['total_tokens'] += len(tokens)
+        
+        return best
+    
+    def insert(self, tokens, worker = None):
+        block_ids = self.get_block_ids(tokens)
+        with self._mutex:
+            blocks = self._blocks[worker]
+            for block_id in block_ids:
+                if block_id in blocks:
+                    blocks.move_to_end(block_id)
+                else:
+                    blocks[block_id] = True
+            
+            while len(blocks) > self.max_blocks:
+                blocks.popitem(last = False)
+                self._stats['evicted'] += 1
+        
+        return block_ids
+    
+    def remove_worker(self, worker):
+        with self._mutex:
+            self._blocks.pop(worker, None)
+    
+    def clear(self):
+        with self._mutex:
+            self._blocks.clear()
+    
+    def get_stats(self):
+        with self._mutex:
+            return {
+                'workers'   : len(self._blocks),
+                'blocks'    : sum(len(blocks) for blocks in self._blocks.values()),
+                'lookups'   : self._stats['lookups'],
+                'evicted'   : self._stats['evicted'],
+                'hit_rate'  : self._stats['hit_tokens'] / max(self._stats['total_tokens'], 1)
+            }
+
+class PrefixRouter:
+    """
+        Router (see `ProcessPool`) that sends the requests sharing a prefix to the same worker
+        
+        The router lives in the dispatching process : its `cache` is fed with the prompts of the requests completed by each worker (see `on_result`, called by `ProcessPool`), which are then held in the KV cache of this worker. The state of the workers is therefore never duplicated in their own process.
+        
+        Example usage :
+        ```python
+        router  = PrefixRouter(LocalPrefixCache(32), get_tokens = lambda data: data['tokens'])
+        pool    = ProcessPool(worker_fn, 4, router = router)
+        ```
+    """
+    def __init__(self, cache, get_tokens = None, *, max_imbalance = 4):
+        """
+            Arguments :
+                - cache : the `PrefixCache` used to route the requests
+                - get_tokens    : callable returning the prompt tokens of a request (default to the request itself)
+                - max_imbalance : see `PrefixCache.route`
+        """
+        self.cache  = cache
+        self.get_tokens = get_tokens
+        self.max_imbalance  = max_imbalance
+    
+    def __call__(self, data, outstanding):
+        """ Return the index of the worker that should process `data`, given the `outstanding` requests of each worker """
+        return self.cache.route(
+            self._get_tokens(data), range(len(outstanding)), load = outstanding, max_imbalance = self.max_imbalance
+        )
+    
+    def on_result(self, data, worker, result):
+        """ Record that the prompt of `data` is cached by `worker`, once it has processed it (without error) """
+        if isinstance(result, Exception): return
+        self.cache.insert(self._get_tokens(data), worker)
+    
+    def _get_tokens(self, data):
+        return self.get_tokens(data) if self.get_tokens is not None else data
@@ -13,12 +13,15 @@ import os
 import time
 import queue
 import logging
+import collections
 import multiprocessing.queues
 
 from functools import wraps
 from threading import Thread, RLock
 
 from .async_result import AsyncResult
+from .shared_memory import SharedMemoryQueue
+from .priority_queue import _MultiprocessingPriorityQueue
 from .stream import STOP, KEEP_ALIVE, IS_RUNNING, DataWithResult, _locked_property, _run_callbacks
 
 RESULTS_HANDLER_WAKEUP_TIME = 1.
@@ -49,6 +52,19 @@ def run_in_thread(fn = None, name = None, callback = None, ** thread_kwargs):
         return inner
     return wrapper if fn is None else wrapper(fn)
 
+class WorkerCrashedError(RuntimeError):
+    """ Error set in the `AsyncResult` of the requests lost by the crash of a `Process` """
+    def __init__(self, name, exitcode, indexes = ()):
+        super().__init__(name, exitcode, indexes)
+        self.name   = name
+        self.exitcode   = exitcode
+        self.indexes    = indexes
+    
+    def __str__(self):
+        return 'Process `{}` exited with status {} while processing the request'.format(
+            self.name, self.exitcode
+        )
+
 class MetaProcess(type):
     def __call__(self, fn, * args, add_stream = True, name = None, ** kwargs):
         if not name:
@@ -80,6 +96,9 @@ class Process(metaclass = MetaProcess):
                  only_process_last  = False,
                  
                  restart    = False,
+                 restart_on_error   = False,
+                 on_restart = None,
+                 shared_memory  = False,
                  
                  result_key = None,
                  keep_results   = False,
@@ -96,9 +115,16 @@ class Process(metaclass = MetaProcess):
         self.callbacks  = callbacks
         
         self.restart    = restart
+        self.restart_on_error   = restart_on_error
+        self.on_restart = on_restart
+        self.num_restarts   = 0
 
-        self.input_stream   = _get_buffer(input_stream) if input_stream is not None else None
-        self.output_stream  = _get_buffer('queue')
+        self.shared_memory  = shared_memory
+        self.input_stream   = _get_buffer(input_stream, tracked = True) if input_stream is not None else None
+        self.output_stream  = self._build_output_stream()
+        if shared_memory and self.input_stream is not None:
+            shm_config = shared_memory if isinstance(shared_memory, dict) else {}
+            self.input_stream = SharedMemoryQueue(self.input_stream, ** shm_config)
         self.skip_outputs   = skip_outputs
         self.only_process_last  = only_process_last
         
@@ -112,11 +138,22 @@ class Process(metaclass = MetaProcess):
         self._results   = {}
         self._waiting_results   = {}
         self._results_handler   = None
+        self._crashes   = []
+        # indexes of the items put in the input stream (in order), until they are taken and finished
+        self._sent  = collections.deque()
+        self._put_mutex = RLock()
         
         self._index = 0
         self._stopped   = False
         self._exitcode  = None
     
+    def _build_output_stream(self):
+        stream = _get_buffer('queue')
+        if self.shared_memory:
+            shm_config = self.shared_memory if isinstance(self.shared_memory, dict) else {}
+            stream = SharedMemoryQueue(stream, ** shm_config)
+        return stream
+    
     def _get_index(self, data):
         if (self.result_key is None) or (isinstance(data, str) and data in (KEEP_ALIVE, IS_RUNNING)):
             return self.index
@@ -154,10 +191,24 @@ class Process(metaclass = MetaProcess):
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug('[{}] Add new item to queue'.format(self.name))
         
-        self.input_stream.put(DataWithResult(
+        self._put(DataWithResult(
             args = _args, kwargs = _kwargs, index = index, priority = priority
-        ))
+        ), index)
         return result
+    
+    def _put(self, item, index = None):
+        """ Put `item` in the input stream, and record its `index` (`None` for control items) in the sent items """
+        with self._put_mutex:
+            counter = getattr(self._tracked_stream, 'num_gets', None)
+            if counter is not None:
+                with counter.get_lock():
+                    # forget the items taken by the process, and whose result has been received
+                    while counter.value and self._sent and self._sent[0] not in self._waiting_results:
+                        self._sent.popleft()
+                        counter.value -= 1
+                self._sent.append(index)
+            
+            self.input_stream.put(item)
 
     def _map_async(self, items, *, priority = 0, callback = None):
         with self.mutex:
@@ -185,7 +236,12 @@ class Process(metaclass = MetaProcess):
     
     @property
     def buffer_type(self):
-        return self.input_stream.__class__.__name__
+        return getattr(self.input_stream, 'buffer', self.input_stream).__class__.__name__
+    
+    @property
+    def _tracked_stream(self):
+        stream = getattr(self.input_stream, 'buffer', self.input_stream)
+        return stream if isinstance(stream, _TrackedQueue) else None
     
     def __enter__(self):
         return self.start()
@@ -238,7 +294,7 @@ class Process(metaclass = MetaProcess):
         if not self._stopped:
             self.stopped = True
             if self.input_stream is not None:
-                self.input_stream.put(STOP)
+                self._put(STOP)
             else:
                 self.terminate()
     
@@ -255,7 +311,7 @@ class Process(metaclass = MetaProcess):
         return True
     
     def keep_alive(self):
-        self.input_stream.put(KEEP_ALIVE)
+        self._put(KEEP_ALIVE)
     
     def is_alive(self):
         with self.mutex:
@@ -275,10 +331,13 @@ class Process(metaclass = MetaProcess):
             
             self.process.terminate()
             self.process.join()
-            self.output_stream.put(STOP)
+            # the results handler stops by itself (`STOP` is not sent, as a killed process may have left the stream locked)
 
             self._exitcode = self.process.exitcode
         
+        for stream in (self.input_stream, self.output_stream):
+            if isinstance(stream, SharedMemoryQueue): stream.close()
+        
         logger.info('Process `{}` is closed (status {}) !'.format(
             self.name, self.exitcode
         ))
@@ -287,8 +346,15 @@ class Process(metaclass = MetaProcess):
 
     @run_in_thread(daemon = True)
     def start_results_handler(self):
+        stream = self.output_stream
         while not self.stopped:
-            data = self.output_stream.get()
+            try:
+                data = stream.get(timeout = RESULTS_HANDLER_WAKEUP_TIME)
+            except queue.Empty:
+                # all the results sent before the crash (if any) have been received
+                if self._crashes: stream = self._handle_crash(stream)
+                continue
+            
             if data is STOP: return
 
             if isinstance(data, DataWithResult):
@@ -312,20 +378,73 @@ class Process(metaclass = MetaProcess):
     
     @run_in_thread(daemon = True)
     def start_finalizer(self):
-        finalize, run = False, 0
+        finalize = False
         while not finalize:
             self.process.join()
-            if self.stopped or self.process.exitcode != 0:
+            if self.stopped or (self.process.exitcode != 0 and not self.restart_on_error):
                 finalize = True
-            elif (self.restart) and (self.restart is True or run < self.restart):
-                run += 1
+            elif (self.restart) and (self.restart is True or self.num_restarts < self.restart):
+                if self.process.exitcode != 0:
+                    logger.warning('Process `{}` exited with status {}, restarting it'.format(
+                        self.name, self.process.exitcode
+                    ))
+                    self._add_crash()
+                self.num_restarts += 1
                 self.start()
+                if self.on_restart is not None: self.on_restart(self)
             else:
                 finalize = True
         
         self.terminate()
+        if self.exitcode != 0:
+            # no result will be received anymore : all the waiting requests are failed
+            self._results_handler.join(timeout = RESULTS_HANDLER_WAKEUP_TIME)
+            self._fail_requests(WorkerCrashedError(self.name, self.exitcode))
+    
+    def _add_crash(self):
+        """
+            Record the requests lost by the crash of the process, i.e., the waiting requests taken from the input stream by the process (e.g., the request being processed at the time of the crash)
+            
+            The input stream counts the items taken from it (`num_gets`, in shared memory), while the items are taken in the order they are put (see `_put`) : the first `num_gets` sent items are the taken ones, and the others are still queued (possibly in the feeder buffer), and are processed by the restarted process. If the input stream is not tracked (e.g., a custom queue), all the waiting requests are considered as lost.
+            
+            The lost requests are failed by the results handler once it has received all the results sent before the crash. The restarted process uses a new output stream, as a process killed while writing in a `multiprocessing.Queue` may leave it locked.
+        """
+        with self._put_mutex:
+            counter = getattr(self._tracked_stream, 'num_gets', None)
+            if counter is not None:
+                with counter.get_lock():
+                    taken = [self._sent.popleft() for _ in range(min(counter.value, len(self._sent)))]
+                    counter.value = 0
+        
+        with self.mutex:
+            if counter is None: taken = list(self._waiting_results)
+            lost = [idx for idx in dict.fromkeys(taken) if idx is not None and idx in self._waiting_results]
+            self._crashes.append((
+                self.output_stream, WorkerCrashedError(self.name, self.process.exitcode, lost)
+            ))
+            self.output_stream  = self._build_output_stream()
+    
+    def _handle_crash(self, stream):
+        """ Fail the requests lost by the crash associated to `stream`, and return the next stream to read """
+        with self.mutex:
+            if not self._crashes or self._crashes[0][0] is not stream: return self.output_stream
+            _, error = self._crashes.pop(0)
+            next_stream = self._crashes[0][0] if self._crashes else self.output_stream
+        
+        self._fail_requests(error, error.indexes)
+        if isinstance(stream, SharedMemoryQueue): stream.close()
+        return next_stream
+    
+    def _fail_requests(self, error, indexes = None):
+        with self.mutex:
+            if indexes is None: indexes = list(self._waiting_results)
+            results = [res for idx in indexes for res in self._waiting_results.pop(idx, [])]
+        
+        if results:
+            logger.error('[{}] {} request(s) failed : {}'.format(self.name, len(results), error))
+        for res in results: res.set_exception(error)
 
-def _get_buffer(buffer = 'fifo', maxsize = 0):
+def _get_buffer(buffer = 'fifo', maxsize = 0, tracked = False):
     if buffer is None: buffer = 'queue'
 
     if isinstance(buffer, str):
@@ -333,9 +452,35 @@ def _get_buffer(buffer = 'fifo', maxsize = 0):
         if buffer not in _buffers:
             raise ValueError('`buffer` is an unknown queue type :\n  Accepted : {}\n  Got : {}\n'.format(tuple(_buffers.keys()), buffer))
         
-        buffer = _buffers[buffer](maxsize)
+        if not tracked:
+            buffer = _buffers[buffer](maxsize)
+        elif 'priority' in buffer:
+            buffer = _TrackedPriorityQueue(maxsize, ctx = multiprocessing.get_context())
+        else:
+            buffer = _TrackedQueue(maxsize, ctx = multiprocessing.get_context())
     
     elif not isinstance(buffer, (queue.Queue, multiprocessing.queues.Queue)):
         raise ValueError('`buffer` must be a Queue instance or subclass')
 
     return buffer
+
+class _TrackedQueue(multiprocessing.queues.Queue):
+    """ `multiprocessing.Queue` that counts the items taken from it (in shared memory, such that the count survives a crash of the consumer process) """
+    def __init__(self, * args, ctx, ** kwargs):
+        super().__init__(* args, ctx = ctx, ** kwargs)
+        self.num_gets = ctx.Value('q', 0)
+    
+    def __getstate__(self):
+        return super().__getstate__() + (self.num_gets, )
+    
+    def __setstate__(self, state):
+        super().__setstate__(state[:-1])
+        self.num_gets = state[-1]
+    
+    def get(self, * args, ** kwargs):
+        item = super().get(* args, ** kwargs)
+        with self.num_gets.get_lock(): self.num_gets.value += 1
+        return item
+
+class _TrackedPriorityQueue(_MultiprocessingPriorityQueue, _TrackedQueue):
+    """ Priority queue that counts the items taken from the underlying `multiprocessing.Queue` (i.e., in the order they are put) """
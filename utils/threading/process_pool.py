@@ -0,0 +1,167 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from threading import Lock
+from functools import partial
+
+from .process import Process, WorkerCrashedError
+from .async_result import AsyncResult
+
+logger = logging.getLogger(__name__)
+
+class ProcessPool:
+    """
+        Pool of `num_workers` identical `Process`, where each request is sent to the worker with the least outstanding requests
+        
+        Each worker executes `fn` (e.g., a function that loads the model once, then processes its input stream), and is restarted if it crashes (up to `restart` times). The requests waiting in the input queue of a crashed worker are processed once it is restarted, while the request being processed at the time of the crash is failed with a `WorkerCrashedError` (raised by `get`).
+        
+        Example usage :
+        ```python
+        def worker(stream, callback, ** kwargs):
+            model = get_pretrained('bge_m3')
+            Stream(model.embed, stream = stream, callback = callback).run()
+        
+        with ProcessPool(worker, 4, name = 'embedding') as pool:
+            results = pool.map(['Hello', 'World'])
+        ```
+    """
+    def __init__(self, fn, num_workers, *, name = None, restart = True, router = None, ** kwargs):
+        """
+            Arguments :
+                - fn    : the function executed by each worker (see `Process`)
+                - num_workers   : the number of worker processes
+                - name  : the name of the pool (the workers are named "{name}-{index}")
+                - restart   : the maximal number of restarts of each worker (`True` for no limit)
+                - router    : callable `router(data, outstanding) -> index` that selects the worker of each request (e.g., `PrefixRouter`), default to the least outstanding worker. If it has an `on_result(data, index, result)` method, it is called (in this process) with the result of each request. If it has a `cache` (e.g., `PrefixCache`), the entries of a worker are removed when it is restarted
+                - kwargs    : forwarded to each `Process`
+        """
+        if not name: name = getattr(fn, '__name__', fn.__class__.__name__)
+        
+        self.name   = name
+        self.router = router
+        self.workers    = [
+            Process(
+                fn,
+                name    = '{}-{}'.format(name, i),
+                restart = restart,
+                restart_on_error    = True,
+                on_restart  = partial(self._on_restart, i),
+                ** kwargs
+            )
+            for i in range(num_workers)
+        ]
+        
+        self._mutex = Lock()
+        self._outstanding   = [0] * num_workers
+    
+    @property
+    def num_workers(self):
+        return len(self.workers)
+    
+    @property
+    def outstanding(self):
+        with self._mutex:
+            return self._outstanding.copy()
+    
+    def __len__(self):
+        return len(self.workers)
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, * args):
+        self.terminate()
+    
+    def __repr__(self):
+        return '<ProcessPool name={} workers={} outstanding={}>'.format(
+            self.name, self.num_workers, sum(self.outstanding)
+        )
+    
+    def start(self):
+        for worker in self.workers: worker.start()
+        return self
+    
+    def stop(self):
+        for worker in self.workers: worker.stop()
+    
+    def join(self, ** kwargs):
+        for worker in self.workers: worker.join(** kwargs)
+    
+    def terminate(self):
+        for worker in self.workers: worker.terminate()
+    
+    def is_alive(self):
+        return any(worker.is_alive() for worker in self.workers)
+    
+    def _on_restart(self, idx, worker):
+        # the restarted worker has lost its state (e.g., its KV cache)
+        cache = getattr(self.router, 'cache', None)
+        if cache is not None: cache.remove_worker(idx)
+    
+    def apply_async(self, data, *, priority = 0, callback = None, loop = None):
+        """ Send `data` to the worker with the least outstanding requests (or selected by `self.router`), and return its `AsyncResult` """
+        with self._mutex:
+            if self.router is not None:
+                idx = self.router(data, self._outstanding.copy())
+            else:
+                idx = min(range(self.num_workers), key = self._outstanding.__getitem__)
+            self._outstanding[idx] += 1
+        
+        def on_result(result):
+            with self._mutex:
+                self._outstanding[idx] -= 1
+            if hasattr(self.router, 'on_result'): self.router.on_result(data, idx, result)
+            if callback is not None: callback(result)
+        
+        try:
+            return self.workers[idx].put(data, priority = priority, callback = on_result, loop = loop)
+        except Exception:
+            with self._mutex:
+                self._outstanding[idx] -= 1
+            raise
+    
+    def map_async(self, items, *, priority = 0, callback = None):
+        """ Send all the `items` to the workers, and return an `AsyncResult` of the list of results """
+        if isinstance(priority, (int, float)): priority = [priority] * len(items)
+        
+        result  = AsyncResult(callback = callback)
+        if not items:
+            result([])
+            return result
+        
+        mutex   = Lock()
+        outputs = [None] * len(items)
+        remaining   = [len(items)]
+        
+        def set_output(i, output):
+            outputs[i] = output
+            with mutex:
+                if remaining[0] <= 0: return
+                failed  = isinstance(output, WorkerCrashedError)
+                # a single failed request fails the whole `map`
+                remaining[0] = 0 if failed else remaining[0] - 1
+                done = remaining[0] == 0
+            
+            if failed:      result.set_exception(output)
+            elif done:      result(outputs)
+        
+        for i, (item, p) in enumerate(zip(items, priority)):
+            self.apply_async(item, priority = p, callback = lambda out, i = i: set_output(i, out))
+        
+        return result
+    
+    def map(self, items, ** kwargs):
+        return self.map_async(items, ** kwargs).get()
+    
+    __call__    = apply_async
+    put     = apply_async
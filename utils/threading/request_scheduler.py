@@ -0,0 +1,325 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import heapq
+import logging
+import itertools
+import contextvars
+import collections
+
+from threading import Thread, Condition
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_demoted_priority = float('inf')
+_min_finish_tags    = 64
+
+# the scheduler executing the current request (propagated to the threads started with its context)
+_current_scheduler  = contextvars.ContextVar('current_scheduler', default = None)
+
+class RequestScheduler:
+    """
+        Schedules the execution of requests in a fixed number of worker threads, by priority, per-tenant fairness and deadline
+        
+        The requests are executed in the following order :
+            1. by `priority` (lower value first), e.g., 0 for interactive requests, and 1 for batch jobs
+            2. by start-time fair queuing (SFQ) between tenants : each tenant receives a share of the execution proportional to its `weight`, where each request accounts for `cost / weight` (e.g., `cost = max_new_tokens`)
+            3. by submission order
+        
+        The `deadline` of a request is a completion deadline : before executing a request, the current time plus the (moving average) execution time is checked against it. If it cannot be met, the request is either dropped (its future raises `TimeoutError`), or demoted to the lowest priority (`deadline_policy = 'deprioritize'`).
+        
+        Admission control : if `max_pending_cost` is set, a request is rejected (`RuntimeError`) if the cumulated cost of the queued and running requests would exceed it.
+        
+        Example usage :
+        ```python
+        scheduler = RequestScheduler(max_workers = 4, weights = {'premium' : 4})
+        future = scheduler.submit(model.infer, 'Hello !', tenant = 'premium', priority = 0, timeout = 5, cost = 256)
+        print(future.result())
+        print(scheduler.get_stats())
+        ```
+    """
+    def __init__(self,
+                 max_workers    = 1,
+                 *,
+                 
+                 weights    = None,
+                 default_weight = 1.,
+                 
+                 max_pending_cost   = None,
+                 deadline_policy    = 'drop',
+                 time_smoothing = 0.1,
+                 
+                 name   = 'scheduler'
+                ):
+        """
+            Arguments :
+                - max_workers   : the number of requests executed concurrently
+                
+                - weights   : `dict` `{tenant : weight}`
+                - default_weight    : the weight of the tenants not in `weights`
+                
+                - max_pending_cost  : the maximal cumulated cost of the queued and running requests
+                - deadline_policy   : either "drop" or "deprioritize"
+                - time_smoothing    : the smoothing factor of the execution time moving average
+                
+                - name  : the name of the worker threads
+        """
+        if deadline_policy not in ('drop', 'deprioritize'):
+            raise ValueError('Unsupported `deadline_policy` : {}'.format(deadline_policy))
+        
+        self.max_workers    = max_workers
+        self.weights    = dict(weights or {})
+        self.default_weight = default_weight
+        self.max_pending_cost   = max_pending_cost
+        self.deadline_policy    = deadline_policy
+        self.time_smoothing = time_smoothing
+        self.name   = name
+        
+        self._cond  = Condition()
+        self._heap  = []
+        self._counter   = itertools.count()
+        self._workers   = []
+        self._stopped   = False
+        
+        self._virtual_time  = 0.
+        self._finish_tags   = {}
+        self._max_finish_tags   = _min_finish_tags
+        self._queued    = collections.Counter()
+        self._running   = 0
+        self._pending_cost  = 0
+        self._exec_time = None
+        
+        self._stats = collections.Counter()
+        self._total_wait_time   = 0.
+    
+    @property
+    def num_queued(self):
+        return len(self._heap)
+    
+    @property
+    def num_running(self):
+        return self._running
+    
+    def __repr__(self):
+        return '<RequestScheduler workers={} queued={} running={}>'.format(
+            self.max_workers, self.num_queued, self._running
+        )
+    
+    @staticmethod
+    def is_scheduled():
+        """ Return whether the current thread executes a request of a `RequestScheduler` (or a thread started with its context) """
+        return _current_scheduler.get() is not None
+    
+    def set_weight(self, tenant, weight):
+        with self._cond:
+            self.weights[tenant] = weight
+    
+    def submit(self,
+               fn,
+               /,
+               * args,
+               
+               tenant   = None,
+               priority = 0,
+               cost = 1,
+               deadline = None,
+               timeout  = None,
+               
+               ** kwargs
+              ):
+        """
+            Schedule the execution of `fn(* args, ** kwargs)`
+            
+            Arguments :
+                - fn    : the function to execute
+                - args / kwargs : forwarded to `fn`
+                
+                - tenant    : the tenant that submits the request (used for fair queuing)
+                - priority  : the priority class (lower value is executed first)
+                - cost      : the cost of the request (e.g., its maximal number of tokens)
+                - deadline  : the time (`time.time()`) before which the request should be completed
+                - timeout   : alternative to `deadline`, relative to the submission time
+            Return :
+                - future    : `concurrent.futures.Future`
+        """
+        now = time.time()
+        if timeout is not None:
+            deadline = now + timeout if deadline is None else min(deadline, now + timeout)
+        
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('The scheduler is stopped')
+            
+            if self.max_pending_cost and self._pending_cost + cost > self.max_pending_cost:
+                self._stats['rejected'] += 1
+                raise RuntimeError('The request is rejected : the pending cost ({} + {}) exceeds the budget ({})'.format(
+                    self._pending_cost, cost, self.max_pending_cost
+                ))
+            
+            weight = self.weights.get(tenant, self.default_weight)
+            start  = max(self._virtual_time, self._finish_tags.get(tenant, 0.))
+            self._finish_tags[tenant] = start + cost / weight
+            
+            request = {
+                'fn'    : fn,
+                'args'  : args,
+                'kwargs'    : kwargs,
+                'future'    : future,
+                'tenant'    : tenant,
+                'priority'  : priority,
+                'cost'  : cost,
+                'start' : start,
+                'deadline'  : deadline,
+                'submit_time'   : now
+            }
+            self._push(request)
+            self._pending_cost += cost
+            self._stats['submitted'] += 1
+            
+            if len(self._workers) < self.max_workers and self._running + len(self._heap) > len(self._workers):
+                self._start_worker()
+            
+            self._cond.notify()
+        
+        return future
+    
+    def stop(self, cancel = True):
+        """ Stop the workers (after the running requests), and cancel the queued requests """
+        with self._cond:
+            self._stopped = True
+            if cancel:
+                for *_, request in self._heap:
+                    request['future'].cancel()
+                    self._pending_cost -= request['cost']
+                self._stats['cancelled'] += len(self._heap)
+                self._heap.clear()
+                self._queued.clear()
+            self._cond.notify_all()
+    
+    def join(self):
+        for worker in self._workers: worker.join()
+    
+    def get_stats(self):
+        with self._cond:
+            completed = self._stats['completed']
+            return {
+                'queued'    : len(self._heap),
+                'running'   : self._running,
+                'queued_per_tenant' : {k : v for k, v in self._queued.items() if v},
+                'queued_per_priority'   : dict(collections.Counter(it[0] for it in self._heap)),
+                'pending_cost'  : self._pending_cost,
+                'mean_wait_time'    : self._total_wait_time / completed if completed else 0.,
+                'mean_exec_time'    : self._exec_time or 0.,
+                ** {k : self._stats[k] for k in (
+                    'submitted', 'completed', 'failed', 'cancelled', 'dropped', 'demoted', 'rejected'
+                )}
+            }
+    
+    def _push(self, request):
+        heapq.heappush(
+            self._heap, (request['priority'], request['start'], next(self._counter), request)
+        )
+        self._queued[request['tenant']] += 1
+    
+    def _pop(self):
+        """ Return the next request to execute (or `None` if the scheduler is stopped), must be called with the lock held """
+        while True:
+            while not self._heap and not self._stopped:
+                self._cond.wait()
+            if not self._heap: return None
+            
+            *_, request = heapq.heappop(self._heap)
+            self._queued[request['tenant']] -= 1
+            if not self._queued[request['tenant']]: del self._queued[request['tenant']]
+            self._virtual_time = max(self._virtual_time, request['start'])
+            self._prune_finish_tags()
+            
+            if request['future'].cancelled():
+                self._pending_cost -= request['cost']
+                self._stats['cancelled'] += 1
+                continue
+            
+            deadline = request['deadline']
+            if deadline is not None and request['priority'] != _demoted_priority:
+                if time.time() + (self._exec_time or 0.) > deadline:
+                    if self.deadline_policy == 'drop':
+                        self._pending_cost -= request['cost']
+                        self._stats['dropped'] += 1
+                        request['future'].set_exception(TimeoutError(
+                            'The deadline of the request cannot be met'
+                        ))
+                        continue
+                    
+                    self._stats['demoted'] += 1
+                    self._push({** request, 'priority' : _demoted_priority})
+                    continue
+            
+            if not request['future'].set_running_or_notify_cancel():
+                self._pending_cost -= request['cost']
+                self._stats['cancelled'] += 1
+                continue
+            
+            self._running += 1
+            return request
+    
+    def _start_worker(self):
+        worker = Thread(
+            target = self._run, name = '{}_{}'.format(self.name, len(self._workers)), daemon = True
+        )
+        self._workers.append(worker)
+        worker.start()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                request = self._pop()
+            if request is None: return
+            
+            t0 = time.time()
+            token = _current_scheduler.set(self)
+            try:
+                result = request['fn'](* request['args'], ** request['kwargs'])
+                request['future'].set_result(result)
+                status = 'completed'
+            except BaseException as e:
+                logger.error('[{}] Request failed : {}'.format(self.name, e))
+                request['future'].set_exception(e)
+                status = 'failed'
+            finally:
+                _current_scheduler.reset(token)
+            
+            exec_time = time.time() - t0
+            with self._cond:
+                self._running -= 1
+                self._pending_cost -= request['cost']
+                self._stats[status] += 1
+                if not self._heap and not self._running:
+                    # idle : the virtual time jumps to the last finish tag, such that all the tenants restart equally
+                    if self._finish_tags:
+                        self._virtual_time = max(self._virtual_time, max(self._finish_tags.values()))
+                    self._finish_tags.clear()
+                if status == 'completed':
+                    self._total_wait_time += t0 - request['submit_time']
+                    self._exec_time = exec_time if self._exec_time is None else (
+                        self.time_smoothing * exec_time + (1. - self.time_smoothing) * self._exec_time
+                    )
+    
+    def _prune_finish_tags(self):
+        """ Remove the finish tags that are not after the virtual time (i.e., equivalent to no tag), must be called with the lock held """
+        if len(self._finish_tags) <= self._max_finish_tags: return
+        
+        self._finish_tags = {
+            tenant : tag for tenant, tag in self._finish_tags.items() if tag > self._virtual_time
+        }
+        self._max_finish_tags = max(_min_finish_tags, 2 * len(self._finish_tags))
@@ -0,0 +1,220 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import weakref
+import logging
+import multiprocessing
+import numpy as np
+
+from typing import Any, Tuple
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+from .stream import DataWithResult
+
+logger = logging.getLogger(__name__)
+
+_FREE, _USED = 0, 1
+
+@dataclass
+class SharedArray:
+    """ Descriptor of a `np.ndarray` stored in a slot of a `SharedMemoryRing` """
+    slot    : int
+    shape   : Tuple[int]
+    dtype   : Any
+
+class SharedMemoryRing:
+    """
+        Fixed-size slots in a `multiprocessing.shared_memory` block, shared between processes
+        
+        The slots are allocated in a round-robin way (ring buffer), and are released by the reader once the array is not used anymore (i.e., when the array returned by `read` is garbage collected), or directly after reading if `copy = True`.
+        The allocation state is stored in a shared array, such that any process can allocate / release slots.
+    """
+    def __init__(self, num_slots = 16, slot_size = 4 * 1024 ** 2, *, copy = False):
+        """
+            Arguments :
+                - num_slots : the number of slots
+                - slot_size : the size (in bytes) of each slot (larger arrays are not stored in the ring)
+                - copy      : whether `read` returns a copy of the array (releasing the slot directly), or a view on the shared memory (the slot is released when the array is deleted)
+        """
+        self.num_slots  = num_slots
+        self.slot_size  = slot_size
+        self.copy   = copy
+        
+        self._shm   = shared_memory.SharedMemory(create = True, size = num_slots * slot_size)
+        self._name  = self._shm.name
+        # the pid of the creator, such that a copy (pickled or inherited with `fork`) never unlinks the memory
+        self._owner_pid = os.getpid()
+        # the last item is the position of the allocation cursor
+        self._states    = multiprocessing.Array('i', num_slots + 1)
+    
+    @property
+    def name(self):
+        return self._name
+    
+    @property
+    def num_used(self):
+        with self._states.get_lock():
+            return sum(self._states[:self.num_slots])
+    
+    def __repr__(self):
+        return '<SharedMemoryRing name={} slots={} slot_size={} used={}>'.format(
+            self._name, self.num_slots, self.slot_size, self.num_used
+        )
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shm'] = None
+        return state
+    
+    @property
+    def shm(self):
+        if self._shm is None: self._shm = shared_memory.SharedMemory(name = self._name)
+        return self._shm
+    
+    def acquire(self):
+        """ Return the index of a free slot (or `None` if all the slots are used) """
+        with self._states.get_lock():
+            start = self._states[self.num_slots]
+            for i in range(self.num_slots):
+                slot = (start + i) % self.num_slots
+                if self._states[slot] == _FREE:
+                    self._states[slot] = _USED
+                    self._states[self.num_slots] = (slot + 1) % self.num_slots
+                    return slot
+        return None
+    
+    def release(self, slot):
+        with self._states.get_lock():
+            self._states[slot] = _FREE
+    
+    def write(self, array):
+        """ Copy `array` in a free slot, and return its `SharedArray` descriptor (or `None` if it does not fit) """
+        if array.nbytes > self.slot_size: return None
+        
+        slot = self.acquire()
+        if slot is None: return None
+        
+        view = np.ndarray(
+            array.shape, dtype = array.dtype, buffer = self.shm.buf, offset = slot * self.slot_size
+        )
+        view[...] = array
+        return SharedArray(slot = slot, shape = array.shape, dtype = array.dtype)
+    
+    def read(self, desc):
+        """ Return the array described by `desc` """
+        array = np.ndarray(
+            desc.shape, dtype = desc.dtype, buffer = self.shm.buf, offset = desc.slot * self.slot_size
+        )
+        if self.copy:
+            array = array.copy()
+            self.release(desc.slot)
+        else:
+            # the views created from `array` keep a reference to it in `base`
+            weakref.finalize(array, self.release, desc.slot).atexit = False
+        return array
+    
+    def close(self):
+        """ Close the shared memory (and unlink it if this instance has been created by the current process) """
+        if self._shm is None: return
+        
+        if os.getpid() == self._owner_pid:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        
+        try:
+            self._shm.close()
+            self._shm = None
+        except BufferError:
+            logger.warning('The shared memory {} is still used by some arrays'.format(self._name))
+
+class SharedMemoryQueue:
+    """
+        Wrapper around a `multiprocessing.Queue` that transfers the `np.ndarray` items in a `SharedMemoryRing`, and only sends their (small) descriptors through the queue
+        
+        The arrays are searched in the items, `DataWithResult` (args, kwargs and result), and (nested) `list`, `tuple` and `dict`. Arrays smaller than `min_size` bytes, or that do not fit in the ring (too large or no free slot), are pickled as usual.
+    """
+    def __init__(self, buffer, ring = None, *, min_size = 64 * 1024, ** kwargs):
+        """
+            Arguments :
+                - buffer    : the `multiprocessing.Queue` used to send the items / descriptors
+                - ring      : the `SharedMemoryRing` (created with `kwargs` if not provided)
+                - min_size  : minimal size (in bytes) to transfer an array in shared memory
+        """
+        self.buffer = buffer
+        self.ring   = ring if ring is not None else SharedMemoryRing(** kwargs)
+        self.min_size   = min_size
+    
+    def __repr__(self):
+        return '<SharedMemoryQueue buffer={} ring={}>'.format(
+            self.buffer.__class__.__name__, self.ring
+        )
+    
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None: break
+            yield item
+    
+    def put(self, item, * args, ** kwargs):
+        return self.buffer.put(self.encode(item), * args, ** kwargs)
+    
+    def get(self, * args, ** kwargs):
+        return self.decode(self.buffer.get(* args, ** kwargs))
+    
+    def get_nowait(self):
+        return self.decode(self.buffer.get_nowait())
+    
+    def empty(self):
+        return self.buffer.empty()
+    
+    def qsize(self):
+        return self.buffer.qsize()
+    
+    def close(self):
+        self.ring.close()
+    
+    def encode(self, item):
+        """ Store the arrays of `item` in the ring, and return the item with the descriptors """
+        if isinstance(item, np.ndarray):
+            if item.nbytes < self.min_size or item.dtype.hasobject: return item
+            return self.ring.write(np.ascontiguousarray(item)) or item
+        elif isinstance(item, DataWithResult):
+            return DataWithResult(
+                args    = self.encode(item.args) if isinstance(item.args, tuple) else item.args,
+                kwargs  = self.encode(item.kwargs),
+                result  = self.encode(item.result),
+                priority    = item.priority,
+                index   = item.index
+            )
+        elif type(item) in (list, tuple):
+            return type(item)(self.encode(it) for it in item)
+        elif isinstance(item, dict):
+            return {k : self.encode(v) for k, v in item.items()}
+        return item
+    
+    def decode(self, item):
+        """ Inverse of `encode` : replace the `SharedArray` descriptors by the arrays """
+        if isinstance(item, SharedArray):
+            return self.ring.read(item)
+        elif isinstance(item, DataWithResult):
+            item.args   = self.decode(item.args) if isinstance(item.args, tuple) else item.args
+            item.kwargs = self.decode(item.kwargs)
+            item.result = self.decode(item.result)
+            return item
+        elif type(item) in (list, tuple):
+            return type(item)(self.decode(it) for it in item)
+        elif isinstance(item, dict):
+            return {k : self.decode(v) for k, v in item.items()}
+        return item
@@ -0,0 +1,211 @@
+# Copyright (C) 2025-now yui-mhcp project author. All rights reserved.
+# Licenced under the Affero GPL v3 Licence (the "Licence").
+# you may not use this file except in compliance with the License.
+# See the "LICENCE" file at the root of the directory for the licence information.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import numpy as np
+
+from threading import Lock, Condition
+
+from ..cache_utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+class Flight:
+    """
+        A computation shared between a leader (that computes it) and followers (that wait for its result)
+        
+        The leader can `publish` intermediate items (e.g., the tokens generated at each step), that followers can iterate over (`for item in flight`) while the computation is running.
+    """
+    def __init__(self, key):
+        self.key    = key
+        
+        self._cond  = Condition()
+        self._updates   = []
+        self._done  = False
+        self._result    = None
+        self._exception = None
+        self.num_followers  = 0
+    
+    @property
+    def done(self):
+        return self._done
+    
+    def __repr__(self):
+        return '<Flight key={} updates={} followers={} done={}>'.format(
+            self.key[:8] if isinstance(self.key, str) else self.key,
+            len(self._updates), self.num_followers, self._done
+        )
+    
+    def __iter__(self):
+        """ Iterate over the published items (including the ones published before the call), until the end of the computation """
+        idx = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: idx < len(self._updates) or self._done)
+                items = self._updates[idx :]
+                done  = self._done
+            
+            idx += len(items)
+            yield from items
+            if done and idx == len(self._updates): return
+    
+    def publish(self, item):
+        with self._cond:
+            self._updates.append(item)
+            self._cond.notify_all()
+    
+    def set_result(self, result):
+        with self._cond:
+            self._result, self._done = result, True
+            self._cond.notify_all()
+    
+    def set_exception(self, exception):
+        with self._cond:
+            self._exception, self._done = exception, True
+            self._cond.notify_all()
+    
+    def result(self, timeout = None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._done, timeout):
+                raise TimeoutError('The flight {} is not finished'.format(self.key))
+        
+        if self._exception is not None: raise self._exception
+        return self._result
+
+class SingleFlight:
+    """
+        Deduplicates identical concurrent computations : the first caller (the leader) computes the result, while the callers with the same key (the followers) wait for it
+        
+        If `ttl > 0`, the results are additionally cached for `ttl` seconds.
+        
+        Example usage :
+        ```python
+        single_flight = SingleFlight()
+        # concurrent calls with the same query only call `search` once
+        result = single_flight.do(canonical_hash(query), search, query)
+        ```
+    """
+    def __init__(self, *, ttl = 0, max_size = 256):
+        """
+            Arguments :
+                - ttl   : the time-to-live (in seconds) of the results (0 to disable the cache)
+                - max_size  : the maximal number of cached results
+        """
+        self.ttl    = ttl
+        self.max_size   = max_size
+        
+        self._mutex = Lock()
+        self._flights   = {}
+        self._cache = LRUCache(max_size, ttl = ttl) if ttl else None
+        
+        self.num_leaders    = 0
+        self.num_followers  = 0
+        self.num_cached = 0
+    
+    def __repr__(self):
+        return '<SingleFlight in-flight={} leaders={} followers={} cached={}>'.format(
+            len(self._flights), self.num_leaders, self.num_followers, self.num_cached
+        )
+    
+    def acquire(self, key):
+        """
+            Return a tuple `(flight, is_leader)`
+            
+            The leader **must** call `release(flight, result = ..., exception = ...)` once the computation is done.
+            If the result is cached, the returned flight is already done.
+        """
+        with self._mutex:
+            if self._cache is not None:
+                result = self._cache.get(key, _missing)
+                if result is not _missing:
+                    self.num_cached += 1
+                    flight = Flight(key)
+                    flight.set_result(result)
+                    return flight, False
+            
+            flight = self._flights.get(key, None)
+            if flight is not None:
+                self.num_followers   += 1
+                flight.num_followers += 1
+                return flight, False
+            
+            self.num_leaders += 1
+            flight = self._flights[key] = Flight(key)
+            return flight, True
+    
+    def release(self, flight, result = None, exception = None):
+        """ Set the result (or exception) of `flight`, and remove it from the in-flight computations """
+        with self._mutex:
+            if self._flights.get(flight.key, None) is flight:
+                self._flights.pop(flight.key)
+            if exception is None and self._cache is not None:
+                self._cache[flight.key] = result
+        
+        if exception is not None:
+            flight.set_exception(exception)
+        else:
+            flight.set_result(result)
+    
+    def do(self, key, fn, * args, ** kwargs):
+        """ Return `fn(* args, ** kwargs)`, computed only once for all the concurrent calls with the same `key` """
+        flight, is_leader = self.acquire(key)
+        if not is_leader: return flight.result()
+        
+        try:
+            result = fn(* args, ** kwargs)
+        except Exception as e:
+            self.release(flight, exception = e)
+            raise
+        
+        self.release(flight, result = result)
+        return result
+    
+    def get_stats(self):
+        with self._mutex:
+            return {
+                'in_flight' : len(self._flights),
+                'leaders'   : self.num_leaders,
+                'followers' : self.num_followers,
+                'cached'    : self.num_cached
+            }
+
+def canonical_hash(* args, ** kwargs):
+    """
+        Return a deterministic hash of the given arguments
+        
+        `dict` are hashed independently of their keys order, `np.ndarray` by their dtype, shape and content, and other objects by their `repr` (i.e., objects with a default `repr` are only equal to themselves).
+    """
+    hasher = hashlib.sha256()
+    _update_hash(hasher, (args, kwargs))
+    return hasher.hexdigest()
+
+def _update_hash(hasher, value):
+    if isinstance(value, dict):
+        hasher.update(b'{')
+        for k in sorted(value, key = str):
+            _update_hash(hasher, k)
+            hasher.update(b':')
+            _update_hash(hasher, value[k])
+        hasher.update(b'}')
+    elif isinstance(value, (list, tuple, set)):
+        hasher.update(b'[')
+        for v in (sorted(value, key = repr) if isinstance(value, set) else value):
+            _update_hash(hasher, v)
+            hasher.update(b',')
+        hasher.update(b']')
+    elif isinstance(value, np.ndarray):
+        hasher.update('array({}, {})'.format(value.dtype, value.shape).encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    else:
+        hasher.update(repr(value).encode('utf-8', 'replace'))
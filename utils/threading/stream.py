@@ -9,14 +9,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import queue
 import logging
 import inspect
+import collections
 import multiprocessing.queues
 
 from typing import Any, Dict
 from functools import partial
-from threading import Thread, RLock, Event
+from threading import Thread, Condition, Lock, RLock, Event
 from dataclasses import dataclass, field
 from multiprocessing.pool import ThreadPool
 
@@ -68,6 +70,9 @@ class Stream(Thread):
                  
                  dict_as_kwargs = None,
                  
+                 callback_batch_size    = 0,
+                 callback_batch_delay   = 0.,
+                 
                  prefetch_size  = 0,
                  max_workers    = 0,
                  daemon = True,
@@ -88,14 +93,27 @@ class Stream(Thread):
         self.max_workers    = max_workers
         self.prefetch_size  = prefetch_size
 
-        self._callbacks = {
-            'start' : start_callback or [],
-            'stop'  : stop_callback or [],
-            'item'  : callback or [],
-            'control'   : control_callback or []
-        }
-        for k, v in self._callbacks.items():
-            if not isinstance(v, list): self._callbacks[k] = [v]
+        self.callback_batch_size    = callback_batch_size
+        self.callback_batch_delay   = callback_batch_delay
+        
+        # the callbacks are stored in tuples, replaced (copy-on-write) when a callback is added / removed
+        self._callbacks_mutex   = Lock()
+        self._callbacks = {}
+        self._item_callbacks    = ()
+        self._batch_callbacks   = ()
+        for event, callbacks in (
+            ('start', start_callback), ('stop', stop_callback), ('item', callback), ('control', control_callback)
+        ):
+            if callbacks is None: callbacks = []
+            elif not isinstance(callbacks, (list, tuple)): callbacks = [callbacks]
+            self._set_callbacks(event, callbacks)
+        
+        # the results are appended to the (thread-safe) `_batch` without lock. If `callback_batch_delay` is set, the batches are flushed by a single `_flusher` thread, signaled when the batch is full or when the deadline of its 1st result is armed. Otherwise, the producer flushes the full batches
+        self._batch = collections.deque()
+        self._batch_mutex   = Lock()
+        self._batch_cond    = Condition(self._batch_mutex)
+        self._batch_deadline    = None
+        self._flusher   = None
 
         self.mutex  = RLock() if max_workers else FakeLock()
         self.__started  = False
@@ -110,6 +128,30 @@ class Stream(Thread):
     empty   = _locked_property('empty')
     stopped = _locked_property('stopped')
     
+    def add_callback(self, callback, event = 'item', *, index = None):
+        """ Add `callback` to the `event` callbacks (at position `index` if provided) """
+        with self._callbacks_mutex:
+            callbacks = list(self._callbacks[event])
+            if index is None:   callbacks.append(callback)
+            else:               callbacks.insert(index, callback)
+            self._set_callbacks(event, callbacks)
+    
+    def remove_callback(self, callback, event = 'item'):
+        with self._callbacks_mutex:
+            self._set_callbacks(event, [c for c in self._callbacks[event] if c != callback])
+    
+    def _set_callbacks(self, event, callbacks):
+        """ Replace the `event` callbacks, and split the item callbacks between the per-item and batched ones """
+        self._callbacks[event] = tuple(callbacks)
+        if event == 'item':
+            self._item_callbacks    = tuple(c for c in callbacks if not getattr(c, 'batched', False))
+            self._batch_callbacks   = tuple(c for c in callbacks if getattr(c, 'batched', False))
+    
+    def _discard_callbacks(self, event, callbacks):
+        if not callbacks: return
+        with self._callbacks_mutex:
+            self._set_callbacks(event, [c for c in self._callbacks[event] if c not in callbacks])
+    
     def _apply_async(self, * args, return_input = False, ** kwargs):
         """
             Call `self.fn` with the given `args` and `kwargs`
@@ -249,7 +291,7 @@ class Stream(Thread):
         else:
             self._generator_finished    = Event()
             self._results_buffer = queue.Queue(self.prefetch_size)
-            self._callbacks['item'].insert(0, self._results_buffer)
+            self.add_callback(self._results_buffer, index = 0)
             
             self.start()
             
@@ -305,6 +347,10 @@ class Stream(Thread):
     def on_stop(self):
         """ Function called when stopping the thread """
         self._stopped   = True
+        with self._batch_cond: self._batch_cond.notify_all()
+        # the flusher may be calling the batched callbacks : the last batch is flushed after it
+        if self._flusher is not None: self._flusher.join()
+        self.flush_callbacks()
         self.__finished = True
         if self._pool is not None: self._pool.terminate()
         if logger.isEnabledFor(logging.DEBUG): logger.debug('[STATUS {}] Stop'.format(self.name))
@@ -315,22 +361,88 @@ class Stream(Thread):
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug('[ITEM PRODUCED {}]'.format(self.name))
 
-        _run_callbacks(self._callbacks['item'], item, result)
+        self._discard_callbacks('item', _run_callbacks(self._item_callbacks, item, result))
         if result is CONTROL:
-            _run_callbacks(self._callbacks['control'], item, result)
+            self._discard_callbacks('control', _run_callbacks(self._callbacks['control'], item, result))
+        elif self._batch_callbacks:
+            if not self.callback_batch_delay:
+                # a size of 0 means "no batching" without delay (and "no size limit" otherwise)
+                if self.callback_batch_size <= 1 and not self._batch:
+                    self._run_batch([result])
+                else:
+                    self._batch.append(result)
+                    if len(self._batch) >= self.callback_batch_size: self.flush_callbacks()
+                return
+            
+            self._batch.append(result)
+            if self.callback_batch_size > 0 and len(self._batch) >= self.callback_batch_size:
+                self._signal_flusher(time.time())
+            elif self._batch_deadline is None:
+                self._signal_flusher(time.time() + self.callback_batch_delay)
+    
+    def flush_callbacks(self):
+        """ Call the batched callbacks with the `list` of pending results """
+        with self._batch_cond:
+            batch = self._take_batch()
+        self._run_batch(batch)
+    
+    def _signal_flusher(self, deadline):
+        """ Set the deadline of the pending batch (if earlier than the current one), and wake up the flusher """
+        with self._batch_cond:
+            if not self._batch: return
+            if self._batch_deadline is not None and self._batch_deadline <= deadline: return
+            
+            self._batch_deadline = deadline
+            if self._flusher is None:
+                self._flusher = Thread(
+                    target = self._run_flusher, name = '{}_flusher'.format(self.name), daemon = True
+                )
+                self._flusher.start()
+            self._batch_cond.notify()
+    
+    def _take_batch(self):
+        """ Return the `list` of pending results (`_batch_mutex` should be held) """
+        # the deadline is reset before the results are taken, such that a result appended in the meantime arms a new deadline
+        self._batch_deadline = None
+        
+        batch = []
+        while self._batch:
+            batch.append(self._batch.popleft())
+        return batch
+    
+    def _run_batch(self, batch):
+        if batch:
+            self._discard_callbacks('item', _run_callbacks(self._batch_callbacks, None, batch))
+    
+    def _run_flusher(self):
+        """ Flush the pending batch once its deadline is reached (the callbacks are called without lock), until the stream is stopped """
+        while True:
+            with self._batch_cond:
+                while not self._stopped and (
+                    self._batch_deadline is None or self._batch_deadline > time.time()
+                ):
+                    self._batch_cond.wait(
+                        self._batch_deadline - time.time() if self._batch_deadline is not None else None
+                    )
+                
+                if self._stopped: return
+                batch = self._take_batch()
+            
+            self._run_batch(batch)
 
 def _run_callbacks(callbacks, data = None, res = None):
+    """ Call `callbacks` with `res`, and return the callbacks to remove (i.e., stopped or that raised an exception) """
     assert data is None or isinstance(data, DataWithResult), str(data)
     
     if data is not None: data.result = res
 
-    if not callbacks: return
-    elif not isinstance(callbacks, list): callbacks = [callbacks]
+    if not callbacks: return []
+    elif not isinstance(callbacks, (list, tuple)): callbacks = [callbacks]
 
     _remove = []
-    for i, callback in enumerate(callbacks):
+    for callback in callbacks:
         try:
-            if getattr(callback, 'stopped', False): _remove.append(i)
+            if getattr(callback, 'stopped', False): _remove.append(callback)
             elif callable(callback):
                 if res is not CONTROL: callback(res) if res is not None else callback()
             elif hasattr(callback, 'put'):  callback.put(data if data is not None else res)
@@ -340,8 +452,9 @@ def _run_callbacks(callbacks, data = None, res = None):
                 logger.error('An exception occured while calling callback {} : {}'.format(
                     callback, e
                 ))
-            _remove.append(i)
+            _remove.append(callback)
     
-    for i in reversed(_remove): callbacks.pop(i)
-    return callbacks
+    if _remove and isinstance(callbacks, list):
+        for callback in _remove: callbacks.remove(callback)
+    return _remove
 